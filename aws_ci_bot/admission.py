@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+"""
+Admission control of the build job runs.
+
+A CodeBuild project has a ``concurrent_build_limit``, a build job run started
+above the limit waits in the CodeBuild queue, and it fails when it hits the
+``queued_timeout_in_minutes``. In admission mode, we track the in-flight
+build job runs of each build project in a store (see :mod:`aws_ci_bot.store`),
+and only start a build job run if the project has a free slot. Otherwise, the
+start request is held in the queue of the project, and the comment says
+it is queued. When the CodeBuild event handler receives the terminal
+(SUCCEEDED / FAILED / STOPPED) state change event of a build job run, the
+slot is released and the queued requests are started, so no build job run
+is dropped. The queue is dequeued by priority with aging, see
+:mod:`aws_ci_bot.priority`.
+
+The state of a project (in-flight build job runs and queued requests) is one
+key in the store, it is read and written under a lease lock built on
+:meth:`~aws_ci_bot.store.BaseStore.put_if_absent`. An in-flight build job run
+whose terminal event is lost is dropped after ``ttl`` seconds, so a lost
+event doesn't take a slot forever.
+"""
+
+import typing as T
+import time
+import uuid
+import contextlib
+import dataclasses
+
+from . import logger
+from .metrics import metrics
+from .throttle import call_api
+from .store import BaseStore
+from .ci_data import CIData
+from .priority import BuildPriorityEnum, pick_next
+from .summary_comment import CommentModeEnum, update_summary_comment
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+    from aws_codebuild import BuildJobRun
+
+
+def parse_build_limits(text: str) -> T.Dict[str, int]:
+    """
+    Parse the concurrent build limit setting, for example
+    ``my-project=5,*=2``. Each item is ``${project_name}=${limit}``, ``*`` is
+    the default of all other projects. 0 means no limit.
+
+    :return: project name -> limit
+    """
+    limits = dict()
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            project_name, limit = item.split("=", 1)
+            limits[project_name.strip()] = int(limit)
+        except ValueError:
+            raise ValueError(f"invalid concurrent build limit {item!r}")
+    return limits
+
+
+def get_admission_key(project_name: str) -> str:
+    return f"admission:{project_name}"
+
+
+def get_admission_lock_key(project_name: str) -> str:
+    return f"admission-lock:{project_name}"
+
+
+def get_build_id(build_job_run: "BuildJobRun") -> str:
+    return f"{build_job_run.project_name}:{build_job_run.run_id}"
+
+
+@dataclasses.dataclass
+class BuildRequest:
+    """
+    A request to start a build job run.
+
+    :param project_name: the CodeBuild project name.
+    :param is_batch: is it a batch build.
+    :param kwargs: the ``StartBuild`` / ``StartBuildBatch`` API arguments.
+    :param priority: see :class:`~aws_ci_bot.priority.BuildPriorityEnum`.
+    :param requested_at: when the build job run was requested.
+    """
+
+    project_name: str = dataclasses.field()
+    is_batch: bool = dataclasses.field(default=False)
+    kwargs: dict = dataclasses.field(default_factory=dict)
+    priority: int = dataclasses.field(default=BuildPriorityEnum.feature.value)
+    requested_at: float = dataclasses.field(default_factory=time.time)
+
+    @property
+    def env_var(self) -> T.Dict[str, str]:
+        return {
+            dct["name"]: dct["value"]
+            for dct in self.kwargs.get("environmentVariablesOverride", [])
+        }
+
+    def start(self, bsm: "BotoSesManager") -> "BuildJobRun":
+        from aws_codebuild import BuildJobRun, start_build, start_build_batch
+
+        if self.is_batch:
+            start_build_function = start_build_batch
+        else:
+            start_build_function = start_build
+        res = call_api(
+            f"codebuild.{start_build_function.__name__}",
+            start_build_function,
+            bsm=bsm,
+            **self.kwargs,
+        )
+        return BuildJobRun.from_start_build_response(res)
+
+
+@dataclasses.dataclass
+class ProjectState:
+    """
+    The admission state of a build project.
+
+    :param inflight: build id -> when it was started.
+    :param queue: the waiting requests, in the order of arrival.
+    """
+
+    inflight: T.Dict[str, float] = dataclasses.field(default_factory=dict)
+    queue: T.List[BuildRequest] = dataclasses.field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+    @classmethod
+    def from_dict(cls, dct: dict) -> "ProjectState":
+        return cls(
+            inflight=dct["inflight"],
+            queue=[BuildRequest(**request) for request in dct["queue"]],
+        )
+
+
+def note_started(
+    bsm: "BotoSesManager",
+    request: BuildRequest,
+    build_job_run: T.Optional["BuildJobRun"],
+):
+    """
+    Note in the comment that a queued request is started, ``build_job_run``
+    is None if it failed to start.
+    """
+    ci_data = CIData.from_env_var(request.env_var)
+    if not ci_data.comment_id:
+        return
+    if build_job_run is None:
+        build_id, console_url = None, None
+    else:
+        build_id, console_url = get_build_id(build_job_run), build_job_run.console_url
+    if ci_data.comment_mode == CommentModeEnum.summary.value:
+        update_summary_comment(
+            bsm=bsm,
+            comment_id=ci_data.comment_id,
+            func=lambda summary: summary.start_queued(
+                project_name=request.project_name,
+                build_id=build_id,
+                console_url=console_url,
+            ),
+        )
+        return
+
+    from aws_codecommit import better_boto
+
+    if build_id is None:
+        content = "❌ Build Run FAILED_TO_START"
+    else:
+        content = f"▶️ Build Run STARTED: [{build_id}]({console_url})"
+    call_api(
+        "codecommit.post_comment_reply",
+        better_boto.post_comment_reply,
+        bsm=bsm,
+        in_reply_to=ci_data.comment_id,
+        content=content,
+    )
+
+
+class Admission:
+    """
+    :param store: where to track the in-flight build job runs and the queue.
+    :param limits: see :func:`parse_build_limits`.
+    :param ttl: how long in seconds an in-flight build job run takes a slot
+        if its terminal event never arrives, it should be longer than the
+        build timeout. It is also the TTL of the project state.
+    :param lock_ttl: how long in seconds the project lock is held at most.
+    :param lock_timeout: how long in seconds to wait for the project lock.
+    :param aging_seconds: a queued request gains one priority level per this
+        many seconds, 0 means strict priority. See :mod:`aws_ci_bot.priority`.
+    :param clock: the time function, it is only for testing.
+    :param sleep: the sleep function, it is only for testing.
+    """
+
+    def __init__(
+        self,
+        store: BaseStore,
+        limits: T.Union[str, T.Dict[str, int]],
+        ttl: int = 86400,
+        lock_ttl: int = 60,
+        lock_timeout: float = 30.0,
+        aging_seconds: int = 600,
+        clock: T.Callable[[], float] = time.time,
+        sleep: T.Callable[[float], T.Any] = time.sleep,
+    ):
+        if isinstance(limits, str):
+            limits = parse_build_limits(limits)
+        self.store = store
+        self.limits = dict(limits)
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.lock_timeout = lock_timeout
+        self.aging_seconds = aging_seconds
+        self.clock = clock
+        self.sleep = sleep
+
+    def get_limit(self, project_name: str) -> T.Optional[int]:
+        """
+        :return: the concurrent build limit, None means no limit.
+        """
+        limit = self.limits.get(project_name, self.limits.get("*", 0))
+        return limit if limit > 0 else None
+
+    @contextlib.contextmanager
+    def lock(self, project_name: str):
+        key = get_admission_lock_key(project_name)
+        owner = uuid.uuid4().hex
+        deadline = self.clock() + self.lock_timeout
+        delay = 0.05
+        while not self.store.put_if_absent(key, {"owner": owner}, ttl=self.lock_ttl):
+            if self.clock() >= deadline:
+                raise TimeoutError(f"failed to lock the admission of {project_name!r}")
+            self.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        try:
+            yield
+        finally:
+            current = self.store.get(key)
+            if current is not None and current["owner"] == owner:
+                self.store.delete(key)
+
+    def load(self, project_name: str) -> ProjectState:
+        dct = self.store.get(get_admission_key(project_name))
+        state = ProjectState() if dct is None else ProjectState.from_dict(dct)
+        # drop the build job runs whose terminal event is lost
+        expire = self.clock() - self.ttl
+        for build_id, started_at in list(state.inflight.items()):
+            if started_at <= expire:
+                logger.info(f"drop expired in-flight build {build_id!r}")
+                state.inflight.pop(build_id)
+        return state
+
+    def save(self, project_name: str, state: ProjectState):
+        key = get_admission_key(project_name)
+        if state.inflight or state.queue:
+            self.store.put(key, state.to_dict(), ttl=self.ttl)
+        else:
+            self.store.delete(key)
+
+    def _start(
+        self,
+        bsm: "BotoSesManager",
+        state: ProjectState,
+        request: BuildRequest,
+    ) -> "BuildJobRun":
+        build_job_run = request.start(bsm)
+        state.inflight[get_build_id(build_job_run)] = self.clock()
+        return build_job_run
+
+    def _drain(
+        self,
+        bsm: "BotoSesManager",
+        state: ProjectState,
+        limit: int,
+        submitted: T.Optional[BuildRequest] = None,
+    ) -> T.List[T.Tuple[BuildRequest, T.Optional["BuildJobRun"]]]:
+        """
+        Start the queued requests by priority while the project has free
+        slots. The error of the ``submitted`` request is raised, the error of
+        other requests is logged and noted in the comment.
+        """
+        started = list()
+        while state.queue and len(state.inflight) < limit:
+            now = self.clock()
+            request = state.queue.pop(pick_next(state.queue, now, self.aging_seconds))
+            try:
+                build_job_run = self._start(bsm, state, request)
+            except Exception as e:
+                if request is submitted:
+                    raise
+                logger.error(
+                    f"failed to start queued build of {request.project_name!r}: {e!r}"
+                )
+                build_job_run = None
+            else:
+                priority = BuildPriorityEnum(request.priority).name
+                metrics.put(
+                    f"admission.wait_seconds.{priority}", now - request.requested_at
+                )
+            started.append((request, build_job_run))
+        return started
+
+    def _note(
+        self,
+        bsm: "BotoSesManager",
+        started: T.List[T.Tuple[BuildRequest, T.Optional["BuildJobRun"]]],
+    ):
+        for request, build_job_run in started:
+            try:
+                note_started(bsm, request, build_job_run)
+            except Exception as e:
+                logger.error(f"failed to note the started build: {e!r}")
+
+    def submit(
+        self,
+        bsm: "BotoSesManager",
+        request: BuildRequest,
+    ) -> T.Optional["BuildJobRun"]:
+        """
+        Put the request in the queue, and start the queued requests by
+        priority while the project has free slots.
+
+        :return: the started build job run, None if it is queued.
+        """
+        limit = self.get_limit(request.project_name)
+        if limit is None:
+            return request.start(bsm)
+        build_job_run = None
+        with self.lock(request.project_name):
+            state = self.load(request.project_name)
+            state.queue.append(request)
+            started = list()
+            try:
+                started = self._drain(bsm, state, limit, submitted=request)
+            finally:
+                self.save(request.project_name, state)
+        others = list()
+        for started_request, started_run in started:
+            if started_request is request:
+                build_job_run = started_run
+            else:
+                others.append((started_request, started_run))
+        if build_job_run is None:
+            metrics.put("admission.queued", 1)
+            logger.info(
+                f"{request.project_name!r} reached the concurrent build "
+                f"limit {limit}, queue the build, "
+                f"{len(state.queue)} build(s) in the queue"
+            )
+        self._note(bsm, others)
+        return build_job_run
+
+    def release(
+        self,
+        bsm: "BotoSesManager",
+        project_name: str,
+        build_id: str,
+    ) -> T.List[T.Tuple[BuildRequest, T.Optional["BuildJobRun"]]]:
+        """
+        Release the slot of the finished build job run, and start the queued
+        requests. It is safe to release a build job run more than once.
+
+        :return: the started requests and build job runs.
+        """
+        limit = self.get_limit(project_name)
+        if limit is None:
+            return []
+        with self.lock(project_name):
+            state = self.load(project_name)
+            if state.inflight.pop(build_id, None) is not None:
+                logger.info(f"release the slot of {build_id!r}")
+            started = self._drain(bsm, state, limit)
+            self.save(project_name, state)
+        self._note(bsm, started)
+        return started
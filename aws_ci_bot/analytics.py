@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+
+"""
+Build timing analytics sink.
+
+The CodeBuild state change event of a finished build job run carries the
+start time, the end time and the duration of every build phase. The CodeBuild
+event handler turns it into one flat :class:`BuildTiming` row: the project,
+the branch type, the outcome, the queue time and the duration of each phase.
+The rows of one Lambda invocation are buffered and written as one Parquet
+file to S3 or to a local folder at the end of the invocation, in the hive
+partition layout ``${uri}/date=${YYYY-MM-DD}/${uuid}.parquet``, so the
+folder can be loaded by pandas, Athena, Spark, ...
+(see :mod:`aws_ci_bot.analytics_report`).
+
+Only the terminal state change events are recorded, the phase change events
+carry no extra information, so it still works when
+``DROP_IGNORABLE_EVENTS`` drops them (see :mod:`aws_ci_bot.prefilter`).
+
+Each invocation writes a small file, run :meth:`BuildTimingSink.compact`
+periodically (for example daily) to merge the small files of each date
+partition into one file::
+
+    from boto_session_manager import BotoSesManager
+    from aws_ci_bot.analytics import BuildTimingSink
+
+    bsm = BotoSesManager()
+    sink = BuildTimingSink(uri="s3://my-bucket/build_timings/", s3_client=bsm.s3_client)
+    sink.compact()
+
+It requires the optional ``pyarrow`` dependency, see
+``requirements-analytics.txt``. The Lambda deployment package doesn't
+include it, add it as a Lambda layer, otherwise the Lambda function refuses
+to start with ``BUILD_TIMINGS_URI``. The sink is best effort, a write error
+is logged but not raised.
+"""
+
+import typing as T
+import io
+import uuid
+import importlib.util
+import threading
+import dataclasses
+from pathlib import Path
+from datetime import datetime
+
+from . import logger
+from .metrics import metrics
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from aws_codebuild import CodeBuildEvent
+    from .ci_data import CIData
+
+# the CodeBuild build phases in the order they run, each one is a
+# ``${phase}_seconds`` column, the last phase ``COMPLETED`` has no duration
+PHASES = [
+    "SUBMITTED",
+    "QUEUED",
+    "PROVISIONING",
+    "DOWNLOAD_SOURCE",
+    "INSTALL",
+    "PRE_BUILD",
+    "BUILD",
+    "POST_BUILD",
+    "UPLOAD_ARTIFACTS",
+    "FINALIZING",
+]
+
+# the phases before the build container is running
+WAITING_PHASES = {"SUBMITTED", "QUEUED"}
+
+# the file name prefix of the merged file of a date partition
+COMPACTED_PREFIX = "compacted-"
+
+BRANCH_TYPE_ALIASES = {
+    "master": "main",
+    "feat": "feature",
+    "rls": "release",
+    "cleanup": "clean",
+    "develop": "dev",
+    "staging": "stage",
+}
+
+
+def get_branch_type(branch_name: T.Optional[str]) -> str:
+    """
+    The semantic branch type of the built branch, for example
+    ``feature/add-this`` -> ``feature``.
+    See :mod:`aws_codecommit.semantic_branch`.
+    """
+    from aws_codecommit.semantic_branch import SemanticBranchEnum
+
+    if not branch_name:
+        return "unknown"
+    word = branch_name.split("/")[0].lower().strip()
+    if word not in SemanticBranchEnum._value2member_map_:
+        return "other"
+    return BRANCH_TYPE_ALIASES.get(word, word)
+
+
+def get_phase_column(phase: str) -> str:
+    return f"{phase.lower()}_seconds"
+
+
+def _parse_event_time(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%SZ")
+
+
+@dataclasses.dataclass
+class BuildTiming:
+    """
+    The timing of one finished build job run.
+
+    :param build_id: the ``${project_name}:${run_id}`` build id.
+    :param project_name: the CodeBuild project name.
+    :param is_batch: is it a batch build.
+    :param branch_type: see :func:`get_branch_type`.
+    :param build_status: SUCCEEDED, FAILED or STOPPED.
+    :param event_time: when the build job run finished, in UTC.
+    :param queue_seconds: the time before the build container is running.
+    :param run_seconds: the time after the build container is running.
+    :param phase_seconds: phase name -> duration, the missing phase is None.
+    """
+
+    build_id: str = dataclasses.field()
+    project_name: str = dataclasses.field()
+    is_batch: bool = dataclasses.field()
+    branch_type: str = dataclasses.field()
+    build_status: str = dataclasses.field()
+    event_time: datetime = dataclasses.field()
+    queue_seconds: int = dataclasses.field(default=0)
+    run_seconds: int = dataclasses.field(default=0)
+    phase_seconds: T.Dict[str, T.Optional[int]] = dataclasses.field(
+        default_factory=dict
+    )
+
+    @classmethod
+    def from_cb_event(
+        cls,
+        cb_event: "CodeBuildEvent",
+        ci_data: "CIData",
+    ) -> "BuildTiming":
+        """
+        Make the row from the terminal state change event.
+        """
+        phase_seconds = {phase: None for phase in PHASES}
+        for phase in cb_event.phases:
+            phase_type = phase.get("phase-type")
+            if phase_type in phase_seconds:
+                phase_seconds[phase_type] = phase.get("duration-in-seconds")
+        queue_seconds, run_seconds = 0, 0
+        for phase, seconds in phase_seconds.items():
+            if seconds is None:
+                continue
+            if phase in WAITING_PHASES:
+                queue_seconds += seconds
+            else:
+                run_seconds += seconds
+        # arn:aws:codebuild:${region}:${account}:${build_type}/${build_id}
+        build_type, build_id = cb_event.build_arn.split(":", 5)[5].split("/", 1)
+        return cls(
+            build_id=build_id,
+            project_name=cb_event.project_name,
+            is_batch=build_type == "build-batch",
+            branch_type=get_branch_type(ci_data.branch_name),
+            build_status=cb_event.build_status,
+            event_time=_parse_event_time(cb_event.event_time),
+            queue_seconds=queue_seconds,
+            run_seconds=run_seconds,
+            phase_seconds=phase_seconds,
+        )
+
+    def to_row(self) -> dict:
+        row = dataclasses.asdict(self)
+        for phase, seconds in row.pop("phase_seconds").items():
+            row[get_phase_column(phase)] = seconds
+        for phase in PHASES:
+            row.setdefault(get_phase_column(phase), None)
+        return row
+
+
+def get_schema():
+    """
+    The Parquet schema of the :meth:`BuildTiming.to_row` rows.
+    """
+    import pyarrow as pa
+
+    fields = [
+        ("build_id", pa.string()),
+        ("project_name", pa.string()),
+        ("is_batch", pa.bool_()),
+        ("branch_type", pa.string()),
+        ("build_status", pa.string()),
+        ("event_time", pa.timestamp("s")),
+        ("queue_seconds", pa.int32()),
+        ("run_seconds", pa.int32()),
+    ]
+    fields.extend((get_phase_column(phase), pa.int32()) for phase in PHASES)
+    return pa.schema(fields)
+
+
+def check_pyarrow():
+    """
+    Raise if ``pyarrow`` is not installed, it doesn't import it.
+    """
+    if importlib.util.find_spec("pyarrow") is None:
+        raise ImportError(
+            "BUILD_TIMINGS_URI requires pyarrow, it is not in the Lambda "
+            "deployment package, add it as a Lambda layer, "
+            "see requirements-analytics.txt"
+        )
+
+
+def to_parquet(rows: T.List[dict]) -> bytes:
+    import pyarrow as pa
+
+    return _write_table(pa.Table.from_pylist(rows, schema=get_schema()))
+
+
+def _write_table(table) -> bytes:
+    import pyarrow.parquet as pq
+
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="snappy")
+    return buffer.getvalue()
+
+
+def merge_parquet(body_list: T.List[bytes]) -> bytes:
+    """
+    Merge many Parquet files into one.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = get_schema()
+    tables = [
+        pq.read_table(io.BytesIO(body)).select(schema.names).cast(schema)
+        for body in body_list
+    ]
+    return _write_table(pa.concat_tables(tables))
+
+
+class BuildTimingSink:
+    """
+    Buffer the :class:`BuildTiming` rows of one Lambda invocation, it is
+    thread safe.
+
+    :param uri: ``s3://bucket/prefix`` or a local folder.
+    :param s3_client: required if the ``uri`` is on S3.
+    """
+
+    def __init__(self, uri: str, s3_client=None):
+        check_pyarrow()
+        self.uri = uri.rstrip("/")
+        self.s3_client = s3_client
+        self._rows: T.List[dict] = list()
+        self._lock = threading.Lock()
+
+    def add(self, build_timing: BuildTiming):
+        with self._lock:
+            self._rows.append(build_timing.to_row())
+
+    @property
+    def is_s3(self) -> bool:
+        return self.uri.startswith("s3://")
+
+    def _get_bucket_and_key(self, key: str) -> T.Tuple[str, str]:
+        bucket, _, prefix = self.uri[len("s3://") :].partition("/")
+        return bucket, f"{prefix}/{key}" if prefix else key
+
+    def _write(self, key: str, body: bytes) -> str:
+        if self.is_s3:
+            bucket, key = self._get_bucket_and_key(key)
+            self.s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+            return f"s3://{bucket}/{key}"
+        path = Path(self.uri, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+        return str(path)
+
+    def _read(self, key: str) -> bytes:
+        if self.is_s3:
+            bucket, key = self._get_bucket_and_key(key)
+            return self.s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        return Path(self.uri, key).read_bytes()
+
+    def _delete(self, keys: T.List[str]):
+        if self.is_s3:
+            bucket, prefix = self._get_bucket_and_key("")
+            # the DeleteObjects API takes at most 1000 keys per call
+            for i in range(0, len(keys), 1000):
+                self.s3_client.delete_objects(
+                    Bucket=bucket,
+                    Delete={
+                        "Objects": [
+                            {"Key": f"{prefix}{key}"} for key in keys[i : i + 1000]
+                        ],
+                        "Quiet": True,
+                    },
+                )
+            return
+        for key in keys:
+            Path(self.uri, key).unlink()
+
+    def _list(self) -> T.List[str]:
+        """
+        List the Parquet files, the keys are relative to the ``uri``.
+        """
+        if self.is_s3:
+            from .archive import iter_s3_keys
+
+            bucket, prefix = self._get_bucket_and_key("")
+            return sorted(
+                key[len(prefix) :]
+                for key in iter_s3_keys(self.s3_client, bucket, prefix)
+                if key.endswith(".parquet")
+            )
+        root = Path(self.uri)
+        if not root.exists():
+            return []
+        return sorted(
+            path.relative_to(root).as_posix() for path in root.glob("date=*/*.parquet")
+        )
+
+    def compact(self) -> T.List[str]:
+        """
+        Merge the small Parquet files of each date partition into one file,
+        and delete the small files. A row may be written twice if it fails
+        in between, :func:`aws_ci_bot.analytics_report.load_build_timings`
+        deduplicates it.
+
+        :return: where the merged files are written.
+        """
+        partitions: T.Dict[str, T.List[str]] = dict()
+        for key in self._list():
+            partitions.setdefault(key.rsplit("/", 1)[0], []).append(key)
+        written = list()
+        for partition, keys in sorted(partitions.items()):
+            if len(keys) <= 1:
+                continue
+            body = merge_parquet([self._read(key) for key in keys])
+            written.append(
+                self._write(
+                    f"{partition}/{COMPACTED_PREFIX}{uuid.uuid4().hex}.parquet", body
+                )
+            )
+            self._delete(keys)
+            logger.info(f"compacted {len(keys)} files of {partition}")
+        return written
+
+    def flush(self) -> T.Optional[str]:
+        """
+        Write the buffered rows into one Parquet file.
+
+        :return: where the file is written, None if nothing is written.
+        """
+        with self._lock:
+            rows, self._rows = self._rows, list()
+        if len(rows) == 0:
+            return None
+        try:
+            with metrics.timer("stage.write_build_timings"):
+                date = datetime.utcnow().strftime("%Y-%m-%d")
+                return self._write(
+                    f"date={date}/{uuid.uuid4().hex}.parquet",
+                    to_parquet(rows),
+                )
+        except Exception as e:
+            logger.error(f"failed to write {len(rows)} build timings: {e!r}")
+            return None
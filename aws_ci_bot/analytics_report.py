@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Build timing report, to size the CodeBuild compute types and the concurrent
+build limits.
+
+It loads the Parquet files written by :mod:`aws_ci_bot.analytics` into a
+pandas ``DataFrame``, and aggregates them with the vectorized group by
+operations, so it scales to millions of build job runs:
+
+- :func:`duration_report`: the number of builds, the failure rate, and the
+  p50 / p95 of the queue time and the run time per (project, branch type).
+- :func:`phase_report`: the p50 / p95 of each build phase per project.
+- :func:`queue_time_trend`: the p50 / p95 queue time per project per day
+  (or any pandas frequency).
+
+It requires the optional ``pandas`` and ``pyarrow`` dependencies, see
+``requirements-analytics.txt``. Reading from S3 also requires ``s3fs``.
+
+Usage::
+
+    from aws_ci_bot.analytics_report import load_build_timings, duration_report
+
+    df = load_build_timings("s3://my-bucket/aws_ci_bot/build_timings/")
+    print(duration_report(df))
+"""
+
+import typing as T
+
+from .analytics import PHASES, get_phase_column
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    import pandas as pd
+
+GROUP_BY = ["project_name", "branch_type"]
+QUANTILES = [0.5, 0.95]
+
+
+def load_build_timings(path: str) -> "pd.DataFrame":
+    """
+    Load the build timings from a Parquet file or folder. A redelivered
+    event may be recorded twice, only the last row of a build id is kept.
+    """
+    import pandas as pd
+
+    df = pd.read_parquet(path, engine="pyarrow")
+    # the hive partition column
+    df = df.drop(columns=["date"], errors="ignore")
+    return df.drop_duplicates(subset="build_id", keep="last").reset_index(drop=True)
+
+
+def _quantiles(
+    df: "pd.DataFrame",
+    by: T.Union[str, T.List[T.Any]],
+    columns: T.List[str],
+) -> "pd.DataFrame":
+    """
+    The p50 / p95 of each column, the result columns are
+    ``${column}_p50`` and ``${column}_p95``.
+    """
+    # a phase that never ran is an all null column
+    df = df.assign(**{column: df[column].astype("float64") for column in columns})
+    result = df.groupby(by)[columns].quantile(QUANTILES).unstack()
+    result.columns = [
+        f"{column}_p{int(round(quantile * 100))}"
+        for column, quantile in result.columns
+    ]
+    return result
+
+
+def duration_report(
+    df: "pd.DataFrame",
+    by: T.Optional[T.List[str]] = None,
+) -> "pd.DataFrame":
+    """
+    The build count, failure rate, and queue / run time percentiles per
+    (project, branch type).
+    """
+    if by is None:
+        by = GROUP_BY
+    df = df.assign(failed=df["build_status"].ne("SUCCEEDED"))
+    grouped = df.groupby(by)
+    summary = grouped["build_id"].size().rename("builds").to_frame()
+    summary["failure_rate"] = grouped["failed"].mean()
+    return summary.join(_quantiles(df, by, ["queue_seconds", "run_seconds"]))
+
+
+def phase_report(
+    df: "pd.DataFrame",
+    by: T.Union[str, T.List[str]] = "project_name",
+) -> "pd.DataFrame":
+    """
+    The p50 / p95 duration of each build phase.
+    """
+    columns = [
+        get_phase_column(phase) for phase in PHASES if get_phase_column(phase) in df
+    ]
+    return _quantiles(df, by, columns)
+
+
+def queue_time_trend(
+    df: "pd.DataFrame",
+    freq: str = "D",
+    by: str = "project_name",
+) -> "pd.DataFrame":
+    """
+    The p50 / p95 queue time per project per period, a growing p95 means the
+    concurrent build limit is too low.
+
+    :param freq: the pandas frequency string, ``D`` is daily, ``W`` is weekly.
+    """
+    import pandas as pd
+
+    return _quantiles(
+        df,
+        [by, pd.Grouper(key="event_time", freq=freq)],
+        ["queue_seconds"],
+    )
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""
+Offline compactor of the CI event archive.
+
+:func:`~aws_ci_bot.sns_event.upload_ci_event` stores each CI event as a tiny
+S3 object under a ``year=YYYY/month=MM/day=DD`` partition. After a while the
+archive bucket holds millions of tiny objects, and listing and reading them
+is slow and expensive. This module rolls all the per-event objects in a
+partition into one ``events.jsonl.gz`` file, one compact JSON event per line.
+The ``events.manifest.json`` file next to it lists the per-event objects
+already rolled into it, so running the compactor again without deleting the
+per-event objects doesn't duplicate the events.
+
+Example::
+
+    from boto_session_manager import BotoSesManager
+    from aws_ci_bot.archive import compact_archive
+
+    bsm = BotoSesManager()
+    compact_archive(
+        s3_client=bsm.s3_client,
+        bucket="my-bucket",
+        prefix="projects/aws_ci_bot/events/",
+        delete_source=True,
+    )
+"""
+
+import typing as T
+import gzip
+import json
+import dataclasses
+from datetime import datetime
+
+from .sns_event import encode_partition_key, decode_ci_event
+from . import logger
+
+COMPACTED_FILENAME = "events.jsonl.gz"
+MANIFEST_FILENAME = "events.manifest.json"
+
+
+def iter_s3_keys(
+    s3_client,
+    bucket: str,
+    prefix: str,
+) -> T.Iterable[str]:
+    """
+    Iterate all S3 keys under the given prefix, handle the pagination.
+    """
+    kwargs = dict(Bucket=bucket, Prefix=prefix)
+    while True:
+        res = s3_client.list_objects_v2(**kwargs)
+        for obj in res.get("Contents", []):
+            yield obj["Key"]
+        if res.get("IsTruncated"):
+            kwargs["ContinuationToken"] = res["NextContinuationToken"]
+        else:
+            break
+
+
+def is_event_key(key: str) -> bool:
+    """
+    Test if the S3 key is a per-event object created by
+    :func:`~aws_ci_bot.sns_event.upload_ci_event`.
+    """
+    return (
+        ("/year=" in key)
+        and (key.endswith(".json") or key.endswith(".json.gz"))
+        and not key.endswith(f"/{MANIFEST_FILENAME}")
+    )
+
+
+def get_partition_prefix(key: str) -> str:
+    """
+    Get the partition folder of a per-event object, it ends with ``/``.
+    For CodeBuild events, the partition also includes the build type
+    (single-build or batch-build).
+    """
+    return key.rsplit("/", 1)[0] + "/"
+
+
+def group_by_partition(keys: T.Iterable[str]) -> T.Dict[str, T.List[str]]:
+    """
+    Group the per-event object keys by partition. Keys in each group are
+    sorted, which is also the event time order.
+    """
+    groups = dict()
+    for key in keys:
+        if is_event_key(key):
+            groups.setdefault(get_partition_prefix(key), []).append(key)
+    for key_list in groups.values():
+        key_list.sort()
+    return groups
+
+
+def encode_jsonl_gz(event_dict_list: T.Iterable[dict]) -> bytes:
+    lines = [
+        json.dumps(event_dict, separators=(",", ":"))
+        for event_dict in event_dict_list
+    ]
+    if len(lines):
+        lines.append("")
+    return gzip.compress("\n".join(lines).encode("utf-8"))
+
+
+def decode_jsonl_gz(body: bytes) -> T.List[dict]:
+    return [
+        json.loads(line)
+        for line in gzip.decompress(body).decode("utf-8").splitlines()
+        if line.strip()
+    ]
+
+
+@dataclasses.dataclass
+class CompactResult:
+    """
+    The result of compacting one partition.
+
+    :param s3_uri: the compacted JSONL.gz file.
+    :param n_compacted: number of per-event objects rolled into the file in
+        this run.
+    :param n_total: number of events in the compacted file, it includes the
+        events from the previous compaction.
+    """
+
+    s3_uri: str = dataclasses.field()
+    n_compacted: int = dataclasses.field()
+    n_total: int = dataclasses.field()
+
+
+def _get_body(s3_client, bucket: str, key: str) -> bytes:
+    return s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+
+
+def read_manifest(s3_client, bucket: str, manifest_key: str) -> T.Set[str]:
+    """
+    Get the per-event object keys already rolled into the compacted file.
+    """
+    try:
+        body = _get_body(s3_client, bucket, manifest_key)
+    except s3_client.exceptions.NoSuchKey:
+        return set()
+    return set(json.loads(body)["keys"])
+
+
+def compact_partition(
+    s3_client,
+    bucket: str,
+    partition_prefix: str,
+    keys: T.Optional[T.List[str]] = None,
+    delete_source: bool = False,
+) -> T.Optional[CompactResult]:
+    """
+    Roll all per-event objects in a partition into one JSONL.gz file. If the
+    partition has been compacted before, the new events are appended after
+    the existing ones, the per-event objects listed in the manifest file are
+    skipped.
+
+    :param s3_client:
+    :param bucket:
+    :param partition_prefix: the partition folder, ends with ``/``.
+    :param keys: the per-event object keys in this partition, if not given,
+        list them from S3.
+    :param delete_source: if True, delete the per-event objects after the
+        compacted file is written.
+
+    :return: None if there's nothing new to compact.
+    """
+    if keys is None:
+        keys = sorted(
+            key
+            for key in iter_s3_keys(s3_client, bucket, partition_prefix)
+            if is_event_key(key) and get_partition_prefix(key) == partition_prefix
+        )
+    compacted_key = f"{partition_prefix}{COMPACTED_FILENAME}"
+    manifest_key = f"{partition_prefix}{MANIFEST_FILENAME}"
+    if len(keys):
+        compacted_keys = read_manifest(s3_client, bucket, manifest_key)
+        new_keys = [key for key in keys if key not in compacted_keys]
+    else:
+        new_keys = list()
+    if len(new_keys) == 0:
+        return None
+
+    try:
+        event_dict_list = decode_jsonl_gz(
+            _get_body(s3_client, bucket, compacted_key)
+        )
+    except s3_client.exceptions.NoSuchKey:
+        event_dict_list = list()
+
+    for key in new_keys:
+        event_dict_list.append(decode_ci_event(_get_body(s3_client, bucket, key)))
+
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=compacted_key,
+        Body=encode_jsonl_gz(event_dict_list),
+        ContentType="application/x-ndjson",
+    )
+    # written after the compacted file, a crash in between duplicates the
+    # new events in the next run instead of losing them. The deleted
+    # per-event objects are not listed anymore, so it doesn't keep growing.
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=manifest_key,
+        Body=json.dumps({"keys": sorted(keys)}),
+        ContentType="application/json",
+    )
+    s3_uri = f"s3://{bucket}/{compacted_key}"
+    logger.info(f"compacted {len(new_keys)} events into {s3_uri}")
+
+    if delete_source:
+        # the DeleteObjects API takes at most 1000 keys per call
+        for i in range(0, len(keys), 1000):
+            s3_client.delete_objects(
+                Bucket=bucket,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[i : i + 1000]],
+                    "Quiet": True,
+                },
+            )
+
+    return CompactResult(
+        s3_uri=s3_uri,
+        n_compacted=len(new_keys),
+        n_total=len(event_dict_list),
+    )
+
+
+def compact_archive(
+    s3_client,
+    bucket: str,
+    prefix: str,
+    date: T.Optional[datetime] = None,
+    delete_source: bool = False,
+) -> T.List[CompactResult]:
+    """
+    Compact all partitions under the archive prefix.
+
+    :param s3_client:
+    :param bucket:
+    :param prefix: the ``S3_PREFIX`` of the Lambda function.
+    :param date: if given, only compact the partitions of this day. You may
+        want to skip today's partition, because events are still arriving.
+    :param delete_source: if True, delete the per-event objects after the
+        compacted file is written.
+    """
+    if not prefix.endswith("/"):
+        prefix = prefix + "/"
+    groups = group_by_partition(iter_s3_keys(s3_client, bucket, prefix))
+    if date is not None:
+        partition_key = f"/{encode_partition_key(date)}/"
+        groups = {
+            partition_prefix: keys
+            for partition_prefix, keys in groups.items()
+            if partition_key in partition_prefix
+        }
+    results = list()
+    for partition_prefix in sorted(groups):
+        result = compact_partition(
+            s3_client=s3_client,
+            bucket=bucket,
+            partition_prefix=partition_prefix,
+            keys=groups[partition_prefix],
+            delete_source=delete_source,
+        )
+        if result is not None:
+            results.append(result)
+    return results
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+Process multiple records of one Lambda invocation concurrently.
+
+Each record is handled in its own thread, a failure of one record never
+affects the other records.
+"""
+
+import typing as T
+import enum
+import traceback
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+
+from . import logger
+
+
+class RecordStatusEnum(str, enum.Enum):
+    succeeded = "succeeded"
+    failed = "failed"
+
+
+@dataclasses.dataclass
+class RecordResult:
+    """
+    The processing result of one record.
+
+    :param index: the index of the record in the batch.
+    :param status: succeeded or failed.
+    :param error: the error message if failed.
+    :param record_id: an optional identifier of the record, for example the
+        SNS message id.
+    """
+
+    index: int = dataclasses.field()
+    status: str = dataclasses.field()
+    error: T.Optional[str] = dataclasses.field(default=None)
+    record_id: T.Optional[str] = dataclasses.field(default=None)
+
+    @property
+    def is_succeeded(self) -> bool:
+        return self.status == RecordStatusEnum.succeeded
+
+    def to_dict(self) -> dict:
+        return dataclasses.asdict(self)
+
+
+def _process_one(
+    func: T.Callable[[T.Any], T.Any],
+    index: int,
+    record: T.Any,
+) -> RecordResult:
+    try:
+        func(record)
+        return RecordResult(index=index, status=RecordStatusEnum.succeeded.value)
+    except Exception as e:
+        logger.error(f"failed to process record {index}: {e!r}")
+        logger.error(traceback.format_exc())
+        return RecordResult(
+            index=index,
+            status=RecordStatusEnum.failed.value,
+            error=f"{e.__class__.__name__}: {e}",
+        )
+
+
+def process_records(
+    records: T.List[T.Any],
+    func: T.Callable[[T.Any], T.Any],
+    max_workers: int = 4,
+) -> T.List[RecordResult]:
+    """
+    Call ``func(record)`` for each record on a bounded thread pool.
+
+    :param records: list of record to process.
+    :param func: the function to process one record.
+    :param max_workers: the maximum number of concurrent threads.
+
+    :return: the list of :class:`RecordResult`, in the same order as the
+        input records.
+    """
+    if len(records) == 0:
+        return []
+    if len(records) == 1 or max_workers <= 1:
+        return [
+            _process_one(func, index, record)
+            for index, record in enumerate(records)
+        ]
+    max_workers = min(max_workers, len(records))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_process_one, func, index, record)
+            for index, record in enumerate(records)
+        ]
+        return [future.result() for future in futures]
+
+
+def summarize(results: T.List[RecordResult]) -> dict:
+    """
+    Create a JSON serializable summary of the batch processing results.
+    """
+    n_succeeded = sum(1 for result in results if result.is_succeeded)
+    return {
+        "total": len(results),
+        "succeeded": n_succeeded,
+        "failed": len(results) - n_succeeded,
+        "records": [result.to_dict() for result in results],
+    }
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+"""
+Per child build report of a batch build.
+
+A batch build runs many child builds, but its state change event only tells
+the overall status. When a batch build job run finishes, the CodeBuild event
+handler fetches the child build ids with one ``BatchGetBuildBatches`` call,
+and the child builds with ``BatchGetBuilds`` calls, then renders a table of
+the status and the duration of each child build in the status reply, or
+below the table of the summary comment.
+
+``BatchGetBuilds`` accepts at most :data:`MAX_IDS_PER_CALL` ids per call, so
+the ids are split into chunks, and the chunks of a very large batch are
+fetched on a small thread pool.
+"""
+
+import typing as T
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+
+from aws_codebuild import BuildJobRun
+
+from .throttle import call_api
+from .summary_comment import status_emoji_mapper
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+
+MAX_IDS_PER_CALL = 100
+
+
+def chunk(items: T.List[T.Any], size: int = MAX_IDS_PER_CALL) -> T.List[T.List[T.Any]]:
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def get_build_id_from_arn(arn: str) -> str:
+    """
+    ``arn:aws:codebuild:${region}:${account}:build/${project}:${run_id}``
+    -> ``${project}:${run_id}``
+    """
+    return arn.split("/", 1)[1]
+
+
+def format_duration(seconds: T.Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    seconds = int(round(seconds))
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes}m {seconds}s"
+    if minutes:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+
+@dataclasses.dataclass
+class ChildBuild:
+    """
+    One child build of a batch build.
+
+    :param identifier: the build graph / list / matrix identifier.
+    :param build_id: the ``${project_name}:${run_id}`` build id.
+    :param console_url: the child build console url.
+    :param status: the CodeBuild build status.
+    :param duration_seconds: None if the child build is not finished.
+    """
+
+    identifier: str = dataclasses.field()
+    build_id: str = dataclasses.field()
+    console_url: str = dataclasses.field()
+    status: str = dataclasses.field()
+    duration_seconds: T.Optional[float] = dataclasses.field(default=None)
+
+    def to_markdown(self) -> str:
+        emoji = status_emoji_mapper.get(self.status, "")
+        return (
+            f"| {self.identifier} | [{self.build_id}]({self.console_url}) "
+            f"| {emoji} {self.status} | {format_duration(self.duration_seconds)} |"
+        )
+
+
+def get_child_build_arns(
+    bsm: "BotoSesManager",
+    batch_id: str,
+) -> T.List[T.Tuple[str, str]]:
+    """
+    :return: the (identifier, build arn) of the current child builds.
+    """
+    res = call_api(
+        "codebuild.batch_get_build_batches",
+        bsm.codebuild_client.batch_get_build_batches,
+        ids=[batch_id],
+    )
+    if len(res["buildBatches"]) == 0:
+        raise ValueError(f"build batch {batch_id!r} not found")
+    return [
+        (group["identifier"], group["currentBuildSummary"]["arn"])
+        for group in res["buildBatches"][0].get("buildGroups", [])
+        if "currentBuildSummary" in group
+    ]
+
+
+def batch_get_builds(
+    bsm: "BotoSesManager",
+    build_ids: T.List[str],
+    max_workers: int = 4,
+) -> T.Dict[str, dict]:
+    """
+    Get the builds by id, :data:`MAX_IDS_PER_CALL` ids per API call.
+
+    :return: build id -> build data, the not found build is not included.
+    """
+
+    def get_builds(ids: T.List[str]) -> T.List[dict]:
+        return call_api(
+            "codebuild.batch_get_builds",
+            bsm.codebuild_client.batch_get_builds,
+            ids=ids,
+        )["builds"]
+
+    chunks = chunk(build_ids)
+    if len(chunks) <= 1 or max_workers <= 1:
+        results = [get_builds(ids) for ids in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            results = list(executor.map(get_builds, chunks))
+    return {build["id"]: build for builds in results for build in builds}
+
+
+def get_child_builds(
+    bsm: "BotoSesManager",
+    batch_id: str,
+    max_workers: int = 4,
+) -> T.List[ChildBuild]:
+    """
+    Get the current child builds of a batch build, in the build group order.
+    """
+    identifier_and_arn_list = get_child_build_arns(bsm, batch_id)
+    builds = batch_get_builds(
+        bsm,
+        [get_build_id_from_arn(arn) for _, arn in identifier_and_arn_list],
+        max_workers=max_workers,
+    )
+    child_builds = list()
+    for identifier, arn in identifier_and_arn_list:
+        build_id = get_build_id_from_arn(arn)
+        build = builds.get(build_id, {})
+        if "startTime" in build and "endTime" in build:
+            duration = (build["endTime"] - build["startTime"]).total_seconds()
+        else:
+            duration = None
+        child_builds.append(
+            ChildBuild(
+                identifier=identifier,
+                build_id=build_id,
+                console_url=BuildJobRun.from_arn(arn).console_url,
+                status=build.get("buildStatus", "UNKNOWN"),
+                duration_seconds=duration,
+            )
+        )
+    return child_builds
+
+
+def render_batch_report(child_builds: T.List[ChildBuild]) -> str:
+    lines = [
+        "| child build | build run | status | duration |",
+        "| --- | --- | --- | --- |",
+    ]
+    lines.extend(child_build.to_markdown() for child_build in child_builds)
+    return "\n".join(lines)
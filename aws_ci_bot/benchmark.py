@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the Lambda function end to end.
+
+It drives :func:`aws_ci_bot.lbd.lambda_handler` with a synthetic corpus of
+CodeCommit and CodeBuild SNS events (see :func:`aws_ci_bot.corpus.generate_corpus`)
+against the in-memory AWS stand-in, and reports:
+
+- p50 / p95 / p99 latency, overall and per event type.
+- number of AWS API calls per event type.
+- peak memory allocated by Python, measured by ``tracemalloc``.
+
+The result is a JSON file, so you can keep it with each release and compare
+them to catch regressions::
+
+    python -m aws_ci_bot.benchmark --n-events 2000 --output benchmark.json
+"""
+
+import typing as T
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import dataclasses
+import collections
+from datetime import datetime
+
+from ._version import __version__
+from .config import Config
+from .sns_event import extract_sns_message_dict
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .local_aws import LocalBotoSesManager
+
+
+def percentile(values: T.List[float], q: float) -> float:
+    """
+    The q-th percentile (0 - 100) of the values, with linear interpolation
+    between the closest ranks.
+    """
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    k = (len(values) - 1) * q / 100
+    f = int(k)
+    c = min(f + 1, len(values) - 1)
+    return values[f] + (values[c] - values[f]) * (k - f)
+
+
+def get_event_type(message_dict: dict) -> str:
+    """
+    Get a human-readable event type of the CodeStar notification event, it is
+    the key to group the benchmark result.
+    """
+    if message_dict["source"] == "aws.codecommit":
+        from aws_codecommit import CodeCommitEvent
+
+        return f"codecommit.{CodeCommitEvent.from_event(message_dict).event_type}"
+    elif message_dict["source"] == "aws.codebuild":
+        detail = message_dict["detail"]
+        if "build-status" in detail:
+            return f"codebuild.state_change.{detail['build-status']}"
+        else:
+            return "codebuild.phase_change"
+    else:  # pragma: no cover
+        return "unknown"
+
+
+@dataclasses.dataclass
+class LatencyStats:
+    """
+    Latency statistics in milliseconds.
+    """
+
+    count: int = dataclasses.field()
+    mean: float = dataclasses.field()
+    p50: float = dataclasses.field()
+    p95: float = dataclasses.field()
+    p99: float = dataclasses.field()
+    max: float = dataclasses.field()
+
+    @classmethod
+    def from_values(cls, values: T.List[float]) -> "LatencyStats":
+        return cls(
+            count=len(values),
+            mean=sum(values) / len(values) if values else 0.0,
+            p50=percentile(values, 50),
+            p95=percentile(values, 95),
+            p99=percentile(values, 99),
+            max=max(values) if values else 0.0,
+        )
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    """
+    :param latency: overall latency stats.
+    :param event_types: per event type latency stats and API call counts.
+    :param peak_memory: peak memory in bytes while handling the corpus.
+    """
+
+    n_events: int = dataclasses.field()
+    elapsed: float = dataclasses.field()
+    failed: int = dataclasses.field()
+    latency: LatencyStats = dataclasses.field()
+    event_types: T.Dict[str, dict] = dataclasses.field()
+    peak_memory: T.Optional[int] = dataclasses.field(default=None)
+    metadata: dict = dataclasses.field(default_factory=dict)
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.n_events / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "metadata": self.metadata,
+            "n_events": self.n_events,
+            "failed": self.failed,
+            "elapsed": self.elapsed,
+            "events_per_sec": self.events_per_sec,
+            "peak_memory": self.peak_memory,
+            "latency_ms": dataclasses.asdict(self.latency),
+            "event_types": self.event_types,
+        }
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4, sort_keys=True)
+
+
+def _run_once(
+    events: T.List[dict],
+    bsm: "LocalBotoSesManager",
+    config: Config,
+) -> T.Tuple[T.List[T.Tuple[str, float, T.Counter[str]]], int]:
+    """
+    Handle the events one by one, return the (event type, latency in ms,
+    api calls) of each event and the number of failed events.
+    """
+    from . import lbd
+    from .code_build_config import clear_cache
+    from .replay import patch_lambda_handler
+
+    # start with a cold cache, so every run is comparable
+    clear_cache()
+    records = list()
+    failed = 0
+    with patch_lambda_handler(bsm=bsm, config=config):
+        for event in events:
+            event_type = get_event_type(extract_sns_message_dict(event))
+            before = bsm.call_counter
+            start = time.perf_counter()
+            try:
+                lbd.lambda_handler(event, None)
+            except Exception:
+                failed += 1
+            latency = (time.perf_counter() - start) * 1000
+            api_calls = bsm.call_counter
+            api_calls.subtract(before)
+            records.append((event_type, latency, +api_calls))
+    return records, failed
+
+
+def run_benchmark(
+    n_events: int = 1000,
+    n_repos: int = 5,
+    seed: int = 1,
+    latency: float = 0.0,
+    config: T.Optional[Config] = None,
+    measure_memory: bool = True,
+) -> BenchmarkResult:
+    """
+    Run the benchmark.
+
+    :param n_events: number of events in the corpus.
+    :param n_repos: number of git repos in the corpus.
+    :param seed: random seed of the corpus.
+    :param latency: simulated latency of each AWS API call in seconds.
+    :param config: the Lambda function config, by default it archives the
+        event to a local bucket.
+    :param measure_memory: if True, handle the corpus again with ``tracemalloc``
+        on to measure the peak memory. It is not measured in the latency run,
+        because ``tracemalloc`` slows down the code a lot.
+    """
+    from .corpus import generate_corpus
+    from .local_aws import LocalBotoSesManager
+    from .replay import LOCAL_BUCKET
+
+    if config is None:
+        config = Config(s3_bucket=LOCAL_BUCKET, s3_prefix="benchmark")
+    corpus = generate_corpus(n_events=n_events, n_repos=n_repos, seed=seed)
+
+    bsm = LocalBotoSesManager(latency=latency)
+    corpus.setup(bsm)
+    start = time.perf_counter()
+    records, failed = _run_once(corpus.events, bsm, config)
+    elapsed = time.perf_counter() - start
+
+    latency_by_type: T.Dict[str, T.List[float]] = collections.defaultdict(list)
+    api_calls_by_type: T.Dict[str, T.Counter[str]] = collections.defaultdict(
+        collections.Counter
+    )
+    for event_type, ms, api_calls in records:
+        latency_by_type[event_type].append(ms)
+        api_calls_by_type[event_type].update(api_calls)
+    event_types = dict()
+    for event_type in sorted(latency_by_type):
+        count = len(latency_by_type[event_type])
+        event_types[event_type] = {
+            "latency_ms": dataclasses.asdict(
+                LatencyStats.from_values(latency_by_type[event_type])
+            ),
+            "api_calls": dict(sorted(api_calls_by_type[event_type].items())),
+            "api_calls_per_event": sum(api_calls_by_type[event_type].values())
+            / count,
+        }
+
+    peak_memory = None
+    if measure_memory:
+        bsm = LocalBotoSesManager(latency=latency)
+        corpus.setup(bsm)
+        tracemalloc.start()
+        try:
+            _run_once(corpus.events, bsm, config)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return BenchmarkResult(
+        n_events=len(corpus.events),
+        elapsed=elapsed,
+        failed=failed,
+        latency=LatencyStats.from_values([ms for _, ms, _ in records]),
+        event_types=event_types,
+        peak_memory=peak_memory,
+        metadata={
+            "aws_ci_bot_version": __version__,
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "created_at": datetime.utcnow().isoformat(),
+            "n_repos": n_repos,
+            "seed": seed,
+            "api_latency": latency,
+            "config": dataclasses.asdict(config),
+        },
+    )
+
+
+def main(args: T.Optional[T.List[str]] = None):  # pragma: no cover
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--n-events", type=int, default=1000)
+    parser.add_argument("--n-repos", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="simulated AWS API latency"
+    )
+    parser.add_argument("--output", help="path to the JSON result file")
+    parser.add_argument("--no-memory", action="store_true")
+    ns = parser.parse_args(args)
+
+    result = run_benchmark(
+        n_events=ns.n_events,
+        n_repos=ns.n_repos,
+        seed=ns.seed,
+        latency=ns.latency,
+        measure_memory=not ns.no_memory,
+    )
+    if ns.output:
+        result.write(ns.output)
+    json.dump(result.to_dict(), sys.stdout, indent=4, sort_keys=True)
+    print()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+A thread safe in-memory LRU cache with item count limit, memory limit and
+TTL. The module level cache lives as long as the Lambda container, so the
+warm invocations can reuse the data fetched by the previous invocations.
+"""
+
+import typing as T
+import sys
+import time
+import threading
+import dataclasses
+import collections
+
+from .metrics import metrics
+
+_MISSING = object()
+
+
+def get_size(value: T.Any) -> int:
+    """
+    Estimate the memory size of a value in bytes. It is only used to enforce
+    the memory limit, it doesn't have to be precise.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int = dataclasses.field(default=0)
+    misses: int = dataclasses.field(default=0)
+    evictions: int = dataclasses.field(default=0)
+    expirations: int = dataclasses.field(default=0)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class LRUCache:
+    """
+    :param name: the cache name, the hit and miss are also emitted as
+        ``cache.${name}.hit`` and ``cache.${name}.miss`` metrics.
+    :param max_items: maximum number of items, 0 disables the cache.
+    :param max_bytes: maximum total size of the items, None means no limit.
+    :param ttl: time to live in seconds, None means never expire.
+    :param clock: the time function, it is only for testing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_items: int = 256,
+        max_bytes: T.Optional[int] = None,
+        ttl: T.Optional[float] = None,
+        clock: T.Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        # key -> (value, size, expire at)
+        self._data: T.OrderedDict[
+            T.Hashable, T.Tuple[T.Any, int, T.Optional[float]]
+        ] = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._bytes
+
+    def _pop(self, key: T.Hashable):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: T.Hashable, default: T.Any = None) -> T.Any:
+        with self._lock:
+            value = _MISSING
+            item = self._data.get(key)
+            if item is not None:
+                expire_at = item[2]
+                if expire_at is not None and self.clock() >= expire_at:
+                    self._pop(key)
+                    self.stats.expirations += 1
+                else:
+                    self._data.move_to_end(key)
+                    value = item[0]
+            if value is _MISSING:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+        if value is _MISSING:
+            metrics.put(f"cache.{self.name}.miss", 1)
+            return default
+        else:
+            metrics.put(f"cache.{self.name}.hit", 1)
+            return value
+
+    def set(self, key: T.Hashable, value: T.Any, size: T.Optional[int] = None):
+        if self.max_items <= 0:
+            return
+        if size is None:
+            size = get_size(value)
+        # never cache an item larger than the memory limit
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        expire_at = None if self.ttl is None else self.clock() + self.ttl
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (value, size, expire_at)
+            self._bytes += size
+            while len(self._data) > self.max_items or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                self._pop(next(iter(self._data)))
+                self.stats.evictions += 1
+
+    def configure(
+        self,
+        max_items: int,
+        max_bytes: T.Optional[int] = None,
+        ttl: T.Optional[float] = None,
+    ):
+        """
+        Change the limits, it clears the cache.
+        """
+        with self._lock:
+            self.max_items = max_items
+            self.max_bytes = max_bytes
+            self.ttl = ttl
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self.stats = CacheStats()
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.stats.hits,
+            "misses": self.stats.misses,
+            "evictions": self.stats.evictions,
+            "expirations": self.stats.expirations,
+            "hit_rate": self.stats.hit_rate,
+        }
@@ -19,6 +19,12 @@ class CIData:
         CodeCommit event. it will send to the Environment Variable for CodeBuild
         job run, and all of sub-sequence CodeBuild event will reply
         to this comment.
+    :param comment_mode: if it is ``summary``, the comment is a summary
+        comment of all build job runs, and the CodeBuild event updates the
+        status in it instead of replying to it.
+    :param build_job_key: the identity of the build job, see
+        :func:`aws_ci_bot.result_cache.get_build_job_key`. It is set if the
+        build result cache or the supersede mode is enabled.
 
     All attributes have a default value None, because if it is None,
     it won't be used in environment variable
@@ -27,6 +33,7 @@ class CIData:
     event_s3_uri: T.Optional[str] = dataclasses.field(default=None)
     event_type: T.Optional[str] = dataclasses.field(default=None)
     comment_id: T.Optional[str] = dataclasses.field(default=None)
+    comment_mode: T.Optional[str] = dataclasses.field(default=None)
     commit_id: T.Optional[str] = dataclasses.field(default=None)
     commit_message: T.Optional[str] = dataclasses.field(default=None)
     committer_name: T.Optional[str] = dataclasses.field(default=None)
@@ -36,6 +43,7 @@ class CIData:
     pr_to_branch: T.Optional[str] = dataclasses.field(default=None)
     pr_from_commit_id: T.Optional[str] = dataclasses.field(default=None)
     pr_to_commit_id: T.Optional[str] = dataclasses.field(default=None)
+    build_job_key: T.Optional[str] = dataclasses.field(default=None)
 
     def to_env_var(
         self,
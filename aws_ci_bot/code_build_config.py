@@ -6,25 +6,63 @@ CodeBuild project the git repo should use to run CI job.
 """
 
 import typing as T
+import fnmatch
 import dataclasses
 
-from superjson import json
 from aws_codecommit import better_boto
 from boto_session_manager import BotoSesManager
 
+from .cache import LRUCache
+from .throttle import call_api
 from . import logger
 
+# (repo name, commit id) -> blob id of the ``codebuild-config.json`` file.
+# A commit is immutable, so the mapping never changes.
+blob_id_cache = LRUCache(name="codebuild_config_blob_id")
+# blob id -> parsed :class:`CodebuildConfig`, the size is the file size
+config_cache = LRUCache(name="codebuild_config")
+
+
+def configure_cache(
+    max_items: int = 256,
+    max_bytes: int = 1_000_000,
+    ttl: int = 3600,
+):
+    """
+    Change the ``codebuild-config.json`` cache limits, it clears the cache.
+    See the ``config_cache_*`` settings of :class:`aws_ci_bot.config.Config`.
+    """
+    blob_id_cache.configure(max_items=max_items * 4, ttl=ttl)
+    config_cache.configure(max_items=max_items, max_bytes=max_bytes, ttl=ttl)
+
+
+configure_cache()
+
 
 @dataclasses.dataclass
 class BuildJobConfig:
     """
     Per CodeBuild project configuration. One git repo can map to multiple
     CodeBuild projects.
+
+    :param include_paths: list of file path glob patterns, the job only runs
+        if any changed file matches one of them. Empty list means all files.
+        The glob follows the :mod:`fnmatch` rules, ``*`` also matches ``/``,
+        so ``services/api/*`` matches all files under the folder.
+    :param exclude_paths: list of file path glob patterns, the changed files
+        matching any of them are ignored.
+    :param reuse_result: if True, skip the job when it already passed on the
+        same git tree, see :mod:`aws_ci_bot.result_cache`. Only turn it on if
+        the job does not depend on the event type or the target branch, for
+        example a unit test job, never a deploy job.
     """
     project_name: str = dataclasses.field()
     is_batch_job: bool = dataclasses.field()
     buildspec: T.Optional[str] = dataclasses.field(default=None)
     env_var: dict = dataclasses.field(default_factory=dict)
+    include_paths: T.List[str] = dataclasses.field(default_factory=list)
+    exclude_paths: T.List[str] = dataclasses.field(default_factory=list)
+    reuse_result: bool = dataclasses.field(default=False)
 
     @classmethod
     def from_dict(cls, dct: dict) -> "BuildJobConfig":
@@ -33,8 +71,35 @@ class BuildJobConfig:
             is_batch_job=dct["is_batch_job"],
             buildspec=dct.get("buildspec"),
             env_var=dct.get("env_var", {}),
+            include_paths=dct.get("include_paths", []),
+            exclude_paths=dct.get("exclude_paths", []),
+            reuse_result=dct.get("reuse_result", False),
+        )
+
+    @property
+    def has_path_filter(self) -> bool:
+        return bool(self.include_paths or self.exclude_paths)
+
+    def is_path_matched(self, path: str) -> bool:
+        if self.include_paths and not any(
+            fnmatch.fnmatchcase(path, pattern) for pattern in self.include_paths
+        ):
+            return False
+        return not any(
+            fnmatch.fnmatchcase(path, pattern) for pattern in self.exclude_paths
         )
 
+    def should_run(self, changed_files: T.Optional[T.Iterable[str]]) -> bool:
+        """
+        Test if any changed file matches the path filter.
+
+        :param changed_files: None means we don't know what is changed, then
+            the job always runs.
+        """
+        if changed_files is None or not self.has_path_filter:
+            return True
+        return any(self.is_path_matched(path) for path in changed_files)
+
 
 @dataclasses.dataclass
 class CodebuildConfig:
@@ -56,7 +121,9 @@ class CodebuildConfig:
                     "env_var": {
                         "key1": "value1",
                         "key2": "value2"
-                    }
+                    },
+                    "include_paths": ["services/api/*"],
+                    "exclude_paths": ["*.md"]
                 },
                 {
                     ...
@@ -83,16 +150,49 @@ class CodebuildConfig:
 
         Read more about the :class:`~aws_ci_bot.code_build_config.CodebuildConfig`
         file.
+
+        The parsed file is cached in the warm Lambda container. If we have
+        seen this commit before, it skips the ``GetFile`` API call. If the
+        file content (blob id) is unchanged, it skips the JSON parsing.
+        The returned object is shared, don't modify it.
         """
         file_path = "codebuild-config.json"
-        logger.info(f"Get codebuild config from {file_path!r}")
 
-        file = better_boto.get_file(
+        blob_id = blob_id_cache.get((repo_name, commit_id))
+        if blob_id is not None:
+            cb_config = config_cache.get(blob_id)
+            if cb_config is not None:
+                logger.info(f"Use cached codebuild config {file_path!r}")
+                return cb_config
+
+        logger.info(f"Get codebuild config from {file_path!r}")
+        file = call_api(
+            "codecommit.get_file",
+            better_boto.get_file,
             bsm=bsm,
             repo_name=repo_name,
             file_path=file_path,
             commit_id=commit_id,
         )
-        return CodebuildConfig.from_dict(
-            json.loads(file.get_text(), ignore_comments=True)
-        )
+        blob_id_cache.set((repo_name, commit_id), file.blob_id, size=0)
+
+        cb_config = config_cache.get(file.blob_id)
+        if cb_config is None:
+            # superjson is only needed when we trigger build, import it lazily
+            # to reduce the Lambda cold start time
+            from superjson import json
+
+            content = file.get_text()
+            cb_config = CodebuildConfig.from_dict(
+                json.loads(content, ignore_comments=True)
+            )
+            config_cache.set(file.blob_id, cb_config, size=len(content))
+        return cb_config
+
+
+def clear_cache():
+    """
+    Clear the ``codebuild-config.json`` cache.
+    """
+    blob_id_cache.clear()
+    config_cache.clear()
@@ -4,6 +4,7 @@
 This module defines the CodeBuild event handling logics.
 """
 
+import typing as T
 import dataclasses
 
 from aws_codecommit import better_boto
@@ -15,7 +16,16 @@ from aws_codebuild import (
 from boto_session_manager import BotoSesManager
 
 from . import logger
+from .metrics import metrics
+from .throttle import call_api
 from .ci_data import CIData
+from .idempotency import Idempotency, claim, get_codebuild_key
+from .supersede import Supersede, get_repo_name_from_source_location
+from .admission import Admission
+from .result_cache import ResultCache, BuildResult
+from .batch_report import get_child_builds, render_batch_report
+from .analytics import BuildTiming, BuildTimingSink
+from .summary_comment import CommentModeEnum, update_summary_comment_status
 from .codebuild_rule import CodeBuildHandlerActionEnum, check_what_to_do
 
 
@@ -30,6 +40,22 @@ class CodeBuildEventHandler:
     :param s3_console_url: where the original event is stored.
     :param s3_uri: where the original event is stored.
     :param build_job_run: the CodeBuild job run object.
+    :param idempotency: if given, a duplicated event doesn't post the build
+        status again. See :mod:`aws_ci_bot.idempotency`.
+    :param supersede: if given, stop tracking the finished build job run.
+        See :mod:`aws_ci_bot.supersede`.
+    :param admission: if given, release the slot of the finished build job
+        run and start the queued ones. See :mod:`aws_ci_bot.admission`.
+    :param result_cache: if given, record the succeeded build job run, so
+        the same build job on the same git tree can reuse it.
+        See :mod:`aws_ci_bot.result_cache`.
+    :param batch_report: if True, the status reply of a batch build job run
+        has a table of the status and the duration of each child build.
+        See :mod:`aws_ci_bot.batch_report`.
+    :param batch_report_max_workers: the thread pool size to fetch the
+        child builds of a very large batch build.
+    :param build_timings: if given, record the timing of the finished build
+        job run. See :mod:`aws_ci_bot.analytics`.
     """
 
     bsm: BotoSesManager = dataclasses.field()
@@ -37,6 +63,13 @@ class CodeBuildEventHandler:
     s3_console_url: str = dataclasses.field()
     s3_uri: str = dataclasses.field()
     build_job_run: BuildJobRun = dataclasses.field()
+    idempotency: T.Optional[Idempotency] = dataclasses.field(default=None)
+    supersede: T.Optional[Supersede] = dataclasses.field(default=None)
+    admission: T.Optional[Admission] = dataclasses.field(default=None)
+    result_cache: T.Optional[ResultCache] = dataclasses.field(default=None)
+    batch_report: bool = dataclasses.field(default=False)
+    batch_report_max_workers: int = dataclasses.field(default=4)
+    build_timings: T.Optional[BuildTimingSink] = dataclasses.field(default=None)
 
     def log_cb_event(self):
         logger.header("Handle CodeBuild event", "-", 60)
@@ -44,9 +77,98 @@ class CodeBuildEventHandler:
         logger.info(f"- detected event type = {self.cb_event.event_type!r}")
         logger.info(f"- build job run url = {self.cb_event.console_url}")
 
+    def release_inflight_build(self, ci_data: CIData):
+        if self.supersede is None or not ci_data.pr_id or not ci_data.build_job_key:
+            return
+        self.supersede.release(
+            repo_name=get_repo_name_from_source_location(
+                self.cb_event.source_location
+            ),
+            pr_id=ci_data.pr_id,
+            build_job_key=ci_data.build_job_key,
+            build_arn=self.build_job_run.arn,
+        )
+
+    def release_admission_slot(self):
+        if self.admission is None:
+            return
+        self.admission.release(
+            bsm=self.bsm,
+            project_name=self.build_job_run.project_name,
+            build_id=f"{self.build_job_run.project_name}:{self.build_job_run.run_id}",
+        )
+
+    def record_build_result(self, ci_data: CIData):
+        """
+        Record the succeeded build job run. The error is logged but not
+        raised, the build result cache is best effort.
+        """
+        if (
+            self.result_cache is None
+            or not ci_data.build_job_key
+            or not ci_data.commit_id
+            or not self.cb_event.is_build_status_SUCCEEDED()
+        ):
+            return
+        try:
+            self.result_cache.put(
+                bsm=self.bsm,
+                repo_name=get_repo_name_from_source_location(
+                    self.cb_event.source_location
+                ),
+                build_job_key=ci_data.build_job_key,
+                result=BuildResult(
+                    build_id=f"{self.build_job_run.project_name}:{self.build_job_run.run_id}",
+                    console_url=self.build_job_run.console_url,
+                    commit_id=ci_data.commit_id,
+                ),
+            )
+        except Exception as e:
+            logger.error(f"failed to record the build result: {e!r}")
+
+    def record_build_timing(self, ci_data: CIData):
+        """
+        Record the timing of the finished build job run. The error is logged
+        but not raised, the analytics is best effort.
+        """
+        if self.build_timings is None:
+            return
+        try:
+            self.build_timings.add(BuildTiming.from_cb_event(self.cb_event, ci_data))
+        except Exception as e:
+            logger.error(f"failed to record the build timing: {e!r}")
+
+    def get_batch_report(self) -> T.Optional[str]:
+        """
+        Render the child builds table of a batch build job run. The error is
+        logged but not raised, the status is still posted without the table.
+        """
+        if not (self.batch_report and self.build_job_run.is_batch):
+            return None
+        try:
+            child_builds = get_child_builds(
+                bsm=self.bsm,
+                batch_id=f"{self.build_job_run.project_name}:{self.build_job_run.run_id}",
+                max_workers=self.batch_report_max_workers,
+            )
+        except Exception as e:
+            logger.error(f"failed to get the child builds: {e!r}")
+            return None
+        if len(child_builds) == 0:
+            return None
+        return render_batch_report(child_builds)
+
     def post_build_status_to_comment(self):
         ci_data = CIData.from_env_var(self.cb_event.plain_text_env_var)
+        self.release_inflight_build(ci_data)
+        self.record_build_result(ci_data)
+        self.record_build_timing(ci_data)
         if ci_data.comment_id:
+            with metrics.timer("stage.get_batch_report"):
+                report = self.get_batch_report()
+            if ci_data.comment_mode == CommentModeEnum.summary.value:
+                self.update_summary_comment(ci_data.comment_id, report=report)
+                return
             if self.cb_event.is_build_status_SUCCEEDED():
                 comment = "🟢 Build Run SUCCEEDED"
             elif self.cb_event.is_build_status_FAILED():
@@ -55,18 +177,39 @@ class CodeBuildEventHandler:
                 comment = "⚫ Build Run STOPPED"
             else:  # pragma: no cover
                 raise NotImplementedError
+            if report is not None:
+                comment = f"{comment}\n\n{report}"
             logger.info(
                 f"  post status {self.cb_event.build_status!r} to comment {ci_data.comment_id!r}"
             )
-            better_boto.post_comment_reply(
+            call_api(
+                "codecommit.post_comment_reply",
+                better_boto.post_comment_reply,
                 bsm=self.bsm,
                 in_reply_to=ci_data.comment_id,
                 content=comment,
             )
 
+    def update_summary_comment(
+        self,
+        comment_id: str,
+        report: T.Optional[str] = None,
+    ):
+        update_summary_comment_status(
+            bsm=self.bsm,
+            comment_id=comment_id,
+            build_id=f"{self.build_job_run.project_name}:{self.build_job_run.run_id}",
+            status=self.cb_event.build_status,
+            report=report,
+        )
+
     def action_post_status_to_comment(self):
         logger.header("Post job run status", "-", 60)
-        self.post_build_status_to_comment()
+        if self.admission is not None:
+            with metrics.timer("stage.release_admission_slot"):
+                self.release_admission_slot()
+        with metrics.timer("stage.post_build_status"):
+            self.post_build_status_to_comment()
 
     def execute(self):
         self.log_cb_event()
@@ -74,4 +217,9 @@ class CodeBuildEventHandler:
         if action == CodeBuildHandlerActionEnum.nothing:
             return
         elif action == CodeBuildHandlerActionEnum.post_status_to_comment:
-            self.action_post_status_to_comment()
+            key = get_codebuild_key(self.cb_event)
+            with claim(self.idempotency, key) as is_new:
+                if is_new:
+                    self.action_post_status_to_comment()
+                else:
+                    logger.info(f"duplicate event {key!r}, skip")
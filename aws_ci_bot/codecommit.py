@@ -4,6 +4,7 @@
 This module defines the CodeCommit event handling logics.
 """
 
+import typing as T
 import dataclasses
 
 from aws_codecommit import (
@@ -20,9 +21,26 @@ from aws_codebuild import (
 from boto_session_manager import BotoSesManager
 
 from . import logger
+from .metrics import metrics
+from .throttle import call_api
+from .batch import process_records, RecordResult
+from .idempotency import Idempotency, claim, get_codecommit_key
+from .supersede import Supersede, InflightBuild
+from .admission import Admission, BuildRequest
+from .priority import get_build_priority
+from .result_cache import ResultCache, BuildResult, get_build_job_key
+from .debounce import Debounce, is_debounced_event
+from .diff import get_changed_files
 from .ci_data import CIData, CI_DATA_PREFIX
 from .code_build_config import CodebuildConfig, BuildJobConfig
+from .summary_comment import (
+    CommentModeEnum,
+    JobStatusEnum,
+    JobRow,
+    SummaryComment,
+)
 from .codecommit_rule import CodeCommitHandlerActionEnum, check_what_to_do
+from .trigger_rule import TriggerRulesModeEnum, default_rules, load_trigger_rules
 
 
 @dataclasses.dataclass
@@ -35,12 +53,42 @@ class CodeCommitEventHandler:
     :param cc_event: the CodeCommit event object.
     :param s3_console_url: where the original event is stored.
     :param s3_uri: where the original event is stored.
+    :param max_workers: how many build jobs to trigger concurrently.
+    :param comment_mode: ``per_job`` posts one comment thread per build job,
+        ``summary`` posts one summary comment per event and edits it in place.
+        See :mod:`aws_ci_bot.summary_comment`.
+    :param idempotency: if given, a duplicated event doesn't trigger build
+        jobs again. See :mod:`aws_ci_bot.idempotency`.
+    :param supersede: if given, a new build job run of a PR stops the stale
+        one. See :mod:`aws_ci_bot.supersede`.
+    :param debounce: if given, the build of a PR event is deferred, and only
+        the latest source commit in the debounce window is built.
+        See :mod:`aws_ci_bot.debounce`.
+    :param sns_event: the Lambda event with the original SNS record, it is
+        required by ``debounce``.
+    :param trigger_rules: where the trigger rules come from, see
+        :class:`~aws_ci_bot.trigger_rule.TriggerRulesModeEnum`.
+    :param admission: if given, a build job run above the concurrent build
+        limit of the project is queued. See :mod:`aws_ci_bot.admission`.
+    :param result_cache: if given, skip the build job that already passed on
+        the same git tree. See :mod:`aws_ci_bot.result_cache`.
     """
 
     bsm: BotoSesManager = dataclasses.field()
     cc_event: CodeCommitEvent = dataclasses.field()
     s3_console_url: str = dataclasses.field()
     s3_uri: str = dataclasses.field()
+    max_workers: int = dataclasses.field(default=4)
+    comment_mode: str = dataclasses.field(default=CommentModeEnum.per_job.value)
+    idempotency: T.Optional[Idempotency] = dataclasses.field(default=None)
+    supersede: T.Optional[Supersede] = dataclasses.field(default=None)
+    debounce: T.Optional[Debounce] = dataclasses.field(default=None)
+    sns_event: T.Optional[dict] = dataclasses.field(default=None)
+    trigger_rules: str = dataclasses.field(
+        default=TriggerRulesModeEnum.code.value
+    )
+    admission: T.Optional[Admission] = dataclasses.field(default=None)
+    result_cache: T.Optional[ResultCache] = dataclasses.field(default=None)
 
     def log_cc_event(self):
         logger.header("Handle CodeCommit event", "-", 60)
@@ -83,18 +131,42 @@ class CodeCommitEventHandler:
         ]
         return "\n".join(lines)
 
+    @property
+    def comment_body_build_job_queued(self) -> str:
+        lines = [
+            "## 🕒 A build run is queued, the build project is busy.",
+            "",
+            f"- commit id: [{self.cc_event.source_commit[:7]}]({self.pr_commit_console_url})",
+            f'- commit message: "{self.cc_event.commit_message.strip()}"',
+            f'- committer name: "{self.cc_event.committer_name.strip()}"',
+        ]
+        return "\n".join(lines)
+
+    def get_comment_body_reused_result(self, result: BuildResult) -> str:
+        lines = [
+            "## ♻️ A build run is skipped, the same tree already passed.",
+            "",
+            f"- reused build run: [{result.build_id}]({result.console_url})",
+            f"- reused commit id: {result.commit_id[:7]}",
+            f"- commit id: [{self.cc_event.source_commit[:7]}]({self.pr_commit_console_url})",
+            f'- commit message: "{self.cc_event.commit_message.strip()}"',
+            f'- committer name: "{self.cc_event.committer_name.strip()}"',
+        ]
+        return "\n".join(lines)
+
     def run_build_job(
         self,
         build_job_config: BuildJobConfig,
         additional_env_var: dict,
-    ) -> BuildJobRun:
+    ) -> T.Optional[BuildJobRun]:
         """
         Based on build job config from the ``codebuild-config.json`` file,
         run the CodeBuild job.
 
         :param build_job_config:
         :param additional_env_var:
-        :return:
+        :return: the build job run, None if it is queued by the admission
+            control.
         """
         # prepare argument
         kwargs = dict(
@@ -114,18 +186,24 @@ class CodeCommitEventHandler:
         # add additional env var based on the build type
         if build_job_config.is_batch_job:
             logger.info(
-                f"invoke codebuild.start_build_batch API, "
+                f"invoke codebuild.start_build_batch API for "
+                f"{build_job_config.project_name!r}, "
                 f"source version = {self.cc_event.source_commit!r}"
             )
             start_build_function = start_build_batch
             env_var[f"{CI_DATA_PREFIX}BUILD_TYPE"] = "batch build"
         else:
             logger.info(
-                f"invoke codebuild.start_build API, "
+                f"invoke codebuild.start_build API for "
+                f"{build_job_config.project_name!r}, "
                 f"source version = {self.cc_event.source_commit!r}"
             )
             start_build_function = start_build
             env_var[f"{CI_DATA_PREFIX}BUILD_TYPE"] = "single build"
+        if self.result_cache is not None or self.supersede is not None:
+            env_var[f"{CI_DATA_PREFIX}BUILD_JOB_KEY"] = get_build_job_key(
+                build_job_config
+            )
 
         # set env var in kwargs
         kwargs["environmentVariablesOverride"] = [
@@ -137,21 +215,72 @@ class CodeCommitEventHandler:
             for key, value in env_var.items()
         ]
 
+        # hold the build in the queue if the build project is busy
+        if self.admission is not None:
+            kwargs.pop("bsm")
+            build_job_run = self.admission.submit(
+                bsm=self.bsm,
+                request=BuildRequest(
+                    project_name=build_job_config.project_name,
+                    is_batch=build_job_config.is_batch_job,
+                    kwargs=kwargs,
+                    priority=get_build_priority(self.cc_event).value,
+                ),
+            )
+            self.mark_job_started(build_job_config)
+            return build_job_run
+
         # run build job
-        res = start_build_function(**kwargs)
+        res = call_api(
+            f"codebuild.{start_build_function.__name__}",
+            start_build_function,
+            **kwargs,
+        )
+        self.mark_job_started(build_job_config)
 
         # parse API response
         build_job_run = BuildJobRun.from_start_build_response(res)
         return build_job_run
 
-    def run_build_job_and_post_comment(
+    def mark_job_started(self, build_job_config: BuildJobConfig):
+        """
+        Record the started (or queued) build job in the idempotency store, so
+        the retry of a partially failed event doesn't start it again.
+        """
+        if self.idempotency is None:
+            return
+        self.idempotency.mark_done(
+            get_codecommit_key(self.cc_event),
+            get_build_job_key(build_job_config),
+        )
+
+    def skip_started_jobs(
         self,
-        build_job_config: BuildJobConfig,
-    ):
+        jobs: T.List[BuildJobConfig],
+    ) -> T.List[BuildJobConfig]:
+        """
+        Skip the build jobs that a previous attempt of this event already
+        started, see :meth:`mark_job_started`.
+        """
+        if self.idempotency is None:
+            return jobs
+        key = get_codecommit_key(self.cc_event)
+        to_run = list()
+        for job in jobs:
+            if self.idempotency.is_done(key, get_build_job_key(job)):
+                logger.info(f"{job.project_name!r} is already started, skip")
+            else:
+                to_run.append(job)
+        return to_run
+
+    def post_comment(self, content: str) -> cc_boto.Comment:
+        """
+        Post a comment on the PR, or on the commit if it is not a PR event.
+        """
         with cc_boto.CommentThread(bsm=self.bsm) as thread:
             post_comment_kwargs = dict(
                 repo_name=self.cc_event.repo_name,
-                content=self.comment_body_before_run_build_job,
+                content=content,
                 before_commit_id=self.cc_event.target_commit,
                 after_commit_id=self.cc_event.source_commit,
             )
@@ -160,52 +289,387 @@ class CodeCommitEventHandler:
                 logger.info(f"post comment on PR {self.cc_event.pr_id}")
             else:
                 logger.info(f"post comment on Commit {self.cc_event.source_commit}")
-            comment = thread.post_comment(**post_comment_kwargs)
+            return call_api(
+                "codecommit.post_comment",
+                thread.post_comment,
+                **post_comment_kwargs,
+            )
 
-            ci_data = CIData(
-                event_s3_console_url=self.s3_console_url,
-                event_s3_uri=self.s3_uri,
-                event_type=self.cc_event.event_type,
+    def update_comment(self, comment_id: str, content: str):
+        call_api(
+            "codecommit.update_comment",
+            cc_boto.update_comment,
+            bsm=self.bsm,
+            comment_id=comment_id,
+            content=content,
+        )
+
+    def make_ci_data(self, comment_id: str) -> CIData:
+        comment_mode = None
+        if self.comment_mode == CommentModeEnum.summary.value:
+            comment_mode = self.comment_mode
+        return CIData(
+            event_s3_console_url=self.s3_console_url,
+            event_s3_uri=self.s3_uri,
+            event_type=self.cc_event.event_type,
+            comment_id=comment_id,
+            comment_mode=comment_mode,
+            commit_id=self.cc_event.source_commit,
+            commit_message=self.cc_event.commit_message,
+            committer_name=self.cc_event.committer_name,
+            branch_name=self.cc_event.source_branch,
+            pr_id=self.cc_event.pr_id,
+            pr_from_branch=self.cc_event.source_branch,
+            pr_to_branch=self.cc_event.target_branch,
+            pr_from_commit_id=self.cc_event.source_commit,
+            pr_to_commit_id=self.cc_event.target_commit,
+        )
+
+    def supersede_stale_build(
+        self,
+        build_job_config: BuildJobConfig,
+        build_job_run: BuildJobRun,
+        comment_id: str,
+    ):
+        """
+        Track the build job run of a PR, and stop the stale build job run of
+        the same PR and build project if the PR source branch is updated.
+        """
+        if self.supersede is None or not self.cc_event.pr_id:
+            return
+        self.supersede.supersede(
+            bsm=self.bsm,
+            repo_name=self.cc_event.repo_name,
+            pr_id=self.cc_event.pr_id,
+            build_job_key=get_build_job_key(build_job_config),
+            build=InflightBuild(
+                build_arn=build_job_run.arn,
+                source_commit=self.cc_event.source_commit,
+                comment_id=comment_id,
+                comment_mode=self.comment_mode,
+            ),
+            stop_previous=self.cc_event.is_pr_update_event,
+        )
+
+    def run_build_job_and_post_comment(
+        self,
+        build_job_config: BuildJobConfig,
+    ):
+        comment = self.post_comment(self.comment_body_before_run_build_job)
+        ci_data = self.make_ci_data(comment_id=comment.comment_id)
+
+        # start build
+        build_job_run = self.run_build_job(
+            build_job_config=build_job_config,
+            additional_env_var=ci_data.to_env_var(),
+        )
+        if build_job_run is None:
+            self.update_comment(
                 comment_id=comment.comment_id,
-                commit_id=self.cc_event.source_commit,
-                commit_message=self.cc_event.commit_message,
-                committer_name=self.cc_event.committer_name,
-                branch_name=self.cc_event.source_branch,
-                pr_id=self.cc_event.pr_id,
-                pr_from_branch=self.cc_event.source_branch,
-                pr_to_branch=self.cc_event.target_branch,
-                pr_from_commit_id=self.cc_event.source_commit,
-                pr_to_commit_id=self.cc_event.target_commit,
+                content=self.comment_body_build_job_queued,
             )
+            return
+
+        # update the first comment with build job run console url
+        self.update_comment(
+            comment_id=comment.comment_id,
+            content=self.get_comment_body_after_run_build_job(build_job_run),
+        )
+        self.supersede_stale_build(
+            build_job_config, build_job_run, comment_id=comment.comment_id
+        )
 
-            # start build
-            build_job_run = self.run_build_job(
-                build_job_config=build_job_config,
-                additional_env_var=ci_data.to_env_var(),
+    def action_start_build(self):
+        logger.header("Trigger build jobs", "-", 60)
+        with metrics.timer("stage.trigger_build_jobs"):
+            cb_config = CodebuildConfig.from_codecommit_repo(
+                bsm=self.bsm,
+                repo_name=self.cc_event.repo_name,
+                commit_id=self.cc_event.source_commit,
             )
+            jobs = self.filter_jobs_by_changed_files(cb_config.jobs)
+            if len(jobs) == 0:
+                logger.info("no build job matches the changed files, skip")
+                return
+            jobs = self.skip_started_jobs(jobs)
+            if len(jobs) == 0:
+                return
+            jobs, reused = self.find_reusable_results(jobs)
+            if self.comment_mode == CommentModeEnum.summary.value:
+                self.run_build_jobs_with_summary_comment(jobs, reused=reused)
+            else:
+                for job, result in reused:
+                    self.post_comment(self.get_comment_body_reused_result(result))
+                self.run_build_jobs(jobs)
+
+    def find_reusable_results(
+        self,
+        jobs: T.List[BuildJobConfig],
+    ) -> T.Tuple[
+        T.List[BuildJobConfig],
+        T.List[T.Tuple[BuildJobConfig, BuildResult]],
+    ]:
+        """
+        Find the build jobs that already passed on the same git tree. Only the
+        build jobs with ``reuse_result`` turned on are looked up, and a failed
+        lookup is treated as a miss.
 
-            # update the first comment with build job run console url
-            cc_boto.update_comment(
+        :return: the build jobs to run, and the build jobs with the reusable
+            build results.
+        """
+        if self.result_cache is None:
+            return jobs, []
+        to_run, reused = list(), list()
+        for job in jobs:
+            if not job.reuse_result:
+                to_run.append(job)
+                continue
+            try:
+                result = self.result_cache.get(
+                    bsm=self.bsm,
+                    repo_name=self.cc_event.repo_name,
+                    commit_id=self.cc_event.source_commit,
+                    build_job_key=get_build_job_key(job),
+                )
+            except Exception as e:
+                # the cache is an optimization, a broken lookup runs the job
+                logger.error(
+                    f"failed to find the reusable result of "
+                    f"{job.project_name!r}, run it: {e!r}"
+                )
+                metrics.put("build_result.error", 1)
+                result = None
+            if result is None:
+                to_run.append(job)
+            else:
+                logger.info(
+                    f"reuse the result of {result.build_id!r} "
+                    f"for {job.project_name!r}, skip"
+                )
+                reused.append((job, result))
+        return to_run, reused
+
+    def get_changed_files(self) -> T.Optional[T.FrozenSet[str]]:
+        """
+        Get the changed files between the target commit and the source commit.
+        Return None if we don't know.
+        """
+        if not self.cc_event.target_commit:
+            return None
+        try:
+            return get_changed_files(
                 bsm=self.bsm,
-                comment_id=comment.comment_id,
-                content=self.get_comment_body_after_run_build_job(build_job_run),
+                repo_name=self.cc_event.repo_name,
+                before_commit_id=self.cc_event.target_commit,
+                after_commit_id=self.cc_event.source_commit,
+            )
+        except Exception as e:
+            logger.error(
+                f"failed to get the changed files, the path filters are "
+                f"ignored: {e!r}"
             )
+            return None
 
-    def action_start_build(self):
-        logger.header("Trigger build jobs", "-", 60)
-        cb_config = CodebuildConfig.from_codecommit_repo(
-            bsm=self.bsm,
+    def filter_jobs_by_changed_files(
+        self,
+        jobs: T.List[BuildJobConfig],
+    ) -> T.List[BuildJobConfig]:
+        """
+        Skip the build jobs whose paths are untouched, see
+        :attr:`~aws_ci_bot.code_build_config.BuildJobConfig.include_paths`.
+        """
+        if not any(job.has_path_filter for job in jobs):
+            return jobs
+        changed_files = self.get_changed_files()
+        if changed_files is None:
+            # a broken path filter (for example the missing
+            # ``codecommit:GetDifferences`` permission) runs all build jobs
+            logger.info("the changed files are unknown, run all build jobs")
+            metrics.put("path_filter.fallback", 1)
+        filtered_jobs = list()
+        for job in jobs:
+            if job.should_run(changed_files):
+                filtered_jobs.append(job)
+            else:
+                logger.info(f"skip {job.project_name!r}, its paths are untouched")
+        return filtered_jobs
+
+    def _create_clients(self):
+        # boto3 client creation is not thread safe, create them
+        # before we start the thread pool
+        _ = self.bsm.codecommit_client
+        _ = self.bsm.codebuild_client
+
+    @staticmethod
+    def _raise_for_failed_jobs(
+        jobs: T.List[BuildJobConfig],
+        results: T.List[RecordResult],
+    ):
+        errors = [
+            f"{jobs[result.index].project_name}: {result.error}"
+            for result in results
+            if not result.is_succeeded
+        ]
+        if errors:
+            raise RuntimeError(
+                f"{len(errors)} of {len(jobs)} build jobs failed: "
+                + "; ".join(errors)
+            )
+
+    def run_build_jobs(self, jobs: T.List[BuildJobConfig]):
+        """
+        Trigger the build jobs concurrently on a bounded thread pool, so the
+        latency stays close to one job no matter how many jobs are defined.
+        A failed job doesn't stop other jobs, but we still raise an error at
+        the end so the Lambda invocation is reported as failed. The retry only
+        starts the failed jobs, see :meth:`mark_job_started`.
+        """
+        if len(jobs) > 1:
+            self._create_clients()
+        results = process_records(
+            records=jobs,
+            func=self.run_build_job_and_post_comment,
+            max_workers=self.max_workers,
+        )
+        self._raise_for_failed_jobs(jobs, results)
+
+    def run_build_jobs_with_summary_comment(
+        self,
+        jobs: T.List[BuildJobConfig],
+        reused: T.Optional[T.List[T.Tuple[BuildJobConfig, BuildResult]]] = None,
+    ):
+        """
+        Post one summary comment for all build jobs, trigger the build jobs
+        concurrently, then update the summary comment once with all build
+        job runs. It takes 2 comment writes instead of 2 per build job.
+
+        :param reused: the build jobs with the reusable build results, they
+            are listed in the summary comment without running.
+        """
+        summary = SummaryComment(
+            header=self.comment_body_before_run_build_job,
+            rows=[
+                JobRow(
+                    project_name=job.project_name,
+                    is_batch_job=job.is_batch_job,
+                )
+                for job in jobs
+            ],
+        )
+        for job, result in reused or []:
+            summary.rows.append(
+                JobRow(
+                    project_name=job.project_name,
+                    is_batch_job=job.is_batch_job,
+                    status=JobStatusEnum.REUSED.value,
+                    build_id=result.build_id,
+                    console_url=result.console_url,
+                )
+            )
+        comment = self.post_comment(summary.render())
+        if len(jobs) == 0:
+            return
+        additional_env_var = self.make_ci_data(
+            comment_id=comment.comment_id
+        ).to_env_var()
+
+        if len(jobs) > 1:
+            self._create_clients()
+        build_job_runs: T.List[T.Optional[BuildJobRun]] = [None] * len(jobs)
+        queued: T.Set[int] = set()
+
+        def run(index: int):
+            build_job_runs[index] = self.run_build_job(
+                build_job_config=jobs[index],
+                additional_env_var=additional_env_var,
+            )
+            if build_job_runs[index] is None:
+                queued.add(index)
+                return
+            self.supersede_stale_build(
+                jobs[index], build_job_runs[index], comment_id=comment.comment_id
+            )
+
+        results = process_records(
+            records=list(range(len(jobs))),
+            func=run,
+            max_workers=self.max_workers,
+        )
+        for index, (row, build_job_run) in enumerate(
+            zip(summary.rows, build_job_runs)
+        ):
+            if index in queued:
+                row.status = JobStatusEnum.QUEUED.value
+            elif build_job_run is None:
+                row.status = JobStatusEnum.FAILED_TO_START.value
+            else:
+                row.status = JobStatusEnum.IN_PROGRESS.value
+                row.build_id = f"{build_job_run.project_name}:{build_job_run.run_id}"
+                row.console_url = build_job_run.console_url
+        self.update_comment(comment_id=comment.comment_id, content=summary.render())
+        self._raise_for_failed_jobs(jobs, results)
+
+    def debounce_build(self) -> bool:
+        """
+        Defer the build of a PR source branch update event, or skip the
+        delayed one if there is a newer source commit. The other PR events
+        (created, merged, ...) are built right away.
+
+        :return: True if we should not trigger build jobs now.
+        """
+        if (
+            self.debounce is None
+            or self.sns_event is None
+            or not self.cc_event.is_pr_update_event
+        ):
+            return False
+        kwargs = dict(
             repo_name=self.cc_event.repo_name,
-            commit_id=self.cc_event.source_commit,
+            pr_id=self.cc_event.pr_id,
+            source_commit=self.cc_event.source_commit,
         )
-        for job in cb_config.jobs:
-            self.run_build_job_and_post_comment(job)
+        if is_debounced_event(self.sns_event):
+            if self.debounce.is_latest(**kwargs):
+                return False
+            logger.info(
+                f"commit {self.cc_event.source_commit!r} is not the latest one "
+                f"of PR {self.cc_event.pr_id}, skip"
+            )
+            return True
+        self.debounce.defer(event=self.sns_event, **kwargs)
+        return True
+
+    def check_what_to_do(self) -> CodeCommitHandlerActionEnum:
+        """
+        Evaluate the trigger rules.
+        """
+        if self.trigger_rules == TriggerRulesModeEnum.code.value:
+            return check_what_to_do(self.cc_event)
+        elif self.trigger_rules == TriggerRulesModeEnum.repo.value:
+            rules = load_trigger_rules(
+                bsm=self.bsm,
+                repo_name=self.cc_event.repo_name,
+                commit_id=self.cc_event.source_commit,
+            )
+        elif self.trigger_rules == TriggerRulesModeEnum.default.value:
+            rules = default_rules
+        else:  # pragma: no cover
+            raise NotImplementedError
+        return rules.evaluate(self.cc_event)
 
     def execute(self):
         self.log_cc_event()
 
-        action = check_what_to_do(self.cc_event)
+        with metrics.timer("stage.check_what_to_do"):
+            action = self.check_what_to_do()
         if action == CodeCommitHandlerActionEnum.nothing:
             return
         elif action == CodeCommitHandlerActionEnum.start_build:
-            self.action_start_build()
+            if self.debounce_build():
+                return
+            key = get_codecommit_key(self.cc_event)
+            with claim(self.idempotency, key) as is_new:
+                if is_new:
+                    self.action_start_build()
+                else:
+                    logger.info(f"duplicate event {key!r}, skip")
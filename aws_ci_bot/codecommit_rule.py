@@ -36,6 +36,10 @@ def check_what_to_do(cc_event: CodeCommitEvent) -> CodeCommitHandlerActionEnum:
 
     This function should take a ``CodeCommitEvent`` object as input, and return
     a ``CodeCommitHandlerActionEnum`` object.
+
+    It is used by default (``TRIGGER_RULES=code``). With
+    ``TRIGGER_RULES=default``, the equivalent declarative rules in
+    :mod:`aws_ci_bot.trigger_rule` are used instead.
     """
     logger.header("Detect whether we should trigger build", "-", 60)
 
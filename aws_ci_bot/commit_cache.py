@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""
+Warm container cache of the commit metadata.
+
+The commit message and the committer name of a CodeCommit event are fetched
+by the ``GetCommit`` API, and the same commit shows up in many events: the PR
+is created, updated, merged, the delayed event of the debounce mode comes
+back, and the build result cache looks up the tree of the commit. A commit is
+immutable, so we cache the metadata by (repo name, commit id) in the Lambda
+container, the cache is shared by all events of all warm invocations.
+
+:class:`CachedCodeCommitEvent` fetches the commit message and the committer
+name through the cache. It is still lazy, the event that never needs the
+commit message doesn't call the API.
+"""
+
+import typing as T
+import dataclasses
+from functools import cached_property
+
+from aws_codecommit import CodeCommitEvent
+
+from .cache import LRUCache
+from .throttle import call_api
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+
+
+@dataclasses.dataclass
+class CommitMetadata:
+    commit_id: str = dataclasses.field()
+    tree_id: str = dataclasses.field()
+    message: str = dataclasses.field()
+    committer_name: str = dataclasses.field()
+
+
+# (repo name, commit id) -> :class:`CommitMetadata`
+commit_cache = LRUCache(name="commit")
+
+
+def configure_cache(max_items: int = 4096, ttl: int = 3600):
+    """
+    Change the commit metadata cache limits, it clears the cache.
+    See the ``commit_cache_*`` settings of :class:`aws_ci_bot.config.Config`.
+    """
+    commit_cache.configure(max_items=max_items, ttl=ttl)
+
+
+configure_cache()
+
+
+def get_commit_metadata(
+    bsm: "BotoSesManager",
+    repo_name: str,
+    commit_id: str,
+) -> CommitMetadata:
+    key = (repo_name, commit_id)
+    metadata = commit_cache.get(key)
+    if metadata is None:
+        from aws_codecommit import better_boto
+
+        commit = call_api(
+            "codecommit.get_commit",
+            better_boto.get_commit,
+            bsm=bsm,
+            repo_name=repo_name,
+            commit_id=commit_id,
+        )
+        metadata = CommitMetadata(
+            commit_id=commit_id,
+            tree_id=commit.tree_id,
+            message=commit.message,
+            committer_name=commit.committer_name,
+        )
+        commit_cache.set(key, metadata, size=len(metadata.message))
+    return metadata
+
+
+class CachedCodeCommitEvent(CodeCommitEvent):
+    """
+    A :class:`~aws_codecommit.CodeCommitEvent` that gets the source commit
+    metadata from the :data:`commit_cache`.
+    """
+
+    @cached_property
+    def _source_commit_message_and_committer(self) -> T.Tuple[str, str]:
+        metadata = get_commit_metadata(
+            bsm=self.bsm,
+            repo_name=self.repo_name,
+            commit_id=self.source_commit,
+        )
+        return metadata.message, metadata.committer_name
+
+
+def clear_cache():
+    """
+    Clear the commit metadata cache.
+    """
+    commit_cache.clear()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+
+"""
+This module defines the runtime configuration of the Lambda function. All
+settings are read from the environment variable, so you can change the
+behavior without redeploying the code.
+"""
+
+import typing as T
+import dataclasses
+
+
+def _to_bool(value: str) -> bool:
+    return value.strip().lower() in ("true", "yes", "1")
+
+
+@dataclasses.dataclass
+class Config:
+    """
+    Lambda function runtime configuration.
+
+    :param s3_bucket: where to store the CI event data.
+    :param s3_prefix: the S3 folder to store the CI event data.
+    :param batch_mode: if True, process every SNS record in the Lambda event
+        concurrently, and return a per-record result summary. Otherwise, only
+        process the first record.
+    :param max_workers: the thread pool size for batch mode.
+    :param lazy_import: if True, import the heavy dependencies and create the
+        boto session when the first event arrives, instead of at cold start.
+    :param async_archive: if True, upload the CI event to S3 in a background
+        thread while the event is being handled.
+    :param compress_archive: if True, store the CI event in S3 as gzip
+        compressed compact JSON.
+    :param drop_ignorable_events: if True, the events that the rules are
+        guaranteed to ignore (CodeBuild phase change, CodeCommit comment, ...)
+        are dropped before they are parsed and archived to S3. The CodeCommit
+        events are only dropped with ``trigger_rules="default"``.
+        See :mod:`aws_ci_bot.prefilter`.
+    :param ignored_event_archive_rate: the fraction (0.0 - 1.0) of the
+        dropped events that are still archived to S3 for debugging.
+    :param emit_metrics: if True, emit the stage and AWS API call timings as
+        CloudWatch embedded metric format log lines.
+    :param metrics_namespace: the CloudWatch metric namespace.
+    :param build_job_max_workers: how many build jobs defined in the
+        ``codebuild-config.json`` file are triggered concurrently.
+    :param max_concurrent_api_calls: the maximum number of in-flight AWS API
+        calls of all threads in the Lambda container.
+    :param api_rate_limits: the client side rate limit of each AWS API, for
+        example ``codecommit.post_comment=5:10,*=20`` means 5 calls per
+        second with a burst of 10 for ``PostCommentForPullRequest``, 20 calls
+        per second for other APIs. Empty string means no limit until an API
+        is throttled. See :func:`aws_ci_bot.throttle.parse_rate_limits`.
+    :param api_max_attempts: the maximum number of attempts of a throttled
+        AWS API call.
+    :param comment_mode: ``per_job`` posts one comment thread per build job
+        and one reply per build status, ``summary`` posts one summary comment
+        per event with a table of all build job runs and edits it in place.
+    :param idempotency_store: where to store the idempotency keys, so a
+        redelivered event doesn't trigger build jobs again. It also stores
+        the in-flight build job runs for ``supersede_builds``. Empty string
+        disables it. See :func:`aws_ci_bot.idempotency.make_store`.
+    :param idempotency_ttl: how long in seconds an idempotency key is valid.
+    :param idempotency_lease: how long in seconds an idempotency key is held
+        while the event is being handled, it should be at least the Lambda
+        timeout. If the Lambda function dies, the redelivered event takes
+        the key over after the lease.
+    :param supersede_builds: if True, when a PR source branch is updated, stop
+        the in-flight build job runs of the older commit. The in-flight build
+        job runs are tracked in the ``idempotency_store``.
+    :param debounce_seconds: if greater than 0, the build of a PR source
+        branch update event is deferred for this many seconds, and only the
+        latest source commit of the PR in the window is built. It requires ``idempotency_store`` and
+        ``debounce_queue_url``.
+    :param debounce_queue_url: the SQS queue for the deferred events, the
+        Lambda function has to consume it. The deployment stack creates it
+        when ``DEBOUNCE_SECONDS`` is set.
+    :param concurrent_build_limits: the concurrent build limit of each build
+        project, for example ``my-project=5,*=2``, ``*`` is the default of
+        all other projects. A build job run above the limit is queued, and
+        started when a build job run of the project finishes. Empty string
+        disables it. It requires ``idempotency_store``.
+        See :mod:`aws_ci_bot.admission`.
+    :param build_priority_aging_seconds: the queued build job runs are
+        started by priority, the merges to the main and release branches go
+        ahead of the feature branch PR builds. A queued build job run gains
+        one priority level per this many seconds, so it is not starved.
+        0 means strict priority. See :mod:`aws_ci_bot.priority`.
+    :param reuse_build_results: if True, record the succeeded build job runs,
+        and skip the build job that already passed on the same git tree,
+        for example a PR merge that produces the same tree as the PR head.
+        Only the build jobs with ``"reuse_result": true`` in the
+        ``codebuild-config.json`` file are skipped. It requires ``idempotency_store``. See :mod:`aws_ci_bot.result_cache`.
+    :param build_result_ttl: how long in seconds a build result can be
+        reused.
+    :param batch_build_report: if True, the status reply of a batch build
+        job run has a table of the status and the duration of each child
+        build. See :mod:`aws_ci_bot.batch_report`.
+    :param batch_report_max_workers: the thread pool size to fetch the child
+        builds of a very large batch build, 100 child builds per API call.
+    :param build_timings_uri: ``s3://bucket/prefix`` or a local folder to
+        record the phase durations, the queue time and the outcome of every
+        finished build job run as Parquet files. Empty string disables it.
+        It requires ``pyarrow``, which is not in the Lambda deployment
+        package, the Lambda function refuses to start without it.
+        See :mod:`aws_ci_bot.analytics`.
+    :param trigger_rules: ``code`` (the default) uses the
+        ``check_what_to_do`` function in ``codecommit_rule.py``, so your
+        edits of it take effect. ``default`` uses the built-in declarative
+        trigger rules, ``repo`` loads the ``trigger-rules.json`` file from
+        the git repo. See :mod:`aws_ci_bot.trigger_rule`.
+    :param config_cache_max_items: maximum number of parsed
+        ``codebuild-config.json`` files cached in the warm Lambda container,
+        0 disables the cache.
+    :param config_cache_max_bytes: maximum total size of the cached
+        ``codebuild-config.json`` files.
+    :param config_cache_ttl: how long in seconds a cached
+        ``codebuild-config.json`` file is valid.
+    :param commit_cache_max_items: maximum number of commit metadata cached
+        in the warm Lambda container, 0 disables the cache.
+        See :mod:`aws_ci_bot.commit_cache`.
+    :param commit_cache_ttl: how long in seconds a cached commit metadata is
+        valid.
+    """
+
+    s3_bucket: T.Optional[str] = dataclasses.field(default=None)
+    s3_prefix: T.Optional[str] = dataclasses.field(default=None)
+    batch_mode: bool = dataclasses.field(default=False)
+    max_workers: int = dataclasses.field(default=4)
+    lazy_import: bool = dataclasses.field(default=True)
+    async_archive: bool = dataclasses.field(default=False)
+    compress_archive: bool = dataclasses.field(default=False)
+    drop_ignorable_events: bool = dataclasses.field(default=False)
+    ignored_event_archive_rate: float = dataclasses.field(default=0.0)
+    emit_metrics: bool = dataclasses.field(default=False)
+    metrics_namespace: str = dataclasses.field(default="aws_ci_bot")
+    build_job_max_workers: int = dataclasses.field(default=4)
+    max_concurrent_api_calls: int = dataclasses.field(default=8)
+    api_rate_limits: str = dataclasses.field(default="")
+    api_max_attempts: int = dataclasses.field(default=5)
+    comment_mode: str = dataclasses.field(default="per_job")
+    idempotency_store: str = dataclasses.field(default="")
+    idempotency_ttl: int = dataclasses.field(default=86400)
+    idempotency_lease: int = dataclasses.field(default=900)
+    supersede_builds: bool = dataclasses.field(default=False)
+    debounce_seconds: int = dataclasses.field(default=0)
+    debounce_queue_url: str = dataclasses.field(default="")
+    concurrent_build_limits: str = dataclasses.field(default="")
+    build_priority_aging_seconds: int = dataclasses.field(default=600)
+    reuse_build_results: bool = dataclasses.field(default=False)
+    build_result_ttl: int = dataclasses.field(default=2592000)
+    batch_build_report: bool = dataclasses.field(default=False)
+    batch_report_max_workers: int = dataclasses.field(default=4)
+    build_timings_uri: str = dataclasses.field(default="")
+    trigger_rules: str = dataclasses.field(default="code")
+    config_cache_max_items: int = dataclasses.field(default=256)
+    config_cache_max_bytes: int = dataclasses.field(default=1_000_000)
+    config_cache_ttl: int = dataclasses.field(default=3600)
+    commit_cache_max_items: int = dataclasses.field(default=4096)
+    commit_cache_ttl: int = dataclasses.field(default=3600)
+
+    @classmethod
+    def from_env_var(cls, env_var: T.Mapping[str, str]) -> "Config":
+        """
+        env_var is a dict of environment variable key value pair. The
+        environment variable name is the upper case of the attribute name.
+        """
+        kwargs = dict()
+        for field in dataclasses.fields(cls):
+            key = field.name.upper()
+            if key not in env_var:
+                continue
+            value = env_var[key]
+            if field.type is bool:
+                kwargs[field.name] = _to_bool(value)
+            elif field.type is int:
+                kwargs[field.name] = int(value)
+            elif field.type is float:
+                kwargs[field.name] = float(value)
+            else:
+                kwargs[field.name] = value
+        return cls(**kwargs)
@@ -0,0 +1,614 @@
+# -*- coding: utf-8 -*-
+
+"""
+Factories of realistic AWS CodeStar notification events, and the SNS Lambda
+event that wraps them. They are used to test, replay and benchmark the bot
+without real AWS traffic.
+
+Reference:
+
+- https://docs.aws.amazon.com/codecommit/latest/userguide/monitoring-events.html
+- https://docs.aws.amazon.com/codebuild/latest/userguide/sample-build-notifications.html
+"""
+
+import typing as T
+import json
+import uuid
+import random
+import dataclasses
+from datetime import datetime, timedelta
+
+from .local_aws import DEFAULT_AWS_ACCOUNT_ID, DEFAULT_AWS_REGION
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .local_aws import LocalBotoSesManager
+
+CODEBUILD_DATETIME_FORMAT = "%b %d, %Y %I:%M:%S %p"
+
+
+def _iso_time(dt: T.Optional[datetime] = None) -> str:
+    if dt is None:
+        dt = datetime.utcnow()
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def make_sns_event(
+    message_dict: dict,
+    message_id: T.Optional[str] = None,
+    timestamp: T.Optional[str] = None,
+) -> dict:
+    """
+    Wrap the CodeStar notification event into a Lambda event that has exactly
+    one SNS record, it is what the Lambda function receives.
+    """
+    topic_arn = (
+        f"arn:aws:sns:{DEFAULT_AWS_REGION}:{DEFAULT_AWS_ACCOUNT_ID}:aws-ci-bot"
+    )
+    return {
+        "Records": [
+            {
+                "EventSource": "aws:sns",
+                "EventVersion": "1.0",
+                "EventSubscriptionArn": f"{topic_arn}:{uuid.uuid4()}",
+                "Sns": {
+                    "Type": "Notification",
+                    "MessageId": message_id or str(uuid.uuid4()),
+                    "TopicArn": topic_arn,
+                    "Subject": None,
+                    "Message": json.dumps(message_dict),
+                    "Timestamp": timestamp or message_dict.get("time", ""),
+                    "SignatureVersion": "1",
+                    "MessageAttributes": {},
+                },
+            }
+        ]
+    }
+
+
+# ------------------------------------------------------------------------------
+# CodeCommit
+# ------------------------------------------------------------------------------
+def make_codecommit_message(
+    repo_name: str,
+    detail_type: str,
+    detail: dict,
+    time: T.Optional[datetime] = None,
+) -> dict:
+    """
+    Make a CodeCommit notification event. The ``detail`` keys have to be the
+    attributes of the :class:`aws_codecommit.CodeCommitEvent`.
+    """
+    detail = dict(detail)
+    detail.setdefault(
+        "callerUserArn", f"arn:aws:iam::{DEFAULT_AWS_ACCOUNT_ID}:user/developer"
+    )
+    return {
+        "account": DEFAULT_AWS_ACCOUNT_ID,
+        "detailType": detail_type,
+        "region": DEFAULT_AWS_REGION,
+        "source": "aws.codecommit",
+        "time": _iso_time(time),
+        "notificationRuleArn": (
+            f"arn:aws:codestar-notifications:{DEFAULT_AWS_REGION}:"
+            f"{DEFAULT_AWS_ACCOUNT_ID}:notificationrule/{uuid.uuid4().hex}"
+        ),
+        "detail": detail,
+        "resources": [
+            f"arn:aws:codecommit:{DEFAULT_AWS_REGION}:{DEFAULT_AWS_ACCOUNT_ID}:{repo_name}"
+        ],
+        "additionalAttributes": {},
+    }
+
+
+def make_commit_to_branch_message(
+    repo_name: str,
+    branch: str,
+    commit_id: str,
+    old_commit_id: str,
+    from_merge: bool = False,
+    time: T.Optional[datetime] = None,
+) -> dict:
+    detail = {
+        "event": "referenceUpdated",
+        "repositoryName": repo_name,
+        "repositoryId": repo_name,
+        "referenceType": "branch",
+        "referenceName": branch,
+        "referenceFullName": f"refs/heads/{branch}",
+        "commitId": commit_id,
+        "oldCommitId": old_commit_id,
+    }
+    if from_merge:
+        detail["mergeOption"] = "FAST_FORWARD_MERGE"
+    return make_codecommit_message(
+        repo_name, "CodeCommit Repository State Change", detail, time
+    )
+
+
+def make_branch_message(
+    repo_name: str,
+    branch: str,
+    commit_id: str,
+    created: bool = True,
+    time: T.Optional[datetime] = None,
+) -> dict:
+    detail = {
+        "event": "referenceCreated" if created else "referenceDeleted",
+        "repositoryName": repo_name,
+        "repositoryId": repo_name,
+        "referenceType": "branch",
+        "referenceName": branch,
+        "referenceFullName": f"refs/heads/{branch}",
+    }
+    if created:
+        detail["commitId"] = commit_id
+    else:
+        detail["oldCommitId"] = commit_id
+    return make_codecommit_message(
+        repo_name, "CodeCommit Repository State Change", detail, time
+    )
+
+
+PR_EVENTS = {
+    # event type -> (event, pullRequestStatus, isMerged)
+    "pr_created": ("pullRequestCreated", "Open", "False"),
+    "pr_updated": ("pullRequestSourceBranchUpdated", "Open", "False"),
+    "pr_merged": ("pullRequestMergeStatusUpdated", "Closed", "True"),
+    "pr_closed": ("pullRequestStatusChanged", "Closed", "False"),
+}
+
+
+def make_pr_message(
+    repo_name: str,
+    event_type: str,
+    pr_id: str,
+    source_branch: str,
+    target_branch: str,
+    source_commit: str,
+    target_commit: str,
+    title: str = "",
+    time: T.Optional[datetime] = None,
+) -> dict:
+    """
+    :param event_type: one of ``pr_created``, ``pr_updated``, ``pr_merged``,
+        ``pr_closed``.
+    """
+    event, status, is_merged = PR_EVENTS[event_type]
+    detail = {
+        "event": event,
+        "repositoryNames": [repo_name],
+        "pullRequestId": pr_id,
+        "pullRequestStatus": status,
+        "isMerged": is_merged,
+        "title": title or f"PR {pr_id}",
+        "author": f"arn:aws:iam::{DEFAULT_AWS_ACCOUNT_ID}:user/developer",
+        "sourceReference": f"refs/heads/{source_branch}",
+        "destinationReference": f"refs/heads/{target_branch}",
+        "sourceCommit": source_commit,
+        "destinationCommit": target_commit,
+        "revisionId": uuid.uuid4().hex,
+    }
+    return make_codecommit_message(
+        repo_name, "CodeCommit Pull Request State Change", detail, time
+    )
+
+
+def make_comment_message(
+    repo_name: str,
+    pr_id: str,
+    before_commit_id: str,
+    after_commit_id: str,
+    comment_id: T.Optional[str] = None,
+    in_reply_to: str = "",
+    time: T.Optional[datetime] = None,
+) -> dict:
+    detail = {
+        "event": "commentOnPullRequestCreated",
+        "repositoryName": repo_name,
+        "repositoryId": repo_name,
+        "pullRequestId": pr_id,
+        "commentId": comment_id or uuid.uuid4().hex,
+        "beforeCommitId": before_commit_id,
+        "afterCommitId": after_commit_id,
+        "notificationBody": "A comment was made on a pull request.",
+    }
+    if in_reply_to:
+        detail["inReplyTo"] = in_reply_to
+    return make_codecommit_message(
+        repo_name, "CodeCommit Comment on Pull Request", detail, time
+    )
+
+
+def make_approve_message(
+    repo_name: str,
+    pr_id: str,
+    source_branch: str,
+    target_branch: str,
+    source_commit: str,
+    target_commit: str,
+    time: T.Optional[datetime] = None,
+) -> dict:
+    detail = {
+        "event": "pullRequestApprovalStateChanged",
+        "repositoryNames": [repo_name],
+        "pullRequestId": pr_id,
+        "pullRequestStatus": "Open",
+        "isMerged": "False",
+        "approvalStatus": "APPROVE",
+        "sourceReference": f"refs/heads/{source_branch}",
+        "destinationReference": f"refs/heads/{target_branch}",
+        "sourceCommit": source_commit,
+        "destinationCommit": target_commit,
+        "revisionId": uuid.uuid4().hex,
+    }
+    return make_codecommit_message(
+        repo_name, "CodeCommit Pull Request State Change", detail, time
+    )
+
+
+# ------------------------------------------------------------------------------
+# CodeBuild
+# ------------------------------------------------------------------------------
+def make_codebuild_message(
+    project_name: str,
+    run_id: str,
+    repo_name: str,
+    source_version: str,
+    build_status: T.Optional[str] = None,
+    completed_phase: T.Optional[str] = None,
+    completed_phase_status: str = "SUCCEEDED",
+    completed_phase_duration_seconds: int = 1,
+    env_var: T.Optional[T.Dict[str, str]] = None,
+    is_batch: bool = False,
+    build_number: int = 1,
+    time: T.Optional[datetime] = None,
+    phase_durations: T.Optional[T.Dict[str, int]] = None,
+) -> dict:
+    """
+    Make a CodeBuild notification event. If ``build_status`` is given, it is a
+    state change event, otherwise it is a phase change event of the
+    ``completed_phase``.
+
+    :param env_var: the plain text environment variables of the build run,
+        usually it is the ``CIData.to_env_var()``.
+    :param phase_durations: phase name -> duration in seconds of the
+        completed phases, in the order they run.
+    """
+    if time is None:
+        time = datetime.utcnow()
+    type = "build-batch" if is_batch else "build"
+    build_arn = (
+        f"arn:aws:codebuild:{DEFAULT_AWS_REGION}:{DEFAULT_AWS_ACCOUNT_ID}:"
+        f"{type}/{project_name}:{run_id}"
+    )
+    codebuild_time = time.strftime(CODEBUILD_DATETIME_FORMAT)
+    detail = {
+        "project-name": project_name,
+        "build-id": build_arn,
+        "additional-information": {
+            "cache": {"type": "NO_CACHE"},
+            "build-number": build_number,
+            "timeout-in-minutes": 60,
+            "build-complete": build_status not in (None, "IN_PROGRESS"),
+            "initiator": "aws-ci-bot",
+            "build-start-time": codebuild_time,
+            "source": {
+                "location": (
+                    f"https://git-codecommit.{DEFAULT_AWS_REGION}.amazonaws.com"
+                    f"/v1/repos/{repo_name}"
+                ),
+                "type": "CODECOMMIT",
+            },
+            "source-version": source_version,
+            "artifact": {"location": ""},
+            "environment": {
+                "image": "aws/codebuild/amazonlinux2-x86_64-standard:4.0",
+                "privileged-mode": False,
+                "image-pull-credentials-type": "CODEBUILD",
+                "compute-type": "BUILD_GENERAL1_SMALL",
+                "type": "LINUX_CONTAINER",
+                "environment-variables": [
+                    {"name": key, "type": "PLAINTEXT", "value": value}
+                    for key, value in (env_var or {}).items()
+                ],
+            },
+            "phases": [
+                {
+                    "phase-type": phase,
+                    "phase-status": "SUCCEEDED",
+                    "start-time": codebuild_time,
+                    "end-time": codebuild_time,
+                    "duration-in-seconds": duration,
+                    "phase-context": [],
+                }
+                for phase, duration in (phase_durations or {}).items()
+            ],
+            "queued-timeout-in-minutes": 480,
+        },
+        "version": "1",
+    }
+    if build_status is not None:
+        detail_type = "CodeBuild Build State Change"
+        detail["build-status"] = build_status
+        detail["current-phase"] = (
+            "SUBMITTED" if build_status == "IN_PROGRESS" else "COMPLETED"
+        )
+        detail["current-phase-context"] = "[: ]"
+    else:
+        detail_type = "CodeBuild Build Phase Change"
+        detail["completed-phase"] = completed_phase
+        detail["completed-phase-status"] = completed_phase_status
+        detail["completed-phase-duration-seconds"] = completed_phase_duration_seconds
+        detail["completed-phase-start"] = codebuild_time
+        detail["completed-phase-end"] = codebuild_time
+        detail["completed-phase-context"] = "[: ]"
+    return {
+        "account": DEFAULT_AWS_ACCOUNT_ID,
+        "detailType": detail_type,
+        "region": DEFAULT_AWS_REGION,
+        "source": "aws.codebuild",
+        "time": _iso_time(time),
+        "notificationRuleArn": (
+            f"arn:aws:codestar-notifications:{DEFAULT_AWS_REGION}:"
+            f"{DEFAULT_AWS_ACCOUNT_ID}:notificationrule/{uuid.uuid4().hex}"
+        ),
+        "detail": detail,
+        "resources": [build_arn],
+        "additionalAttributes": {},
+    }
+
+
+# ------------------------------------------------------------------------------
+# Synthetic traffic
+# ------------------------------------------------------------------------------
+BUILD_PHASES = [
+    "SUBMITTED",
+    "QUEUED",
+    "PROVISIONING",
+    "DOWNLOAD_SOURCE",
+    "INSTALL",
+    "PRE_BUILD",
+    "BUILD",
+    "POST_BUILD",
+    "UPLOAD_ARTIFACTS",
+    "FINALIZING",
+    "COMPLETED",
+]
+
+FEATURE_BRANCH_PREFIXES = ["feature", "feat", "fix", "hotfix", "doc", "release", "dev"]
+OTHER_BRANCH_PREFIXES = ["experiment", "spike", "user"]
+
+COMMIT_MESSAGES = [
+    "feat: add new feature",
+    "fix: fix a bug",
+    "doc: update document",
+    "test: add more test",
+    "utest: add unit test",
+    "build: update buildspec",
+    "chore: clean up",
+    "refactor the code",
+    "release: bump version",
+]
+
+
+@dataclasses.dataclass
+class Corpus:
+    """
+    A synthetic CI traffic. The events are in time order.
+
+    :param events: list of Lambda events, each of them has one SNS record.
+    :param commits: list of (repo name, commit id, commit message, committer).
+    :param comment_ids: the comment ids that the CodeBuild events reply to.
+    :param codebuild_config: the ``codebuild-config.json`` content used by
+        all repos.
+    """
+
+    events: T.List[dict] = dataclasses.field(default_factory=list)
+    commits: T.List[T.Tuple[str, str, str, str]] = dataclasses.field(
+        default_factory=list
+    )
+    comment_ids: T.List[str] = dataclasses.field(default_factory=list)
+    codebuild_config: dict = dataclasses.field(default_factory=dict)
+
+    def setup(self, bsm: "LocalBotoSesManager"):
+        """
+        Load the git commits, comments and ``codebuild-config.json`` file
+        into the local AWS stand-in.
+        """
+        cc_client = bsm.codecommit_client
+        for repo_name, commit_id, message, committer_name in self.commits:
+            cc_client.add_commit(
+                repo_name=repo_name,
+                commit_id=commit_id,
+                message=message,
+                committer_name=committer_name,
+            )
+        for comment_id in self.comment_ids:
+            cc_client.add_comment(comment_id)
+        cc_client.add_file(
+            file_path="codebuild-config.json",
+            content=json.dumps(self.codebuild_config),
+        )
+
+
+class _CorpusBuilder:
+    def __init__(self, n_events: int, n_repos: int, seed: int):
+        self.n_events = n_events
+        self.rnd = random.Random(seed)
+        self.repos = [f"repo-{i}" for i in range(1, 1 + n_repos)]
+        self.time = datetime(2023, 1, 1)
+        self.corpus = Corpus(
+            codebuild_config={
+                "jobs": [
+                    {"project_name": "unit-test", "is_batch_job": False},
+                    {"project_name": "integration-test", "is_batch_job": True},
+                ]
+            }
+        )
+        self.pr_counter = 0
+
+    def tick(self) -> datetime:
+        self.time += timedelta(seconds=self.rnd.randint(1, 30))
+        return self.time
+
+    def add(self, message_dict: dict):
+        self.corpus.events.append(
+            make_sns_event(
+                message_dict,
+                message_id=str(uuid.UUID(int=self.rnd.getrandbits(128))),
+            )
+        )
+
+    def new_commit(self, repo_name: str) -> str:
+        commit_id = "%040x" % self.rnd.getrandbits(160)
+        self.corpus.commits.append(
+            (
+                repo_name,
+                commit_id,
+                self.rnd.choice(COMMIT_MESSAGES),
+                self.rnd.choice(["alice", "bob", "cathy"]),
+            )
+        )
+        return commit_id
+
+    def new_branch(self) -> str:
+        if self.rnd.random() < 0.8:
+            prefix = self.rnd.choice(FEATURE_BRANCH_PREFIXES)
+        else:
+            prefix = self.rnd.choice(OTHER_BRANCH_PREFIXES)
+        return f"{prefix}/{self.rnd.getrandbits(24):06x}"
+
+    def build(self, repo_name: str, commit_id: str):
+        # the build runs triggered by one commit, with all phase change events
+        for job in self.corpus.codebuild_config["jobs"]:
+            comment_id = uuid.UUID(int=self.rnd.getrandbits(128)).hex
+            self.corpus.comment_ids.append(comment_id)
+            kwargs = dict(
+                project_name=job["project_name"],
+                run_id=str(uuid.UUID(int=self.rnd.getrandbits(128))),
+                repo_name=repo_name,
+                source_version=commit_id,
+                env_var={"CI_DATA_COMMENT_ID": comment_id},
+                is_batch=job["is_batch_job"],
+            )
+            self.add(
+                make_codebuild_message(
+                    build_status="IN_PROGRESS", time=self.tick(), **kwargs
+                )
+            )
+            for phase in BUILD_PHASES:
+                self.add(
+                    make_codebuild_message(
+                        completed_phase=phase,
+                        completed_phase_duration_seconds=self.rnd.randint(1, 120),
+                        time=self.tick(),
+                        **kwargs,
+                    )
+                )
+            status = self.rnd.choices(
+                ["SUCCEEDED", "FAILED", "STOPPED"], weights=[80, 15, 5]
+            )[0]
+            self.add(
+                make_codebuild_message(build_status=status, time=self.tick(), **kwargs)
+            )
+
+    def pull_request(self, repo_name: str):
+        self.pr_counter += 1
+        pr_id = str(self.pr_counter)
+        source_branch = self.new_branch()
+        target_branch = self.rnd.choices(["main", "develop"], weights=[80, 20])[0]
+        target_commit = self.new_commit(repo_name)
+        self.add(make_branch_message(repo_name, source_branch, target_commit))
+        source_commit = self.new_commit(repo_name)
+        args = (repo_name, pr_id, source_branch, target_branch)
+        self.add(
+            make_pr_message(
+                repo_name, "pr_created", pr_id, source_branch, target_branch,
+                source_commit, target_commit, time=self.tick(),
+            )
+        )
+        self.build(repo_name, source_commit)
+        for _ in range(self.rnd.randint(0, 3)):
+            source_commit = self.new_commit(repo_name)
+            self.add(
+                make_pr_message(
+                    repo_name, "pr_updated", pr_id, source_branch, target_branch,
+                    source_commit, target_commit, time=self.tick(),
+                )
+            )
+            self.build(repo_name, source_commit)
+        for _ in range(self.rnd.randint(0, 3)):
+            self.add(
+                make_comment_message(
+                    repo_name, pr_id, target_commit, source_commit, time=self.tick()
+                )
+            )
+        self.add(
+            make_approve_message(
+                *args, source_commit, target_commit, time=self.tick()
+            )
+        )
+        if self.rnd.random() < 0.9:
+            self.add(
+                make_pr_message(
+                    repo_name, "pr_merged", pr_id, source_branch, target_branch,
+                    source_commit, target_commit, time=self.tick(),
+                )
+            )
+            self.build(repo_name, source_commit)
+            self.add(
+                make_commit_to_branch_message(
+                    repo_name, target_branch, source_commit, target_commit,
+                    from_merge=True, time=self.tick(),
+                )
+            )
+            self.add(
+                make_branch_message(
+                    repo_name, source_branch, source_commit, created=False,
+                    time=self.tick(),
+                )
+            )
+        else:
+            self.add(
+                make_pr_message(
+                    repo_name, "pr_closed", pr_id, source_branch, target_branch,
+                    source_commit, target_commit, time=self.tick(),
+                )
+            )
+
+    def direct_commit(self, repo_name: str):
+        old_commit = self.new_commit(repo_name)
+        new_commit = self.new_commit(repo_name)
+        self.add(
+            make_commit_to_branch_message(
+                repo_name, self.new_branch(), new_commit, old_commit, time=self.tick()
+            )
+        )
+
+    def generate(self) -> Corpus:
+        while len(self.corpus.events) < self.n_events:
+            repo_name = self.rnd.choice(self.repos)
+            if self.rnd.random() < 0.7:
+                self.pull_request(repo_name)
+            else:
+                self.direct_commit(repo_name)
+        self.corpus.events = self.corpus.events[: self.n_events]
+        return self.corpus
+
+
+def generate_corpus(
+    n_events: int = 1000,
+    n_repos: int = 5,
+    seed: int = 1,
+) -> Corpus:
+    """
+    Generate a synthetic, but realistic CI traffic. Most of the events are the
+    CodeBuild phase change events and the PR comment / approval events, just
+    like the production traffic. The same seed always generates the same
+    sequence of event types, branches, commits and build results.
+
+    :param n_events: number of events.
+    :param n_repos: number of git repos.
+    :param seed: the random seed.
+    """
+    return _CorpusBuilder(n_events=n_events, n_repos=n_repos, seed=seed).generate()
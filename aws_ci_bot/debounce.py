@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""
+Coalesce the bursty PR update events.
+
+A developer may push several fixup commits in a minute, and each push
+triggers all the build jobs. In debounce mode, a PR source branch update
+event that should trigger build jobs is not handled immediately. The other
+PR events, such as created and merged, are not bursty and are built right
+away, so the merge and release builds don't wait for the debounce window. We record its source commit
+as the latest commit of the (repo, PR) in the store (see
+:mod:`aws_ci_bot.store`), and send the SNS notification to an SQS queue with
+a delay of the debounce window. The Lambda function consumes the queue, when
+the delayed notification comes back, we only trigger the build jobs if its
+source commit is still the latest one, otherwise a newer push will handle it.
+
+The delayed notification is marked by the ``aws_ci_bot_debounced`` SNS
+message attribute, so it is not deferred again.
+
+SNS doesn't guarantee the delivery order, so the latest commit is the one of
+the newest event time, not the last delivered one. The record is updated
+with a compare and set, an older event never replaces a newer one, and it is
+dropped right away.
+"""
+
+import typing as T
+import json
+
+from . import logger
+from .throttle import call_api
+from .store import BaseStore
+
+DEBOUNCED_ATTRIBUTE = "aws_ci_bot_debounced"
+
+# SQS allows at most 15 minutes message delay
+MAX_DELAY_SECONDS = 900
+
+
+def get_debounce_key(repo_name: str, pr_id: str) -> str:
+    return f"debounce:{repo_name}:{pr_id}"
+
+
+def get_event_time(event: dict) -> str:
+    """
+    Get the event time of the Lambda event (with exactly one SNS record), it
+    is the CodeCommit event time, fall back to the SNS publish time. Both are
+    ISO 8601 strings in UTC, so they can be compared as strings.
+    """
+    sns_message = event["Records"][0].get("Sns", {})
+    try:
+        message_dict = json.loads(sns_message.get("Message") or "{}")
+    except ValueError:
+        message_dict = {}
+    return message_dict.get("time") or sns_message.get("Timestamp") or ""
+
+
+def is_debounced_event(event: dict) -> bool:
+    """
+    Test if the Lambda event (with exactly one SNS record) is a delayed
+    notification sent by :meth:`Debounce.defer`.
+    """
+    sns_message = event["Records"][0].get("Sns", {})
+    attributes = sns_message.get("MessageAttributes") or {}
+    return DEBOUNCED_ATTRIBUTE in attributes
+
+
+class Debounce:
+    """
+    :param store: where to store the latest source commit of each PR.
+    :param sqs_client: the boto3 SQS client.
+    :param queue_url: the delayed queue, the Lambda function has to consume it.
+    :param window: the debounce window in seconds.
+    :param ttl: how long in seconds the latest source commit is kept.
+    """
+
+    def __init__(
+        self,
+        store: BaseStore,
+        sqs_client,
+        queue_url: str,
+        window: int,
+        ttl: int = 86400,
+    ):
+        if not (0 < window <= MAX_DELAY_SECONDS):
+            raise ValueError(
+                f"debounce window has to be 1 - {MAX_DELAY_SECONDS} seconds"
+            )
+        self.store = store
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.window = window
+        self.ttl = ttl
+
+    def defer(
+        self,
+        event: dict,
+        repo_name: str,
+        pr_id: str,
+        source_commit: str,
+    ):
+        """
+        Record the source commit as the latest one of the PR, and send the
+        notification to the delayed queue. If a newer event of the PR is
+        already recorded, the event is dropped.
+
+        :param event: the Lambda event with exactly one SNS record.
+        """
+        key = get_debounce_key(repo_name, pr_id)
+        event_time = get_event_time(event)
+        value = {"source_commit": source_commit, "event_time": event_time}
+        while True:
+            latest = self.store.get(key)
+            if latest is not None and latest.get("event_time", "") > event_time:
+                logger.info(
+                    f"commit {source_commit!r} is older than the latest one "
+                    f"{latest['source_commit']!r}, skip"
+                )
+                return
+            if self.store.put_if_match(key, value, ttl=self.ttl, expected=latest):
+                break
+        sns_message = dict(event["Records"][0]["Sns"])
+        attributes = dict(sns_message.get("MessageAttributes") or {})
+        attributes[DEBOUNCED_ATTRIBUTE] = {"Type": "String", "Value": "true"}
+        sns_message["MessageAttributes"] = attributes
+        logger.info(
+            f"defer the build of commit {source_commit!r} for {self.window} seconds"
+        )
+        call_api(
+            "sqs.send_message",
+            self.sqs_client.send_message,
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(sns_message),
+            DelaySeconds=self.window,
+        )
+
+    def is_latest(self, repo_name: str, pr_id: str, source_commit: str) -> bool:
+        """
+        Test if the source commit is still the latest one of the PR.
+        """
+        latest = self.store.get(get_debounce_key(repo_name, pr_id))
+        return latest is None or latest["source_commit"] == source_commit
@@ -8,6 +8,7 @@ import attr
 import cottonformation as cf
 from cottonformation.res import (
     sns,
+    sqs,
     awslambda,
     iam,
     codecommit,
@@ -15,6 +16,8 @@ from cottonformation.res import (
     codestarnotifications,
 )
 
+from ..config import Config
+
 if T.TYPE_CHECKING:
     from .script import DeployConfig
 
@@ -52,6 +55,70 @@ class Stack(cf.Stack):
     def stack_name(self) -> str:
         return self.project_name_slug
 
+    @property
+    def sqs_queue_name(self) -> str:
+        return self.project_name_slug
+
+    @property
+    def sqs_dead_letter_queue_name(self) -> str:
+        return f"{self.project_name_slug}-dlq"
+
+    @property
+    def debounce_queue_name(self) -> str:
+        return f"{self.project_name_slug}-debounce"
+
+    @property
+    def debounce_dead_letter_queue_name(self) -> str:
+        return f"{self.project_name_slug}-debounce-dlq"
+
+    @property
+    def use_debounce(self) -> bool:
+        return self.lambda_config.debounce_seconds > 0
+
+    @property
+    def lambda_config(self) -> Config:
+        """
+        The Lambda function runtime configuration, it is used to grant the
+        permissions that the enabled features need.
+        """
+        return Config.from_env_var(self.deploy_config.lambda_env_var)
+
+    def get_s3_bucket_list(self) -> T.List[str]:
+        """
+        The S3 buckets that the Lambda function reads and writes, the CI event
+        archive bucket, the ``s3://`` idempotency store bucket, and the
+        ``s3://`` build timings bucket.
+        """
+        bucket_list = [self.deploy_config.s3_bucket]
+        for uri in [
+            self.lambda_config.idempotency_store,
+            self.lambda_config.build_timings_uri,
+        ]:
+            if uri.startswith("s3://"):
+                bucket = uri[len("s3://") :].partition("/")[0]
+                if bucket not in bucket_list:
+                    bucket_list.append(bucket)
+        return bucket_list
+
+    def get_lambda_env_var(self) -> T.Dict[str, str]:
+        """
+        The Lambda function environment variables, see
+        :class:`aws_ci_bot.config.Config`.
+        """
+        env_var = dict(
+            S3_BUCKET=self.deploy_config.s3_bucket,
+            S3_PREFIX=self.deploy_config.s3_prefix,
+            **self.deploy_config.lambda_env_var,
+        )
+        if self.use_debounce:
+            env_var["DEBOUNCE_QUEUE_URL"] = self.debounce_queue.rv_QueueUrl
+        # a Lambda invocation can't outlive its timeout
+        if self.lambda_config.idempotency_store:
+            env_var.setdefault(
+                "IDEMPOTENCY_LEASE", str(self.deploy_config.lambda_timeout)
+            )
+        return env_var
+
     def make_rg_1_iam(self):
         self.rg_1_iam = cf.ResourceGroup("RG1")
 
@@ -73,16 +140,42 @@ class Stack(cf.Stack):
         )
         self.rg_1_iam.add(self.iam_role_for_lambda)
 
+        # the S3 idempotency store uses the conditional put, get and delete
         self.stat_s3 = {
             "Effect": "Allow",
             "Action": [
                 "s3:PutObject",
+                "s3:GetObject",
+                "s3:DeleteObject",
             ],
             "Resource": [
-                f"arn:aws:s3:::{self.deploy_config.s3_bucket}/*",
+                f"arn:aws:s3:::{bucket}/*" for bucket in self.get_s3_bucket_list()
             ],
         }
 
+        idempotency_store = self.lambda_config.idempotency_store
+        if idempotency_store.startswith("dynamodb:"):
+            self.stat_dynamodb_permission_for_lambda = {
+                "Effect": "Allow",
+                "Action": [
+                    "dynamodb:GetItem",
+                    "dynamodb:PutItem",
+                    "dynamodb:DeleteItem",
+                ],
+                "Resource": [
+                    cf.Sub(
+                        string="arn:aws:dynamodb:${aws_region}:${aws_account_id}:table/${table_name}",
+                        data=dict(
+                            aws_region=cf.AWS_REGION,
+                            aws_account_id=cf.AWS_ACCOUNT_ID,
+                            table_name=idempotency_store[len("dynamodb:") :],
+                        ),
+                    )
+                ],
+            }
+        else:
+            self.stat_dynamodb_permission_for_lambda = None
+
         if len(self.deploy_config.codecommit_repo_list):
             codecommit_resource = [
                 cf.Sub(
@@ -109,8 +202,10 @@ class Stack(cf.Stack):
         self.stat_codecommit_permissin_for_lambda = {
             "Effect": "Allow",
             "Action": [
+                "codecommit:GetComment",
                 "codecommit:GetCommit",
                 "codecommit:GetFile",
+                "codecommit:GetDifferences",
                 "codecommit:PostCommentForPullRequest",
                 "codecommit:PostCommentForComparedCommit",
                 "codecommit:PostCommentReply",
@@ -149,10 +244,65 @@ class Stack(cf.Stack):
                 "codebuild:StartBuildBatch",
                 "codebuild:BatchGetBuilds",
                 "codebuild:BatchGetBuildBatches",
+                "codebuild:StopBuild",
+                "codebuild:StopBuildBatch",
             ],
             "Resource": codebuild_resource,
         }
 
+        self.stat_sqs_permission_for_lambda = {
+            "Effect": "Allow",
+            "Action": [
+                "sqs:ReceiveMessage",
+                "sqs:DeleteMessage",
+                "sqs:GetQueueAttributes",
+                "sqs:ChangeMessageVisibility",
+            ],
+            "Resource": [
+                cf.Sub(
+                    string="arn:aws:sqs:${aws_region}:${aws_account_id}:${queue_name}",
+                    data=dict(
+                        aws_region=cf.AWS_REGION,
+                        aws_account_id=cf.AWS_ACCOUNT_ID,
+                        queue_name=self.sqs_queue_name,
+                    ),
+                )
+            ],
+        }
+
+        self.stat_debounce_sqs_permission_for_lambda = {
+            "Effect": "Allow",
+            "Action": [
+                "sqs:SendMessage",
+                "sqs:ReceiveMessage",
+                "sqs:DeleteMessage",
+                "sqs:GetQueueAttributes",
+                "sqs:ChangeMessageVisibility",
+            ],
+            "Resource": [
+                cf.Sub(
+                    string="arn:aws:sqs:${aws_region}:${aws_account_id}:${queue_name}",
+                    data=dict(
+                        aws_region=cf.AWS_REGION,
+                        aws_account_id=cf.AWS_ACCOUNT_ID,
+                        queue_name=self.debounce_queue_name,
+                    ),
+                )
+            ],
+        }
+
+        lambda_policy_statement = [
+            self.stat_s3,
+            self.stat_codecommit_permissin_for_lambda,
+            self.stat_codebuild_permission_for_lambda,
+        ]
+        if self.deploy_config.use_sqs:
+            lambda_policy_statement.append(self.stat_sqs_permission_for_lambda)
+        if self.use_debounce:
+            lambda_policy_statement.append(self.stat_debounce_sqs_permission_for_lambda)
+        if self.stat_dynamodb_permission_for_lambda is not None:
+            lambda_policy_statement.append(self.stat_dynamodb_permission_for_lambda)
+
         self.iam_policy_for_lambda = iam.Policy(
             "IamPolicyForLambda",
             rp_PolicyName=cf.Sub(
@@ -162,13 +312,7 @@ class Stack(cf.Stack):
                     aws_region=cf.AWS_REGION,
                 ),
             ),
-            rp_PolicyDocument=encode_policy_document(
-                [
-                    self.stat_s3,
-                    self.stat_codecommit_permissin_for_lambda,
-                    self.stat_codebuild_permission_for_lambda,
-                ]
-            ),
+            rp_PolicyDocument=encode_policy_document(lambda_policy_statement),
             p_Roles=[
                 self.iam_role_for_lambda.ref(),
             ],
@@ -364,6 +508,129 @@ class Stack(cf.Stack):
         )
         self.rg_2_sns.add(self.sns_topic_policy)
 
+        if self.deploy_config.use_sqs:
+            self.make_rg_2_sqs()
+
+        if self.use_debounce:
+            self.make_rg_2_debounce_sqs()
+
+    def make_rg_2_sqs(self):
+        """
+        In the SQS buffered mode, the SNS topic fans out to an SQS queue, and
+        the Lambda function consumes the queue in batch. The message that
+        failed too many times goes to the dead letter queue.
+        """
+        if self.deploy_config.sqs_visibility_timeout < self.deploy_config.lambda_timeout:
+            raise ValueError(
+                "sqs_visibility_timeout has to be greater than or equal to "
+                "lambda_timeout, otherwise the message may be processed twice!"
+            )
+
+        self.sqs_dead_letter_queue = sqs.Queue(
+            "SQSDeadLetterQueue",
+            p_QueueName=self.sqs_dead_letter_queue_name,
+            p_MessageRetentionPeriod=self.deploy_config.sqs_message_retention_period,
+        )
+        self.rg_2_sns.add(self.sqs_dead_letter_queue)
+
+        self.sqs_queue = sqs.Queue(
+            "SQSQueue",
+            p_QueueName=self.sqs_queue_name,
+            p_VisibilityTimeout=self.deploy_config.sqs_visibility_timeout,
+            p_MessageRetentionPeriod=self.deploy_config.sqs_message_retention_period,
+            p_RedrivePolicy={
+                "deadLetterTargetArn": self.sqs_dead_letter_queue.rv_Arn,
+                "maxReceiveCount": self.deploy_config.sqs_max_receive_count,
+            },
+            ra_DependsOn=self.sqs_dead_letter_queue,
+        )
+        self.rg_2_sns.add(self.sqs_queue)
+
+        self.output_sqs_queue_url = cf.Output(
+            "SQSQueueUrl",
+            Value=self.sqs_queue.rv_QueueUrl,
+        )
+        self.rg_2_sns.add(self.output_sqs_queue_url)
+
+        self.sqs_queue_policy = sqs.QueuePolicy(
+            "SQSQueuePolicy",
+            rp_PolicyDocument={
+                "Version": "2012-10-17",
+                "Statement": [
+                    {
+                        "Sid": "SNS_send_message",
+                        "Effect": "Allow",
+                        "Principal": {"Service": "sns.amazonaws.com"},
+                        "Action": "sqs:SendMessage",
+                        "Resource": self.sqs_queue.rv_Arn,
+                        "Condition": {
+                            "ArnEquals": {"aws:SourceArn": self.sns_topic.rv_TopicArn}
+                        },
+                    }
+                ],
+            },
+            rp_Queues=[
+                self.sqs_queue.ref(),
+            ],
+            ra_DependsOn=[
+                self.sns_topic,
+                self.sqs_queue,
+            ],
+        )
+        self.rg_2_sns.add(self.sqs_queue_policy)
+
+        self.sns_subscription_for_sqs = sns.Subscription(
+            "SNSSubscriptionForSQS",
+            rp_Protocol="sqs",
+            rp_TopicArn=self.sns_topic.rv_TopicArn,
+            p_Endpoint=self.sqs_queue.rv_Arn,
+            ra_DependsOn=[
+                self.sns_topic,
+                self.sqs_queue,
+            ],
+        )
+        self.rg_2_sns.add(self.sns_subscription_for_sqs)
+
+    def make_rg_2_debounce_sqs(self):
+        """
+        In debounce mode, the PR source branch update event is sent to the
+        delayed queue, and the Lambda function consumes it when the debounce
+        window is over. See :mod:`aws_ci_bot.debounce`.
+        """
+        if not self.lambda_config.idempotency_store:
+            raise ValueError("DEBOUNCE_SECONDS requires IDEMPOTENCY_STORE!")
+        if self.deploy_config.sqs_visibility_timeout < self.deploy_config.lambda_timeout:
+            raise ValueError(
+                "sqs_visibility_timeout has to be greater than or equal to "
+                "lambda_timeout, otherwise the message may be processed twice!"
+            )
+
+        self.debounce_dead_letter_queue = sqs.Queue(
+            "SQSDebounceDeadLetterQueue",
+            p_QueueName=self.debounce_dead_letter_queue_name,
+            p_MessageRetentionPeriod=self.deploy_config.sqs_message_retention_period,
+        )
+        self.rg_2_sns.add(self.debounce_dead_letter_queue)
+
+        self.debounce_queue = sqs.Queue(
+            "SQSDebounceQueue",
+            p_QueueName=self.debounce_queue_name,
+            p_VisibilityTimeout=self.deploy_config.sqs_visibility_timeout,
+            p_MessageRetentionPeriod=self.deploy_config.sqs_message_retention_period,
+            p_RedrivePolicy={
+                "deadLetterTargetArn": self.debounce_dead_letter_queue.rv_Arn,
+                "maxReceiveCount": self.deploy_config.sqs_max_receive_count,
+            },
+            ra_DependsOn=self.debounce_dead_letter_queue,
+        )
+        self.rg_2_sns.add(self.debounce_queue)
+
+        self.output_debounce_queue_url = cf.Output(
+            "SQSDebounceQueueUrl",
+            Value=self.debounce_queue.rv_QueueUrl,
+        )
+        self.rg_2_sns.add(self.output_debounce_queue_url)
+
     def make_rg_3_lambda(self):
         self.rg_3_lambda = cf.ResourceGroup("RG3")
 
@@ -377,13 +644,10 @@ class Stack(cf.Stack):
             p_FunctionName=f"{self.project_name_slug}",
             p_Runtime=f"python{py_ver}",
             p_Handler="lambda_function.lambda_handler",
-            p_Timeout=10,
+            p_Timeout=self.deploy_config.lambda_timeout,
             p_MemorySize=128,
             p_Environment=awslambda.PropFunctionEnvironment(
-                p_Variables=dict(
-                    S3_BUCKET=self.deploy_config.s3_bucket,
-                    S3_PREFIX=self.deploy_config.s3_prefix,
-                ),
+                p_Variables=self.get_lambda_env_var(),
             ),
             p_PackageType="Zip",
             ra_DependsOn=[
@@ -393,26 +657,59 @@ class Stack(cf.Stack):
         )
         self.rg_3_lambda.add(self.lbd_func)
 
-        self.sns_subscription = sns.Subscription(
-            "SNSSubscriptionForLambda",
-            rp_Protocol="lambda",
-            rp_TopicArn=self.sns_topic.rv_TopicArn,
-            p_Endpoint=self.lbd_func.rv_Arn,
-            ra_DependsOn=[
-                self.sns_topic,
-                self.lbd_func,
-            ],
-        )
-        self.rg_3_lambda.add(self.sns_subscription)
+        if self.deploy_config.use_sqs:
+            self.lambda_event_source_mapping = awslambda.EventSourceMapping(
+                "LambdaEventSourceMappingForSQS",
+                rp_FunctionName=self.lbd_func.ref(),
+                p_EventSourceArn=self.sqs_queue.rv_Arn,
+                p_BatchSize=self.deploy_config.sqs_batch_size,
+                p_MaximumBatchingWindowInSeconds=(
+                    self.deploy_config.sqs_maximum_batching_window_in_seconds
+                ),
+                p_FunctionResponseTypes=["ReportBatchItemFailures"],
+                ra_DependsOn=[
+                    self.sqs_queue,
+                    self.lbd_func,
+                    self.iam_policy_for_lambda,
+                ],
+            )
+            self.rg_3_lambda.add(self.lambda_event_source_mapping)
+        else:
+            self.sns_subscription = sns.Subscription(
+                "SNSSubscriptionForLambda",
+                rp_Protocol="lambda",
+                rp_TopicArn=self.sns_topic.rv_TopicArn,
+                p_Endpoint=self.lbd_func.rv_Arn,
+                ra_DependsOn=[
+                    self.sns_topic,
+                    self.lbd_func,
+                ],
+            )
+            self.rg_3_lambda.add(self.sns_subscription)
 
-        self.lambda_permission_for_sns_topic = (
-            cf.helpers.awslambda.create_permission_for_sns(
-                logic_id="LambdaPermissionForSNSTopic",
-                func=self.lbd_func,
-                topic=self.sns_topic,
+            self.lambda_permission_for_sns_topic = (
+                cf.helpers.awslambda.create_permission_for_sns(
+                    logic_id="LambdaPermissionForSNSTopic",
+                    func=self.lbd_func,
+                    topic=self.sns_topic,
+                )
             )
-        )
-        self.rg_3_lambda.add(self.lambda_permission_for_sns_topic)
+            self.rg_3_lambda.add(self.lambda_permission_for_sns_topic)
+
+        if self.use_debounce:
+            self.lambda_event_source_mapping_for_debounce = awslambda.EventSourceMapping(
+                "LambdaEventSourceMappingForDebounceSQS",
+                rp_FunctionName=self.lbd_func.ref(),
+                p_EventSourceArn=self.debounce_queue.rv_Arn,
+                p_BatchSize=self.deploy_config.sqs_batch_size,
+                p_FunctionResponseTypes=["ReportBatchItemFailures"],
+                ra_DependsOn=[
+                    self.debounce_queue,
+                    self.lbd_func,
+                    self.iam_policy_for_lambda,
+                ],
+            )
+            self.rg_3_lambda.add(self.lambda_event_source_mapping_for_debounce)
 
     def make_rg_4_codecommit(self):
         self.rg_4_codecommit = cf.ResourceGroup("RG4")
@@ -2,6 +2,7 @@
 
 import typing as T
 import hashlib
+import dataclasses
 
 import attr
 from attrs_mate import AttrsClass
@@ -10,6 +11,7 @@ from s3pathlib import S3Path, context
 from boto_session_manager import BotoSesManager
 import cottonformation as cf
 
+from ..config import Config
 from .paths import (
     dir_python_lib,
     path_requirements,
@@ -33,6 +35,16 @@ class CodeBuildProject(AttrsClass):
 
 @attr.s
 class DeployConfig(AttrsClass):
+    """
+    :param lambda_env_var: the Lambda function runtime configuration, the
+        upper case name of the :class:`aws_ci_bot.config.Config` attribute
+        -> value, for example ``{"IDEMPOTENCY_STORE": "dynamodb:my-table"}``.
+        The IAM permissions that the enabled features need are granted to
+        the Lambda function. If ``DEBOUNCE_SECONDS`` is set, the delayed
+        queue is created, consumed by the Lambda function, and set as the
+        ``DEBOUNCE_QUEUE_URL``.
+    """
+
     project_name: str = attr.ib()
     aws_profile: T.Optional[str] = attr.ib()
     aws_region: T.Optional[str] = attr.ib()
@@ -42,6 +54,26 @@ class DeployConfig(AttrsClass):
     codebuild_project_list: T.List[
         CodeBuildProject
     ] = CodeBuildProject.ib_list_of_nested(factory=list)
+    lambda_timeout: int = attr.ib(default=10)
+    use_sqs: bool = attr.ib(default=False)
+    sqs_batch_size: int = attr.ib(default=10)
+    sqs_maximum_batching_window_in_seconds: int = attr.ib(default=0)
+    sqs_visibility_timeout: int = attr.ib(default=60)
+    sqs_max_receive_count: int = attr.ib(default=3)
+    sqs_message_retention_period: int = attr.ib(default=1209600)
+    lambda_env_var: T.Dict[str, str] = attr.ib(factory=dict)
+
+    def __attrs_post_init__(self):
+        names = {field.name.upper() for field in dataclasses.fields(Config)}
+        # the stack sets them, the debounce queue is created by the stack
+        names.difference_update({"S3_BUCKET", "S3_PREFIX", "DEBOUNCE_QUEUE_URL"})
+        for key in self.lambda_env_var:
+            if key not in names:
+                raise ValueError(f"invalid lambda_env_var {key!r}")
+        self.lambda_env_var = {
+            key: str(value).lower() if isinstance(value, bool) else str(value)
+            for key, value in self.lambda_env_var.items()
+        }
 
 
 def get_project_md5(
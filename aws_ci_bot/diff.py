@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Find the changed files between two commits, it is used to skip the build
+jobs whose paths are untouched (see
+:attr:`~aws_ci_bot.code_build_config.BuildJobConfig.include_paths`).
+
+The diff of two commits never changes, it is cached in the warm Lambda
+container, so the events of the same PR (created, comment, approve, merge)
+only call the ``GetDifferences`` API once.
+"""
+
+import typing as T
+
+from . import logger
+from .cache import LRUCache
+from .throttle import call_api
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+
+# (repo name, before commit id, after commit id) -> frozenset of file path
+diff_cache = LRUCache(name="diff", max_items=256, max_bytes=5_000_000)
+
+
+def iter_differences(
+    bsm: "BotoSesManager",
+    repo_name: str,
+    before_commit_id: str,
+    after_commit_id: str,
+) -> T.Iterator[dict]:
+    """
+    Iterate the differences of the ``GetDifferences`` API, it handles the
+    pagination.
+    """
+    kwargs = dict(
+        repositoryName=repo_name,
+        beforeCommitSpecifier=before_commit_id,
+        afterCommitSpecifier=after_commit_id,
+    )
+    while True:
+        res = call_api(
+            "codecommit.get_differences",
+            bsm.codecommit_client.get_differences,
+            **kwargs,
+        )
+        yield from res.get("differences", [])
+        next_token = res.get("NextToken")
+        if not next_token:
+            break
+        kwargs["NextToken"] = next_token
+
+
+def get_changed_files(
+    bsm: "BotoSesManager",
+    repo_name: str,
+    before_commit_id: str,
+    after_commit_id: str,
+) -> T.FrozenSet[str]:
+    """
+    Get the path of the added, modified, deleted and renamed (both the old
+    and new path) files between two commits.
+    """
+    key = (repo_name, before_commit_id, after_commit_id)
+    changed_files = diff_cache.get(key)
+    if changed_files is not None:
+        return changed_files
+    paths = set()
+    for difference in iter_differences(
+        bsm, repo_name, before_commit_id, after_commit_id
+    ):
+        for blob_key in ["beforeBlob", "afterBlob"]:
+            blob = difference.get(blob_key)
+            if blob and blob.get("path"):
+                paths.add(blob["path"])
+    changed_files = frozenset(paths)
+    logger.info(
+        f"{len(changed_files)} files changed between "
+        f"{before_commit_id[:7]} and {after_commit_id[:7]}"
+    )
+    diff_cache.set(key, changed_files, size=sum(len(path) for path in paths))
+    return changed_files
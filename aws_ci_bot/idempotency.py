@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""
+Suppress the duplicated side effects of a redelivered event.
+
+SNS delivery and Lambda async invocation are at-least-once, the same
+CodeStar notification may be handled more than once. Before we trigger
+build jobs or post a build status, we claim an idempotency key in a shared
+store (see :mod:`aws_ci_bot.store`). If the key is already claimed, the
+event is a duplicate and we skip it. If the handling fails, the key is
+released, so the retry can do the work.
+
+The key is claimed as ``in_progress`` with a short lease, about the Lambda
+timeout, and it is switched to ``done`` with the full TTL when the handling
+succeeds. If the Lambda function times out or crashes before it can release
+the key, the lease runs out and the redelivered event takes the key over.
+
+An event may trigger many build jobs, and some of them may fail to start.
+The started build jobs are recorded as the steps of the key (see
+:meth:`Idempotency.mark_done`), so the retry only starts the failed ones.
+
+The idempotency key is derived from the event content instead of the SNS
+message id, so it also catches the same change delivered by two
+notification rules:
+
+- CodeCommit: ``(repo name, event type, PR id, target branch, target commit,
+  source commit)``
+- CodeBuild: ``(build arn, build status)``
+"""
+
+import typing as T
+import contextlib
+from datetime import datetime
+
+from .store import (
+    BaseStore,
+    InMemoryStore,
+    SQLiteStore,
+    S3Store,
+    DynamoDBStore,
+)
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+    from aws_codecommit import CodeCommitEvent
+    from aws_codebuild import CodeBuildEvent
+
+
+def get_codecommit_key(cc_event: "CodeCommitEvent") -> str:
+    # two PRs may be opened from the same source commit
+    return (
+        f"codecommit:{cc_event.repo_name}:{cc_event.event_type}:"
+        f"{cc_event.pr_id or '-'}:{cc_event.target_branch or '-'}:"
+        f"{cc_event.target_commit or '-'}:{cc_event.source_commit}"
+    )
+
+
+def get_codebuild_key(cb_event: "CodeBuildEvent") -> str:
+    return f"codebuild:{cb_event.build_arn}:{cb_event.build_status}"
+
+
+def make_store(
+    uri: str,
+    bsm: "BotoSesManager",
+    s3_bucket: T.Optional[str] = None,
+    s3_prefix: T.Optional[str] = None,
+) -> T.Optional[BaseStore]:
+    """
+    Create the store from the ``IDEMPOTENCY_STORE`` setting:
+
+    - ``""``: disabled, return None.
+    - ``memory``: :class:`~aws_ci_bot.store.InMemoryStore`.
+    - ``sqlite:${path}``: :class:`~aws_ci_bot.store.SQLiteStore`.
+    - ``s3``: :class:`~aws_ci_bot.store.S3Store` in the ``idempotency/``
+      folder of the CI event archive location.
+    - ``s3://${bucket}/${prefix}``: :class:`~aws_ci_bot.store.S3Store`.
+    - ``dynamodb:${table_name}``: :class:`~aws_ci_bot.store.DynamoDBStore`.
+    """
+    if not uri:
+        return None
+    elif uri == "memory":
+        return InMemoryStore()
+    elif uri.startswith("sqlite:"):
+        return SQLiteStore(path=uri[len("sqlite:"):])
+    elif uri == "s3":
+        prefix = f"{s3_prefix}/" if s3_prefix else ""
+        return S3Store(
+            s3_client=bsm.s3_client,
+            bucket=s3_bucket,
+            prefix=f"{prefix}idempotency/",
+        )
+    elif uri.startswith("s3://"):
+        bucket, _, prefix = uri[len("s3://"):].partition("/")
+        return S3Store(s3_client=bsm.s3_client, bucket=bucket, prefix=prefix)
+    elif uri.startswith("dynamodb:"):
+        return DynamoDBStore(
+            dynamodb_client=bsm.dynamodb_client,
+            table_name=uri[len("dynamodb:"):],
+        )
+    else:
+        raise ValueError(f"invalid idempotency store {uri!r}")
+
+
+class Idempotency:
+    """
+    :param store: where to claim the idempotency keys.
+    :param ttl: how long in seconds a done key is valid, it should be
+        longer than the SNS / Lambda retry window.
+    :param lease: how long in seconds an ``in_progress`` key is valid, it
+        should be at least the Lambda timeout.
+    """
+
+    def __init__(self, store: BaseStore, ttl: int = 86400, lease: int = 900):
+        self.store = store
+        self.ttl = ttl
+        self.lease = lease
+
+    @contextlib.contextmanager
+    def claim(self, key: str) -> T.Iterator[bool]:
+        """
+        Claim the key, yield True if it is a new event, False if it is a
+        duplicate. If the code block raises, the key is released. If it
+        never returns, the key is released when the lease runs out.
+
+        Usage::
+
+            with idempotency.claim(key) as is_new:
+                if is_new:
+                    ...
+        """
+        claimed_at = datetime.utcnow().isoformat()
+        is_new = self.store.put_if_absent(
+            key,
+            {"status": "in_progress", "claimed_at": claimed_at},
+            ttl=self.lease,
+        )
+        if is_new is False:
+            yield False
+            return
+        try:
+            yield True
+        except Exception:
+            self.store.delete(key)
+            raise
+        self.store.put(
+            key,
+            {
+                "status": "done",
+                "claimed_at": claimed_at,
+                "done_at": datetime.utcnow().isoformat(),
+            },
+            ttl=self.ttl,
+        )
+
+    @staticmethod
+    def get_step_key(key: str, step: str) -> str:
+        return f"{key}:step:{step}"
+
+    def mark_done(self, key: str, step: str):
+        """
+        Record that a step of the claimed key is done, it is kept when the
+        key is released, so the retry can skip it.
+        """
+        self.store.put(
+            self.get_step_key(key, step),
+            {"done_at": datetime.utcnow().isoformat()},
+            ttl=self.ttl,
+        )
+
+    def is_done(self, key: str, step: str) -> bool:
+        return self.store.get(self.get_step_key(key, step)) is not None
+
+
+@contextlib.contextmanager
+def claim(idempotency: T.Optional[Idempotency], key: str) -> T.Iterator[bool]:
+    """
+    Same as :meth:`Idempotency.claim`, but always yield True if the
+    idempotency is disabled (None).
+    """
+    if idempotency is None:
+        yield True
+    else:
+        with idempotency.claim(key) as is_new:
+            yield is_new
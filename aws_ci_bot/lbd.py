@@ -1,68 +1,586 @@
 # -*- coding: utf-8 -*-
 
-import os
+"""
+The Lambda function entry point.
+
+To reduce the cold start time, this module only imports light weight modules
+at import time. The heavy dependencies (boto3, the CodeCommit / CodeBuild
+event handler, ...) are imported when we know the event source, and the boto
+session is created when we need it. Set ``LAZY_IMPORT=false`` to import
+everything at cold start.
+"""
 
-from aws_codecommit import CodeCommitEvent
-from aws_codebuild import CodeBuildEvent, BuildJobRun
-from boto_session_manager import BotoSesManager, AwsServiceEnum
+import os
+import random
+import typing as T
+import threading
 
 from . import logger
+from .config import Config
 from .console import get_s3_console_url
+from .metrics import metrics
+from .throttle import api_budget, rate_limiter
 from .sns_event import (
     extract_sns_message_dict,
+    split_sns_event,
     upload_ci_event,
+    upload_ci_event_in_background,
+)
+from .sqs_event import (
+    is_sqs_event,
+    sqs_record_to_sns_event,
+    make_batch_item_failures,
+)
+from .prefilter import get_ignore_reason
+from .batch import process_records, summarize
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+    from aws_codecommit import CodeCommitEvent
+    from aws_codebuild import CodeBuildEvent
+    from .idempotency import Idempotency
+    from .store import BaseStore
+    from .supersede import Supersede
+    from .debounce import Debounce
+    from .admission import Admission
+    from .result_cache import ResultCache
+    from .analytics import BuildTimingSink
+
+config = Config.from_env_var(os.environ)
+metrics.configure(
+    enabled=config.emit_metrics,
+    namespace=config.metrics_namespace,
+)
+api_budget.configure(config.max_concurrent_api_calls)
+rate_limiter.configure(
+    rate_limits=config.api_rate_limits,
+    max_attempts=config.api_max_attempts,
 )
-from .codecommit import CodeCommitEventHandler
-from .codebuild import CodeBuildEventHandler
+if config.build_timings_uri:
+    # refuse to start, instead of dropping the build timings silently
+    from .analytics import check_pyarrow
 
-S3_BUCKET = os.environ.get("S3_BUCKET")
-S3_PREFIX = os.environ.get("S3_PREFIX")
+    check_pyarrow()
 
-bsm = BotoSesManager()
+_bsm: T.Optional["BotoSesManager"] = None
+_store: T.Optional["BaseStore"] = None
+_store_lock = threading.Lock()
+_build_timings: T.Optional["BuildTimingSink"] = None
+_cache_settings: T.Optional[tuple] = None
 
 
-def lambda_handler(event: dict, context: dict):
-    logger.header("START", "=", 60)
+def get_config(config: T.Optional[Config] = None) -> Config:
+    """
+    Return the given config, fall back to the module level config that is
+    read from the environment variables at cold start.
+    """
+    if config is None:
+        return globals()["config"]
+    return config
+
+
+def get_bsm() -> "BotoSesManager":
+    """
+    Get the boto session manager, create it when it is called the first time.
+    """
+    global _bsm
+    if _bsm is None:
+        from boto_session_manager import BotoSesManager
+
+        _bsm = BotoSesManager()
+    return _bsm
+
+
+def get_store(
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+) -> T.Optional["BaseStore"]:
+    """
+    Get the store of the idempotency keys and the in-flight build job runs,
+    create it when it is called the first time. Return None if
+    ``IDEMPOTENCY_STORE`` is not set.
+    """
+    global _store
+    config = get_config(config)
+    if not config.idempotency_store:
+        return None
+    with _store_lock:
+        if _store is None:
+            from .idempotency import make_store
+
+            _store = make_store(
+                uri=config.idempotency_store,
+                bsm=bsm,
+                s3_bucket=config.s3_bucket,
+                s3_prefix=config.s3_prefix,
+            )
+    return _store
+
+
+def get_idempotency(
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+) -> T.Optional["Idempotency"]:
+    """
+    Get the idempotency layer, return None if it is disabled.
+    """
+    config = get_config(config)
+    store = get_store(bsm, config)
+    if store is None:
+        return None
+    from .idempotency import Idempotency
+
+    return Idempotency(
+        store=store,
+        ttl=config.idempotency_ttl,
+        lease=config.idempotency_lease,
+    )
+
+
+def get_supersede(
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+) -> T.Optional["Supersede"]:
+    """
+    Get the stale build superseding layer, return None if it is disabled.
+    """
+    config = get_config(config)
+    if config.supersede_builds is False:
+        return None
+    store = get_store(bsm, config)
+    if store is None:
+        raise ValueError("SUPERSEDE_BUILDS requires IDEMPOTENCY_STORE")
+    from .supersede import Supersede
+
+    return Supersede(store=store, ttl=config.idempotency_ttl)
+
+
+def get_debounce(
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+) -> T.Optional["Debounce"]:
+    """
+    Get the PR event debouncing layer, return None if it is disabled.
+    """
+    config = get_config(config)
+    if config.debounce_seconds <= 0:
+        return None
+    store = get_store(bsm, config)
+    if store is None or not config.debounce_queue_url:
+        raise ValueError(
+            "DEBOUNCE_SECONDS requires IDEMPOTENCY_STORE and DEBOUNCE_QUEUE_URL"
+        )
+    from .debounce import Debounce
+
+    return Debounce(
+        store=store,
+        sqs_client=bsm.sqs_client,
+        queue_url=config.debounce_queue_url,
+        window=config.debounce_seconds,
+        ttl=config.idempotency_ttl,
+    )
+
+
+def get_admission(
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+) -> T.Optional["Admission"]:
+    """
+    Get the build admission control layer, return None if it is disabled.
+    """
+    config = get_config(config)
+    if not config.concurrent_build_limits:
+        return None
+    store = get_store(bsm, config)
+    if store is None:
+        raise ValueError("CONCURRENT_BUILD_LIMITS requires IDEMPOTENCY_STORE")
+    from .admission import Admission
+
+    return Admission(
+        store=store,
+        limits=config.concurrent_build_limits,
+        ttl=config.idempotency_ttl,
+        aging_seconds=config.build_priority_aging_seconds,
+    )
+
+
+def get_result_cache(
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+) -> T.Optional["ResultCache"]:
+    """
+    Get the build result cache, return None if it is disabled.
+    """
+    config = get_config(config)
+    if config.reuse_build_results is False:
+        return None
+    store = get_store(bsm, config)
+    if store is None:
+        raise ValueError("REUSE_BUILD_RESULTS requires IDEMPOTENCY_STORE")
+    from .result_cache import ResultCache
+
+    return ResultCache(store=store, ttl=config.build_result_ttl)
+
+
+def get_build_timings(
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+) -> T.Optional["BuildTimingSink"]:
+    """
+    Get the build timing analytics sink, create it when it is called the
+    first time. Return None if ``BUILD_TIMINGS_URI`` is not set.
+    Raise if ``pyarrow`` is not installed.
+    """
+    global _build_timings
+    config = get_config(config)
+    if not config.build_timings_uri:
+        return None
+    with _store_lock:
+        if _build_timings is None:
+            from .analytics import BuildTimingSink
+
+            _build_timings = BuildTimingSink(
+                uri=config.build_timings_uri,
+                s3_client=bsm.s3_client,
+            )
+    return _build_timings
+
+
+def flush_build_timings():
+    """
+    Write the build timings of this Lambda invocation.
+    """
+    if _build_timings is not None:
+        _build_timings.flush()
+
+
+def configure_caches(config: T.Optional[Config] = None):
+    """
+    Apply the cache settings of the ``config`` to the warm container caches,
+    it only clears the caches when the settings are changed.
+    """
+    global _cache_settings
+    config = get_config(config)
+    settings = (
+        config.config_cache_max_items,
+        config.config_cache_max_bytes,
+        config.config_cache_ttl,
+        config.commit_cache_max_items,
+        config.commit_cache_ttl,
+    )
+    with _store_lock:
+        if settings == _cache_settings:
+            return
+        from . import code_build_config, commit_cache
+
+        code_build_config.configure_cache(
+            max_items=config.config_cache_max_items,
+            max_bytes=config.config_cache_max_bytes,
+            ttl=config.config_cache_ttl,
+        )
+        commit_cache.configure_cache(
+            max_items=config.commit_cache_max_items,
+            ttl=config.commit_cache_ttl,
+        )
+        _cache_settings = settings
+
 
-    # parse event
+def import_handlers():
+    """
+    Import all heavy dependencies needed to handle the event.
+    """
+    from . import codecommit, codebuild
+
+
+def parse_sns_event(
+    bsm: "BotoSesManager",
+    event: dict,
+    message_dict: T.Optional[dict] = None,
+) -> T.Union["CodeCommitEvent", "CodeBuildEvent"]:
+    """
+    Parse the AWS CodeStar notification event in the Lambda event into
+    a CodeCommit or CodeBuild event object.
+
+    :param message_dict: the CodeStar notification event if it is already
+        extracted from the Lambda event.
+    """
     logger.header("Parse SNS message", "-", 60)
-    message_dict = extract_sns_message_dict(event)
+    with metrics.timer("stage.parse_sns_message"):
+        if message_dict is None:
+            message_dict = extract_sns_message_dict(event)
 
-    if message_dict["source"] == "aws.codecommit":
-        ci_event = CodeCommitEvent.from_event(message_dict)
-        ci_event.bsm = bsm
-    elif message_dict["source"] == "aws.codebuild":
-        ci_event = CodeBuildEvent.from_codebuid_notification_event(message_dict)
-    else:  # pragma: no cover
-        raise NotImplementedError
+        if message_dict["source"] == "aws.codecommit":
+            from .commit_cache import CachedCodeCommitEvent
+
+            ci_event = CachedCodeCommitEvent.from_event(message_dict)
+            ci_event.bsm = bsm
+        elif message_dict["source"] == "aws.codebuild":
+            from aws_codebuild import CodeBuildEvent
+
+            ci_event = CodeBuildEvent.from_codebuid_notification_event(message_dict)
+        else:  # pragma: no cover
+            raise NotImplementedError
+    return ci_event
+
+
+def handle_sns_event(
+    bsm: "BotoSesManager",
+    config: Config,
+    event: dict,
+):
+    """
+    Handle one AWS CodeStar notification event. The ``event`` has to be a
+    Lambda event that has exactly one SNS record in it.
+    """
+    message_dict = None
+    if config.drop_ignorable_events:
+        message_dict = extract_sns_message_dict(event)
+        reason = get_ignore_reason(message_dict, trigger_rules=config.trigger_rules)
+        if reason is not None:
+            drop_ignorable_event(bsm=bsm, config=config, event=event, reason=reason)
+            return
+
+    ci_event = parse_sns_event(bsm=bsm, event=event, message_dict=message_dict)
 
     # upload event to S3 for debug
-    s3_uri = upload_ci_event(
-        s3_client=bsm.get_client(AwsServiceEnum.S3),
-        event_dict=event,
-        event_obj=ci_event,
-        bucket=S3_BUCKET,
-        prefix=S3_PREFIX,
-    )
+    if config.async_archive:
+        upload = upload_ci_event_in_background(
+            s3_client=bsm.s3_client,
+            event_dict=event,
+            event_obj=ci_event,
+            bucket=config.s3_bucket,
+            prefix=config.s3_prefix,
+            compress=config.compress_archive,
+        )
+        s3_uri = upload.s3_uri
+        try:
+            handle_ci_event(
+                bsm=bsm,
+                ci_event=ci_event,
+                s3_uri=s3_uri,
+                event=event,
+                config=config,
+            )
+        finally:
+            upload.join()
+    else:
+        with metrics.timer("stage.archive"):
+            s3_uri = upload_ci_event(
+                s3_client=bsm.s3_client,
+                event_dict=event,
+                event_obj=ci_event,
+                bucket=config.s3_bucket,
+                prefix=config.s3_prefix,
+                compress=config.compress_archive,
+            )
+        handle_ci_event(
+            bsm=bsm,
+            ci_event=ci_event,
+            s3_uri=s3_uri,
+            event=event,
+            config=config,
+        )
+
+
+def drop_ignorable_event(
+    bsm: "BotoSesManager",
+    config: Config,
+    event: dict,
+    reason: str,
+):
+    """
+    Drop the event that the rules are guaranteed to ignore, only a sample of
+    them is archived to S3. See :mod:`aws_ci_bot.prefilter`.
+    """
+    logger.info(f"drop ignorable event: {reason}")
+    metrics.put("prefilter.dropped", 1)
+    if random.random() >= config.ignored_event_archive_rate:
+        return
+    ci_event = parse_sns_event(bsm=bsm, event=event)
+    with metrics.timer("stage.archive"):
+        upload_ci_event(
+            s3_client=bsm.s3_client,
+            event_dict=event,
+            event_obj=ci_event,
+            bucket=config.s3_bucket,
+            prefix=config.s3_prefix,
+            compress=config.compress_archive,
+        )
+
+
+def handle_ci_event(
+    bsm: "BotoSesManager",
+    ci_event: T.Union["CodeCommitEvent", "CodeBuildEvent"],
+    s3_uri: str,
+    event: T.Optional[dict] = None,
+    config: T.Optional[Config] = None,
+):
+    """
+    Dispatch the parsed CI event to the CodeCommit or CodeBuild event handler.
+
+    :param event: the Lambda event with the original SNS record.
+    :param config: default to the module level config.
+    """
+    from aws_codecommit import CodeCommitEvent
+    from aws_codebuild import CodeBuildEvent, BuildJobRun
+
+    config = get_config(config)
+    configure_caches(config)
     s3_console_url = get_s3_console_url(s3_uri=s3_uri)
 
-    # handle the event
     if isinstance(ci_event, CodeCommitEvent):
+        from .codecommit import CodeCommitEventHandler
+
         cc_event_handler = CodeCommitEventHandler(
             bsm=bsm,
             cc_event=ci_event,
             s3_console_url=s3_console_url,
             s3_uri=s3_uri,
+            max_workers=config.build_job_max_workers,
+            comment_mode=config.comment_mode,
+            idempotency=get_idempotency(bsm, config),
+            supersede=get_supersede(bsm, config),
+            debounce=get_debounce(bsm, config),
+            sns_event=event,
+            trigger_rules=config.trigger_rules,
+            admission=get_admission(bsm, config),
+            result_cache=get_result_cache(bsm, config),
         )
-        cc_event_handler.execute()
+        with metrics.timer("stage.handle_codecommit_event"):
+            cc_event_handler.execute()
     elif isinstance(ci_event, CodeBuildEvent):
+        from .codebuild import CodeBuildEventHandler
+
         cb_event_handler = CodeBuildEventHandler(
             bsm=bsm,
             cb_event=ci_event,
             s3_console_url=s3_console_url,
             s3_uri=s3_uri,
             build_job_run=BuildJobRun.from_arn(ci_event.build_arn),
+            idempotency=get_idempotency(bsm, config),
+            supersede=get_supersede(bsm, config),
+            admission=get_admission(bsm, config),
+            result_cache=get_result_cache(bsm, config),
+            batch_report=config.batch_build_report,
+            batch_report_max_workers=config.batch_report_max_workers,
+            build_timings=get_build_timings(bsm, config),
         )
-        cb_event_handler.execute()
+        with metrics.timer("stage.handle_codebuild_event"):
+            cb_event_handler.execute()
     else:  # pragma: no cover
         raise NotImplementedError
+
+
+def create_clients(bsm: "BotoSesManager"):
+    """
+    boto3 client creation is not thread safe, create all clients we need
+    before we start the thread pool. It also imports the event handlers,
+    so the worker threads don't compete for the import lock.
+    """
+    import_handlers()
+    _ = bsm.s3_client
+    _ = bsm.codecommit_client
+    _ = bsm.codebuild_client
+
+
+def handle_sns_event_in_batch(
+    bsm: "BotoSesManager",
+    config: Config,
+    event: dict,
+) -> dict:
+    """
+    Handle all SNS records in the Lambda event concurrently. A failed record
+    doesn't affect other records, but we still raise an error at the end, so
+    the SNS / Lambda async retry and the DLQ kick in. The retry of a
+    succeeded record is skipped by the idempotency claim.
+
+    :return: the per-record result summary.
+    """
+    create_clients(bsm)
+
+    sub_events = split_sns_event(event)
+    logger.info(f"got {len(sub_events)} SNS records in this batch")
+    results = process_records(
+        records=sub_events,
+        func=lambda sub_event: handle_sns_event(
+            bsm=bsm, config=config, event=sub_event
+        ),
+        max_workers=config.max_workers,
+    )
+    for result, sub_event in zip(results, sub_events):
+        result.record_id = sub_event["Records"][0].get("Sns", {}).get("MessageId")
+    summary = summarize(results)
+    logger.info(
+        f"processed {summary['total']} records, "
+        f"{summary['succeeded']} succeeded, {summary['failed']} failed"
+    )
+    if summary["failed"] > 0:
+        errors = [
+            f"{result.record_id}: {result.error}"
+            for result in results
+            if not result.is_succeeded
+        ]
+        raise RuntimeError(
+            f"{summary['failed']} of {summary['total']} records failed: "
+            + "; ".join(errors)
+        )
+    return summary
+
+
+def handle_sqs_event_in_batch(
+    bsm: "BotoSesManager",
+    config: Config,
+    event: dict,
+) -> dict:
+    """
+    Handle a batch of SQS messages concurrently, each message is an SNS
+    notification envelope.
+
+    :return: the partial batch failure response, only the failed messages
+        will be retried.
+    """
+    create_clients(bsm)
+
+    records = event["Records"]
+    logger.info(f"got {len(records)} SQS messages in this batch")
+    results = process_records(
+        records=records,
+        func=lambda record: handle_sns_event(
+            bsm=bsm,
+            config=config,
+            event=sqs_record_to_sns_event(record),
+        ),
+        max_workers=config.max_workers,
+    )
+    failed_message_id_list = list()
+    for result, record in zip(results, records):
+        result.record_id = record["messageId"]
+        if not result.is_succeeded:
+            failed_message_id_list.append(record["messageId"])
+    summary = summarize(results)
+    logger.info(
+        f"processed {summary['total']} messages, "
+        f"{summary['succeeded']} succeeded, {summary['failed']} failed"
+    )
+    return make_batch_item_failures(failed_message_id_list)
+
+
+def lambda_handler(event: dict, context: dict) -> T.Optional[dict]:
+    logger.header("START", "=", 60)
+    try:
+        with metrics.timer("stage.lambda_handler"):
+            bsm = get_bsm()
+            if is_sqs_event(event):
+                return handle_sqs_event_in_batch(bsm=bsm, config=config, event=event)
+            elif config.batch_mode:
+                return handle_sns_event_in_batch(bsm=bsm, config=config, event=event)
+            else:
+                handle_sns_event(bsm=bsm, config=config, event=event)
+    finally:
+        flush_build_timings()
+        metrics.flush()
+
+
+if config.lazy_import is False:  # pragma: no cover
+    import_handlers()
+    get_bsm()
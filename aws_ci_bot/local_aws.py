@@ -0,0 +1,844 @@
+# -*- coding: utf-8 -*-
+
+"""
+In-memory stand-in of the AWS services used by the bot (S3, CodeCommit,
+CodeBuild, SQS). It only implements the API we call, and it records the number
+of calls of each API. It is used by the replay tool, the benchmark and the
+unit tests, so we can run the full event handling logic without an AWS
+account.
+
+Example::
+
+    from aws_ci_bot.local_aws import LocalBotoSesManager
+
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        repo_name="my-repo",
+        file_path="codebuild-config.json",
+        content='{"jobs": []}',
+    )
+    ...
+    print(bsm.call_counter)
+"""
+
+import typing as T
+import time
+import uuid
+import hashlib
+import threading
+import collections
+from datetime import datetime, timezone, timedelta
+
+from boto_session_manager import BotoSesManager, AwsServiceEnum
+
+DEFAULT_AWS_ACCOUNT_ID = "111122223333"
+DEFAULT_AWS_REGION = "us-east-1"
+
+
+class LocalAwsError(Exception):
+    """
+    Base exception of the local AWS stand-in. It has the same ``response``
+    attribute as the ``botocore.exceptions.ClientError``, so the error handling
+    code can check the error code in the same way.
+    """
+
+    code = "LocalAwsError"
+
+    def __init__(self, message: str = ""):
+        super().__init__(message)
+        self.response = {"Error": {"Code": self.code, "Message": message}}
+
+
+class NoSuchKey(LocalAwsError):
+    code = "NoSuchKey"
+
+
+class PreconditionFailed(LocalAwsError):
+    code = "PreconditionFailed"
+
+
+class FileDoesNotExistException(LocalAwsError):
+    code = "FileDoesNotExistException"
+
+
+class CommentDoesNotExistException(LocalAwsError):
+    code = "CommentDoesNotExistException"
+
+
+class ResourceNotFoundException(LocalAwsError):
+    code = "ResourceNotFoundException"
+
+
+class ThrottlingException(LocalAwsError):
+    code = "ThrottlingException"
+
+
+class InvalidInputException(LocalAwsError):
+    code = "InvalidInputException"
+
+
+class AccessDeniedException(LocalAwsError):
+    code = "AccessDeniedException"
+
+
+def _utc_now() -> datetime:
+    return datetime.utcnow().replace(tzinfo=timezone.utc)
+
+
+class LocalClient:
+    """
+    Base class of the local AWS service client.
+
+    :param latency: sleep this many seconds in every API call, to simulate
+        the network round trip.
+
+    Use :meth:`inject_throttle` and :meth:`set_tps_limit` to simulate the
+    ``ThrottlingException`` of the AWS API, and :meth:`inject_error` to
+    simulate other errors, for example a missing IAM permission.
+    """
+
+    service_name: str = ""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.call_counter: T.Counter[str] = collections.Counter()
+        self.throttled_counter: T.Counter[str] = collections.Counter()
+        self.clock: T.Callable[[], float] = time.monotonic
+        # operation -> number of the upcoming calls to throttle
+        self._throttles: T.Counter[str] = collections.Counter()
+        # operation -> the error to raise in all upcoming calls
+        self._errors: T.Dict[str, Exception] = dict()
+        # operation -> (calls per second, time of the accepted calls)
+        self._tps_limits: T.Dict[str, T.Tuple[float, T.Deque[float]]] = dict()
+        self._lock = threading.RLock()
+
+    def inject_throttle(self, operation: str, count: int = 1):
+        """
+        The next ``count`` calls of the operation raise ``ThrottlingException``.
+        """
+        with self._lock:
+            self._throttles[operation] += count
+
+    def inject_error(self, operation: str, error: T.Optional[Exception]):
+        """
+        All upcoming calls of the operation raise the error, None removes it.
+        """
+        with self._lock:
+            if error is None:
+                self._errors.pop(operation, None)
+            else:
+                self._errors[operation] = error
+
+    def set_tps_limit(self, operation: str, tps: float):
+        """
+        Throttle the calls of the operation above ``tps`` calls in any one
+        second window, like the AWS API rate limit.
+        """
+        with self._lock:
+            self._tps_limits[operation] = (tps, collections.deque())
+
+    def _is_throttled(self, operation: str) -> bool:
+        if self._throttles[operation] > 0:
+            self._throttles[operation] -= 1
+            return True
+        if operation in self._tps_limits:
+            tps, calls = self._tps_limits[operation]
+            now = self.clock()
+            while calls and calls[0] <= now - 1:
+                calls.popleft()
+            if len(calls) >= tps:
+                return True
+            calls.append(now)
+        return False
+
+    def _record(self, operation: str):
+        with self._lock:
+            self.call_counter[operation] += 1
+            error = self._errors.get(operation)
+            is_throttled = self._is_throttled(operation)
+            if is_throttled:
+                self.throttled_counter[operation] += 1
+        if error is not None:
+            raise error
+        if self.latency:
+            time.sleep(self.latency)
+        if is_throttled:
+            raise ThrottlingException(f"Rate exceeded for {operation}")
+
+
+class LocalS3Client(LocalClient):
+    """
+    In-memory S3 client.
+    """
+
+    service_name = AwsServiceEnum.S3
+
+    class exceptions:
+        NoSuchKey = NoSuchKey
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        # (bucket, key) -> object metadata and body
+        self.objects: T.Dict[T.Tuple[str, str], dict] = dict()
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body=b"",
+        IfNoneMatch: T.Optional[str] = None,
+        IfMatch: T.Optional[str] = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Support the S3 conditional write, ``IfNoneMatch="*"`` only writes if
+        the object doesn't exist, ``IfMatch=etag`` only writes if the object
+        is not changed.
+        """
+        self._record("put_object")
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        etag = f'"{hashlib.md5(Body).hexdigest()}"'
+        with self._lock:
+            existing = self.objects.get((Bucket, Key))
+            if IfNoneMatch == "*" and existing is not None:
+                raise PreconditionFailed(f"s3://{Bucket}/{Key} already exists")
+            if IfMatch is not None and (
+                existing is None or existing["ETag"] != IfMatch
+            ):
+                raise PreconditionFailed(f"s3://{Bucket}/{Key} is changed")
+            self.objects[(Bucket, Key)] = dict(Body=Body, ETag=etag, **kwargs)
+        return {"ETag": etag}
+
+    def get_object(self, Bucket: str, Key: str) -> dict:
+        self._record("get_object")
+        try:
+            obj = self.objects[(Bucket, Key)]
+        except KeyError:
+            raise NoSuchKey(f"s3://{Bucket}/{Key}")
+        body = obj["Body"]
+
+        class StreamingBody:
+            def read(self) -> bytes:
+                return body
+
+        res = {k: v for k, v in obj.items() if k != "Body"}
+        res["Body"] = StreamingBody()
+        res["ContentLength"] = len(body)
+        return res
+
+    def list_objects_v2(
+        self,
+        Bucket: str,
+        Prefix: str = "",
+        MaxKeys: int = 1000,
+        ContinuationToken: T.Optional[str] = None,
+    ) -> dict:
+        self._record("list_objects_v2")
+        with self._lock:
+            keys = sorted(
+                key
+                for bucket, key in self.objects
+                if bucket == Bucket and key.startswith(Prefix)
+            )
+        start = int(ContinuationToken or 0)
+        end = start + MaxKeys
+        res = {
+            "Contents": [
+                {"Key": key, "Size": len(self.objects[(Bucket, key)]["Body"])}
+                for key in keys[start:end]
+            ],
+            "IsTruncated": end < len(keys),
+        }
+        if res["IsTruncated"]:
+            res["NextContinuationToken"] = str(end)
+        return res
+
+    def delete_object(self, Bucket: str, Key: str) -> dict:
+        self._record("delete_object")
+        with self._lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def delete_objects(self, Bucket: str, Delete: dict) -> dict:
+        self._record("delete_objects")
+        with self._lock:
+            for obj in Delete["Objects"]:
+                self.objects.pop((Bucket, obj["Key"]), None)
+        return {}
+
+
+class LocalCodeCommitClient(LocalClient):
+    """
+    In-memory CodeCommit client.
+
+    Use :meth:`add_commit` and :meth:`add_file` to prepare the test data. If
+    a commit is not added, ``get_commit`` returns a made up commit, so you can
+    replay production events without copying the git history.
+    """
+
+    service_name = AwsServiceEnum.CodeCommit
+
+    class exceptions:
+        FileDoesNotExistException = FileDoesNotExistException
+        CommentDoesNotExistException = CommentDoesNotExistException
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency=latency)
+        # (repo_name, commit_id) -> commit data
+        self.commits: T.Dict[T.Tuple[str, str], dict] = dict()
+        # (repo_name, commit_id, file_path) -> file content, repo_name and
+        # commit_id can be None, which means "any"
+        self.files: T.Dict[
+            T.Tuple[T.Optional[str], T.Optional[str], str], bytes
+        ] = dict()
+        # (repo_name, before commit_id, after commit_id) -> differences
+        self.differences: T.Dict[T.Tuple[str, str, str], T.List[dict]] = dict()
+        # comment_id -> comment data
+        self.comments: T.Dict[str, dict] = dict()
+
+    # --------------------------------------------------------------------------
+    # test data
+    # --------------------------------------------------------------------------
+    def add_commit(
+        self,
+        repo_name: str,
+        commit_id: str,
+        message: str = "",
+        committer_name: str = "local",
+        tree_id: T.Optional[str] = None,
+        parents: T.Optional[T.List[str]] = None,
+    ):
+        self.commits[(repo_name, commit_id)] = {
+            "commitId": commit_id,
+            "treeId": tree_id or commit_id,
+            "parents": parents or [],
+            "message": message,
+            "author": {"name": committer_name, "email": "", "date": ""},
+            "committer": {"name": committer_name, "email": "", "date": ""},
+            "additionalData": "",
+        }
+
+    def add_file(
+        self,
+        file_path: str,
+        content: T.Union[str, bytes],
+        repo_name: T.Optional[str] = None,
+        commit_id: T.Optional[str] = None,
+    ):
+        """
+        Add a file to the repo at the commit. If ``repo_name`` or ``commit_id``
+        is not given, the file is visible in all repos or all commits.
+        """
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        self.files[(repo_name, commit_id, file_path)] = content
+
+    def add_comment(self, comment_id: str, content: str = "", **kwargs):
+        """
+        Add an existing comment, so the bot can reply to it.
+        """
+        self._new_comment(content=content, commentId=comment_id, **kwargs)
+
+    # --------------------------------------------------------------------------
+    # boto3 API
+    # --------------------------------------------------------------------------
+    def get_commit(self, repositoryName: str, commitId: str) -> dict:
+        self._record("get_commit")
+        try:
+            commit = self.commits[(repositoryName, commitId)]
+        except KeyError:
+            commit = {
+                "commitId": commitId,
+                "treeId": commitId,
+                "parents": [],
+                "message": f"commit {commitId[:7]}\n",
+                "author": {"name": "local", "email": "", "date": ""},
+                "committer": {"name": "local", "email": "", "date": ""},
+                "additionalData": "",
+            }
+        return {"commit": dict(commit)}
+
+    def get_file(
+        self,
+        repositoryName: str,
+        filePath: str,
+        commitSpecifier: T.Optional[str] = None,
+    ) -> dict:
+        self._record("get_file")
+        for key in [
+            (repositoryName, commitSpecifier, filePath),
+            (repositoryName, None, filePath),
+            (None, None, filePath),
+        ]:
+            if key in self.files:
+                content = self.files[key]
+                break
+        else:
+            raise FileDoesNotExistException(f"{repositoryName}:{filePath}")
+        return {
+            "commitId": commitSpecifier or "",
+            "blobId": hashlib.sha1(content).hexdigest(),
+            "filePath": filePath,
+            "fileMode": "NORMAL",
+            "fileSize": len(content),
+            "fileContent": content,
+        }
+
+    def add_differences(
+        self,
+        repo_name: str,
+        before_commit_id: str,
+        after_commit_id: str,
+        paths: T.List[str],
+    ):
+        """
+        Add the changed files between two commits, they are returned as
+        modified files by ``get_differences``.
+        """
+        self.differences[(repo_name, before_commit_id, after_commit_id)] = [
+            {
+                "beforeBlob": {"path": path, "blobId": uuid.uuid4().hex},
+                "afterBlob": {"path": path, "blobId": uuid.uuid4().hex},
+                "changeType": "M",
+            }
+            for path in paths
+        ]
+
+    def get_differences(
+        self,
+        repositoryName: str,
+        afterCommitSpecifier: str,
+        beforeCommitSpecifier: T.Optional[str] = None,
+        MaxResults: int = 100,
+        NextToken: T.Optional[str] = None,
+        **kwargs,
+    ) -> dict:
+        """
+        Return the differences added by :meth:`add_differences`, no difference
+        if they are not added.
+        """
+        self._record("get_differences")
+        differences = self.differences.get(
+            (repositoryName, beforeCommitSpecifier, afterCommitSpecifier), []
+        )
+        start = int(NextToken or 0)
+        end = start + MaxResults
+        res = {"differences": differences[start:end]}
+        if end < len(differences):
+            res["NextToken"] = str(end)
+        return res
+
+    def _new_comment(self, content: str, **kwargs) -> dict:
+        now = _utc_now()
+        comment = {
+            "commentId": uuid.uuid4().hex,
+            "content": content,
+            "creationDate": now,
+            "lastModifiedDate": now,
+            "authorArn": f"arn:aws:iam::{DEFAULT_AWS_ACCOUNT_ID}:role/local",
+            "deleted": False,
+        }
+        comment.update(kwargs)
+        with self._lock:
+            self.comments[comment["commentId"]] = comment
+        return comment
+
+    def post_comment_for_compared_commit(
+        self,
+        repositoryName: str,
+        afterCommitId: str,
+        content: str,
+        beforeCommitId: T.Optional[str] = None,
+        **kwargs,
+    ) -> dict:
+        self._record("post_comment_for_compared_commit")
+        comment = self._new_comment(content=content, repositoryName=repositoryName)
+        return {
+            "repositoryName": repositoryName,
+            "beforeCommitId": beforeCommitId,
+            "afterCommitId": afterCommitId,
+            "comment": dict(comment),
+        }
+
+    def post_comment_for_pull_request(
+        self,
+        pullRequestId: str,
+        repositoryName: str,
+        beforeCommitId: str,
+        afterCommitId: str,
+        content: str,
+        **kwargs,
+    ) -> dict:
+        self._record("post_comment_for_pull_request")
+        comment = self._new_comment(
+            content=content,
+            repositoryName=repositoryName,
+            pullRequestId=pullRequestId,
+        )
+        return {
+            "repositoryName": repositoryName,
+            "pullRequestId": pullRequestId,
+            "beforeCommitId": beforeCommitId,
+            "afterCommitId": afterCommitId,
+            "comment": dict(comment),
+        }
+
+    def post_comment_reply(self, inReplyTo: str, content: str, **kwargs) -> dict:
+        self._record("post_comment_reply")
+        if inReplyTo not in self.comments:
+            raise CommentDoesNotExistException(inReplyTo)
+        comment = self._new_comment(content=content, inReplyTo=inReplyTo)
+        return {"comment": dict(comment)}
+
+    def update_comment(self, commentId: str, content: str) -> dict:
+        self._record("update_comment")
+        with self._lock:
+            try:
+                comment = self.comments[commentId]
+            except KeyError:
+                raise CommentDoesNotExistException(commentId)
+            comment["content"] = content
+            comment["lastModifiedDate"] = _utc_now()
+        return {"comment": dict(comment)}
+
+    def get_comment(self, commentId: str) -> dict:
+        self._record("get_comment")
+        try:
+            return {"comment": dict(self.comments[commentId])}
+        except KeyError:
+            raise CommentDoesNotExistException(commentId)
+
+
+class LocalCodeBuildClient(LocalClient):
+    """
+    In-memory CodeBuild client. A started build stays ``IN_PROGRESS``, the
+    test code decides when and how it ends.
+    """
+
+    service_name = AwsServiceEnum.CodeBuild
+
+    class exceptions:
+        ResourceNotFoundException = ResourceNotFoundException
+        InvalidInputException = InvalidInputException
+
+    # the ``BatchGet*`` APIs accept at most this many ids per call
+    max_batch_get_ids = 100
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        aws_account_id: str = DEFAULT_AWS_ACCOUNT_ID,
+        aws_region: str = DEFAULT_AWS_REGION,
+    ):
+        super().__init__(latency=latency)
+        self.aws_account_id = aws_account_id
+        self.aws_region = aws_region
+        # build id -> build data
+        self.builds: T.Dict[str, dict] = dict()
+        # build batch id -> build batch data
+        self.build_batches: T.Dict[str, dict] = dict()
+        # project name -> the last build number
+        self.build_numbers: T.Counter[str] = collections.Counter()
+
+    def _new_build(self, type: str, projectName: str, **kwargs) -> dict:
+        with self._lock:
+            self.build_numbers[projectName] += 1
+            build_number = self.build_numbers[projectName]
+        run_id = str(uuid.uuid4())
+        build_id = f"{projectName}:{run_id}"
+        return {
+            "id": build_id,
+            "arn": (
+                f"arn:aws:codebuild:{self.aws_region}:{self.aws_account_id}:"
+                f"{type}/{build_id}"
+            ),
+            "projectName": projectName,
+            "startTime": _utc_now(),
+            "sourceVersion": kwargs.get("sourceVersion"),
+            "environment": {
+                "environmentVariables": kwargs.get(
+                    "environmentVariablesOverride", []
+                ),
+            },
+            "buildNumber": build_number,
+        }
+
+    def start_build(self, projectName: str, **kwargs) -> dict:
+        self._record("start_build")
+        build = self._new_build("build", projectName, **kwargs)
+        build["buildStatus"] = "IN_PROGRESS"
+        build["currentPhase"] = "SUBMITTED"
+        with self._lock:
+            self.builds[build["id"]] = build
+        return {"build": dict(build)}
+
+    def start_build_batch(self, projectName: str, **kwargs) -> dict:
+        self._record("start_build_batch")
+        build_batch = self._new_build("build-batch", projectName, **kwargs)
+        build_batch["buildBatchNumber"] = build_batch.pop("buildNumber")
+        build_batch["buildBatchStatus"] = "IN_PROGRESS"
+        build_batch["currentPhase"] = "SUBMITTED"
+        build_batch["buildGroups"] = []
+        with self._lock:
+            self.build_batches[build_batch["id"]] = build_batch
+        return {"buildBatch": dict(build_batch)}
+
+    def stop_build(self, id: str) -> dict:
+        """
+        Stop an in progress build, a completed build is not changed.
+        """
+        self._record("stop_build")
+        with self._lock:
+            try:
+                build = self.builds[id]
+            except KeyError:
+                raise ResourceNotFoundException(id)
+            if build["buildStatus"] == "IN_PROGRESS":
+                build["buildStatus"] = "STOPPED"
+            return {"build": dict(build)}
+
+    def stop_build_batch(self, id: str) -> dict:
+        """
+        Stop an in progress build batch, a completed build batch is not changed.
+        """
+        self._record("stop_build_batch")
+        with self._lock:
+            try:
+                build_batch = self.build_batches[id]
+            except KeyError:
+                raise ResourceNotFoundException(id)
+            if build_batch["buildBatchStatus"] == "IN_PROGRESS":
+                build_batch["buildBatchStatus"] = "STOPPED"
+            return {"buildBatch": dict(build_batch)}
+
+    def add_batch_child(
+        self,
+        batch_id: str,
+        identifier: str,
+        build_status: str = "SUCCEEDED",
+        duration_seconds: int = 60,
+    ) -> dict:
+        """
+        Test helper, add a finished child build to a build batch.
+        """
+        build_batch = self.build_batches[batch_id]
+        build = self._new_build("build", build_batch["projectName"])
+        build["buildStatus"] = build_status
+        build["currentPhase"] = "COMPLETED"
+        build["endTime"] = build["startTime"] + timedelta(seconds=duration_seconds)
+        build["buildBatchArn"] = build_batch["arn"]
+        with self._lock:
+            self.builds[build["id"]] = build
+            build_batch["buildGroups"].append(
+                {
+                    "identifier": identifier,
+                    "dependsOn": [],
+                    "ignoreFailure": False,
+                    "currentBuildSummary": {
+                        "arn": build["arn"],
+                        "requestedOn": build["startTime"],
+                        "buildStatus": build_status,
+                    },
+                }
+            )
+        return build
+
+    def _batch_get(self, ids: T.List[str], data: T.Dict[str, dict]):
+        if len(ids) > self.max_batch_get_ids:
+            raise InvalidInputException(
+                f"at most {self.max_batch_get_ids} ids, got {len(ids)}"
+            )
+        found, not_found = list(), list()
+        with self._lock:
+            for id in ids:
+                if id in data:
+                    found.append(dict(data[id]))
+                else:
+                    not_found.append(id)
+        return found, not_found
+
+    def batch_get_builds(self, ids: T.List[str]) -> dict:
+        self._record("batch_get_builds")
+        found, not_found = self._batch_get(ids, self.builds)
+        return {"builds": found, "buildsNotFound": not_found}
+
+    def batch_get_build_batches(self, ids: T.List[str]) -> dict:
+        self._record("batch_get_build_batches")
+        found, not_found = self._batch_get(ids, self.build_batches)
+        return {"buildBatches": found, "buildBatchesNotFound": not_found}
+
+
+class LocalSQSClient(LocalClient):
+    """
+    In-memory SQS client, it supports the message delay. A received message
+    is invisible until it is deleted.
+
+    :param clock: the time function, the test code can replace it to skip
+        the delay.
+    """
+
+    service_name = AwsServiceEnum.SQS
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        clock: T.Callable[[], float] = time.time,
+    ):
+        super().__init__(latency=latency)
+        self.clock = clock
+        # queue url -> list of messages
+        self.queues: T.Dict[str, T.List[dict]] = collections.defaultdict(list)
+
+    def send_message(
+        self,
+        QueueUrl: str,
+        MessageBody: str,
+        DelaySeconds: int = 0,
+        MessageAttributes: T.Optional[dict] = None,
+    ) -> dict:
+        self._record("send_message")
+        message = {
+            "MessageId": str(uuid.uuid4()),
+            "ReceiptHandle": uuid.uuid4().hex,
+            "Body": MessageBody,
+            "MessageAttributes": MessageAttributes or {},
+            "visible_at": self.clock() + DelaySeconds,
+            "received": False,
+        }
+        with self._lock:
+            self.queues[QueueUrl].append(message)
+        return {"MessageId": message["MessageId"]}
+
+    def receive_message(
+        self,
+        QueueUrl: str,
+        MaxNumberOfMessages: int = 1,
+        **kwargs,
+    ) -> dict:
+        self._record("receive_message")
+        now = self.clock()
+        messages = list()
+        with self._lock:
+            for message in self.queues[QueueUrl]:
+                if len(messages) >= MaxNumberOfMessages:
+                    break
+                if message["received"] is False and message["visible_at"] <= now:
+                    message["received"] = True
+                    messages.append(
+                        {
+                            key: message[key]
+                            for key in [
+                                "MessageId",
+                                "ReceiptHandle",
+                                "Body",
+                                "MessageAttributes",
+                            ]
+                        }
+                    )
+        return {"Messages": messages}
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str) -> dict:
+        self._record("delete_message")
+        with self._lock:
+            self.queues[QueueUrl] = [
+                message
+                for message in self.queues[QueueUrl]
+                if message["ReceiptHandle"] != ReceiptHandle
+            ]
+        return {}
+
+    def to_lambda_event(self, queue_url: str, max_messages: int = 10) -> dict:
+        """
+        Receive and delete the visible messages, and return them as the
+        Lambda event of the SQS event source mapping.
+        """
+        messages = self.receive_message(
+            QueueUrl=queue_url, MaxNumberOfMessages=max_messages
+        )["Messages"]
+        for message in messages:
+            self.delete_message(
+                QueueUrl=queue_url, ReceiptHandle=message["ReceiptHandle"]
+            )
+        return {
+            "Records": [
+                {
+                    "messageId": message["MessageId"],
+                    "receiptHandle": message["ReceiptHandle"],
+                    "body": message["Body"],
+                    "eventSource": "aws:sqs",
+                    "eventSourceARN": (
+                        f"arn:aws:sqs:{DEFAULT_AWS_REGION}:{DEFAULT_AWS_ACCOUNT_ID}:"
+                        f"{queue_url.rstrip('/').split('/')[-1]}"
+                    ),
+                }
+                for message in messages
+            ]
+        }
+
+
+class LocalBotoSesManager(BotoSesManager):
+    """
+    A :class:`~boto_session_manager.BotoSesManager` that returns the local
+    stand-in clients. It never creates a real boto3 client, asking for a
+    client of other AWS service raises ``NotImplementedError``.
+
+    :param latency: simulated latency of each API call in seconds.
+    """
+
+    def __init__(
+        self,
+        aws_account_id: str = DEFAULT_AWS_ACCOUNT_ID,
+        aws_region: str = DEFAULT_AWS_REGION,
+        latency: float = 0.0,
+    ):
+        super().__init__(region_name=aws_region)
+        self._aws_account_id_cache = aws_account_id
+        self._aws_region_cache = aws_region
+        for client in [
+            LocalS3Client(latency=latency),
+            LocalCodeCommitClient(latency=latency),
+            LocalCodeBuildClient(
+                latency=latency,
+                aws_account_id=aws_account_id,
+                aws_region=aws_region,
+            ),
+            LocalSQSClient(latency=latency),
+        ]:
+            self._client_cache[client.service_name] = client
+
+    def get_client(self, service_name: str, **kwargs) -> LocalClient:
+        try:
+            return self._client_cache[service_name]
+        except KeyError:
+            raise NotImplementedError(
+                f"there is no local stand-in for {service_name!r}"
+            )
+
+    @property
+    def call_counter(self) -> T.Counter[str]:
+        """
+        Number of calls of each API in ``${service}.${operation}`` format.
+        """
+        counter = collections.Counter()
+        for service_name, client in self._client_cache.items():
+            for operation, count in client.call_counter.items():
+                counter[f"{service_name}.{operation}"] += count
+        return counter
+
+    @property
+    def throttled_counter(self) -> T.Counter[str]:
+        """
+        Number of throttled calls of each API in ``${service}.${operation}`` format.
+        """
+        counter = collections.Counter()
+        for service_name, client in self._client_cache.items():
+            for operation, count in client.throttled_counter.items():
+                counter[f"{service_name}.{operation}"] += count
+        return counter
+
+    def reset_call_counter(self):
+        for client in self._client_cache.values():
+            with client._lock:
+                client.call_counter.clear()
+                client.throttled_counter.clear()
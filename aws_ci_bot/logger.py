@@ -28,3 +28,7 @@ tab = "  "
 
 def info(msg: str, indent=0):
     return logger.info(f"{tab * indent}{msg}")
+
+
+def error(msg: str, indent=0):
+    return logger.error(f"{tab * indent}{msg}")
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""
+Lightweight instrumentation of the Lambda function.
+
+It times each event handling stage and each outbound AWS API call, and emits
+them as `CloudWatch Embedded Metric Format (EMF)
+<https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html>`_
+log lines. CloudWatch extracts the metrics from the log asynchronously, so it
+doesn't need any extra API call.
+
+Usage::
+
+    from aws_ci_bot.metrics import metrics
+
+    with metrics.timer("api.codecommit.get_file"):
+        ...
+
+    metrics.flush() # at the end of the Lambda invocation
+
+When it is disabled (the default), :meth:`Metrics.timer` returns a shared
+no-op context manager, so the overhead is only an attribute lookup.
+"""
+
+import typing as T
+import os
+import sys
+import json
+import time
+import threading
+
+DEFAULT_NAMESPACE = "aws_ci_bot"
+
+# EMF allows at most 100 values per metric in one log line
+MAX_VALUES_PER_METRIC = 100
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.metrics.put(
+            self.name,
+            (time.perf_counter() - self.start) * 1000,
+            unit="Milliseconds",
+        )
+        return False
+
+
+class Metrics:
+    """
+    Collect the metrics of one Lambda invocation, it is thread safe.
+
+    :param enabled: if False, nothing is recorded.
+    :param namespace: the CloudWatch metric namespace.
+    :param dimensions: the metric dimensions, by default it is the Lambda
+        function name.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        namespace: str = DEFAULT_NAMESPACE,
+        dimensions: T.Optional[T.Dict[str, str]] = None,
+    ):
+        self.enabled = enabled
+        self.namespace = namespace
+        if dimensions is None:
+            dimensions = {
+                "FunctionName": os.environ.get(
+                    "AWS_LAMBDA_FUNCTION_NAME", "aws_ci_bot"
+                ),
+            }
+        self.dimensions = dimensions
+        # metric name -> (unit, values)
+        self._data: T.Dict[str, T.Tuple[str, T.List[float]]] = dict()
+        self._lock = threading.Lock()
+
+    def configure(
+        self,
+        enabled: bool,
+        namespace: T.Optional[str] = None,
+    ):
+        self.enabled = enabled
+        if namespace:
+            self.namespace = namespace
+
+    def timer(self, name: str) -> T.Union[_Timer, _NullTimer]:
+        """
+        Time the code block in milliseconds.
+        """
+        if self.enabled is False:
+            return _null_timer
+        return _Timer(self, name)
+
+    def put(self, name: str, value: float, unit: str = "Count"):
+        if self.enabled is False:
+            return
+        with self._lock:
+            self._data.setdefault(name, (unit, []))[1].append(value)
+
+    def _make_emf(self, data: T.Dict[str, T.Tuple[str, T.List[float]]]) -> dict:
+        doc = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [list(self.dimensions)],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (unit, _) in sorted(data.items())
+                        ],
+                    }
+                ],
+            },
+        }
+        doc.update(self.dimensions)
+        for name, (_, values) in data.items():
+            doc[name] = values[0] if len(values) == 1 else values
+        return doc
+
+    def to_emf(self) -> T.List[dict]:
+        """
+        Convert the collected metrics to EMF documents. EMF allows at most 100
+        values per metric in one document, so it may be split into multiple
+        documents.
+        """
+        with self._lock:
+            data = {
+                name: (unit, list(values))
+                for name, (unit, values) in self._data.items()
+            }
+        docs = list()
+        start = 0
+        while True:
+            chunk = {
+                name: (unit, values[start : start + MAX_VALUES_PER_METRIC])
+                for name, (unit, values) in data.items()
+                if len(values) > start
+            }
+            if len(chunk) == 0:
+                break
+            docs.append(self._make_emf(chunk))
+            start += MAX_VALUES_PER_METRIC
+        return docs
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def flush(self, stream: T.Optional[T.TextIO] = None) -> T.List[dict]:
+        """
+        Write the collected metrics as EMF log lines to stdout, and clear them.
+
+        :return: the EMF documents.
+        """
+        if self.enabled is False:
+            return []
+        docs = self.to_emf()
+        self.clear()
+        if len(docs):
+            if stream is None:
+                stream = sys.stdout
+            for doc in docs:
+                stream.write(json.dumps(doc) + "\n")
+            stream.flush()
+        return docs
+
+
+metrics = Metrics()
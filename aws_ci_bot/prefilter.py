@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""
+Drop the ignorable events before they are archived and parsed.
+
+Most of the traffic is the CodeBuild phase change and ``IN_PROGRESS`` events,
+and the CodeCommit comment and approval events. The full path parses them
+into ``CodeBuildEvent`` / ``CodeCommitEvent`` objects, uploads them to S3,
+and only then the rules return ``nothing``. This module classifies the raw
+CodeStar notification dict by only looking at the ``source``, the
+``detailType`` and a few status fields, so the Lambda function can drop them
+right away (see ``DROP_IGNORABLE_EVENTS``).
+
+The classifier is conservative, it only drops an event if the full rule
+function is guaranteed to return ``nothing``:
+
+- CodeBuild: the phase change events, and the ``IN_PROGRESS`` state change
+  events, see :func:`aws_ci_bot.codebuild_rule.check_what_to_do`.
+- CodeCommit: the event types that no rule of the built-in trigger rules can
+  start a build for, see :attr:`aws_ci_bot.trigger_rule.TriggerRules.table`.
+  The ``code`` and ``repo`` trigger rules can be anything, so the CodeCommit
+  events are never dropped in these modes.
+"""
+
+import typing as T
+
+CODEBUILD_SOURCE = "aws.codebuild"
+CODECOMMIT_SOURCE = "aws.codecommit"
+CODEBUILD_PHASE_CHANGE = "CodeBuild Build Phase Change"
+CODEBUILD_STATE_CHANGE = "CodeBuild Build State Change"
+
+
+def get_codecommit_event_type(detail: dict) -> str:
+    """
+    The same logic as :attr:`aws_codecommit.CodeCommitEvent.event_type`,
+    without creating the event object.
+    """
+    event = detail.get("event")
+    status = detail.get("pullRequestStatus")
+    if event == "referenceUpdated":
+        if detail.get("mergeOption"):
+            return "commit_to_branch_from_merge"
+        return "commit_to_branch"
+    elif event == "referenceCreated":
+        return "create_branch"
+    elif event == "referenceDeleted":
+        return "delete_branch"
+    elif event == "pullRequestCreated":
+        if detail.get("isMerged") == "False" and status == "Open":
+            return "pr_created"
+        return "unknown"
+    elif event == "pullRequestStatusChanged" and status == "Closed":
+        return "pr_closed"
+    elif event == "pullRequestSourceBranchUpdated":
+        return "pr_updated"
+    elif (
+        event == "pullRequestMergeStatusUpdated"
+        and detail.get("isMerged") == "True"
+        and status == "Closed"
+    ):
+        return "pr_merged"
+    elif event == "commentOnPullRequestCreated":
+        if detail.get("inReplyTo"):
+            return "reply_to_comment"
+        return "comment_on_pr_created"
+    elif event == "commentOnPullRequestUpdated":
+        if detail.get("inReplyTo"):
+            return "reply_to_comment"
+        return "comment_on_pr_updated"
+    elif (
+        event == "pullRequestApprovalStateChanged"
+        and detail.get("approvalStatus") == "APPROVE"
+    ):
+        return "approve_pr"
+    elif event == "pullRequestApprovalRuleOverridden":
+        return "approve_rule_override"
+    return "unknown"
+
+
+def get_ignore_reason(
+    message_dict: dict,
+    trigger_rules: str = "code",
+) -> T.Optional[str]:
+    """
+    Classify the CodeStar notification event.
+
+    :param message_dict: the CodeStar notification event in the SNS message.
+    :param trigger_rules: see :class:`~aws_ci_bot.trigger_rule.TriggerRulesModeEnum`.
+
+    :return: why the event can be ignored, None if it has to be handled.
+    """
+    source = message_dict.get("source")
+    if source == CODEBUILD_SOURCE:
+        detail_type = message_dict.get("detailType")
+        if detail_type == CODEBUILD_PHASE_CHANGE:
+            return "codebuild phase change"
+        if (
+            detail_type == CODEBUILD_STATE_CHANGE
+            and message_dict.get("detail", {}).get("build-status") == "IN_PROGRESS"
+        ):
+            return "codebuild state change IN_PROGRESS"
+        return None
+    if source == CODECOMMIT_SOURCE and trigger_rules == "default":
+        from .trigger_rule import default_rules
+
+        event_type = get_codecommit_event_type(message_dict.get("detail", {}))
+        if not default_rules.table.get(event_type, True):
+            return f"codecommit {event_type}"
+    return None
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+"""
+The priority of the queued build job runs.
+
+When a build project is busy, the build job runs are queued by the admission
+control (see :mod:`aws_ci_bot.admission`). The merges to the main and release
+branches should not wait behind dozens of feature branch PR builds, so each
+build request has a priority derived from the CodeCommit event:
+
+- ``release``: a PR is merged into, or a commit is pushed to the main or
+  release branch.
+- ``main``: a PR targets the main or release branch.
+- ``feature``: everything else, including a merge into a feature branch.
+
+The queue is dequeued by the highest effective priority. To prevent
+starvation, a waiting request gains one priority level per
+``aging_seconds``, so a feature build that has waited two levels of
+``aging_seconds`` longer goes ahead of a new release build. The requests of
+the same effective priority are first in first out.
+"""
+
+import typing as T
+import enum
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from aws_codecommit import CodeCommitEvent
+    from .admission import BuildRequest
+
+
+class BuildPriorityEnum(int, enum.Enum):
+    feature = 0
+    main = 1
+    release = 2
+
+
+def _is_main_or_release(branch: T.Optional[str]) -> bool:
+    from aws_codecommit.semantic_branch import is_main_branch, is_release_branch
+
+    if not branch:
+        return False
+    return is_main_branch(branch) or is_release_branch(branch)
+
+
+def get_build_priority(cc_event: "CodeCommitEvent") -> BuildPriorityEnum:
+    """
+    Get the priority of the build job runs triggered by the CodeCommit event.
+    """
+    if cc_event.is_pr_merged_event and _is_main_or_release(
+        cc_event.target_branch
+    ):
+        return BuildPriorityEnum.release
+    if cc_event.is_commit_to_branch_event and _is_main_or_release(
+        cc_event.source_branch
+    ):
+        return BuildPriorityEnum.release
+    if cc_event.is_pr_event and _is_main_or_release(cc_event.target_branch):
+        return BuildPriorityEnum.main
+    return BuildPriorityEnum.feature
+
+
+def get_effective_priority(
+    request: "BuildRequest",
+    now: float,
+    aging_seconds: int,
+) -> float:
+    """
+    The priority plus the aging bonus, 0 ``aging_seconds`` disables aging.
+    """
+    if aging_seconds <= 0:
+        return float(request.priority)
+    return request.priority + max(0.0, now - request.requested_at) / aging_seconds
+
+
+def pick_next(
+    queue: T.List["BuildRequest"],
+    now: float,
+    aging_seconds: int,
+) -> int:
+    """
+    :return: the index of the request to start next.
+    """
+    return max(
+        range(len(queue)),
+        key=lambda i: (
+            get_effective_priority(queue[i], now, aging_seconds),
+            -queue[i].requested_at,
+            -i,
+        ),
+    )
@@ -0,0 +1,323 @@
+# -*- coding: utf-8 -*-
+
+"""
+Replay the archived CI events locally.
+
+The events are loaded from the S3 archive written by
+:func:`~aws_ci_bot.sns_event.upload_ci_event` (including the compacted
+JSONL.gz files), or from a local directory of ``.json``, ``.json.gz`` and
+``.jsonl.gz`` files. They are fed through the Lambda handler, or directly
+through the CodeCommit / CodeBuild event handler, against the in-memory AWS
+stand-in in :mod:`aws_ci_bot.local_aws`.
+
+Events of the same git repo are handled one by one in the original order,
+events of different repos are handled in parallel.
+
+Example::
+
+    from aws_ci_bot.local_aws import LocalBotoSesManager
+    from aws_ci_bot.replay import load_events_from_dir, replay
+
+    bsm = LocalBotoSesManager(latency=0.05)
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=open("codebuild-config.json").read(),
+    )
+    report = replay(
+        events=load_events_from_dir("/path/to/events"),
+        bsm=bsm,
+        parallelism=8,
+    )
+    print(report.to_dict())
+"""
+
+import typing as T
+import enum
+import time
+import contextlib
+import dataclasses
+import collections
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import Config
+from .sns_event import extract_sns_message_dict, split_sns_event, decode_ci_event
+from .archive import (
+    COMPACTED_FILENAME,
+    MANIFEST_FILENAME,
+    iter_s3_keys,
+    decode_jsonl_gz,
+    read_manifest,
+)
+from .batch import RecordResult, _process_one
+from . import logger
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+
+LOCAL_BUCKET = "local-replay"
+
+
+class ReplayTargetEnum(str, enum.Enum):
+    """
+    Where to feed the replayed event.
+
+    - ``lambda_handler``: the :func:`aws_ci_bot.lbd.lambda_handler`, the event
+      is archived again to the (local) S3 bucket.
+    - ``event_handler``: the ``CodeCommitEventHandler`` and
+      ``CodeBuildEventHandler`` directly, skip the archive step.
+    """
+
+    lambda_handler = "lambda_handler"
+    event_handler = "event_handler"
+
+
+@dataclasses.dataclass
+class ReplayEvent:
+    """
+    An archived Lambda event to replay.
+
+    :param event: the Lambda event, it has one or more SNS records.
+    :param source: where the event is loaded from, a S3 uri or a file path.
+    """
+
+    event: dict = dataclasses.field()
+    source: str = dataclasses.field()
+
+    @property
+    def message_dict(self) -> dict:
+        return extract_sns_message_dict(self.event)
+
+    @property
+    def event_time(self) -> str:
+        """
+        The SNS publish time, fall back to the notification event time.
+        """
+        record = self.event["Records"][0]
+        return record.get("Sns", {}).get("Timestamp") or self.message_dict.get(
+            "time", ""
+        )
+
+    @property
+    def ordering_key(self) -> str:
+        """
+        Events that have the same ordering key are replayed in order. It is
+        the git repo name, for the CodeBuild event, it is the repo name in
+        the source location, or the project name if the source is not
+        CodeCommit.
+        """
+        return get_ordering_key(self.message_dict)
+
+    @property
+    def s3_uri(self) -> str:
+        if self.source.startswith("s3://"):
+            return self.source
+        else:
+            return f"s3://{LOCAL_BUCKET}/{self.source.lstrip('/')}"
+
+
+def get_ordering_key(message_dict: dict) -> str:
+    """
+    See :attr:`ReplayEvent.ordering_key`.
+    """
+    if message_dict["source"] == "aws.codecommit":
+        return message_dict["resources"][0].split(":")[-1]
+    elif message_dict["source"] == "aws.codebuild":
+        detail = message_dict["detail"]
+        source = detail.get("additional-information", {}).get("source", {})
+        if source.get("type") == "CODECOMMIT":
+            return source["location"].rstrip("/").split("/")[-1]
+        return detail["project-name"]
+    else:  # pragma: no cover
+        raise NotImplementedError
+
+
+def _sort_by_time(events: T.List[ReplayEvent]) -> T.List[ReplayEvent]:
+    return sorted(events, key=lambda replay_event: replay_event.event_time)
+
+
+def load_events_from_dir(dir_path: T.Union[str, Path]) -> T.List[ReplayEvent]:
+    """
+    Load the archived events from a local directory recursively, sorted by
+    the event time.
+    """
+    events = list()
+    for path in sorted(Path(dir_path).glob("**/*")):
+        if not path.is_file():
+            continue
+        if path.name.endswith(".jsonl.gz"):
+            for event in decode_jsonl_gz(path.read_bytes()):
+                events.append(ReplayEvent(event=event, source=str(path)))
+        elif path.name.endswith(".json") or path.name.endswith(".json.gz"):
+            events.append(
+                ReplayEvent(event=decode_ci_event(path.read_bytes()), source=str(path))
+            )
+    return _sort_by_time(events)
+
+
+def load_events_from_s3(
+    s3_client,
+    bucket: str,
+    prefix: str,
+) -> T.List[ReplayEvent]:
+    """
+    Load the archived events from S3, sorted by the event time. The prefix
+    can be the ``S3_PREFIX`` of the Lambda function, or any partition under it.
+    The per-event objects already rolled into a compacted file are skipped.
+    """
+    keys = list(iter_s3_keys(s3_client, bucket, prefix))
+    compacted_keys = set()
+    for key in keys:
+        if key.endswith(MANIFEST_FILENAME):
+            compacted_keys.update(read_manifest(s3_client, bucket, key))
+    events = list()
+    for key in keys:
+        if key.endswith(MANIFEST_FILENAME) or key in compacted_keys:
+            continue
+        if not (
+            key.endswith(COMPACTED_FILENAME)
+            or key.endswith(".json")
+            or key.endswith(".json.gz")
+        ):
+            continue
+        body = s3_client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        s3_uri = f"s3://{bucket}/{key}"
+        if key.endswith(COMPACTED_FILENAME):
+            for event in decode_jsonl_gz(body):
+                events.append(ReplayEvent(event=event, source=s3_uri))
+        else:
+            events.append(ReplayEvent(event=decode_ci_event(body), source=s3_uri))
+    return _sort_by_time(events)
+
+
+@dataclasses.dataclass
+class ReplayReport:
+    """
+    The replay result.
+
+    :param results: per event result, in the same order as the input events.
+    :param elapsed: the wall clock time in seconds.
+    :param api_calls: the number of AWS API calls, if the local stand-in is used.
+    """
+
+    results: T.List[RecordResult] = dataclasses.field()
+    elapsed: float = dataclasses.field()
+    api_calls: T.Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    @property
+    def total(self) -> int:
+        return len(self.results)
+
+    @property
+    def succeeded(self) -> int:
+        return sum(result.is_succeeded for result in self.results)
+
+    @property
+    def failed(self) -> int:
+        return self.total - self.succeeded
+
+    @property
+    def events_per_sec(self) -> float:
+        if self.elapsed <= 0:
+            return 0.0
+        return self.total / self.elapsed
+
+    def to_dict(self) -> dict:
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed": self.elapsed,
+            "events_per_sec": self.events_per_sec,
+            "api_calls": dict(self.api_calls),
+            "failed_records": [
+                result.to_dict() for result in self.results if not result.is_succeeded
+            ],
+        }
+
+
+@contextlib.contextmanager
+def patch_lambda_handler(bsm: "BotoSesManager", config: Config):
+    """
+    :func:`aws_ci_bot.lbd.lambda_handler` uses the module level boto session
+    and config, swap them with the given ones in the context, and restore
+    them after.
+    """
+    from . import lbd
+
+    original = lbd._bsm, lbd.config, lbd._store, lbd._build_timings
+    lbd._bsm, lbd.config, lbd._store, lbd._build_timings = bsm, config, None, None
+    try:
+        lbd.create_clients(bsm)
+        yield
+    finally:
+        lbd._bsm, lbd.config, lbd._store, lbd._build_timings = original
+
+
+def _handle_with_event_handler(bsm: "BotoSesManager", replay_event: ReplayEvent):
+    from . import lbd
+
+    for sub_event in split_sns_event(replay_event.event):
+        ci_event = lbd.parse_sns_event(bsm=bsm, event=sub_event)
+        lbd.handle_ci_event(
+            bsm=bsm,
+            ci_event=ci_event,
+            s3_uri=replay_event.s3_uri,
+            event=sub_event,
+        )
+
+
+def replay(
+    events: T.Iterable[ReplayEvent],
+    bsm: "BotoSesManager",
+    config: T.Optional[Config] = None,
+    target: ReplayTargetEnum = ReplayTargetEnum.lambda_handler,
+    parallelism: int = 4,
+) -> ReplayReport:
+    """
+    Replay the events.
+
+    :param events: the events to replay, usually it is the output of
+        :func:`load_events_from_dir` or :func:`load_events_from_s3`.
+    :param bsm: usually it is a :class:`~aws_ci_bot.local_aws.LocalBotoSesManager`.
+    :param config: the Lambda function config used by the ``lambda_handler``
+        target, by default, archive the event to the local replay bucket.
+    :param target: see :class:`ReplayTargetEnum`.
+    :param parallelism: the number of repos that are replayed in parallel.
+    """
+    from . import lbd
+
+    if config is None:
+        config = Config(s3_bucket=LOCAL_BUCKET, s3_prefix="replay")
+
+    events = list(events)
+    groups: T.Dict[str, T.List[int]] = collections.OrderedDict()
+    for ind, replay_event in enumerate(events):
+        groups.setdefault(replay_event.ordering_key, []).append(ind)
+    logger.info(f"replay {len(events)} events of {len(groups)} repos")
+
+    results: T.List[T.Optional[RecordResult]] = [None] * len(events)
+
+    def handle(replay_event: ReplayEvent):
+        if target == ReplayTargetEnum.lambda_handler:
+            lbd.lambda_handler(replay_event.event, None)
+        elif target == ReplayTargetEnum.event_handler:
+            _handle_with_event_handler(bsm, replay_event)
+        else:  # pragma: no cover
+            raise NotImplementedError
+
+    def handle_group(ind_list: T.List[int]):
+        # events of the same repo are handled one by one
+        for ind in ind_list:
+            result = _process_one(handle, ind, events[ind])
+            result.record_id = events[ind].source
+            results[ind] = result
+
+    with patch_lambda_handler(bsm=bsm, config=config):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, parallelism)) as executor:
+            list(executor.map(handle_group, groups.values()))
+        elapsed = time.perf_counter() - start
+
+    api_calls = dict(getattr(bsm, "call_counter", {}))
+    return ReplayReport(results=results, elapsed=elapsed, api_calls=api_calls)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+Content addressed build result cache.
+
+A PR merge often produces a git tree identical to the PR head that already
+passed the build, and building the same tree with the same build job again
+tells us nothing new. When the CodeBuild event handler sees a SUCCEEDED build
+job run, we record (repo, tree id, build job) -> build job run in a store
+(see :mod:`aws_ci_bot.store`). Before the CodeCommit event handler triggers a
+build job, it looks up the tree of the source commit, and if the same build
+job already passed on the same tree, it skips the build job and posts a
+"reused result" note instead.
+
+The build job is identified by :func:`get_build_job_key`, a hash of the
+build job config in the ``codebuild-config.json`` file, so changing the
+buildspec or the environment variables of a job invalidates its results.
+The key is passed to the build job run as the ``CI_DATA_BUILD_JOB_KEY``
+environment variable, so the CodeBuild event handler knows it.
+
+The same tree is also built for different reasons, a PR build, a merge
+build, a deploy on the target branch, and the build job may behave
+differently for each of them. So reuse is opt-in per build job, set
+``"reuse_result": true`` in ``codebuild-config.json`` only for the build jobs
+that are a pure function of the git tree and the build job config.
+"""
+
+import typing as T
+import json
+import hashlib
+import dataclasses
+
+from . import logger
+from .commit_cache import get_commit_metadata
+from .metrics import metrics
+from .store import BaseStore
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+    from .code_build_config import BuildJobConfig
+
+
+def get_build_job_key(build_job_config: "BuildJobConfig") -> str:
+    """
+    The identity of a build job, the path filter doesn't change the build.
+    """
+    data = {
+        "project_name": build_job_config.project_name,
+        "is_batch_job": build_job_config.is_batch_job,
+        "buildspec": build_job_config.buildspec,
+        "env_var": build_job_config.env_var,
+    }
+    return hashlib.md5(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def get_result_key(repo_name: str, tree_id: str, build_job_key: str) -> str:
+    return f"result:{repo_name}:{tree_id}:{build_job_key}"
+
+
+def get_tree_id(bsm: "BotoSesManager", repo_name: str, commit_id: str) -> str:
+    return get_commit_metadata(bsm, repo_name, commit_id).tree_id
+
+
+@dataclasses.dataclass
+class BuildResult:
+    """
+    A succeeded build job run.
+
+    :param build_id: the ``${project_name}:${run_id}`` build id.
+    :param console_url: the build job run console url.
+    :param commit_id: the commit it built.
+    """
+
+    build_id: str = dataclasses.field()
+    console_url: str = dataclasses.field()
+    commit_id: str = dataclasses.field()
+
+
+class ResultCache:
+    """
+    :param store: where to store the build results.
+    :param ttl: how long in seconds a build result can be reused.
+    """
+
+    def __init__(self, store: BaseStore, ttl: int = 30 * 86400):
+        self.store = store
+        self.ttl = ttl
+
+    def get(
+        self,
+        bsm: "BotoSesManager",
+        repo_name: str,
+        commit_id: str,
+        build_job_key: str,
+    ) -> T.Optional[BuildResult]:
+        """
+        Find the succeeded build job run of the same tree and build job.
+        """
+        tree_id = get_tree_id(bsm, repo_name, commit_id)
+        value = self.store.get(get_result_key(repo_name, tree_id, build_job_key))
+        if value is None:
+            metrics.put("build_result.miss", 1)
+            return None
+        metrics.put("build_result.hit", 1)
+        return BuildResult(**value)
+
+    def put(
+        self,
+        bsm: "BotoSesManager",
+        repo_name: str,
+        build_job_key: str,
+        result: BuildResult,
+    ):
+        """
+        Record the succeeded build job run.
+        """
+        tree_id = get_tree_id(bsm, repo_name, result.commit_id)
+        logger.info(f"  record the result of {result.build_id!r} for tree {tree_id!r}")
+        self.store.put(
+            get_result_key(repo_name, tree_id, build_job_key),
+            dataclasses.asdict(result),
+            ttl=self.ttl,
+        )
+
@@ -0,0 +1,542 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark the trigger rules, and diff the decisions of two rule versions.
+
+It evaluates the CodeCommit rule (:func:`aws_ci_bot.codecommit_rule.check_what_to_do`
+or the declarative rules in :mod:`aws_ci_bot.trigger_rule`) and the CodeBuild
+rule (:func:`aws_ci_bot.codebuild_rule.check_what_to_do`) over a synthetic
+corpus, and reports:
+
+- evaluations per second, the AWS API calls made by the rules (the commit
+  message is read by ``GetCommit``).
+- the action distribution per event type.
+- the events that get a different action from the two rule versions.
+
+A rule version is described by a spec:
+
+- ``code``: the ``check_what_to_do`` function in the installed package.
+- ``default``: the built-in declarative trigger rules (CodeCommit only).
+- ``path/to/trigger-rules.json``: a declarative trigger rules file
+  (CodeCommit only).
+- ``path/to/codecommit_rule.py`` / ``path/to/codebuild_rule.py``: an edited
+  copy of the rule module, its ``check_what_to_do`` function is used.
+
+Example, check the impact of an edited rule module before shipping it::
+
+    python -m aws_ci_bot.rule_benchmark --baseline code \\
+        --candidate ./my_codecommit_rule.py --n-events 20000 --fail-on-diff
+"""
+
+import typing as T
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import importlib.util
+import dataclasses
+import collections
+from pathlib import Path
+
+from .sns_event import extract_sns_message_dict
+from .corpus import (
+    Corpus,
+    generate_corpus,
+    make_sns_event,
+    make_pr_message,
+    make_branch_message,
+    make_commit_to_branch_message,
+    make_comment_message,
+    make_approve_message,
+    make_codebuild_message,
+    BUILD_PHASES,
+)
+from .benchmark import get_event_type
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from .local_aws import LocalBotoSesManager
+
+BRANCH_WORDS = [
+    # semantic branch
+    "main", "master", "feat", "feature", "build", "doc", "fix", "hotfix",
+    "rls", "release", "clean", "cleanup", "dev", "develop", "test", "int",
+    "stage", "staging", "qa", "preprod", "prod", "blue", "green",
+    # non semantic branch
+    "bugfix", "experiment", "spike", "user", "wip", "renovate", "docs",
+]
+
+COMMIT_TYPES = [
+    "chore", "feat", "feature", "fix", "doc", "test", "utest", "itest",
+    "ltest", "build", "pub", "publish", "rls", "release", "clean", "cleanup",
+    "dev", "int", "stage", "qa", "prod", "refactor", "style", "perf",
+]
+
+CODEBUILD_STATUSES = ["IN_PROGRESS", "SUCCEEDED", "FAILED", "STOPPED"]
+
+CODECOMMIT_EVENT_KINDS = [
+    "pr_created", "pr_updated", "pr_merged", "pr_closed", "create_branch",
+    "delete_branch", "commit_to_branch", "commit_to_branch_from_merge",
+    "comment", "approve",
+]
+
+
+# ------------------------------------------------------------------------------
+# Corpus
+# ------------------------------------------------------------------------------
+def random_branch(rnd: random.Random) -> str:
+    word = rnd.choice(BRANCH_WORDS)
+    style = rnd.randint(0, 5)
+    if style == 0:
+        return word
+    elif style == 1:
+        return f"{word.upper()}/{rnd.getrandbits(16):04x}"
+    elif style == 2:
+        return f"{word}-{rnd.getrandbits(16):04x}"
+    elif style == 3:
+        return f"{word}/team/{rnd.getrandbits(16):04x}"
+    else:
+        return f"{word}/{rnd.getrandbits(16):04x}"
+
+
+def random_commit_message(rnd: random.Random) -> str:
+    type_ = rnd.choice(COMMIT_TYPES)
+    style = rnd.randint(0, 7)
+    if style == 0:
+        return f"{type_}(api): change the code"
+    elif style == 1:
+        return f"{type_}!: breaking change"
+    elif style == 2:
+        return f"{type_}, {rnd.choice(COMMIT_TYPES)}: two types"
+    elif style == 3:
+        return f"{type_}: subject\n\nthe body\nchore: not the subject"
+    elif style == 4:
+        return f"{type_.capitalize()}: capitalized type"
+    elif style == 5:
+        return f"update the {type_} code"
+    else:
+        return f"{type_}: change the code"
+
+
+def generate_rule_corpus(
+    n_events: int = 5000,
+    n_repos: int = 5,
+    seed: int = 1,
+) -> Corpus:
+    """
+    Generate a corpus for the rule benchmark. Half of the events are the
+    realistic traffic from :func:`aws_ci_bot.corpus.generate_corpus`, the
+    other half are random combinations of branch name, commit message and
+    event type, to cover the edge cases of the rules.
+    """
+    n_realistic = n_events // 2
+    corpus = generate_corpus(n_events=n_realistic, n_repos=n_repos, seed=seed)
+    rnd = random.Random(seed)
+    repos = [f"repo-{i}" for i in range(1, 1 + n_repos)]
+
+    def new_commit(repo_name: str) -> str:
+        commit_id = "%040x" % rnd.getrandbits(160)
+        corpus.commits.append(
+            (repo_name, commit_id, random_commit_message(rnd), "fuzz")
+        )
+        return commit_id
+
+    messages = list()
+    while len(messages) < n_events - n_realistic:
+        repo_name = rnd.choice(repos)
+        if rnd.random() < 0.3:
+            kwargs = dict(
+                project_name="unit-test",
+                run_id=str(rnd.getrandbits(64)),
+                repo_name=repo_name,
+                source_version=new_commit(repo_name),
+                is_batch=rnd.random() < 0.3,
+            )
+            if rnd.random() < 0.5:
+                kwargs["completed_phase"] = rnd.choice(BUILD_PHASES)
+            else:
+                kwargs["build_status"] = rnd.choice(CODEBUILD_STATUSES)
+            messages.append(make_codebuild_message(**kwargs))
+            continue
+
+        kind = rnd.choice(CODECOMMIT_EVENT_KINDS)
+        source_branch, target_branch = random_branch(rnd), random_branch(rnd)
+        source_commit, target_commit = new_commit(repo_name), new_commit(repo_name)
+        pr_id = str(rnd.randint(1, 1000))
+        if kind.startswith("pr_"):
+            message = make_pr_message(
+                repo_name, kind, pr_id, source_branch, target_branch,
+                source_commit, target_commit,
+            )
+        elif kind in ("create_branch", "delete_branch"):
+            message = make_branch_message(
+                repo_name, source_branch, source_commit,
+                created=kind == "create_branch",
+            )
+        elif kind.startswith("commit_to_branch"):
+            message = make_commit_to_branch_message(
+                repo_name, source_branch, source_commit, target_commit,
+                from_merge=kind.endswith("merge"),
+            )
+        elif kind == "comment":
+            message = make_comment_message(
+                repo_name, pr_id, target_commit, source_commit
+            )
+        else:
+            message = make_approve_message(
+                repo_name, pr_id, source_branch, target_branch,
+                source_commit, target_commit,
+            )
+        messages.append(message)
+
+    corpus.events.extend(
+        make_sns_event(message, message_id=str(uuid.UUID(int=rnd.getrandbits(128))))
+        for message in messages
+    )
+    return corpus
+
+
+# ------------------------------------------------------------------------------
+# Rule version
+# ------------------------------------------------------------------------------
+def _load_module_from_file(path: str):
+    path = Path(path)
+    # load it as a sibling of the rule modules, so the relative imports work
+    spec = importlib.util.spec_from_file_location(
+        f"aws_ci_bot._rule_{path.stem}", str(path)
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_codecommit_rule(spec: str) -> T.Callable:
+    """
+    Get the CodeCommit rule function by the rule version spec, see the module
+    docstring.
+    """
+    if spec == "code":
+        from .codecommit_rule import check_what_to_do
+
+        return check_what_to_do
+    elif spec == "default":
+        from .trigger_rule import default_rules
+
+        return default_rules.evaluate
+    elif spec.endswith(".json"):
+        from .trigger_rule import TriggerRules
+
+        rules = TriggerRules.from_dict(json.loads(Path(spec).read_text()))
+        return rules.evaluate
+    elif spec.endswith(".py"):
+        return _load_module_from_file(spec).check_what_to_do
+    else:
+        raise ValueError(f"invalid CodeCommit rule version spec {spec!r}")
+
+
+def load_codebuild_rule(spec: str) -> T.Callable:
+    """
+    Get the CodeBuild rule function by the rule version spec, see the module
+    docstring.
+    """
+    if spec == "code":
+        from .codebuild_rule import check_what_to_do
+
+        return check_what_to_do
+    elif spec.endswith(".py"):
+        return _load_module_from_file(spec).check_what_to_do
+    else:
+        raise ValueError(f"invalid CodeBuild rule version spec {spec!r}")
+
+
+@dataclasses.dataclass
+class RuleVersion:
+    """
+    A pair of CodeCommit and CodeBuild rule functions.
+    """
+
+    name: str = dataclasses.field()
+    codecommit_rule: T.Callable = dataclasses.field()
+    codebuild_rule: T.Callable = dataclasses.field()
+
+    @classmethod
+    def from_spec(cls, codecommit: str = "code", codebuild: str = "code"):
+        return cls(
+            name=f"codecommit={codecommit}, codebuild={codebuild}",
+            codecommit_rule=load_codecommit_rule(codecommit),
+            codebuild_rule=load_codebuild_rule(codebuild),
+        )
+
+
+# ------------------------------------------------------------------------------
+# Benchmark
+# ------------------------------------------------------------------------------
+def _get_action(action) -> str:
+    return getattr(action, "value", str(action))
+
+
+def _parse_events(
+    message_dicts: T.List[dict],
+    bsm: "LocalBotoSesManager",
+) -> T.List[T.Tuple[bool, T.Any]]:
+    from aws_codecommit import CodeCommitEvent
+    from aws_codebuild import CodeBuildEvent
+
+    events = list()
+    for message_dict in message_dicts:
+        if message_dict["source"] == "aws.codecommit":
+            cc_event = CodeCommitEvent.from_event(message_dict)
+            cc_event.bsm = bsm
+            events.append((True, cc_event))
+        else:
+            events.append(
+                (False, CodeBuildEvent.from_codebuid_notification_event(message_dict))
+            )
+    return events
+
+
+@dataclasses.dataclass
+class RuleBenchmarkResult:
+    """
+    :param elapsed: the best wall clock time of the repeated runs, the event
+        objects are created before the timer starts, but the ``GetCommit``
+        API call to the local AWS stand-in is included.
+    :param decisions: the action of each event, in the corpus order.
+    :param api_calls: the AWS API calls of one run.
+    """
+
+    name: str = dataclasses.field()
+    n_events: int = dataclasses.field()
+    elapsed: float = dataclasses.field()
+    decisions: T.List[str] = dataclasses.field()
+    event_types: T.List[str] = dataclasses.field()
+    api_calls: T.Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    @property
+    def evaluations_per_sec(self) -> float:
+        return self.n_events / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def action_distribution(self) -> T.Dict[str, T.Dict[str, int]]:
+        """
+        Event type -> action -> count.
+        """
+        dist = collections.defaultdict(collections.Counter)
+        for event_type, action in zip(self.event_types, self.decisions):
+            dist[event_type][action] += 1
+        return {
+            event_type: dict(sorted(counter.items()))
+            for event_type, counter in sorted(dist.items())
+        }
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "n_events": self.n_events,
+            "elapsed": self.elapsed,
+            "evaluations_per_sec": self.evaluations_per_sec,
+            "api_calls": self.api_calls,
+            "action_distribution": self.action_distribution,
+        }
+
+
+def run_rule_benchmark(
+    rule_version: RuleVersion,
+    corpus: Corpus,
+    repeat: int = 3,
+) -> RuleBenchmarkResult:
+    """
+    Evaluate the rules over the corpus ``repeat`` times, keep the best time.
+    """
+    from . import logger
+    from .local_aws import LocalBotoSesManager
+
+    message_dicts = [extract_sns_message_dict(event) for event in corpus.events]
+    event_types = [get_event_type(message_dict) for message_dict in message_dicts]
+
+    best = None
+    decisions = None
+    api_calls = None
+    # the rules log every decision, it is not what we want to measure
+    disabled = logger.logger.disabled
+    logger.logger.disabled = True
+    try:
+        for _ in range(max(1, repeat)):
+            bsm = LocalBotoSesManager()
+            corpus.setup(bsm)
+            bsm.reset_call_counter()
+            # the event object caches the parsed attributes, use new objects
+            events = _parse_events(message_dicts, bsm)
+            run_decisions = list()
+            start = time.perf_counter()
+            for is_codecommit, event in events:
+                if is_codecommit:
+                    action = rule_version.codecommit_rule(event)
+                else:
+                    action = rule_version.codebuild_rule(event)
+                run_decisions.append(_get_action(action))
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best:
+                best = elapsed
+            if decisions is None:
+                decisions = run_decisions
+                api_calls = dict(sorted((+bsm.call_counter).items()))
+    finally:
+        logger.logger.disabled = disabled
+
+    return RuleBenchmarkResult(
+        name=rule_version.name,
+        n_events=len(message_dicts),
+        elapsed=best,
+        decisions=decisions,
+        event_types=event_types,
+        api_calls=api_calls,
+    )
+
+
+@dataclasses.dataclass
+class RuleDiff:
+    """
+    The events that get a different action from the two rule versions.
+
+    :param changes: per changed event detail.
+    """
+
+    n_events: int = dataclasses.field()
+    changes: T.List[dict] = dataclasses.field(default_factory=list)
+
+    @property
+    def n_changed(self) -> int:
+        return len(self.changes)
+
+    @property
+    def summary(self) -> T.Dict[str, int]:
+        """
+        ``${event_type}: ${baseline} -> ${candidate}`` -> count.
+        """
+        counter = collections.Counter(
+            f"{change['event_type']}: {change['baseline']} -> {change['candidate']}"
+            for change in self.changes
+        )
+        return dict(sorted(counter.items()))
+
+    def to_dict(self, max_changes: int = 100) -> dict:
+        return {
+            "n_events": self.n_events,
+            "n_changed": self.n_changed,
+            "summary": self.summary,
+            "changes": self.changes[:max_changes],
+        }
+
+
+def describe_event(message_dict: dict, commit_messages: T.Dict[str, str]) -> dict:
+    """
+    The fields of an event that the rules usually look at.
+    """
+    if message_dict["source"] == "aws.codecommit":
+        from aws_codecommit import CodeCommitEvent
+
+        cc_event = CodeCommitEvent.from_event(message_dict)
+        return {
+            "repo_name": cc_event.repo_name,
+            "source_branch": cc_event.source_branch,
+            "target_branch": cc_event.target_branch,
+            "commit_message": commit_messages.get(cc_event.source_commit),
+        }
+    else:
+        detail = message_dict["detail"]
+        return {
+            "build_id": detail["build-id"],
+            "build_status": detail.get("build-status"),
+            "completed_phase": detail.get("completed-phase"),
+        }
+
+
+def diff_decisions(
+    corpus: Corpus,
+    baseline: RuleBenchmarkResult,
+    candidate: RuleBenchmarkResult,
+) -> RuleDiff:
+    """
+    Compare the decisions of two rule versions on the same corpus.
+    """
+    commit_messages = {commit_id: message for _, commit_id, message, _ in corpus.commits}
+    diff = RuleDiff(n_events=baseline.n_events)
+    for ind, (event, before, after) in enumerate(
+        zip(corpus.events, baseline.decisions, candidate.decisions)
+    ):
+        if before == after:
+            continue
+        change = {
+            "index": ind,
+            "event_type": baseline.event_types[ind],
+            "baseline": before,
+            "candidate": after,
+        }
+        change.update(
+            describe_event(extract_sns_message_dict(event), commit_messages)
+        )
+        diff.changes.append(change)
+    return diff
+
+
+def compare_rules(
+    baseline: RuleVersion,
+    candidate: RuleVersion,
+    n_events: int = 5000,
+    n_repos: int = 5,
+    seed: int = 1,
+    repeat: int = 3,
+) -> T.Tuple[RuleBenchmarkResult, RuleBenchmarkResult, RuleDiff]:
+    """
+    Benchmark two rule versions on the same corpus, and diff their decisions.
+    """
+    corpus = generate_rule_corpus(n_events=n_events, n_repos=n_repos, seed=seed)
+    baseline_result = run_rule_benchmark(baseline, corpus, repeat=repeat)
+    candidate_result = run_rule_benchmark(candidate, corpus, repeat=repeat)
+    diff = diff_decisions(corpus, baseline_result, candidate_result)
+    return baseline_result, candidate_result, diff
+
+
+def main(args: T.Optional[T.List[str]] = None) -> int:  # pragma: no cover
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--baseline", default="code")
+    parser.add_argument("--candidate", default="default")
+    parser.add_argument("--baseline-codebuild", default="code")
+    parser.add_argument("--candidate-codebuild", default="code")
+    parser.add_argument("--n-events", type=int, default=5000)
+    parser.add_argument("--n-repos", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="path to the JSON result file")
+    parser.add_argument(
+        "--fail-on-diff",
+        action="store_true",
+        help="exit with code 1 if any decision is changed",
+    )
+    ns = parser.parse_args(args)
+
+    baseline, candidate, diff = compare_rules(
+        baseline=RuleVersion.from_spec(ns.baseline, ns.baseline_codebuild),
+        candidate=RuleVersion.from_spec(ns.candidate, ns.candidate_codebuild),
+        n_events=ns.n_events,
+        n_repos=ns.n_repos,
+        seed=ns.seed,
+        repeat=ns.repeat,
+    )
+    result = {
+        "baseline": baseline.to_dict(),
+        "candidate": candidate.to_dict(),
+        "diff": diff.to_dict(),
+    }
+    if ns.output:
+        with open(ns.output, "w") as f:
+            json.dump(result, f, indent=4, sort_keys=True)
+    json.dump(result, sys.stdout, indent=4, sort_keys=True)
+    print()
+    return 1 if (ns.fail_on_diff and diff.n_changed) else 0
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main())
@@ -5,16 +5,20 @@ SNS event handling in Lambda function.
 """
 
 import typing as T
+import gzip
 import json
+import threading
+import dataclasses
 from datetime import datetime
 
-from aws_lambda_event import SNSTopicNotificationEvent
-from aws_codebuild import CodeBuildEvent, BuildJobRun
-from aws_codecommit import CodeCommitEvent
-
 from .console import get_s3_console_url
+from .metrics import metrics
 from . import logger
 
+if T.TYPE_CHECKING:  # pragma: no cover
+    from aws_codebuild import CodeBuildEvent
+    from aws_codecommit import CodeCommitEvent
+
 
 def extract_sns_message_dict(event: dict) -> dict:
     """
@@ -25,8 +29,19 @@ def extract_sns_message_dict(event: dict) -> dict:
     :param event: the original lambda function input payload
     :return: the AWS CodeStar notification event data in dict
     """
-    sns_event = SNSTopicNotificationEvent.from_dict(event)
-    return json.loads(sns_event.Records[0].message)
+    return json.loads(event["Records"][0]["Sns"]["Message"])
+
+
+def split_sns_event(event: dict) -> T.List[dict]:
+    """
+    Split a Lambda event that has multiple SNS records into a list of
+    Lambda events, each of them has exactly one SNS record. So each of them
+    can be handled (and archived) independently.
+
+    :param event: the original lambda function input payload
+    :return: list of single record lambda event
+    """
+    return [{"Records": [record]} for record in event.get("Records", [])]
 
 
 def encode_partition_key(dt: datetime) -> str:
@@ -42,33 +57,30 @@ def encode_partition_key(dt: datetime) -> str:
     )
 
 
-def upload_ci_event(
-    s3_client,
-    event_dict: dict,
-    event_obj: T.Union[CodeCommitEvent, CodeBuildEvent],
-    bucket: str,
+def get_ci_event_s3_key(
+    event_obj: T.Union["CodeCommitEvent", "CodeBuildEvent"],
     prefix: str,
-    verbose: bool = True,
+    utc_now: datetime,
+    compress: bool = False,
 ) -> str:
     """
-    Upload CI/CD lambda event to S3 as a backup.
+    Figure out the S3 key to store the CI event. The key only depends on the
+    event object and the time, so we can know it before the upload.
 
-    :param s3_client:
-    :param event_dict:
     :param event_obj:
-    :param bucket:
     :param prefix:
-    :param verbose:
+    :param utc_now:
+    :param compress: if True, the file extension is ``.json.gz``
 
-    :return: the S3 uri where the event is uploaded
+    :return: the S3 key
     """
-    if verbose:
-        logger.info("Upload CI event to S3 ...")
+    # import lazily, to keep this module light at Lambda cold start
+    from aws_codebuild import CodeBuildEvent, BuildJobRun
+    from aws_codecommit import CodeCommitEvent
 
     if prefix.endswith("/"):
         prefix = prefix[:-1]
 
-    utc_now = datetime.utcnow()
     time_str = utc_now.strftime("%Y-%m-%dT%H-%M-%S.%f")
 
     if isinstance(event_obj, CodeCommitEvent):
@@ -92,18 +104,191 @@ def upload_ci_event(
         )
     else:  # pragma: no cover
         raise NotImplementedError
+    if compress:
+        s3_key = s3_key + ".gz"
+    return s3_key
+
+
+def encode_ci_event(event_dict: dict, compress: bool = False) -> dict:
+    """
+    Serialize the CI event, and return the keyword arguments for the
+    ``s3_client.put_object`` API.
+
+    :param event_dict:
+    :param compress: if True, store the gzip compressed compact JSON. Otherwise,
+        store the human-readable indented JSON.
+    """
+    if compress:
+        body = json.dumps(event_dict, separators=(",", ":")).encode("utf-8")
+        return dict(
+            Body=gzip.compress(body),
+            ContentType="application/json",
+            ContentEncoding="gzip",
+        )
+    else:
+        return dict(Body=json.dumps(event_dict, indent=4))
+
+
+def decode_ci_event(body: bytes) -> dict:
+    """
+    Deserialize the CI event created by :func:`encode_ci_event`, no matter it
+    is compressed or not.
+    """
+    if body[:2] == b"\x1f\x8b":  # gzip magic number
+        body = gzip.decompress(body)
+    return json.loads(body.decode("utf-8"))
+
+
+def upload_ci_event(
+    s3_client,
+    event_dict: dict,
+    event_obj: T.Union["CodeCommitEvent", "CodeBuildEvent"],
+    bucket: str,
+    prefix: str,
+    verbose: bool = True,
+    compress: bool = False,
+) -> str:
+    """
+    Upload CI/CD lambda event to S3 as a backup.
+
+    :param s3_client:
+    :param event_dict:
+    :param event_obj:
+    :param bucket:
+    :param prefix:
+    :param verbose:
+    :param compress: if True, store the gzip compressed compact JSON.
+
+    :return: the S3 uri where the event is uploaded
+    """
+    if verbose:
+        logger.info("Upload CI event to S3 ...")
+
+    s3_key = get_ci_event_s3_key(
+        event_obj=event_obj,
+        prefix=prefix,
+        utc_now=datetime.utcnow(),
+        compress=compress,
+    )
     s3_uri = f"s3://{bucket}/{s3_key}"
     if verbose:
         logger.info(f"s3 uri: {s3_uri}", 1)
 
-    s3_client.put_object(
-        Bucket=bucket,
-        Key=s3_key,
-        Body=json.dumps(event_dict, indent=4),
-    )
+    with metrics.timer("api.s3.put_object"):
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=s3_key,
+            **encode_ci_event(event_dict, compress=compress),
+        )
 
     console_url = get_s3_console_url(bucket=bucket, prefix=s3_key)
     if verbose:
         logger.info(f"preview event at: {console_url}", 1)
 
     return s3_uri
+
+
+@dataclasses.dataclass
+class ArchiveStats:
+    """
+    Thread safe counter of the background CI event upload, it lives as long
+    as the Lambda container.
+    """
+
+    succeeded: int = dataclasses.field(default=0)
+    failed: int = dataclasses.field(default=0)
+    _lock: threading.Lock = dataclasses.field(
+        default_factory=threading.Lock,
+        repr=False,
+        compare=False,
+    )
+
+    def incr_succeeded(self):
+        with self._lock:
+            self.succeeded += 1
+
+    def incr_failed(self):
+        with self._lock:
+            self.failed += 1
+
+
+archive_stats = ArchiveStats()
+
+
+@dataclasses.dataclass
+class BackgroundUpload:
+    """
+    A CI event upload running in a background thread.
+
+    :param s3_uri: where the event will be uploaded, it is known before the
+        upload finishes.
+    :param thread: the background thread.
+    """
+
+    s3_uri: str = dataclasses.field()
+    thread: threading.Thread = dataclasses.field()
+    error: T.Optional[Exception] = dataclasses.field(default=None)
+
+    def join(self, timeout: T.Optional[float] = None) -> bool:
+        """
+        Wait for the upload to finish.
+
+        :return: True if the upload succeeded.
+        """
+        self.thread.join(timeout)
+        return (not self.thread.is_alive()) and (self.error is None)
+
+
+def upload_ci_event_in_background(
+    s3_client,
+    event_dict: dict,
+    event_obj: T.Union["CodeCommitEvent", "CodeBuildEvent"],
+    bucket: str,
+    prefix: str,
+    verbose: bool = True,
+    compress: bool = False,
+) -> BackgroundUpload:
+    """
+    Similar to :func:`upload_ci_event`, but the ``put_object`` call runs in a
+    background thread, so the event handling logic doesn't have to wait for
+    S3. The upload failure is logged and counted in :data:`archive_stats`,
+    but never raised.
+
+    You have to call :meth:`BackgroundUpload.join` before the Lambda function
+    returns, otherwise the upload may be frozen with the Lambda container.
+    """
+    if verbose:
+        logger.info("Upload CI event to S3 in background ...")
+
+    s3_key = get_ci_event_s3_key(
+        event_obj=event_obj,
+        prefix=prefix,
+        utc_now=datetime.utcnow(),
+        compress=compress,
+    )
+    s3_uri = f"s3://{bucket}/{s3_key}"
+    if verbose:
+        logger.info(f"s3 uri: {s3_uri}", 1)
+        console_url = get_s3_console_url(bucket=bucket, prefix=s3_key)
+        logger.info(f"preview event at: {console_url}", 1)
+
+    def put_object():
+        try:
+            with metrics.timer("api.s3.put_object"):
+                s3_client.put_object(
+                    Bucket=bucket,
+                    Key=s3_key,
+                    **encode_ci_event(event_dict, compress=compress),
+                )
+            archive_stats.incr_succeeded()
+        except Exception as e:
+            upload.error = e
+            archive_stats.incr_failed()
+            logger.error(f"failed to upload CI event to {s3_uri}: {e!r}")
+
+    upload = BackgroundUpload(
+        s3_uri=s3_uri,
+        thread=threading.Thread(target=put_object, daemon=True),
+    )
+    upload.thread.start()
+    return upload
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+"""
+SQS event handling in Lambda function.
+
+In the SQS buffered mode, the SNS topic fans out the AWS CodeStar notification
+to an SQS queue, and the Lambda function consumes the queue in batch. Each SQS
+message body is the SNS notification envelope.
+"""
+
+import typing as T
+import json
+
+
+def is_sqs_event(event: dict) -> bool:
+    """
+    Test if the Lambda event is from the SQS event source mapping.
+    """
+    records = event.get("Records", [])
+    if len(records) == 0:
+        return False
+    return records[0].get("eventSource") == "aws:sqs"
+
+
+def sqs_record_to_sns_event(record: dict) -> dict:
+    """
+    Convert an SQS record to a Lambda event that has exactly one SNS record,
+    so it can be handled exactly the same way as the SNS subscription mode.
+
+    :param record: one of the record in the SQS Lambda event, its body is the
+        SNS notification envelope.
+    :return: single record SNS lambda event
+    """
+    sns_message = json.loads(record["body"])
+    return {
+        "Records": [
+            {
+                "EventSource": "aws:sns",
+                "EventVersion": "1.0",
+                "EventSubscriptionArn": record.get("eventSourceARN"),
+                "Sns": sns_message,
+            }
+        ]
+    }
+
+
+def make_batch_item_failures(message_id_list: T.Iterable[str]) -> dict:
+    """
+    Create the partial batch failure response of the SQS event source mapping.
+    Only the failed messages will become visible in the queue again.
+
+    Reference:
+
+    - https://docs.aws.amazon.com/lambda/latest/dg/with-sqs.html#services-sqs-batchfailurereporting
+    """
+    return {
+        "batchItemFailures": [
+            {"itemIdentifier": message_id} for message_id in message_id_list
+        ]
+    }
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+
+"""
+A minimal key value store with an atomic "put if absent" operation, it is the
+building block of the idempotency layer (see :mod:`aws_ci_bot.idempotency`)
+and the in-flight build tracking (see :mod:`aws_ci_bot.supersede`). The
+atomic "put if match" (compare and set) operation lets the debounce mode
+(see :mod:`aws_ci_bot.debounce`) update a key without losing a concurrent
+write.
+
+Available backends:
+
+- :class:`InMemoryStore`: only lives in one Lambda container, for testing.
+- :class:`SQLiteStore`: a local SQLite database file, for testing and local
+  replay.
+- :class:`S3Store`: one S3 object per key, using the S3 conditional write.
+- :class:`DynamoDBStore`: one DynamoDB item per key, using the conditional
+  put. The table has to use ``pk`` (string) as the partition key, and you can
+  enable the DynamoDB TTL on the ``expire_at`` attribute.
+
+Every key has an expiration time, an expired key is treated as absent.
+"""
+
+import typing as T
+import json
+import time
+import sqlite3
+import threading
+from urllib.parse import quote
+
+from .throttle import get_error_code
+
+
+class BaseStore:
+    """
+    The store interface.
+    """
+
+    def put_if_absent(self, key: str, value: dict, ttl: int) -> bool:
+        """
+        Put the key if it doesn't exist or it is expired.
+
+        :param key: the key.
+        :param value: a JSON serializable dict.
+        :param ttl: time to live in seconds.
+
+        :return: True if the key is put, False if the key already exists.
+        """
+        raise NotImplementedError
+
+    def put_if_match(
+        self,
+        key: str,
+        value: dict,
+        ttl: int,
+        expected: T.Optional[dict],
+    ) -> bool:
+        """
+        Put the key only if its current value is still ``expected``, it is
+        usually the value returned by :meth:`get`.
+
+        :param expected: the expected current value, None means the key
+            doesn't exist or it is expired.
+
+        :return: True if the key is put, False if the key was changed.
+        """
+        raise NotImplementedError
+
+    def put(self, key: str, value: dict, ttl: int):
+        """
+        Put the key, overwrite the existing one.
+        """
+        raise NotImplementedError
+
+    def get(self, key: str) -> T.Optional[dict]:
+        """
+        Get the value of the key, return None if it doesn't exist or it is
+        expired.
+        """
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+
+class InMemoryStore(BaseStore):
+    def __init__(self):
+        # key -> (value, expire at)
+        self._data: T.Dict[str, T.Tuple[dict, float]] = dict()
+        self._lock = threading.Lock()
+
+    def put_if_absent(self, key: str, value: dict, ttl: int) -> bool:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > now:
+                return False
+            self._data[key] = (value, now + ttl)
+            return True
+
+    def put_if_match(
+        self,
+        key: str,
+        value: dict,
+        ttl: int,
+        expected: T.Optional[dict],
+    ) -> bool:
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            current = None if item is None or item[1] <= now else item[0]
+            if current != expected:
+                return False
+            self._data[key] = (value, now + ttl)
+            return True
+
+    def put(self, key: str, value: dict, ttl: int):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+    def get(self, key: str) -> T.Optional[dict]:
+        item = self._data.get(key)
+        if item is None or item[1] <= time.time():
+            return None
+        return item[0]
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+class SQLiteStore(BaseStore):
+    """
+    :param path: the SQLite database file path, ``:memory:`` for an in-memory
+        database.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expire_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def put_if_absent(self, key: str, value: dict, ttl: int) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM kv WHERE key = ? AND expire_at <= ?", (key, now)
+            )
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expire_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+            return cursor.rowcount == 1
+
+    def put_if_match(
+        self,
+        key: str,
+        value: dict,
+        ttl: int,
+        expected: T.Optional[dict],
+    ) -> bool:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND expire_at > ?",
+                (key, now),
+            ).fetchone()
+            current = None if row is None else json.loads(row[0])
+            if current != expected:
+                return False
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expire_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+            return True
+
+    def put(self, key: str, value: dict, ttl: int):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expire_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time() + ttl),
+            )
+
+    def get(self, key: str) -> T.Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND expire_at > ?",
+                (key, time.time()),
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+
+class S3Store(BaseStore):
+    """
+    Store each key as ``s3://${bucket}/${prefix}${key}.json``, it uses the
+    S3 conditional write (``If-None-Match`` / ``If-Match``) to make
+    :meth:`put_if_absent` atomic. You may want a lifecycle rule on the prefix
+    to clean up the expired keys.
+    """
+
+    def __init__(self, s3_client, bucket: str, prefix: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _s3_key(self, key: str) -> str:
+        return f"{self.prefix}{quote(key, safe='')}.json"
+
+    def _get(self, key: str) -> T.Tuple[T.Optional[dict], T.Optional[str]]:
+        try:
+            res = self.s3_client.get_object(Bucket=self.bucket, Key=self._s3_key(key))
+        except Exception as e:
+            if get_error_code(e) == "NoSuchKey":
+                return None, None
+            raise
+        return json.loads(res["Body"].read()), res.get("ETag")
+
+    def put_if_absent(self, key: str, value: dict, ttl: int) -> bool:
+        now = time.time()
+        body = json.dumps({"value": value, "expire_at": now + ttl})
+        kwargs = dict(Bucket=self.bucket, Key=self._s3_key(key), Body=body)
+        try:
+            self.s3_client.put_object(IfNoneMatch="*", **kwargs)
+            return True
+        except Exception as e:
+            if get_error_code(e) not in ("PreconditionFailed", "ConditionalRequestConflict"):
+                raise
+        # the key exists, take it over only if it is expired
+        data, etag = self._get(key)
+        if data is not None and data["expire_at"] > now:
+            return False
+        try:
+            if data is None:
+                self.s3_client.put_object(IfNoneMatch="*", **kwargs)
+            else:
+                self.s3_client.put_object(IfMatch=etag, **kwargs)
+            return True
+        except Exception as e:
+            if get_error_code(e) in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+
+    def put_if_match(
+        self,
+        key: str,
+        value: dict,
+        ttl: int,
+        expected: T.Optional[dict],
+    ) -> bool:
+        now = time.time()
+        data, etag = self._get(key)
+        current = None if data is None or data["expire_at"] <= now else data["value"]
+        if current != expected:
+            return False
+        body = json.dumps({"value": value, "expire_at": now + ttl})
+        kwargs = dict(Bucket=self.bucket, Key=self._s3_key(key), Body=body)
+        try:
+            if data is None:
+                self.s3_client.put_object(IfNoneMatch="*", **kwargs)
+            else:
+                self.s3_client.put_object(IfMatch=etag, **kwargs)
+            return True
+        except Exception as e:
+            if get_error_code(e) in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+
+    def put(self, key: str, value: dict, ttl: int):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._s3_key(key),
+            Body=json.dumps({"value": value, "expire_at": time.time() + ttl}),
+        )
+
+    def get(self, key: str) -> T.Optional[dict]:
+        data, _ = self._get(key)
+        if data is None or data["expire_at"] <= time.time():
+            return None
+        return data["value"]
+
+    def delete(self, key: str):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._s3_key(key))
+
+
+class DynamoDBStore(BaseStore):
+    """
+    Store each key as an item in a DynamoDB table, the partition key is ``pk``.
+    """
+
+    def __init__(self, dynamodb_client, table_name: str):
+        self.dynamodb_client = dynamodb_client
+        self.table_name = table_name
+
+    def put_if_absent(self, key: str, value: dict, ttl: int) -> bool:
+        now = int(time.time())
+        try:
+            self.dynamodb_client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "pk": {"S": key},
+                    "value": {"S": json.dumps(value)},
+                    "expire_at": {"N": str(now + ttl)},
+                },
+                ConditionExpression="attribute_not_exists(pk) OR expire_at <= :now",
+                ExpressionAttributeValues={":now": {"N": str(now)}},
+            )
+            return True
+        except Exception as e:
+            if get_error_code(e) == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    def put_if_match(
+        self,
+        key: str,
+        value: dict,
+        ttl: int,
+        expected: T.Optional[dict],
+    ) -> bool:
+        if expected is None:
+            return self.put_if_absent(key, value, ttl)
+        now = int(time.time())
+        try:
+            # the value is stored as the JSON string that :meth:`get` loads,
+            # dumping it again gives the same string
+            self.dynamodb_client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "pk": {"S": key},
+                    "value": {"S": json.dumps(value)},
+                    "expire_at": {"N": str(now + ttl)},
+                },
+                ConditionExpression="#value = :expected AND expire_at > :now",
+                ExpressionAttributeNames={"#value": "value"},
+                ExpressionAttributeValues={
+                    ":expected": {"S": json.dumps(expected)},
+                    ":now": {"N": str(now)},
+                },
+            )
+            return True
+        except Exception as e:
+            if get_error_code(e) == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    def put(self, key: str, value: dict, ttl: int):
+        self.dynamodb_client.put_item(
+            TableName=self.table_name,
+            Item={
+                "pk": {"S": key},
+                "value": {"S": json.dumps(value)},
+                "expire_at": {"N": str(int(time.time()) + ttl)},
+            },
+        )
+
+    def get(self, key: str) -> T.Optional[dict]:
+        res = self.dynamodb_client.get_item(
+            TableName=self.table_name,
+            Key={"pk": {"S": key}},
+            ConsistentRead=True,
+        )
+        item = res.get("Item")
+        if item is None or int(item["expire_at"]["N"]) <= time.time():
+            return None
+        return json.loads(item["value"]["S"])
+
+    def delete(self, key: str):
+        self.dynamodb_client.delete_item(
+            TableName=self.table_name,
+            Key={"pk": {"S": key}},
+        )
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""
+The consolidated summary comment.
+
+In ``summary`` comment mode, the bot posts one comment per triggering event
+with a table of all build job runs, and edits it in place when a build job
+run finishes, instead of one comment thread per build job plus one reply per
+build status. The table state is stored in an HTML comment at the end of the
+comment content, so the CodeBuild event handler can update one row without
+knowing the other build job runs.
+"""
+
+import typing as T
+import re
+import enum
+import json
+import dataclasses
+
+from . import logger
+from .throttle import call_api
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+
+
+class CommentModeEnum(str, enum.Enum):
+    per_job = "per_job"
+    summary = "summary"
+
+
+class JobStatusEnum(str, enum.Enum):
+    PENDING = "PENDING"
+    QUEUED = "QUEUED"
+    FAILED_TO_START = "FAILED_TO_START"
+    IN_PROGRESS = "IN_PROGRESS"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    STOPPED = "STOPPED"
+    SUPERSEDED = "SUPERSEDED"
+    REUSED = "REUSED"
+
+
+status_emoji_mapper = {
+    JobStatusEnum.PENDING.value: "⏳",
+    JobStatusEnum.QUEUED.value: "🕒",
+    JobStatusEnum.FAILED_TO_START.value: "❌",
+    JobStatusEnum.IN_PROGRESS.value: "🟡",
+    JobStatusEnum.SUCCEEDED.value: "🟢",
+    JobStatusEnum.FAILED.value: "🔴",
+    JobStatusEnum.STOPPED.value: "⚫",
+    JobStatusEnum.SUPERSEDED.value: "⏭️",
+    JobStatusEnum.REUSED.value: "♻️",
+}
+
+_STATE_PREFIX = "<!-- aws_ci_bot summary: "
+_STATE_SUFFIX = " -->"
+_state_pattern = re.compile(
+    re.escape(_STATE_PREFIX) + r"(.*?)" + re.escape(_STATE_SUFFIX), re.DOTALL
+)
+
+
+@dataclasses.dataclass
+class JobRow:
+    """
+    One build job run in the summary table.
+
+    :param project_name: the CodeBuild project name.
+    :param is_batch_job: is it a batch build.
+    :param status: one of :class:`JobStatusEnum`.
+    :param build_id: the ``${project_name}:${run_id}`` build id, it is None
+        before the build job run is started.
+    :param console_url: the build job run console url.
+    :param report: the markdown rendered below the table, for example the
+        child builds of a batch build (see :mod:`aws_ci_bot.batch_report`).
+    """
+
+    project_name: str = dataclasses.field()
+    is_batch_job: bool = dataclasses.field(default=False)
+    status: str = dataclasses.field(default=JobStatusEnum.PENDING.value)
+    build_id: T.Optional[str] = dataclasses.field(default=None)
+    console_url: T.Optional[str] = dataclasses.field(default=None)
+    report: T.Optional[str] = dataclasses.field(default=None)
+
+    def to_markdown(self) -> str:
+        emoji = status_emoji_mapper.get(self.status, "")
+        build_type = "batch build" if self.is_batch_job else "single build"
+        if self.build_id:
+            run = f"[{self.build_id}]({self.console_url})"
+        else:
+            run = "-"
+        return f"| {self.project_name} | {build_type} | {run} | {emoji} {self.status} |"
+
+
+@dataclasses.dataclass
+class SummaryComment:
+    """
+    The summary comment content.
+
+    :param header: the markdown text above the table.
+    :param rows: the build job runs.
+    """
+
+    header: str = dataclasses.field(default="")
+    rows: T.List[JobRow] = dataclasses.field(default_factory=list)
+
+    def render(self) -> str:
+        lines = [
+            self.header,
+            "",
+            "| project | type | build run | status |",
+            "| --- | --- | --- | --- |",
+        ]
+        lines.extend(row.to_markdown() for row in self.rows)
+        for row in self.rows:
+            if row.report:
+                lines.append("")
+                lines.append(
+                    f"**{row.project_name}** [{row.build_id}]({row.console_url})"
+                )
+                lines.append("")
+                lines.append(row.report)
+        state = {
+            "header": self.header,
+            "rows": [dataclasses.asdict(row) for row in self.rows],
+        }
+        lines.append("")
+        lines.append(_STATE_PREFIX + json.dumps(state) + _STATE_SUFFIX)
+        return "\n".join(lines)
+
+    @classmethod
+    def parse(cls, content: str) -> "SummaryComment":
+        """
+        Parse the content created by :meth:`render`.
+        """
+        match = _state_pattern.search(content)
+        if match is None:
+            raise ValueError("not a summary comment")
+        state = json.loads(match.group(1))
+        return cls(
+            header=state["header"],
+            rows=[JobRow(**row) for row in state["rows"]],
+        )
+
+    def get_row(self, build_id: str) -> T.Optional[JobRow]:
+        for row in self.rows:
+            if row.build_id == build_id:
+                return row
+        return None
+
+    def set_status(
+        self,
+        build_id: str,
+        status: str,
+        report: T.Optional[str] = None,
+    ) -> bool:
+        """
+        Update the status and the report of a build job run.
+
+        :return: True if the status or the report is changed.
+        """
+        row = self.get_row(build_id)
+        if row is None:
+            return False
+        changed = False
+        if report is not None and row.report != report:
+            row.report = report
+            changed = True
+        if row.status == status:
+            return changed
+        # a superseded build job run ends with STOPPED, keep the more
+        # informative status
+        if (
+            row.status == JobStatusEnum.SUPERSEDED.value
+            and status == JobStatusEnum.STOPPED.value
+        ):
+            return changed
+        row.status = status
+        return True
+
+    def start_queued(
+        self,
+        project_name: str,
+        build_id: T.Optional[str],
+        console_url: T.Optional[str],
+    ) -> bool:
+        """
+        A queued build job run of the project is started, see
+        :mod:`aws_ci_bot.admission`. ``build_id`` is None if it failed to
+        start.
+
+        :return: True if a queued row is found.
+        """
+        for row in self.rows:
+            if (
+                row.project_name == project_name
+                and row.status == JobStatusEnum.QUEUED.value
+            ):
+                if build_id is None:
+                    row.status = JobStatusEnum.FAILED_TO_START.value
+                else:
+                    row.status = JobStatusEnum.IN_PROGRESS.value
+                    row.build_id = build_id
+                    row.console_url = console_url
+                return True
+        return False
+
+
+def update_summary_comment(
+    bsm: "BotoSesManager",
+    comment_id: str,
+    func: T.Callable[[SummaryComment], bool],
+    max_attempts: int = 3,
+):
+    """
+    Update the summary comment by the ``func``, it changes the summary
+    comment in place and returns True if anything is changed.
+
+    Build job runs of the same event may finish at the same time, and
+    CodeCommit has no conditional update, so we read the comment again
+    after the update, and redo it if our change is overwritten.
+    """
+    from aws_codecommit import better_boto
+
+    for _ in range(max_attempts):
+        comment = call_api(
+            "codecommit.get_comment",
+            better_boto.get_comment,
+            bsm=bsm,
+            comment_id=comment_id,
+        )
+        summary = SummaryComment.parse(comment.content)
+        if func(summary) is False:
+            return
+        call_api(
+            "codecommit.update_comment",
+            better_boto.update_comment,
+            bsm=bsm,
+            comment_id=comment_id,
+            content=summary.render(),
+        )
+    logger.info(f"  failed to update summary comment {comment_id!r}")
+
+
+def update_summary_comment_status(
+    bsm: "BotoSesManager",
+    comment_id: str,
+    build_id: str,
+    status: str,
+    report: T.Optional[str] = None,
+    max_attempts: int = 3,
+):
+    """
+    Update the status and the report of a build job run in the summary
+    comment.
+    """
+
+    def func(summary: SummaryComment) -> bool:
+        if summary.set_status(build_id, status, report=report) is False:
+            return False
+        logger.info(
+            f"  update status {status!r} of {build_id!r} "
+            f"in summary comment {comment_id!r}"
+        )
+        return True
+
+    update_summary_comment(bsm, comment_id, func, max_attempts=max_attempts)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Supersede the stale build job runs of a pull request.
+
+When a PR receives several pushes in a short time, every push triggers the
+build jobs, and the builds of the older commits keep running although nobody
+cares about their result. In supersede mode, we track the in-flight build job
+run per (repo, PR, build job) in a store (see :mod:`aws_ci_bot.store`). The
+build job is identified by :func:`aws_ci_bot.result_cache.get_build_job_key`,
+so two build jobs of the same build project don't stop each other.
+When the PR source branch is updated and a build job run of the newer source
+commit is started, the previous one is stopped by the ``StopBuild`` /
+``StopBuildBatch`` API, and the cancellation is noted in its comment. The
+other PR events (created, merged, ...) only track their build job runs, a
+merge never stops the build of the PR head, so its result can still be
+reused (see :mod:`aws_ci_bot.result_cache`). The entry is removed when the
+build job run finishes.
+
+The tracking is best effort, the store read and write are not atomic, two
+pushes handled at the same moment may leave an older build running.
+"""
+
+import typing as T
+import dataclasses
+
+from . import logger
+from .throttle import call_api
+from .store import BaseStore
+from .summary_comment import (
+    CommentModeEnum,
+    JobStatusEnum,
+    update_summary_comment_status,
+)
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+
+
+def get_inflight_key(repo_name: str, pr_id: str, build_job_key: str) -> str:
+    return f"inflight:{repo_name}:{pr_id}:{build_job_key}"
+
+
+def get_repo_name_from_source_location(source_location: str) -> str:
+    """
+    Get the CodeCommit repo name from the CodeBuild source location, for
+    example ``https://git-codecommit.us-east-1.amazonaws.com/v1/repos/my-repo``.
+    """
+    return source_location.rstrip("/").split("/")[-1]
+
+
+@dataclasses.dataclass
+class InflightBuild:
+    """
+    An in-flight build job run of a pull request.
+
+    :param build_arn: the build or build batch arn.
+    :param source_commit: the commit id it builds.
+    :param comment_id: the comment that tracks this build job run.
+    :param comment_mode: see :class:`~aws_ci_bot.summary_comment.CommentModeEnum`.
+    """
+
+    build_arn: str = dataclasses.field()
+    source_commit: str = dataclasses.field()
+    comment_id: T.Optional[str] = dataclasses.field(default=None)
+    comment_mode: T.Optional[str] = dataclasses.field(default=None)
+
+    @property
+    def is_batch(self) -> bool:
+        return ":build-batch/" in self.build_arn
+
+    @property
+    def build_id(self) -> str:
+        """
+        The ``${project_name}:${run_id}`` build id.
+        """
+        return self.build_arn.split("/", 1)[1]
+
+
+def stop_build_job_run(bsm: "BotoSesManager", build: InflightBuild):
+    if build.is_batch:
+        call_api(
+            "codebuild.stop_build_batch",
+            bsm.codebuild_client.stop_build_batch,
+            id=build.build_id,
+        )
+    else:
+        call_api(
+            "codebuild.stop_build",
+            bsm.codebuild_client.stop_build,
+            id=build.build_id,
+        )
+
+
+def note_superseded(
+    bsm: "BotoSesManager",
+    build: InflightBuild,
+    new_commit_id: str,
+):
+    """
+    Note the cancellation in the comment of the superseded build job run.
+    """
+    if not build.comment_id:
+        return
+    if build.comment_mode == CommentModeEnum.summary.value:
+        update_summary_comment_status(
+            bsm=bsm,
+            comment_id=build.comment_id,
+            build_id=build.build_id,
+            status=JobStatusEnum.SUPERSEDED.value,
+        )
+    else:
+        from aws_codecommit import better_boto
+
+        call_api(
+            "codecommit.post_comment_reply",
+            better_boto.post_comment_reply,
+            bsm=bsm,
+            in_reply_to=build.comment_id,
+            content=f"⏭️ Build Run SUPERSEDED by commit {new_commit_id[:7]}",
+        )
+
+
+class Supersede:
+    """
+    :param store: where to track the in-flight build job runs.
+    :param ttl: how long in seconds an in-flight build job run is tracked,
+        it should be longer than the build timeout.
+    """
+
+    def __init__(self, store: BaseStore, ttl: int = 86400):
+        self.store = store
+        self.ttl = ttl
+
+    def track(
+        self,
+        repo_name: str,
+        pr_id: str,
+        build_job_key: str,
+        build: InflightBuild,
+    ) -> T.Optional[InflightBuild]:
+        """
+        Track the new build job run.
+
+        :return: the previous in-flight build job run if it builds another
+            commit, it should be superseded.
+        """
+        key = get_inflight_key(repo_name, pr_id, build_job_key)
+        previous = self.store.get(key)
+        self.store.put(key, dataclasses.asdict(build), ttl=self.ttl)
+        if previous is None:
+            return None
+        previous = InflightBuild(**previous)
+        if (
+            previous.build_arn == build.build_arn
+            or previous.source_commit == build.source_commit
+        ):
+            return None
+        return previous
+
+    def release(
+        self,
+        repo_name: str,
+        pr_id: str,
+        build_job_key: str,
+        build_arn: str,
+    ):
+        """
+        Stop tracking the finished build job run, unless a newer one has
+        replaced it.
+        """
+        key = get_inflight_key(repo_name, pr_id, build_job_key)
+        current = self.store.get(key)
+        if current is not None and current["build_arn"] == build_arn:
+            self.store.delete(key)
+
+    def supersede(
+        self,
+        bsm: "BotoSesManager",
+        repo_name: str,
+        pr_id: str,
+        build_job_key: str,
+        build: InflightBuild,
+        stop_previous: bool = True,
+    ):
+        """
+        Track the new build job run, stop the previous one and note it in the
+        comment. The error is logged but not raised, it should not fail the
+        new build job run.
+
+        :param stop_previous: if False, only track the new build job run.
+        """
+        try:
+            previous = self.track(repo_name, pr_id, build_job_key, build)
+            if previous is None or stop_previous is False:
+                return
+            logger.info(
+                f"stop stale build {previous.build_id!r} "
+                f"of commit {previous.source_commit!r}"
+            )
+            stop_build_job_run(bsm, previous)
+            note_superseded(bsm, previous, new_commit_id=build.source_commit)
+        except Exception as e:
+            logger.error(
+                f"failed to supersede stale build of {build.build_id!r}: {e!r}"
+            )
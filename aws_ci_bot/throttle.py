@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+
+"""
+Throttle the outbound AWS API calls.
+
+The Lambda function handles SNS records and build jobs on thread pools, and
+the pools can be nested (batch mode x build jobs). The module level objects
+are shared by all threads in the Lambda container:
+
+- :data:`api_budget` limits the number of in-flight API calls, no matter how
+  the work is fanned out.
+- :data:`rate_limiter` limits the calls per second of each API with a token
+  bucket, and retries the call on a throttling error. A throttling error also
+  halves the rate of the API, and the rate slowly grows back on success.
+
+Usage::
+
+    from aws_ci_bot.throttle import call_api
+
+    res = call_api(
+        "codebuild.start_build",
+        bsm.codebuild_client.start_build,
+        projectName="my-project",
+    )
+"""
+
+import typing as T
+import time
+import random
+import threading
+
+from .metrics import metrics
+
+# the error code of a throttled AWS API call
+THROTTLING_ERROR_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "TooManyRequestsException",
+    "RequestLimitExceeded",
+    "SlowDown",
+}
+
+
+def get_error_code(e: Exception) -> T.Optional[str]:
+    """
+    Get the AWS error code from a ``botocore.exceptions.ClientError``.
+    """
+    response = getattr(e, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+def is_throttling_error(e: Exception) -> bool:
+    return get_error_code(e) in THROTTLING_ERROR_CODES
+
+
+class ApiBudget:
+    """
+    A semaphore of concurrent API calls.
+
+    :param max_concurrency: the maximum number of concurrent API calls.
+    """
+
+    def __init__(self, max_concurrency: int = 8):
+        self.configure(max_concurrency)
+
+    def configure(self, max_concurrency: int):
+        """
+        Change the budget. Don't call it while API calls are in-flight.
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._semaphore.release()
+        return False
+
+
+api_budget = ApiBudget()
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket with adaptive rate.
+
+    :param max_rate: the configured calls per second, None means no limit
+        until the API is throttled.
+    :param burst: the bucket size, by default it is one second of calls.
+    :param throttled_rate: the rate of an unlimited bucket after the first
+        throttling error.
+    :param min_rate: the rate never goes below it.
+    :param increase: the rate grows this much per successful call after a
+        throttling error, until it reaches ``max_rate``. An unlimited bucket
+        becomes unlimited again when the rate reaches ``recovered_rate``.
+    :param clock: the time function, it is only for testing.
+    """
+
+    def __init__(
+        self,
+        max_rate: T.Optional[float] = None,
+        burst: T.Optional[float] = None,
+        throttled_rate: float = 10.0,
+        min_rate: float = 0.5,
+        increase: float = 0.5,
+        recovered_rate: float = 100.0,
+        clock: T.Callable[[], float] = time.monotonic,
+    ):
+        if max_rate is not None and max_rate <= 0:
+            raise ValueError("rate must be positive")
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.burst = burst
+        self.throttled_rate = throttled_rate
+        self.min_rate = min_rate
+        self.increase = increase
+        self.recovered_rate = recovered_rate
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated_at = clock()
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        if self.rate is None:
+            return 0.0
+        return max(1.0, self.burst if self.burst else self.rate)
+
+    def _refill(self, now: float):
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def reserve(self) -> float:
+        """
+        Take a token.
+
+        :return: how many seconds the caller has to wait before the call.
+        """
+        with self._lock:
+            if self.rate is None:
+                return 0.0
+            now = self.clock()
+            self._refill(now)
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def on_throttle(self):
+        """
+        Halve the rate.
+        """
+        with self._lock:
+            now = self.clock()
+            if self.rate is None:
+                self.rate = self.throttled_rate
+                self.tokens = 0.0
+            else:
+                self._refill(now)
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.tokens = min(self.tokens, self.capacity)
+            self.updated_at = now
+
+    def on_success(self):
+        """
+        Grow the rate back after a throttling error.
+        """
+        if self.rate == self.max_rate:
+            return
+        with self._lock:
+            if self.rate is None or self.rate == self.max_rate:
+                return
+            self._refill(self.clock())
+            self.rate += self.increase
+            if self.max_rate is not None:
+                self.rate = min(self.rate, self.max_rate)
+            elif self.rate >= self.recovered_rate:
+                self.rate = None
+                self.tokens = 0.0
+
+
+def parse_rate_limits(text: str) -> T.Dict[str, T.Tuple[float, T.Optional[float]]]:
+    """
+    Parse the rate limit setting, for example
+    ``codecommit.post_comment=5:10,codecommit.update_comment=5,*=20``.
+    Each item is ``${api}=${calls_per_second}[:${burst}]``, ``*`` is the
+    default of all other APIs.
+
+    :return: api name -> (rate, burst)
+    """
+    rate_limits = dict()
+    for item in text.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            api, value = item.split("=", 1)
+            if ":" in value:
+                rate, burst = value.split(":", 1)
+                rate_limits[api.strip()] = (float(rate), float(burst))
+            else:
+                rate_limits[api.strip()] = (float(value), None)
+        except ValueError:
+            raise ValueError(f"invalid rate limit {item!r}")
+    return rate_limits
+
+
+class RateLimiter:
+    """
+    Per API token buckets and the retry on throttling error.
+
+    :param rate_limits: see :func:`parse_rate_limits`.
+    :param max_attempts: the maximum number of attempts of a throttled call.
+    :param base_delay: the backoff of the first retry in seconds, it doubles
+        on each retry, with full jitter.
+    :param max_delay: the maximum backoff in seconds.
+    :param clock: the time function, it is only for testing.
+    :param sleep: the sleep function, it is only for testing.
+    """
+
+    def __init__(
+        self,
+        rate_limits: T.Union[str, dict] = "",
+        max_attempts: int = 5,
+        base_delay: float = 0.1,
+        max_delay: float = 5.0,
+        clock: T.Callable[[], float] = time.monotonic,
+        sleep: T.Callable[[float], T.Any] = time.sleep,
+    ):
+        self.clock = clock
+        self.sleep = sleep
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.configure(rate_limits=rate_limits, max_attempts=max_attempts)
+
+    def configure(
+        self,
+        rate_limits: T.Union[str, dict] = "",
+        max_attempts: int = 5,
+    ):
+        """
+        Change the settings and reset all token buckets.
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        if isinstance(rate_limits, str):
+            rate_limits = parse_rate_limits(rate_limits)
+        self.rate_limits = dict(rate_limits)
+        self.max_attempts = max_attempts
+        self._buckets: T.Dict[str, TokenBucket] = dict()
+        self._lock = threading.Lock()
+
+    def get_bucket(self, api: str) -> TokenBucket:
+        try:
+            return self._buckets[api]
+        except KeyError:
+            with self._lock:
+                if api not in self._buckets:
+                    rate, burst = self.rate_limits.get(
+                        api, self.rate_limits.get("*", (None, None))
+                    )
+                    self._buckets[api] = TokenBucket(
+                        max_rate=rate, burst=burst, clock=self.clock
+                    )
+                return self._buckets[api]
+
+    def get_backoff(self, attempt: int) -> float:
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        )
+
+    def call(self, api: str, func: T.Callable, *args, **kwargs):
+        """
+        Call the API function, wait for the token bucket and retry on
+        throttling error.
+
+        :param api: the ``${service}.${operation}`` name.
+        """
+        bucket = self.get_bucket(api)
+        attempt = 0
+        while True:
+            attempt += 1
+            wait = bucket.reserve()
+            if wait > 0:
+                self.sleep(wait)
+            try:
+                with api_budget:
+                    res = func(*args, **kwargs)
+            except Exception as e:
+                if not is_throttling_error(e):
+                    raise
+                metrics.put(f"api.{api}.throttled", 1)
+                bucket.on_throttle()
+                if attempt >= self.max_attempts:
+                    raise
+                self.sleep(self.get_backoff(attempt))
+                continue
+            bucket.on_success()
+            return res
+
+
+rate_limiter = RateLimiter()
+
+
+def call_api(api: str, func: T.Callable, *args, **kwargs):
+    """
+    Call an AWS API function through the :data:`rate_limiter` and the
+    :data:`api_budget`, and time it as the ``api.${api}`` metric.
+
+    :param api: the ``${service}.${operation}`` name.
+    """
+    with metrics.timer(f"api.{api}"):
+        return rate_limiter.call(api, func, *args, **kwargs)
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+
+"""
+Declarative trigger rules, the data driven version of
+:func:`aws_ci_bot.codecommit_rule.check_what_to_do`.
+
+The rules are an ordered list, the first rule that matches the CodeCommit
+event decides the action. All conditions of a rule have to match, a list
+condition matches if any item matches:
+
+.. code-block:: javascript
+
+    {
+        "default_action": "nothing",
+        "rules": [
+            {
+                "name": "pull request from feature branch",
+                // CodeCommitEventTypeEnum values
+                "event_types": ["pr_created", "pr_updated"],
+                // semantic branch words, the part before the first "/",
+                // case insensitive, "feat" matches "feat/add-this"
+                "source_branches": ["feat", "feature"],
+                "target_branches": ["main"],
+                // conventional commit types, "chore" matches "chore: clean"
+                "commit_types": ["chore"],
+                // Python regular expressions, searched in the string
+                "source_branch_pattern": "^feat/",
+                "target_branch_pattern": "^main$",
+                "commit_message_pattern": "\\[skip ci\\]",
+                // "start_build" or "nothing"
+                "action": "start_build"
+            }
+        ]
+    }
+
+The rules are compiled once: the regular expressions are precompiled, the
+branch words become sets, and the rules are indexed by event type into a
+decision table. The trailing rules that return the default action are
+dropped from the table, so an event type that can never trigger a build
+doesn't cost the ``GetCommit`` API call to read the commit message. The
+branch prefix and the commit types of an event are computed at most once.
+
+The rules can be stored in the ``trigger-rules.json`` file in the git repo,
+see :func:`load_trigger_rules`.
+"""
+
+import typing as T
+import re
+import enum
+import dataclasses
+
+from aws_codecommit import CodeCommitEvent, better_boto
+from aws_codecommit.notification import CodeCommitEventTypeEnum
+from aws_codecommit.conventional_commits import default_parser
+
+from . import logger
+from .cache import LRUCache
+from .throttle import call_api, get_error_code
+from .codecommit_rule import CodeCommitHandlerActionEnum
+
+if T.TYPE_CHECKING:  # pragma: no cover
+    from boto_session_manager import BotoSesManager
+
+TRIGGER_RULES_FILE = "trigger-rules.json"
+
+
+class TriggerRulesModeEnum(str, enum.Enum):
+    """
+    Where the trigger rules come from.
+
+    - ``code``: the :func:`aws_ci_bot.codecommit_rule.check_what_to_do`
+      function, it is the default.
+    - ``default``: the built-in :data:`DEFAULT_RULES`, opt-in.
+    - ``repo``: the ``trigger-rules.json`` file in the git repo, fall back to
+      the built-in rules if the file doesn't exist.
+    """
+
+    code = "code"
+    default = "default"
+    repo = "repo"
+
+
+# the same strategy as the :func:`aws_ci_bot.codecommit_rule.check_what_to_do`
+DEFAULT_RULES = {
+    "default_action": "nothing",
+    "rules": [
+        {
+            "name": "chore commit",
+            "commit_types": ["chore"],
+            "action": "nothing",
+        },
+        {
+            "name": "pull request from semantic branch",
+            "event_types": ["pr_created", "pr_updated"],
+            "source_branches": [
+                # based on purpose
+                "feat",
+                "feature",
+                "fix",
+                "build",
+                "doc",
+                "rls",
+                "release",
+                "clean",
+                "cleanup",
+                # based on environment
+                "dev",
+                "develop",
+                "test",
+                "int",
+                "stage",
+                "staging",
+                "qa",
+                "preprod",
+                "prod",
+                "blue",
+                "green",
+            ],
+            "action": "start_build",
+        },
+        {
+            "name": "pull request merged",
+            "event_types": ["pr_merged"],
+            "action": "start_build",
+        },
+    ],
+}
+
+
+def get_semantic_prefix(branch: str) -> str:
+    """
+    The same normalization as :func:`aws_codecommit.is_certain_semantic_branch`.
+    """
+    return branch.lower().strip().split("/")[0]
+
+
+def _to_words(words: T.Iterable[str]) -> T.FrozenSet[str]:
+    return frozenset(word.lower().strip() for word in words)
+
+
+def _compile(pattern: T.Optional[str]) -> T.Optional[T.Pattern]:
+    return None if pattern is None else re.compile(pattern)
+
+
+class EventFacts:
+    """
+    The facts of a CodeCommit event that the rules look at. Each fact is
+    computed when a rule needs it for the first time, so the commit message
+    is only fetched if a rule checks it.
+    """
+
+    def __init__(self, cc_event: CodeCommitEvent):
+        self.cc_event = cc_event
+        self._cache = dict()
+
+    def _get(self, name: str, func: T.Callable[[], T.Any]) -> T.Any:
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = self._cache[name] = func()
+            return value
+
+    @property
+    def event_type(self) -> str:
+        return self._get("event_type", lambda: self.cc_event.event_type)
+
+    @property
+    def source_branch(self) -> str:
+        return self._get("source_branch", lambda: self.cc_event.source_branch or "")
+
+    @property
+    def target_branch(self) -> str:
+        return self._get("target_branch", lambda: self.cc_event.target_branch or "")
+
+    @property
+    def source_prefix(self) -> str:
+        return self._get(
+            "source_prefix", lambda: get_semantic_prefix(self.source_branch)
+        )
+
+    @property
+    def target_prefix(self) -> str:
+        return self._get(
+            "target_prefix", lambda: get_semantic_prefix(self.target_branch)
+        )
+
+    @property
+    def commit_message(self) -> str:
+        return self._get("commit_message", lambda: self.cc_event.commit_message)
+
+    @property
+    def commit_types(self) -> T.FrozenSet[str]:
+        def parse():
+            commit = default_parser.parse_message(self.commit_message)
+            return frozenset() if commit is None else frozenset(commit.types)
+
+        return self._get("commit_types", parse)
+
+
+@dataclasses.dataclass
+class TriggerRule:
+    """
+    One trigger rule, see the module docstring for the meaning of the fields.
+    An empty or None condition always matches.
+    """
+
+    action: str = dataclasses.field()
+    name: str = dataclasses.field(default="")
+    event_types: T.List[str] = dataclasses.field(default_factory=list)
+    source_branches: T.List[str] = dataclasses.field(default_factory=list)
+    target_branches: T.List[str] = dataclasses.field(default_factory=list)
+    commit_types: T.List[str] = dataclasses.field(default_factory=list)
+    source_branch_pattern: T.Optional[str] = dataclasses.field(default=None)
+    target_branch_pattern: T.Optional[str] = dataclasses.field(default=None)
+    commit_message_pattern: T.Optional[str] = dataclasses.field(default=None)
+
+    def __post_init__(self):
+        self.action = CodeCommitHandlerActionEnum(self.action).value
+        for event_type in self.event_types:
+            CodeCommitEventTypeEnum(event_type)
+        self._source_branches = _to_words(self.source_branches)
+        self._target_branches = _to_words(self.target_branches)
+        self._commit_types = frozenset(self.commit_types)
+        self._source_branch_regex = _compile(self.source_branch_pattern)
+        self._target_branch_regex = _compile(self.target_branch_pattern)
+        self._commit_message_regex = _compile(self.commit_message_pattern)
+
+    @classmethod
+    def from_dict(cls, dct: dict) -> "TriggerRule":
+        field_names = {field.name for field in dataclasses.fields(cls)}
+        unknown = set(dct) - field_names
+        if unknown:
+            raise ValueError(f"unknown trigger rule fields: {sorted(unknown)}")
+        return cls(**dct)
+
+    def is_match(self, facts: EventFacts) -> bool:
+        """
+        Test the cheap conditions first, the commit message is the last one.
+        """
+        if self.event_types and facts.event_type not in self.event_types:
+            return False
+        if self._source_branches and facts.source_prefix not in self._source_branches:
+            return False
+        if self._target_branches and facts.target_prefix not in self._target_branches:
+            return False
+        if self._source_branch_regex is not None and (
+            self._source_branch_regex.search(facts.source_branch) is None
+        ):
+            return False
+        if self._target_branch_regex is not None and (
+            self._target_branch_regex.search(facts.target_branch) is None
+        ):
+            return False
+        if self._commit_types and not (self._commit_types & facts.commit_types):
+            return False
+        if self._commit_message_regex is not None and (
+            self._commit_message_regex.search(facts.commit_message) is None
+        ):
+            return False
+        return True
+
+
+class TriggerRules:
+    """
+    The compiled trigger rules.
+
+    :param rules: the ordered rules, the first matched rule wins.
+    :param default_action: the action if no rule matches.
+    """
+
+    def __init__(
+        self,
+        rules: T.List[TriggerRule],
+        default_action: str = CodeCommitHandlerActionEnum.nothing.value,
+    ):
+        self.rules = rules
+        self.default_action = CodeCommitHandlerActionEnum(default_action).value
+        # event type -> the rules that may decide the action of this event type
+        self.table: T.Dict[str, T.Tuple[TriggerRule, ...]] = {
+            event_type.value: self._get_candidates(event_type.value)
+            for event_type in CodeCommitEventTypeEnum
+        }
+
+    @classmethod
+    def from_dict(cls, dct: dict) -> "TriggerRules":
+        return cls(
+            rules=[TriggerRule.from_dict(d) for d in dct["rules"]],
+            default_action=dct.get(
+                "default_action", CodeCommitHandlerActionEnum.nothing.value
+            ),
+        )
+
+    def _get_candidates(self, event_type: str) -> T.Tuple[TriggerRule, ...]:
+        candidates = [
+            rule
+            for rule in self.rules
+            if (not rule.event_types) or (event_type in rule.event_types)
+        ]
+        # the trailing rules return the same action as no rule matches
+        while candidates and candidates[-1].action == self.default_action:
+            candidates.pop()
+        return tuple(candidates)
+
+    def evaluate(self, cc_event: CodeCommitEvent) -> CodeCommitHandlerActionEnum:
+        """
+        Find out what to do for the CodeCommit event.
+        """
+        logger.header("Detect whether we should trigger build", "-", 60)
+        facts = EventFacts(cc_event)
+        event_type = facts.event_type
+        try:
+            candidates = self.table[event_type]
+        except KeyError:  # pragma: no cover
+            candidates = self._get_candidates(event_type)
+        for rule in candidates:
+            if rule.is_match(facts):
+                logger.info(
+                    f"matched rule {rule.name!r}, action is {rule.action!r} "
+                    f"for event type {event_type!r} on {facts.source_branch!r}"
+                )
+                return CodeCommitHandlerActionEnum(rule.action)
+        logger.info(
+            f"no rule matched, action is {self.default_action!r} "
+            f"for event type {event_type!r} on {facts.source_branch!r}"
+        )
+        return CodeCommitHandlerActionEnum(self.default_action)
+
+
+# compiled at cold start
+default_rules = TriggerRules.from_dict(DEFAULT_RULES)
+
+# (repo name, commit id) -> blob id of the ``trigger-rules.json`` file,
+# empty string means the file doesn't exist.
+rules_blob_id_cache = LRUCache(name="trigger_rules_blob_id", max_items=1024)
+# blob id -> compiled :class:`TriggerRules`
+rules_cache = LRUCache(name="trigger_rules", max_items=256)
+
+
+def load_trigger_rules(
+    bsm: "BotoSesManager",
+    repo_name: str,
+    commit_id: str,
+) -> TriggerRules:
+    """
+    Load and compile the ``trigger-rules.json`` file of the git repo at the
+    given commit, so each repo can have its own rules without redeploying the
+    Lambda function. Use the built-in rules if the file doesn't exist.
+
+    The compiled rules are cached by the file content (blob id) in the warm
+    Lambda container, and the blob id is cached by the commit.
+    """
+    if not commit_id:
+        return default_rules
+
+    blob_id = rules_blob_id_cache.get((repo_name, commit_id))
+    if blob_id == "":
+        return default_rules
+    if blob_id is not None:
+        rules = rules_cache.get(blob_id)
+        if rules is not None:
+            return rules
+
+    try:
+        file = call_api(
+            "codecommit.get_file",
+            better_boto.get_file,
+            bsm=bsm,
+            repo_name=repo_name,
+            file_path=TRIGGER_RULES_FILE,
+            commit_id=commit_id,
+        )
+    except Exception as e:
+        if get_error_code(e) == "FileDoesNotExistException":
+            rules_blob_id_cache.set((repo_name, commit_id), "", size=0)
+            return default_rules
+        raise
+    rules_blob_id_cache.set((repo_name, commit_id), file.blob_id, size=0)
+
+    rules = rules_cache.get(file.blob_id)
+    if rules is None:
+        from superjson import json
+
+        logger.info(f"compile trigger rules from {TRIGGER_RULES_FILE!r}")
+        rules = TriggerRules.from_dict(
+            json.loads(file.get_text(), ignore_comments=True)
+        )
+        rules_cache.set(file.blob_id, rules, size=0)
+    return rules
+
+
+def clear_cache():
+    """
+    Clear the ``trigger-rules.json`` cache.
+    """
+    rules_blob_id_cache.clear()
+    rules_cache.clear()
@@ -164,6 +164,11 @@ if __name__ == "__main__":
     except:
         print("'requirements-doc.txt' not found!")
 
+    try:
+        EXTRA_REQUIRE["analytics"] = read_requirements_file("requirements-analytics.txt")
+    except:
+        print("'requirements-analytics.txt' not found!")
+
     setup(
         name=PKG_NAME,
         description=SHORT_DESCRIPTION,
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message, make_codebuild_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.summary_comment import SummaryComment
+from aws_ci_bot.store import InMemoryStore
+from aws_ci_bot.admission import (
+    parse_build_limits,
+    get_admission_lock_key,
+    BuildRequest,
+    Admission,
+)
+from aws_ci_bot import lbd
+
+
+def test_parse_build_limits():
+    assert parse_build_limits("") == {}
+    assert parse_build_limits("my-project=5, *=2") == {"my-project": 5, "*": 2}
+    with pytest.raises(ValueError):
+        parse_build_limits("my-project")
+
+    admission = Admission(store=InMemoryStore(), limits="a=1,b=0,*=3")
+    assert admission.get_limit("a") == 1
+    assert admission.get_limit("b") is None
+    assert admission.get_limit("c") == 3
+    assert Admission(store=InMemoryStore(), limits="a=1").get_limit("c") is None
+
+
+def test_submit_and_release():
+    bsm = LocalBotoSesManager()
+    now = [1000.0]
+    admission = Admission(
+        store=InMemoryStore(), limits="my-project=2", ttl=3600, clock=lambda: now[0]
+    )
+
+    def submit(commit_id: str):
+        return admission.submit(
+            bsm=bsm,
+            request=BuildRequest(
+                project_name="my-project",
+                kwargs=dict(projectName="my-project", sourceVersion=commit_id),
+            ),
+        )
+
+    r1, r2 = submit("c1"), submit("c2")
+    assert r1 is not None and r2 is not None
+    assert submit("c3") is None
+    assert submit("c4") is None
+    assert bsm.call_counter["codebuild.start_build"] == 2
+    state = admission.load("my-project")
+    assert len(state.inflight) == 2
+    assert [r.kwargs["sourceVersion"] for r in state.queue] == ["c3", "c4"]
+
+    # a finished build job run starts the first queued one
+    started = admission.release(bsm, "my-project", f"my-project:{r1.run_id}")
+    assert [(r.kwargs["sourceVersion"], run is not None) for r, run in started] == [
+        ("c3", True)
+    ]
+    # release is idempotent
+    assert admission.release(bsm, "my-project", f"my-project:{r1.run_id}") == []
+    assert bsm.call_counter["codebuild.start_build"] == 3
+
+    # a lost terminal event doesn't take the slot forever
+    now[0] += 3600
+    started = admission.release(bsm, "my-project", "my-project:unknown")
+    assert [r.kwargs["sourceVersion"] for r, _ in started] == ["c4"]
+    state = admission.load("my-project")
+    assert len(state.inflight) == 1 and state.queue == []
+
+    # the lock is released
+    assert admission.store.get(get_admission_lock_key("my-project")) is None
+
+
+def test_lock_timeout():
+    store = InMemoryStore()
+    store.put(get_admission_lock_key("my-project"), {"owner": "other"}, ttl=60)
+    now = [0.0]
+
+    def sleep(seconds: float):
+        now[0] += seconds
+
+    admission = Admission(
+        store=store,
+        limits="*=1",
+        lock_timeout=1,
+        clock=lambda: now[0],
+        sleep=sleep,
+    )
+    with pytest.raises(TimeoutError):
+        admission.release(LocalBotoSesManager(), "my-project", "my-project:r1")
+    # the lock of other owner is kept
+    assert store.get(get_admission_lock_key("my-project")) == {"owner": "other"}
+
+
+def get_env_var(build: dict) -> dict:
+    return {
+        dct["name"]: dct["value"]
+        for dct in build["environment"]["environmentVariables"]
+    }
+
+
+def run_two_prs(comment_mode: str):
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        concurrent_build_limits="my-project=1",
+        comment_mode=comment_mode,
+    )
+    with patch_lambda_handler(bsm, config):
+        for pr_id, commit_id in [("1", "c1"), ("2", "c2")]:
+            lbd.lambda_handler(
+                make_sns_event(
+                    make_pr_message(
+                        "repo", "pr_created", pr_id, "feature/a", "main", commit_id, "c0"
+                    )
+                ),
+                None,
+            )
+        assert bsm.call_counter["codebuild.start_build"] == 1
+        (b1,) = bsm.codebuild_client.builds.values()
+
+        # the SUCCEEDED event of the first build starts the queued one
+        lbd.lambda_handler(
+            make_sns_event(
+                make_codebuild_message(
+                    project_name="my-project",
+                    run_id=b1["id"].split(":", 1)[1],
+                    repo_name="repo",
+                    source_version="c1",
+                    build_status="SUCCEEDED",
+                    env_var=get_env_var(b1),
+                )
+            ),
+            None,
+        )
+        assert bsm.call_counter["codebuild.start_build"] == 2
+    b2 = [
+        build
+        for build in bsm.codebuild_client.builds.values()
+        if build["sourceVersion"] == "c2"
+    ][0]
+    return bsm, b2
+
+
+def test_admission_per_job_comment():
+    bsm, b2 = run_two_prs("per_job")
+    comment_id = get_env_var(b2)["CI_DATA_COMMENT_ID"]
+    comment = bsm.codecommit_client.comments[comment_id]
+    assert "queued" in comment["content"]
+    replies = [
+        c["content"]
+        for c in bsm.codecommit_client.comments.values()
+        if c.get("inReplyTo") == comment_id
+    ]
+    assert len(replies) == 1
+    assert replies[0].startswith(f"▶️ Build Run STARTED: [{b2['id']}]")
+
+
+def test_admission_summary_comment():
+    bsm, b2 = run_two_prs("summary")
+    comment_id = get_env_var(b2)["CI_DATA_COMMENT_ID"]
+    summary = SummaryComment.parse(bsm.codecommit_client.comments[comment_id]["content"])
+    assert summary.rows[0].status == "IN_PROGRESS"
+    assert summary.rows[0].build_id == b2["id"]
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.admission", preview=False)
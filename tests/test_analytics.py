@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import importlib.util
+from datetime import datetime
+
+import pytest
+from aws_codebuild import CodeBuildEvent
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.ci_data import CIData
+from aws_ci_bot.corpus import make_sns_event, make_codebuild_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.analytics import (
+    PHASES,
+    BuildTiming,
+    get_branch_type,
+)
+from aws_ci_bot import lbd
+
+
+def test_get_branch_type():
+    assert get_branch_type(None) == "unknown"
+    assert get_branch_type("main") == "main"
+    assert get_branch_type("master") == "main"
+    assert get_branch_type("feat/add-this") == "feature"
+    assert get_branch_type("Release/1.2.3") == "release"
+    assert get_branch_type("hotfix/issue-1") == "hotfix"
+    assert get_branch_type("spike/try-this") == "other"
+
+
+PHASE_DURATIONS = {
+    "SUBMITTED": 1,
+    "QUEUED": 30,
+    "PROVISIONING": 20,
+    "DOWNLOAD_SOURCE": 3,
+    "BUILD": 120,
+}
+
+
+def make_message(
+    run_id: str,
+    build_status: str = "SUCCEEDED",
+    branch_name: str = "feature/a",
+    project_name: str = "my-project",
+    queued: int = 30,
+    time: datetime = datetime(2023, 1, 2, 3, 4, 5),
+) -> dict:
+    return make_codebuild_message(
+        project_name=project_name,
+        run_id=run_id,
+        repo_name="repo",
+        source_version="c1",
+        build_status=build_status,
+        env_var=CIData(branch_name=branch_name).to_env_var(),
+        time=time,
+        phase_durations={**PHASE_DURATIONS, "QUEUED": queued},
+    )
+
+
+def test_build_timing():
+    cb_event = CodeBuildEvent.from_codebuid_notification_event(
+        make_message("r1", build_status="FAILED")
+    )
+    build_timing = BuildTiming.from_cb_event(
+        cb_event, CIData.from_env_var(cb_event.plain_text_env_var)
+    )
+    assert build_timing.build_id == "my-project:r1"
+    assert build_timing.is_batch is False
+    assert build_timing.branch_type == "feature"
+    assert build_timing.build_status == "FAILED"
+    assert build_timing.event_time == datetime(2023, 1, 2, 3, 4, 5)
+    assert build_timing.queue_seconds == 31
+    assert build_timing.run_seconds == 143
+
+    row = build_timing.to_row()
+    assert row["queued_seconds"] == 30
+    assert row["install_seconds"] is None
+    assert len([key for key in row if key.endswith("_seconds")]) == len(PHASES) + 2
+
+
+def make_rows() -> list:
+    rows = list()
+    for i in range(20):
+        message = make_message(
+            f"r{i}",
+            build_status="FAILED" if i % 4 == 0 else "SUCCEEDED",
+            branch_name="main" if i % 2 else "feature/a",
+            queued=i,
+            time=datetime(2023, 1, 1 + i % 2, 3, 4, 5),
+        )
+        cb_event = CodeBuildEvent.from_codebuid_notification_event(message)
+        build_timing = BuildTiming.from_cb_event(
+            cb_event, CIData.from_env_var(cb_event.plain_text_env_var)
+        )
+        rows.append(build_timing.to_row())
+    return rows
+
+
+def test_report():
+    pd = pytest.importorskip("pandas")
+    from aws_ci_bot.analytics_report import (
+        duration_report,
+        phase_report,
+        queue_time_trend,
+    )
+
+    df = pd.DataFrame(make_rows())
+    report = duration_report(df)
+    feature = report.loc[("my-project", "feature")]
+    assert feature["builds"] == 10
+    assert feature["failure_rate"] == 0.5
+    assert feature["queue_seconds_p50"] == 10
+    assert report.loc[("my-project", "main"), "failure_rate"] == 0.0
+
+    report = phase_report(df)
+    assert report.loc["my-project", "build_seconds_p95"] == 120
+
+    report = queue_time_trend(df)
+    assert len(report) == 2
+    assert list(report.columns) == ["queue_seconds_p50", "queue_seconds_p95"]
+
+
+def test_lambda_handler(tmp_path):
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("pandas")
+    from aws_ci_bot.analytics_report import load_build_timings
+
+    bsm = LocalBotoSesManager()
+    config = Config(s3_bucket="b", s3_prefix="p", build_timings_uri=str(tmp_path))
+    with patch_lambda_handler(bsm, config):
+        for message in [
+            make_message("r1"),
+            make_message("r2", build_status="FAILED"),
+            # the redelivered event is deduplicated by the report
+            make_message("r2", build_status="FAILED"),
+            make_codebuild_message(
+                "my-project", "r3", "repo", "c1", completed_phase="BUILD"
+            ),
+        ]:
+            lbd.lambda_handler(make_sns_event(message), None)
+    assert len(list(tmp_path.glob("date=*/*.parquet"))) == 3
+    df = load_build_timings(str(tmp_path))
+    assert sorted(df["build_id"]) == ["my-project:r1", "my-project:r2"]
+    assert list(df["queued_seconds"]) == [30, 30]
+
+
+def test_s3_sink():
+    pytest.importorskip("pyarrow")
+    from aws_ci_bot.analytics import BuildTimingSink
+
+    bsm = LocalBotoSesManager()
+    sink = BuildTimingSink(uri="s3://b/timings/", s3_client=bsm.s3_client)
+    assert sink.flush() is None
+    cb_event = CodeBuildEvent.from_codebuid_notification_event(make_message("r1"))
+    sink.add(BuildTiming.from_cb_event(cb_event, CIData()))
+    s3_uri = sink.flush()
+    assert s3_uri.startswith("s3://b/timings/date=")
+    assert bsm.call_counter["s3.put_object"] == 1
+
+
+
+def test_require_pyarrow():
+    if importlib.util.find_spec("pyarrow") is not None:
+        pytest.skip("pyarrow is installed")
+    from aws_ci_bot.analytics import BuildTimingSink
+
+    with pytest.raises(ImportError):
+        BuildTimingSink(uri="s3://b/timings/")
+
+
+def test_compact(tmp_path):
+    pytest.importorskip("pyarrow")
+    pytest.importorskip("pandas")
+    from aws_ci_bot.analytics import BuildTimingSink
+    from aws_ci_bot.analytics_report import load_build_timings
+
+    bsm = LocalBotoSesManager()
+    local_sink = BuildTimingSink(uri=str(tmp_path))
+    s3_sink = BuildTimingSink(uri="s3://b/timings/", s3_client=bsm.s3_client)
+    for sink in [local_sink, s3_sink]:
+        # one small file per Lambda invocation
+        for row in make_rows():
+            cb_event = CodeBuildEvent.from_codebuid_notification_event(
+                make_message(row["build_id"].split(":")[1])
+            )
+            sink.add(BuildTiming.from_cb_event(cb_event, CIData()))
+            sink.flush()
+        assert len(sink._list()) == 20
+        assert len(sink.compact()) == 1
+        assert len(sink._list()) == 1
+        # nothing to compact
+        assert sink.compact() == []
+    df = load_build_timings(str(tmp_path))
+    assert len(df) == 20
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.analytics", preview=False)
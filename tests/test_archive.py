@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+
+from aws_ci_bot.sns_event import encode_ci_event
+from aws_ci_bot.local_aws import LocalS3Client
+from aws_ci_bot.archive import (
+    COMPACTED_FILENAME,
+    MANIFEST_FILENAME,
+    is_event_key,
+    get_partition_prefix,
+    group_by_partition,
+    decode_jsonl_gz,
+    compact_archive,
+)
+
+
+def put_event(s3_client, key: str, event_dict: dict, compress: bool):
+    s3_client.put_object(
+        Bucket="my-bucket",
+        Key=key,
+        **encode_ci_event(event_dict, compress=compress),
+    )
+
+
+def test_group_by_partition():
+    keys = [
+        "ci/codecommit/repo/year=2023/month=01/day=02/t2_repo.json",
+        "ci/codecommit/repo/year=2023/month=01/day=02/t1_repo.json.gz",
+        "ci/codebuild/proj/year=2023/month=01/day=02/single-build/t1_run.json",
+        f"ci/codecommit/repo/year=2023/month=01/day=02/{COMPACTED_FILENAME}",
+        "ci/readme.txt",
+    ]
+    assert is_event_key(keys[0]) is True
+    assert is_event_key(keys[3]) is False
+    assert is_event_key(keys[0].replace("t2_repo.json", MANIFEST_FILENAME)) is False
+    assert get_partition_prefix(keys[0]) == (
+        "ci/codecommit/repo/year=2023/month=01/day=02/"
+    )
+    groups = group_by_partition(keys)
+    assert groups == {
+        "ci/codecommit/repo/year=2023/month=01/day=02/": [keys[1], keys[0]],
+        "ci/codebuild/proj/year=2023/month=01/day=02/single-build/": [keys[2]],
+    }
+
+
+def test_compact_archive():
+    s3_client = LocalS3Client()
+    p1 = "ci/codecommit/repo/year=2023/month=01/day=02/"
+    p2 = "ci/codecommit/repo/year=2023/month=01/day=03/"
+    put_event(s3_client, f"{p1}t1_repo.json", {"i": 1}, compress=False)
+    put_event(s3_client, f"{p1}t2_repo.json.gz", {"i": 2}, compress=True)
+    put_event(s3_client, f"{p1}t3_repo.json", {"i": 3}, compress=False)
+    put_event(s3_client, f"{p2}t1_repo.json", {"i": 4}, compress=False)
+
+    # only compact one day
+    results = compact_archive(
+        s3_client=s3_client,
+        bucket="my-bucket",
+        prefix="ci",
+        date=datetime(2023, 1, 2),
+        delete_source=True,
+    )
+    assert len(results) == 1
+    assert results[0].s3_uri == f"s3://my-bucket/{p1}{COMPACTED_FILENAME}"
+    assert results[0].n_compacted == 3
+    assert sorted(key for _, key in s3_client.objects) == [
+        f"{p1}{COMPACTED_FILENAME}",
+        f"{p1}{MANIFEST_FILENAME}",
+        f"{p2}t1_repo.json",
+    ]
+    body = s3_client.objects[("my-bucket", f"{p1}{COMPACTED_FILENAME}")]["Body"]
+    assert decode_jsonl_gz(body) == [{"i": 1}, {"i": 2}, {"i": 3}]
+
+    # new events arrive, the compacted file is extended
+    put_event(s3_client, f"{p1}t4_repo.json", {"i": 5}, compress=False)
+    results = compact_archive(
+        s3_client=s3_client,
+        bucket="my-bucket",
+        prefix="ci/",
+    )
+    assert [(r.n_compacted, r.n_total) for r in results] == [(1, 4), (1, 1)]
+    body = s3_client.objects[("my-bucket", f"{p1}{COMPACTED_FILENAME}")]["Body"]
+    assert decode_jsonl_gz(body) == [{"i": 1}, {"i": 2}, {"i": 3}, {"i": 5}]
+    # source objects are kept by default
+    assert ("my-bucket", f"{p1}t4_repo.json") in s3_client.objects
+
+    # run it again, the kept source objects are not compacted twice
+    assert compact_archive(s3_client, "my-bucket", "ci/") == []
+    put_event(s3_client, f"{p2}t2_repo.json", {"i": 6}, compress=False)
+    results = compact_archive(s3_client, "my-bucket", "ci/")
+    assert [(r.n_compacted, r.n_total) for r in results] == [(1, 2)]
+    body = s3_client.objects[("my-bucket", f"{p1}{COMPACTED_FILENAME}")]["Body"]
+    assert decode_jsonl_gz(body) == [{"i": 1}, {"i": 2}, {"i": 3}, {"i": 5}]
+    body = s3_client.objects[("my-bucket", f"{p2}{COMPACTED_FILENAME}")]["Body"]
+    assert decode_jsonl_gz(body) == [{"i": 4}, {"i": 6}]
+
+    # nothing to compact
+    assert compact_archive(s3_client, "my-bucket", "other/") == []
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.archive", preview=False)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import threading
+
+import pytest
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.summary_comment import SummaryComment
+from aws_ci_bot import lbd
+from aws_ci_bot.batch import (
+    RecordStatusEnum,
+    process_records,
+    summarize,
+)
+
+
+def test_process_records():
+    thread_ids = set()
+    lock = threading.Lock()
+
+    def func(record: int):
+        with lock:
+            thread_ids.add(threading.get_ident())
+        time.sleep(0.01)
+        if record % 3 == 0:
+            raise ValueError(f"bad record {record}")
+
+    results = process_records(records=list(range(1, 10)), func=func, max_workers=4)
+    # result order is the same as the input order
+    assert [result.index for result in results] == list(range(9))
+    # failure is isolated per record
+    failed = [result.index for result in results if not result.is_succeeded]
+    assert failed == [2, 5, 8]
+    assert results[2].status == RecordStatusEnum.failed.value
+    assert results[2].error == "ValueError: bad record 3"
+    # the thread pool is bounded
+    assert 1 < len(thread_ids) <= 4
+
+    summary = summarize(results)
+    assert summary["total"] == 9
+    assert summary["succeeded"] == 6
+    assert summary["failed"] == 3
+    assert len(summary["records"]) == 9
+
+
+def test_process_records_edge_case():
+    assert process_records(records=[], func=print) == []
+    results = process_records(records=[1], func=lambda x: x)
+    assert results[0].is_succeeded
+
+
+
+def test_handle_sns_event_in_batch():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    event = make_sns_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    bad_record = make_sns_event({"source": "aws.codebuild"}, message_id="bad")
+    event["Records"].extend(bad_record["Records"])
+    config = Config(s3_bucket="b", s3_prefix="p", batch_mode=True)
+    with patch_lambda_handler(bsm, config):
+        # the failed record fails the invocation, so it is retried
+        with pytest.raises(RuntimeError, match="1 of 2 records failed: bad"):
+            lbd.lambda_handler(event, None)
+    # the good record is still handled
+    assert bsm.call_counter["codebuild.start_build"] == 1
+
+
+
+def test_handle_sns_event_in_batch_config():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    event = make_sns_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    with patch_lambda_handler(bsm, Config(s3_bucket="b", s3_prefix="p")):
+        # the given config is used, not the module level one
+        lbd.handle_sns_event_in_batch(
+            bsm=bsm,
+            config=Config(s3_bucket="b", s3_prefix="p", comment_mode="summary"),
+            event=event,
+        )
+    (comment,) = bsm.codecommit_client.comments.values()
+    assert SummaryComment.parse(comment["content"]).rows[0].status == "IN_PROGRESS"
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.batch", preview=False)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.ci_data import CIData
+from aws_ci_bot.corpus import make_sns_event, make_codebuild_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.summary_comment import SummaryComment, JobRow
+from aws_ci_bot.batch_report import (
+    chunk,
+    format_duration,
+    get_child_builds,
+)
+from aws_ci_bot import lbd
+
+
+def test_chunk():
+    assert chunk(list(range(5)), 2) == [[0, 1], [2, 3], [4]]
+    assert chunk([]) == []
+    assert len(chunk(list(range(250)))) == 3
+
+
+def test_format_duration():
+    assert format_duration(None) == "-"
+    assert format_duration(5.4) == "5s"
+    assert format_duration(125) == "2m 5s"
+    assert format_duration(3725) == "1h 2m 5s"
+
+
+def start_batch(bsm: LocalBotoSesManager, n_children: int) -> str:
+    client = bsm.codebuild_client
+    res = client.start_build_batch(projectName="my-project", sourceVersion="c1")
+    batch_id = res["buildBatch"]["id"]
+    for i in range(n_children):
+        client.add_batch_child(
+            batch_id,
+            identifier=f"job_{i}",
+            build_status="FAILED" if i == 1 else "SUCCEEDED",
+            duration_seconds=60 + i,
+        )
+    return batch_id
+
+
+def test_get_child_builds():
+    bsm = LocalBotoSesManager()
+    batch_id = start_batch(bsm, n_children=250)
+    child_builds = get_child_builds(bsm, batch_id, max_workers=3)
+    assert [c.identifier for c in child_builds] == [f"job_{i}" for i in range(250)]
+    assert child_builds[1].status == "FAILED"
+    assert child_builds[2].duration_seconds == 62
+    # one call for the batch, the builds are chunked at 100 ids per call
+    assert bsm.call_counter["codebuild.batch_get_build_batches"] == 1
+    assert bsm.call_counter["codebuild.batch_get_builds"] == 3
+
+
+def run_batch_build_finished(
+    batch_build_report: bool,
+    comment_mode: str = "per_job",
+) -> str:
+    bsm = LocalBotoSesManager()
+    batch_id = start_batch(bsm, n_children=2)
+    if comment_mode == "summary":
+        content = SummaryComment(
+            header="build job",
+            rows=[
+                JobRow(
+                    project_name="my-project",
+                    is_batch_job=True,
+                    status="IN_PROGRESS",
+                    build_id=batch_id,
+                    console_url="url",
+                )
+            ],
+        ).render()
+    else:
+        content = "build job"
+    comment = bsm.codecommit_client.post_comment_for_pull_request(
+        pullRequestId="1",
+        repositoryName="repo",
+        beforeCommitId="c0",
+        afterCommitId="c1",
+        content=content,
+    )["comment"]
+    config = Config(s3_bucket="b", s3_prefix="p", batch_build_report=batch_build_report)
+    ci_data = CIData(comment_id=comment["commentId"], comment_mode=comment_mode)
+    with patch_lambda_handler(bsm, config):
+        lbd.lambda_handler(
+            make_sns_event(
+                make_codebuild_message(
+                    project_name="my-project",
+                    run_id=batch_id.split(":", 1)[1],
+                    repo_name="repo",
+                    source_version="c1",
+                    build_status="FAILED",
+                    env_var=ci_data.to_env_var(),
+                    is_batch=True,
+                )
+            ),
+            None,
+        )
+    return list(bsm.codecommit_client.comments.values())[-1]["content"]
+
+
+def test_batch_build_report():
+    content = run_batch_build_finished(batch_build_report=True)
+    assert content.startswith("🔴 Build Run FAILED")
+    assert "| job_0 |" in content
+    assert "🔴 FAILED | 1m 1s |" in content
+    assert run_batch_build_finished(batch_build_report=False) == "🔴 Build Run FAILED"
+
+
+def test_batch_build_report_in_summary_comment():
+    content = run_batch_build_finished(batch_build_report=True, comment_mode="summary")
+    summary = SummaryComment.parse(content)
+    assert summary.rows[0].status == "FAILED"
+    assert "| job_0 |" in summary.rows[0].report
+    assert "🔴 FAILED | 1m 1s |" in content.split("<!--")[0]
+
+    content = run_batch_build_finished(batch_build_report=False, comment_mode="summary")
+    assert SummaryComment.parse(content).rows[0].report is None
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.batch_report", preview=False)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from aws_ci_bot.sns_event import extract_sns_message_dict
+from aws_ci_bot.corpus import generate_corpus
+from aws_ci_bot.benchmark import percentile, get_event_type, run_benchmark
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    assert percentile([1], 99) == 1
+    assert percentile([1, 2, 3, 4, 5], 50) == 3
+    assert percentile([1, 2, 3, 4, 5], 100) == 5
+    assert percentile([1, 2], 50) == 1.5
+
+
+def test_generate_corpus():
+    def get_event_types(corpus):
+        return [
+            get_event_type(extract_sns_message_dict(event)) for event in corpus.events
+        ]
+
+    corpus = generate_corpus(n_events=300, seed=1)
+    assert len(corpus.events) == 300
+    event_types = get_event_types(corpus)
+    assert "codecommit.pr_created" in event_types
+    assert "codebuild.phase_change" in event_types
+    assert "codebuild.state_change.IN_PROGRESS" in event_types
+    # same seed, same traffic
+    assert get_event_types(generate_corpus(n_events=300, seed=1)) == event_types
+
+
+def test_run_benchmark(tmp_path):
+    result = run_benchmark(n_events=200, seed=1)
+    assert result.n_events == 200
+    assert result.failed == 0
+    assert result.peak_memory > 0
+    assert result.latency.p50 <= result.latency.p95 <= result.latency.p99
+    pr_created = result.event_types["codecommit.pr_created"]
+    assert pr_created["api_calls"]["codecommit.get_file"] > 0
+    phase_change = result.event_types["codebuild.phase_change"]
+    assert phase_change["api_calls"] == {"s3.put_object": phase_change["latency_ms"]["count"]}
+
+    path = tmp_path / "benchmark.json"
+    result.write(str(path))
+    data = json.loads(path.read_text())
+    assert data["n_events"] == 200
+    assert data["metadata"]["seed"] == 1
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.benchmark", preview=False)
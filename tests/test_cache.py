@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from aws_ci_bot.cache import LRUCache
+from aws_ci_bot.code_build_config import (
+    CodebuildConfig,
+    blob_id_cache,
+    config_cache,
+    clear_cache,
+)
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.commit_cache import commit_cache
+from aws_ci_bot import lbd
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_lru_cache():
+    cache = LRUCache(name="test", max_items=2)
+    assert cache.get("a") is None
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evict b, a is recently used
+    assert cache.get("b", "missing") == "missing"
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.stats.hits == 3
+    assert cache.stats.misses == 2
+    assert cache.stats.evictions == 1
+    assert cache.to_dict()["hit_rate"] == 0.6
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats.hits == 0
+
+    # disabled
+    cache = LRUCache(name="test", max_items=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_lru_cache_max_bytes():
+    cache = LRUCache(name="test", max_items=10, max_bytes=10)
+    cache.set("a", "12345")
+    cache.set("b", "12345")
+    assert cache.total_bytes == 10
+    cache.set("c", "123")
+    assert cache.get("a") is None
+    assert cache.total_bytes == 8
+    cache.set("d", "12345678901")  # larger than the limit, not cached
+    assert cache.get("d") is None
+    assert cache.get("b") == "12345"
+
+
+def test_lru_cache_ttl():
+    clock = Clock()
+    cache = LRUCache(name="test", ttl=10, clock=clock)
+    cache.set("a", 1)
+    clock.now = 9.9
+    assert cache.get("a") == 1
+    clock.now = 10
+    assert cache.get("a") is None
+    assert cache.stats.expirations == 1
+    assert len(cache) == 0
+
+
+def test_codebuild_config_cache():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    content = json.dumps(
+        {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+    )
+    bsm.codecommit_client.add_file(file_path="codebuild-config.json", content=content)
+
+    cb_config = CodebuildConfig.from_codecommit_repo(bsm, "my-repo", "c1")
+    assert cb_config.jobs[0].project_name == "my-project"
+    assert bsm.call_counter["codecommit.get_file"] == 1
+
+    # same commit, skip GetFile
+    assert CodebuildConfig.from_codecommit_repo(bsm, "my-repo", "c1") is cb_config
+    assert bsm.call_counter["codecommit.get_file"] == 1
+
+    # new commit with the same file content, skip the parsing
+    assert CodebuildConfig.from_codecommit_repo(bsm, "my-repo", "c2") is cb_config
+    assert bsm.call_counter["codecommit.get_file"] == 2
+    assert len(config_cache) == 1
+    assert len(blob_id_cache) == 2
+
+    clear_cache()
+    assert CodebuildConfig.from_codecommit_repo(bsm, "my-repo", "c1") is not cb_config
+    clear_cache()
+
+
+
+def test_lru_cache_configure():
+    cache = LRUCache(name="test", max_items=2)
+    cache.set("a", 1)
+    cache.configure(max_items=0, ttl=10)
+    assert (cache.max_items, cache.max_bytes, cache.ttl) == (0, None, 10)
+    assert len(cache) == 0
+    cache.set("a", 1)
+    assert len(cache) == 0
+
+
+def run_same_commit_twice(config: Config) -> LocalBotoSesManager:
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    bsm.codecommit_client.add_commit("repo", "c1")
+    event = make_sns_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    with patch_lambda_handler(bsm, config):
+        lbd.lambda_handler(event, None)
+        lbd.lambda_handler(event, None)
+    return bsm
+
+
+def test_configure_caches():
+    clear_cache()
+    commit_cache.clear()
+    # the cache settings follow the patched config
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        config_cache_max_items=0,
+        commit_cache_max_items=0,
+    )
+    bsm = run_same_commit_twice(config)
+    assert config_cache.max_items == 0
+    assert commit_cache.max_items == 0
+    assert bsm.call_counter["codecommit.get_file"] == 2
+    assert bsm.call_counter["codecommit.get_commit"] == 2
+
+    bsm = run_same_commit_twice(Config(s3_bucket="b", s3_prefix="p"))
+    assert config_cache.max_items == 256
+    assert commit_cache.max_items == 4096
+    assert bsm.call_counter["codecommit.get_file"] == 1
+    assert bsm.call_counter["codecommit.get_commit"] == 1
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.cache", preview=False)
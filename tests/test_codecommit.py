@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+import threading
+
+import pytest
+from aws_codecommit import CodeCommitEvent
+
+from aws_ci_bot.corpus import make_pr_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.codecommit import CodeCommitEventHandler
+from aws_ci_bot.throttle import ApiBudget
+
+
+def make_handler(bsm: LocalBotoSesManager, n_jobs: int) -> CodeCommitEventHandler:
+    clear_cache()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {
+                "jobs": [
+                    {"project_name": f"project-{i}", "is_batch_job": False}
+                    for i in range(n_jobs)
+                ]
+            }
+        ),
+    )
+    cc_event = CodeCommitEvent.from_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    cc_event.bsm = bsm
+    return CodeCommitEventHandler(
+        bsm=bsm,
+        cc_event=cc_event,
+        s3_console_url="https://console.aws.amazon.com/s3/object/b",
+        s3_uri="s3://b/k.json",
+        max_workers=4,
+    )
+
+
+def test_run_build_jobs_in_parallel():
+    latency = 0.05
+    handler = make_handler(LocalBotoSesManager(latency=latency), n_jobs=4)
+    start = time.perf_counter()
+    handler.execute()
+    elapsed = time.perf_counter() - start
+    calls = handler.bsm.call_counter
+    assert calls["codebuild.start_build"] == 4
+    assert calls["codecommit.post_comment_for_pull_request"] == 4
+    assert calls["codecommit.update_comment"] == 4
+    # 12 calls of the build jobs take 0.6 second in serial
+    assert elapsed < latency * 9
+
+
+def test_run_build_jobs_isolation():
+    bsm = LocalBotoSesManager()
+    handler = make_handler(bsm, n_jobs=3)
+    start_build = bsm.codebuild_client.start_build
+
+    def flaky_start_build(projectName: str, **kwargs):
+        if projectName == "project-1":
+            raise ValueError("boom")
+        return start_build(projectName=projectName, **kwargs)
+
+    bsm.codebuild_client.start_build = flaky_start_build
+    with pytest.raises(RuntimeError) as e:
+        handler.execute()
+    assert "1 of 3 build jobs failed: project-1: ValueError: boom" in str(e.value)
+    assert bsm.call_counter["codebuild.start_build"] == 2
+
+
+def test_api_budget():
+    budget = ApiBudget(max_concurrency=2)
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0}
+
+    def call():
+        with budget:
+            with lock:
+                state["running"] += 1
+                state["peak"] = max(state["peak"], state["running"])
+            time.sleep(0.01)
+            with lock:
+                state["running"] -= 1
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert state["peak"] == 2
+
+    with pytest.raises(ValueError):
+        budget.configure(0)
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.codecommit", preview=False)
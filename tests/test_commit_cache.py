@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+from aws_ci_bot.corpus import make_pr_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.commit_cache import (
+    CachedCodeCommitEvent,
+    get_commit_metadata,
+    commit_cache,
+    clear_cache,
+)
+
+
+def make_cc_event(bsm, commit_id: str, event_type: str = "pr_created"):
+    cc_event = CachedCodeCommitEvent.from_event(
+        make_pr_message("repo", event_type, "1", "feature/a", "main", commit_id, "c0")
+    )
+    cc_event.bsm = bsm
+    return cc_event
+
+
+def test_get_commit_metadata():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_commit(
+        "repo", "c1", message="feat: add", committer_name="alice", tree_id="t1"
+    )
+    metadata = get_commit_metadata(bsm, "repo", "c1")
+    assert metadata.tree_id == "t1"
+    assert metadata.message == "feat: add"
+    assert get_commit_metadata(bsm, "repo", "c1") is metadata
+    assert bsm.call_counter["codecommit.get_commit"] == 1
+    assert commit_cache.stats.hits == 1
+
+
+def test_cached_codecommit_event():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_commit(
+        "repo", "c1", message="feat: add", committer_name="alice"
+    )
+    # the event that doesn't need the commit message doesn't call the API
+    cc_event = make_cc_event(bsm, "c1")
+    assert bsm.call_counter["codecommit.get_commit"] == 0
+
+    # the events of the same commit share the commit metadata
+    for event_type in ["pr_created", "pr_updated", "pr_merged"]:
+        cc_event = make_cc_event(bsm, "c1", event_type)
+        assert cc_event.commit_message == "feat: add"
+        assert cc_event.committer_name == "alice"
+    assert bsm.call_counter["codecommit.get_commit"] == 1
+
+    make_cc_event(bsm, "c2").commit_message
+    assert bsm.call_counter["codecommit.get_commit"] == 2
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.commit_cache", preview=False)
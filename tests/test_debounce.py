@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+
+import json
+from datetime import datetime
+
+import pytest
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.store import InMemoryStore
+from aws_ci_bot.debounce import (
+    Debounce,
+    get_debounce_key,
+    get_event_time,
+    is_debounced_event,
+)
+from aws_ci_bot import lbd
+
+QUEUE_URL = "https://sqs.us-east-1.amazonaws.com/111122223333/debounce"
+
+
+def test_debounce_window():
+    for window in [0, 901]:
+        with pytest.raises(ValueError):
+            Debounce(
+                store=InMemoryStore(),
+                sqs_client=None,
+                queue_url=QUEUE_URL,
+                window=window,
+            )
+
+
+def test_debounce():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    now = [0.0]
+    bsm.sqs_client.clock = lambda: now[0]
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        debounce_seconds=60,
+        debounce_queue_url=QUEUE_URL,
+    )
+    with patch_lambda_handler(bsm, config):
+        # 3 pushes in the debounce window
+        for event_type, commit_id in [
+            ("pr_created", "c1"),
+            ("pr_updated", "c2"),
+            ("pr_updated", "c3"),
+        ]:
+            event = make_sns_event(
+                make_pr_message(
+                    "repo", event_type, "1", "feature/a", "main", commit_id, "c0"
+                )
+            )
+            assert is_debounced_event(event) is False
+            lbd.lambda_handler(event, None)
+        # the PR created event is not deferred
+        assert bsm.call_counter["codebuild.start_build"] == 1
+        assert bsm.call_counter["sqs.send_message"] == 2
+        assert bsm.sqs_client.to_lambda_event(QUEUE_URL)["Records"] == []
+
+        # the delayed events come back
+        now[0] = 60
+        sqs_event = bsm.sqs_client.to_lambda_event(QUEUE_URL)
+        assert len(sqs_event["Records"]) == 2
+        res = lbd.lambda_handler(sqs_event, None)
+        assert res == {"batchItemFailures": []}
+
+        # the merge is not deferred
+        lbd.lambda_handler(
+            make_sns_event(
+                make_pr_message("repo", "pr_merged", "1", "feature/a", "main", "m1", "c0")
+            ),
+            None,
+        )
+
+    # only the latest update is built
+    assert [
+        build["sourceVersion"] for build in bsm.codebuild_client.builds.values()
+    ] == ["c1", "c3", "m1"]
+    assert bsm.call_counter["sqs.send_message"] == 2
+
+
+
+def test_debounce_out_of_order():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    now = [0.0]
+    bsm.sqs_client.clock = lambda: now[0]
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        debounce_seconds=60,
+        debounce_queue_url=QUEUE_URL,
+    )
+    with patch_lambda_handler(bsm, config):
+        # the newer push is delivered before the older one
+        for commit_id, second in [("c3", 3), ("c2", 2)]:
+            event = make_sns_event(
+                make_pr_message(
+                    "repo",
+                    "pr_updated",
+                    "1",
+                    "feature/a",
+                    "main",
+                    commit_id,
+                    "c0",
+                    time=datetime(2023, 1, 1, 0, 0, second),
+                )
+            )
+            assert get_event_time(event) == f"2023-01-01T00:00:0{second}Z"
+            lbd.lambda_handler(event, None)
+        assert lbd._store.get(get_debounce_key("repo", "1")) == {
+            "source_commit": "c3",
+            "event_time": "2023-01-01T00:00:03Z",
+        }
+        # the older event is dropped right away
+        assert bsm.call_counter["sqs.send_message"] == 1
+
+        now[0] = 60
+        lbd.lambda_handler(bsm.sqs_client.to_lambda_event(QUEUE_URL), None)
+
+    assert [
+        build["sourceVersion"] for build in bsm.codebuild_client.builds.values()
+    ] == ["c3"]
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.debounce", preview=False)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+import json
+import typing as T
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message
+from aws_ci_bot.local_aws import LocalBotoSesManager, AccessDeniedException
+from aws_ci_bot.metrics import metrics
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import BuildJobConfig, clear_cache
+from aws_ci_bot.diff import diff_cache, get_changed_files
+from aws_ci_bot import lbd
+
+
+def test_should_run():
+    job = BuildJobConfig(project_name="p", is_batch_job=False)
+    assert job.should_run(["README.md"]) is True
+
+    job = BuildJobConfig(
+        project_name="p",
+        is_batch_job=False,
+        include_paths=["services/api/*", "lib/*"],
+        exclude_paths=["*.md"],
+    )
+    assert job.should_run(None) is True
+    assert job.should_run([]) is False
+    assert job.should_run(["services/api/app/main.py"]) is True
+    assert job.should_run(["services/web/main.py"]) is False
+    assert job.should_run(["services/api/README.md"]) is False
+    assert job.should_run(["services/api/README.md", "lib/util.py"]) is True
+
+    job = BuildJobConfig(project_name="p", is_batch_job=False, exclude_paths=["docs/*"])
+    assert job.should_run(["docs/index.rst"]) is False
+    assert job.should_run(["docs/index.rst", "setup.py"]) is True
+
+
+def test_get_changed_files():
+    diff_cache.clear()
+    bsm = LocalBotoSesManager()
+    paths = [f"src/file_{i}.py" for i in range(250)]
+    bsm.codecommit_client.add_differences("repo", "c0", "c1", paths)
+    assert get_changed_files(bsm, "repo", "c0", "c1") == frozenset(paths)
+    assert bsm.call_counter["codecommit.get_differences"] == 3
+    # warm cache
+    assert get_changed_files(bsm, "repo", "c0", "c1") == frozenset(paths)
+    assert bsm.call_counter["codecommit.get_differences"] == 3
+    assert get_changed_files(bsm, "repo", "c0", "c2") == frozenset()
+
+
+def run_path_filtered_jobs(bsm: LocalBotoSesManager) -> T.List[str]:
+    clear_cache()
+    diff_cache.clear()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {
+                "jobs": [
+                    {
+                        "project_name": "api",
+                        "is_batch_job": False,
+                        "include_paths": ["services/api/*"],
+                    },
+                    {
+                        "project_name": "web",
+                        "is_batch_job": False,
+                        "include_paths": ["services/web/*"],
+                    },
+                    {"project_name": "lint", "is_batch_job": False},
+                ]
+            }
+        ),
+    )
+    bsm.codecommit_client.add_differences(
+        "repo", "c0", "c1", ["services/api/main.py"]
+    )
+    with patch_lambda_handler(bsm, Config(s3_bucket="b", s3_prefix="p")):
+        lbd.lambda_handler(
+            make_sns_event(
+                make_pr_message(
+                    "repo", "pr_created", "1", "feature/a", "main", "c1", "c0"
+                )
+            ),
+            None,
+        )
+    return sorted(
+        build["projectName"] for build in bsm.codebuild_client.builds.values()
+    )
+
+
+def test_path_filtered_jobs():
+    bsm = LocalBotoSesManager()
+    assert run_path_filtered_jobs(bsm) == ["api", "lint"]
+
+
+def test_path_filter_fallback(capsys):
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.inject_error(
+        "get_differences", AccessDeniedException("codecommit:GetDifferences")
+    )
+    metrics.configure(enabled=True)
+    try:
+        # the broken path filter runs all build jobs, and it is visible
+        assert run_path_filtered_jobs(bsm) == ["api", "lint", "web"]
+    finally:
+        metrics.configure(enabled=False)
+    doc = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert doc["path_filter.fallback"] == 1
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.diff", preview=False)
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import json
+import time
+
+import pytest
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message, make_codebuild_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.store import InMemoryStore, SQLiteStore, S3Store
+from aws_ci_bot.idempotency import Idempotency, claim, make_store
+from aws_ci_bot import lbd
+
+
+def test_claim():
+    idempotency = Idempotency(store=InMemoryStore())
+    with idempotency.claim("k1") as is_new:
+        assert is_new is True
+    with idempotency.claim("k1") as is_new:
+        assert is_new is False
+
+    # the key is released on failure
+    with pytest.raises(ValueError):
+        with idempotency.claim("k2") as is_new:
+            assert is_new is True
+            raise ValueError
+    with idempotency.claim("k2") as is_new:
+        assert is_new is True
+
+    # disabled
+    with claim(None, "k1") as is_new:
+        assert is_new is True
+
+
+def test_claim_lease():
+    store = InMemoryStore()
+    idempotency = Idempotency(store=store, ttl=60, lease=0.2)
+    with idempotency.claim("k1") as is_new:
+        assert store.get("k1")["status"] == "in_progress"
+    assert store.get("k1")["status"] == "done"
+    # the done key outlives the lease
+    time.sleep(0.3)
+    with idempotency.claim("k1") as is_new:
+        assert is_new is False
+
+    # the Lambda function dies in the code block, nothing is raised
+    ctx = idempotency.claim("k2")
+    assert ctx.__enter__() is True
+    with idempotency.claim("k2") as is_new:
+        assert is_new is False
+    # the redelivered event takes the key over after the lease
+    time.sleep(0.3)
+    with idempotency.claim("k2") as is_new:
+        assert is_new is True
+    assert store.get("k2")["status"] == "done"
+
+
+def test_make_store():
+    bsm = LocalBotoSesManager()
+    assert make_store("", bsm) is None
+    assert isinstance(make_store("memory", bsm), InMemoryStore)
+    assert isinstance(make_store("sqlite::memory:", bsm), SQLiteStore)
+    store = make_store("s3", bsm, s3_bucket="b", s3_prefix="p")
+    assert isinstance(store, S3Store)
+    assert (store.bucket, store.prefix) == ("b", "p/idempotency/")
+    store = make_store("s3://b/keys/", bsm)
+    assert (store.bucket, store.prefix) == ("b", "keys/")
+    with pytest.raises(ValueError):
+        make_store("redis://localhost", bsm)
+
+
+def test_duplicated_event():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    config = Config(s3_bucket="b", s3_prefix="p", idempotency_store="s3")
+    cc_event = make_sns_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    with patch_lambda_handler(bsm, config):
+        lbd.lambda_handler(cc_event, None)
+        lbd.lambda_handler(cc_event, None)
+        assert bsm.call_counter["codebuild.start_build"] == 1
+
+        (build,) = bsm.codebuild_client.builds.values()
+        env_var = {
+            dct["name"]: dct["value"]
+            for dct in build["environment"]["environmentVariables"]
+        }
+        cb_event = make_sns_event(
+            make_codebuild_message(
+                project_name="my-project",
+                run_id=build["id"].split(":", 1)[1],
+                repo_name="repo",
+                source_version="c1",
+                build_status="SUCCEEDED",
+                env_var=env_var,
+            )
+        )
+        lbd.lambda_handler(cb_event, None)
+        lbd.lambda_handler(cb_event, None)
+        assert bsm.call_counter["codecommit.post_comment_reply"] == 1
+
+
+
+def test_retry_partially_failed_event():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {
+                "jobs": [
+                    {"project_name": "my-project", "is_batch_job": False},
+                    {"project_name": "my-project", "is_batch_job": True},
+                ]
+            }
+        ),
+    )
+    config = Config(s3_bucket="b", s3_prefix="p", idempotency_store="memory")
+    cc_event = make_sns_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    with patch_lambda_handler(bsm, config):
+        bsm.codebuild_client.inject_error(
+            "start_build_batch", RuntimeError("service unavailable")
+        )
+        with pytest.raises(Exception):
+            lbd.lambda_handler(cc_event, None)
+        assert len(bsm.codebuild_client.builds) == 1
+        assert len(bsm.codebuild_client.build_batches) == 0
+
+        # the retry only starts the failed build job
+        bsm.codebuild_client.inject_error("start_build_batch", None)
+        lbd.lambda_handler(cc_event, None)
+        assert len(bsm.codebuild_client.builds) == 1
+        assert len(bsm.codebuild_client.build_batches) == 1
+
+        # then the event is done
+        lbd.lambda_handler(cc_event, None)
+        assert len(bsm.codebuild_client.build_batches) == 1
+
+
+
+def test_prs_of_same_source_commit():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    config = Config(s3_bucket="b", s3_prefix="p", idempotency_store="memory")
+    with patch_lambda_handler(bsm, config):
+        for pr_id, target_branch, target_commit in [
+            ("1", "main", "c0"),
+            ("2", "release/1.0", "r0"),
+        ]:
+            lbd.lambda_handler(
+                make_sns_event(
+                    make_pr_message(
+                        "repo",
+                        "pr_created",
+                        pr_id,
+                        "feature/a",
+                        target_branch,
+                        "c1",
+                        target_commit,
+                    )
+                ),
+                None,
+            )
+    assert bsm.call_counter["codebuild.start_build"] == 2
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.idempotency", preview=False)
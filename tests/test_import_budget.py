@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+"""
+Make sure ``import aws_ci_bot.lbd`` stays cheap, because it is on the Lambda
+cold start path. The budget can be adjusted by environment variable.
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+IMPORT_TIME_BUDGET = float(os.environ.get("AWS_CI_BOT_IMPORT_TIME_BUDGET", "0.5"))
+IMPORT_MODULE_BUDGET = int(os.environ.get("AWS_CI_BOT_IMPORT_MODULE_BUDGET", "100"))
+
+HEAVY_MODULES = [
+    "boto3",
+    "botocore",
+    "aws_codecommit",
+    "aws_codebuild",
+    "superjson",
+]
+
+SCRIPT = """
+import sys, time, json
+before = set(sys.modules)
+start = time.perf_counter()
+import aws_ci_bot.lbd
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "elapsed": elapsed,
+    "new_modules": sorted(set(sys.modules) - before),
+}))
+"""
+
+
+def measure_import() -> dict:
+    res = subprocess.run(
+        [sys.executable, "-c", SCRIPT],
+        capture_output=True,
+        check=True,
+        env=dict(os.environ, LAZY_IMPORT="true"),
+    )
+    return json.loads(res.stdout.decode("utf-8").strip().splitlines()[-1])
+
+
+def test_import_budget():
+    result = measure_import()
+    new_modules = result["new_modules"]
+    for module in HEAVY_MODULES:
+        assert module not in new_modules, f"{module!r} is imported at cold start"
+    assert len(new_modules) <= IMPORT_MODULE_BUDGET, (
+        f"import aws_ci_bot.lbd loaded {len(new_modules)} modules, "
+        f"budget is {IMPORT_MODULE_BUDGET}"
+    )
+    assert result["elapsed"] <= IMPORT_TIME_BUDGET, (
+        f"import aws_ci_bot.lbd took {result['elapsed']:.3f} seconds, "
+        f"budget is {IMPORT_TIME_BUDGET}"
+    )
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.lbd", preview=False)
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from aws_codecommit import better_boto as cc_boto
+from aws_codebuild import BuildJobRun, start_build, start_build_batch
+
+from aws_ci_bot.local_aws import (
+    LocalBotoSesManager,
+    NoSuchKey,
+    FileDoesNotExistException,
+    CommentDoesNotExistException,
+)
+
+
+def test_local_bsm():
+    bsm = LocalBotoSesManager()
+    assert bsm.aws_account_id == "111122223333"
+    assert bsm.aws_region == "us-east-1"
+    with pytest.raises(NotImplementedError):
+        _ = bsm.dynamodb_client
+
+
+def test_s3():
+    bsm = LocalBotoSesManager()
+    s3_client = bsm.s3_client
+    s3_client.put_object(Bucket="b", Key="k", Body="hello")
+    assert s3_client.get_object(Bucket="b", Key="k")["Body"].read() == b"hello"
+    with pytest.raises(NoSuchKey) as e:
+        s3_client.get_object(Bucket="b", Key="not-exists")
+    assert e.value.response["Error"]["Code"] == "NoSuchKey"
+
+    for i in range(3):
+        s3_client.put_object(Bucket="b", Key=f"folder/{i}", Body="")
+    res = s3_client.list_objects_v2(Bucket="b", Prefix="folder/", MaxKeys=2)
+    assert [obj["Key"] for obj in res["Contents"]] == ["folder/0", "folder/1"]
+    res = s3_client.list_objects_v2(
+        Bucket="b",
+        Prefix="folder/",
+        ContinuationToken=res["NextContinuationToken"],
+    )
+    assert [obj["Key"] for obj in res["Contents"]] == ["folder/2"]
+    assert res["IsTruncated"] is False
+
+    assert bsm.call_counter["s3.put_object"] == 4
+    bsm.reset_call_counter()
+    assert sum(bsm.call_counter.values()) == 0
+
+
+def test_codecommit():
+    bsm = LocalBotoSesManager()
+    cc_client = bsm.codecommit_client
+    cc_client.add_commit("repo", "c1", message="feat: hello", committer_name="alice")
+    commit = cc_boto.get_commit(bsm=bsm, repo_name="repo", commit_id="c1")
+    assert commit.message == "feat: hello"
+    assert commit.committer_name == "alice"
+    # unknown commit
+    commit = cc_boto.get_commit(bsm=bsm, repo_name="repo", commit_id="c2")
+    assert commit.commit_id == "c2"
+
+    cc_client.add_file("config.json", "{}")
+    cc_client.add_file("config.json", "[]", repo_name="repo", commit_id="c1")
+    file = cc_boto.get_file(bsm, "repo", "config.json", commit_id="c1")
+    assert file.get_text() == "[]"
+    file = cc_boto.get_file(bsm, "repo", "config.json", commit_id="c2")
+    assert file.get_text() == "{}"
+    with pytest.raises(FileDoesNotExistException):
+        cc_boto.get_file(bsm, "repo", "not-exists.json", commit_id="c1")
+
+    with cc_boto.CommentThread(bsm=bsm) as thread:
+        comment = thread.post_comment(
+            repo_name="repo",
+            before_commit_id="c1",
+            after_commit_id="c2",
+            content="hello",
+            pr_id="1",
+        )
+        reply = thread.reply("world")
+    assert reply.in_reply_to == comment.comment_id
+    cc_boto.update_comment(bsm, comment.comment_id, "hi")
+    assert cc_boto.get_comment(bsm, comment.comment_id).content == "hi"
+    with pytest.raises(CommentDoesNotExistException):
+        cc_boto.post_comment_reply(bsm, in_reply_to="not-exists", content="")
+
+
+def test_codebuild():
+    bsm = LocalBotoSesManager()
+    res = start_build(bsm=bsm, projectName="my-project", sourceVersion="c1")
+    build_job_run = BuildJobRun.from_start_build_response(res)
+    assert build_job_run.is_batch is False
+    assert build_job_run.build_number == 1
+
+    res = start_build_batch(bsm=bsm, projectName="my-project", sourceVersion="c1")
+    build_job_run = BuildJobRun.from_start_build_response(res)
+    assert build_job_run.is_batch is True
+    assert build_job_run.build_number == 2
+
+
+def test_sqs_client():
+    bsm = LocalBotoSesManager()
+    sqs_client = bsm.sqs_client
+    now = [0.0]
+    sqs_client.clock = lambda: now[0]
+    url = "https://sqs.us-east-1.amazonaws.com/111122223333/my-queue"
+    sqs_client.send_message(QueueUrl=url, MessageBody="a", DelaySeconds=10)
+    sqs_client.send_message(QueueUrl=url, MessageBody="b")
+    event = sqs_client.to_lambda_event(url)
+    assert [record["body"] for record in event["Records"]] == ["b"]
+    assert event["Records"][0]["eventSource"] == "aws:sqs"
+    now[0] = 10
+    assert [record["body"] for record in sqs_client.to_lambda_event(url)["Records"]] == ["a"]
+    assert sqs_client.to_lambda_event(url)["Records"] == []
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.local_aws", preview=False)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import io
+import json
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.metrics import Metrics, metrics, _null_timer
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.corpus import make_sns_event, make_pr_message
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.commit_cache import clear_cache as clear_commit_cache
+from aws_ci_bot import lbd
+
+
+def test_disabled():
+    m = Metrics(enabled=False)
+    assert m.timer("a") is _null_timer
+    with m.timer("a"):
+        pass
+    m.put("b", 1)
+    assert m.to_emf() == []
+    assert m.flush() == []
+
+
+def test_emf():
+    m = Metrics(enabled=True, namespace="test", dimensions={"FunctionName": "f"})
+    with m.timer("stage.a"):
+        pass
+    for _ in range(150):
+        m.put("count.b", 1)
+    stream = io.StringIO()
+    docs = m.flush(stream=stream)
+    assert len(docs) == 2
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line) for line in lines] == docs
+
+    doc = docs[0]
+    directive = doc["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == "test"
+    assert directive["Dimensions"] == [["FunctionName"]]
+    assert directive["Metrics"] == [
+        {"Name": "count.b", "Unit": "Count"},
+        {"Name": "stage.a", "Unit": "Milliseconds"},
+    ]
+    assert doc["FunctionName"] == "f"
+    assert isinstance(doc["stage.a"], float)
+    assert len(doc["count.b"]) == 100
+    assert len(docs[1]["count.b"]) == 50
+    assert "stage.a" not in docs[1]
+
+    # flush clears the metrics
+    assert m.flush(stream=stream) == []
+
+
+def test_lambda_handler(capsys):
+    clear_cache()
+    clear_commit_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    event = make_sns_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    metrics.configure(enabled=True)
+    try:
+        with patch_lambda_handler(bsm, Config(s3_bucket="b", s3_prefix="p")):
+            lbd.lambda_handler(event, None)
+    finally:
+        metrics.configure(enabled=False)
+    doc = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    names = {
+        dct["Name"] for dct in doc["_aws"]["CloudWatchMetrics"][0]["Metrics"]
+    }
+    assert names == {
+        "stage.lambda_handler",
+        "stage.parse_sns_message",
+        "stage.archive",
+        "stage.handle_codecommit_event",
+        "stage.check_what_to_do",
+        "stage.trigger_build_jobs",
+        "api.s3.put_object",
+        "api.codecommit.get_file",
+        "api.codecommit.get_commit",
+        "api.codecommit.post_comment",
+        "api.codebuild.start_build",
+        "api.codecommit.update_comment",
+        "cache.codebuild_config_blob_id.miss",
+        "cache.codebuild_config.miss",
+        "cache.commit.miss",
+    }
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.metrics", preview=False)
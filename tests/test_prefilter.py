@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from aws_codecommit import CodeCommitEvent
+from aws_codebuild import CodeBuildEvent
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import (
+    generate_corpus,
+    make_sns_event,
+    make_comment_message,
+    make_codebuild_message,
+)
+from aws_ci_bot.rule_benchmark import generate_rule_corpus
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.codebuild_rule import check_what_to_do as check_codebuild
+from aws_ci_bot.trigger_rule import default_rules
+from aws_ci_bot.prefilter import get_codecommit_event_type, get_ignore_reason
+from aws_ci_bot import lbd
+
+
+def test_agree_with_rules():
+    bsm = LocalBotoSesManager()
+    n_events, n_dropped = 0, 0
+    for corpus in [generate_corpus(n_events=1000, seed=5), generate_rule_corpus(1000)]:
+        corpus.setup(bsm)
+        for event in corpus.events:
+            n_events += 1
+            message_dict = json.loads(event["Records"][0]["Sns"]["Message"])
+            reason = get_ignore_reason(message_dict, trigger_rules="default")
+            if message_dict["source"] == "aws.codecommit":
+                cc_event = CodeCommitEvent.from_event(message_dict)
+                cc_event.bsm = bsm
+                assert (
+                    get_codecommit_event_type(message_dict["detail"])
+                    == cc_event.event_type
+                )
+                if reason is not None:
+                    assert default_rules.evaluate(cc_event) == "nothing"
+                # the custom rules can be anything
+                assert get_ignore_reason(message_dict, trigger_rules="repo") is None
+                assert get_ignore_reason(message_dict, trigger_rules="code") is None
+            else:
+                cb_event = CodeBuildEvent.from_codebuid_notification_event(message_dict)
+                if reason is not None:
+                    assert check_codebuild(cb_event) == "nothing"
+            if reason is not None:
+                n_dropped += 1
+    assert n_dropped / n_events > 0.5
+
+
+def run_ignorable_events(archive_rate: float) -> LocalBotoSesManager:
+    bsm = LocalBotoSesManager()
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        drop_ignorable_events=True,
+        ignored_event_archive_rate=archive_rate,
+        # the comment event is only dropped by the declarative rules
+        trigger_rules="default",
+    )
+    with patch_lambda_handler(bsm, config):
+        for message_dict in [
+            make_comment_message("repo", "1", "c1", "c0", comment_id="cm1"),
+            make_codebuild_message(
+                "my-project", "r1", "repo", "c1", completed_phase="BUILD"
+            ),
+            make_codebuild_message(
+                "my-project", "r1", "repo", "c1", build_status="IN_PROGRESS"
+            ),
+        ]:
+            lbd.lambda_handler(make_sns_event(message_dict), None)
+    return bsm
+
+
+def test_drop_ignorable_events():
+    assert run_ignorable_events(0.0).call_counter["s3.put_object"] == 0
+    assert run_ignorable_events(1.0).call_counter["s3.put_object"] == 3
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.prefilter", preview=False)
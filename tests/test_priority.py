@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+from aws_codecommit import CodeCommitEvent
+
+from aws_ci_bot.corpus import make_pr_message, make_commit_to_branch_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.store import InMemoryStore
+from aws_ci_bot.admission import BuildRequest, Admission
+from aws_ci_bot.priority import (
+    BuildPriorityEnum,
+    get_build_priority,
+    get_effective_priority,
+    pick_next,
+)
+
+
+def get_priority(message_dict: dict) -> BuildPriorityEnum:
+    return get_build_priority(CodeCommitEvent.from_event(message_dict))
+
+
+def test_get_build_priority():
+    pr = lambda event_type, source, target: make_pr_message(
+        "repo", event_type, "1", source, target, "c1", "c0"
+    )
+    assert get_priority(pr("pr_merged", "feature/a", "main")) == BuildPriorityEnum.release
+    # a merge into a non release branch is a normal PR build
+    assert get_priority(pr("pr_merged", "feature/a-1", "feature/a")) == BuildPriorityEnum.feature
+    assert get_priority(pr("pr_created", "feature/a", "main")) == BuildPriorityEnum.main
+    assert get_priority(pr("pr_updated", "fix/a", "release/1.0")) == BuildPriorityEnum.main
+    assert get_priority(pr("pr_created", "feature/a", "develop")) == BuildPriorityEnum.feature
+    assert (
+        get_priority(make_commit_to_branch_message("repo", "release/1.0", "c1", "c0"))
+        == BuildPriorityEnum.release
+    )
+    assert (
+        get_priority(make_commit_to_branch_message("repo", "feature/a", "c1", "c0"))
+        == BuildPriorityEnum.feature
+    )
+
+
+def make_request(commit_id: str, priority: BuildPriorityEnum, requested_at: float):
+    return BuildRequest(
+        project_name="my-project",
+        kwargs=dict(projectName="my-project", sourceVersion=commit_id),
+        priority=priority.value,
+        requested_at=requested_at,
+    )
+
+
+def test_pick_next():
+    queue = [
+        make_request("f1", BuildPriorityEnum.feature, 0),
+        make_request("f2", BuildPriorityEnum.feature, 10),
+        make_request("r1", BuildPriorityEnum.release, 500),
+    ]
+    assert get_effective_priority(queue[0], now=600, aging_seconds=600) == 1.0
+    assert get_effective_priority(queue[0], now=600, aging_seconds=0) == 0.0
+    # release goes first
+    assert pick_next(queue, now=600, aging_seconds=600) == 2
+    assert pick_next(queue, now=600, aging_seconds=0) == 2
+    # same priority, first in first out
+    assert pick_next(queue[:2], now=600, aging_seconds=600) == 0
+    # the feature build waited two levels longer than the new release build
+    queue[2] = make_request("r2", BuildPriorityEnum.release, 1500)
+    assert pick_next(queue, now=1500, aging_seconds=600) == 0
+    assert pick_next(queue, now=1500, aging_seconds=0) == 2
+
+
+def test_admission_by_priority():
+    bsm = LocalBotoSesManager()
+    now = [100.0]
+    admission = Admission(
+        store=InMemoryStore(),
+        limits="my-project=1",
+        aging_seconds=600,
+        clock=lambda: now[0],
+    )
+    r0 = admission.submit(bsm, make_request("f0", BuildPriorityEnum.feature, 100))
+    for commit_id, priority in [
+        ("f1", BuildPriorityEnum.feature),
+        ("f2", BuildPriorityEnum.feature),
+        ("m1", BuildPriorityEnum.main),
+        ("r1", BuildPriorityEnum.release),
+    ]:
+        assert admission.submit(bsm, make_request(commit_id, priority, now[0])) is None
+
+    order = list()
+    build_id = f"my-project:{r0.run_id}"
+    while True:
+        now[0] += 60
+        started = admission.release(bsm, "my-project", build_id)
+        if not started:
+            break
+        ((request, build_job_run),) = started
+        order.append(request.kwargs["sourceVersion"])
+        build_id = f"my-project:{build_job_run.run_id}"
+    assert order == ["r1", "m1", "f1", "f2"]
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.priority", preview=False)
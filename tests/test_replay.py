@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import json
+import gzip
+from datetime import datetime, timedelta
+
+from aws_ci_bot.corpus import (
+    make_sns_event,
+    make_pr_message,
+    make_comment_message,
+    make_codebuild_message,
+)
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.sns_event import encode_ci_event
+from aws_ci_bot.archive import encode_jsonl_gz, compact_archive
+from aws_ci_bot.replay import (
+    LOCAL_BUCKET,
+    ReplayTargetEnum,
+    load_events_from_dir,
+    load_events_from_s3,
+    replay,
+)
+
+CODEBUILD_CONFIG = json.dumps(
+    {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+)
+
+
+def make_bsm() -> LocalBotoSesManager:
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=CODEBUILD_CONFIG,
+    )
+    return bsm
+
+
+def make_events() -> list:
+    t0 = datetime(2023, 1, 1)
+    return [
+        make_sns_event(
+            make_pr_message(
+                "repo-a", "pr_created", "1", "feature/a", "main", "a1", "a0",
+                time=t0,
+            )
+        ),
+        make_sns_event(
+            make_pr_message(
+                "repo-a", "pr_updated", "1", "feature/a", "main", "a2", "a0",
+                time=t0 + timedelta(seconds=2),
+            )
+        ),
+        make_sns_event(
+            make_comment_message(
+                "repo-b", "2", "b0", "b1", time=t0 + timedelta(seconds=1)
+            )
+        ),
+        # the comment doesn't exist, it fails
+        make_sns_event(
+            make_codebuild_message(
+                project_name="my-project",
+                run_id="run-1",
+                repo_name="repo-b",
+                source_version="b1",
+                build_status="SUCCEEDED",
+                env_var={"CI_DATA_COMMENT_ID": "not-exists"},
+                time=t0 + timedelta(seconds=3),
+            )
+        ),
+    ]
+
+
+def test_replay_from_dir(tmp_path):
+    events = make_events()
+    dir_events = tmp_path / "events"
+    dir_events.mkdir()
+    # the archive may have all kinds of file format
+    (dir_events / "1.json").write_text(json.dumps(events[0], indent=4))
+    (dir_events / "2.json.gz").write_bytes(
+        gzip.compress(json.dumps(events[1]).encode("utf-8"))
+    )
+    (dir_events / "sub").mkdir()
+    (dir_events / "sub" / "events.jsonl.gz").write_bytes(
+        encode_jsonl_gz(events[2:])
+    )
+
+    replay_events = load_events_from_dir(dir_events)
+    assert [replay_event.ordering_key for replay_event in replay_events] == [
+        "repo-a",
+        "repo-b",
+        "repo-a",
+        "repo-b",
+    ]
+
+    for target in ReplayTargetEnum:
+        bsm = make_bsm()
+        report = replay(replay_events, bsm=bsm, target=target, parallelism=2)
+        assert report.total == 4
+        assert report.succeeded == 3
+        assert report.failed == 1
+        assert report.results[3].record_id.endswith("events.jsonl.gz")
+        assert report.events_per_sec > 0
+        assert report.api_calls["codebuild.start_build"] == 2
+        assert report.api_calls["codecommit.post_comment_for_pull_request"] == 2
+        assert report.to_dict()["failed"] == 1
+
+        # events of the same repo are replayed in order
+        contents = [
+            comment["content"] for comment in bsm.codecommit_client.comments.values()
+        ]
+        assert "a1" in contents[0]
+        assert "a2" in contents[1]
+
+        # only the lambda handler archives the event again
+        n_archived = len(
+            load_events_from_s3(bsm.s3_client, LOCAL_BUCKET, "replay")
+        )
+        if target == ReplayTargetEnum.lambda_handler:
+            assert n_archived == 4
+        else:
+            assert n_archived == 0
+
+
+
+def test_load_compacted_events_from_s3():
+    bsm = make_bsm()
+    events = make_events()
+    partition = "ci/codecommit/repo-a/year=2023/month=01/day=01/"
+    for i, event in enumerate(events):
+        if i == 2:
+            # the source objects are kept after the compaction
+            compact_archive(bsm.s3_client, LOCAL_BUCKET, "ci/")
+        bsm.s3_client.put_object(
+            Bucket=LOCAL_BUCKET,
+            Key=f"{partition}t{i}_repo-a.json",
+            **encode_ci_event(event, compress=False),
+        )
+    replay_events = load_events_from_s3(bsm.s3_client, LOCAL_BUCKET, "ci/")
+    assert [replay_event.event for replay_event in replay_events] == [
+        events[0],
+        events[2],
+        events[1],
+        events[3],
+    ]
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.replay", preview=False)
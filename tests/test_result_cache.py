@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message, make_codebuild_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import BuildJobConfig, clear_cache
+from aws_ci_bot.summary_comment import SummaryComment
+from aws_ci_bot.store import InMemoryStore
+from aws_ci_bot.result_cache import (
+    BuildResult,
+    ResultCache,
+    get_build_job_key,
+)
+from aws_ci_bot.commit_cache import clear_cache as clear_commit_cache
+from aws_ci_bot import lbd
+
+
+def test_get_build_job_key():
+    job = BuildJobConfig(project_name="my-project", is_batch_job=False)
+    key = get_build_job_key(job)
+    job.include_paths = ["src/*"]
+    assert get_build_job_key(job) == key
+    job.buildspec = "buildspec-test.yml"
+    assert get_build_job_key(job) != key
+
+
+def test_result_cache():
+    clear_commit_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_commit("repo", "c1", tree_id="t1")
+    bsm.codecommit_client.add_commit("repo", "c2", tree_id="t1")
+    bsm.codecommit_client.add_commit("repo", "c3", tree_id="t3")
+    result_cache = ResultCache(store=InMemoryStore())
+    assert result_cache.get(bsm, "repo", "c1", "job") is None
+    result = BuildResult(build_id="my-project:r1", console_url="url", commit_id="c1")
+    result_cache.put(bsm, "repo", "job", result)
+    # same tree
+    assert result_cache.get(bsm, "repo", "c2", "job") == result
+    # other tree, other job
+    assert result_cache.get(bsm, "repo", "c3", "job") is None
+    assert result_cache.get(bsm, "repo", "c2", "other-job") is None
+    # the tree id is cached, commits are immutable
+    assert bsm.call_counter["codecommit.get_commit"] == 3
+
+
+def get_env_var(build: dict) -> dict:
+    return {
+        dct["name"]: dct["value"]
+        for dct in build["environment"]["environmentVariables"]
+    }
+
+
+def run_merge_after_green_pr(comment_mode: str, reuse_result: bool = True):
+    clear_cache()
+    clear_commit_cache()
+    bsm = LocalBotoSesManager()
+    job = {
+        "project_name": "my-project",
+        "is_batch_job": False,
+        "reuse_result": reuse_result,
+    }
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps({"jobs": [job]}),
+    )
+    # the merge commit has the same tree as the PR head
+    bsm.codecommit_client.add_commit("repo", "c1", tree_id="t1")
+    bsm.codecommit_client.add_commit("repo", "m1", tree_id="t1")
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        reuse_build_results=True,
+        comment_mode=comment_mode,
+    )
+    with patch_lambda_handler(bsm, config):
+        lbd.lambda_handler(
+            make_sns_event(
+                make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+            ),
+            None,
+        )
+        (b1,) = bsm.codebuild_client.builds.values()
+        assert get_env_var(b1)["CI_DATA_BUILD_JOB_KEY"]
+        lbd.lambda_handler(
+            make_sns_event(
+                make_codebuild_message(
+                    project_name="my-project",
+                    run_id=b1["id"].split(":", 1)[1],
+                    repo_name="repo",
+                    source_version="c1",
+                    build_status="SUCCEEDED",
+                    env_var=get_env_var(b1),
+                )
+            ),
+            None,
+        )
+        lbd.lambda_handler(
+            make_sns_event(
+                make_pr_message("repo", "pr_merged", "1", "feature/a", "main", "m1", "c0")
+            ),
+            None,
+        )
+    return bsm, b1
+
+
+def test_merge_build_runs_by_default():
+    # the merge build may do more than the PR build, e.g. deploy
+    bsm, b1 = run_merge_after_green_pr("per_job", reuse_result=False)
+    assert bsm.call_counter["codebuild.start_build"] == 2
+    contents = [c["content"] for c in bsm.codecommit_client.comments.values()]
+    assert not any("same tree already passed" in c for c in contents)
+
+
+def test_reuse_per_job_comment():
+    bsm, b1 = run_merge_after_green_pr("per_job")
+    assert bsm.call_counter["codebuild.start_build"] == 1
+    contents = [c["content"] for c in bsm.codecommit_client.comments.values()]
+    assert "same tree already passed" in contents[-1]
+    assert b1["id"] in contents[-1]
+
+
+def test_reuse_summary_comment():
+    bsm, b1 = run_merge_after_green_pr("summary")
+    assert bsm.call_counter["codebuild.start_build"] == 1
+    comment = list(bsm.codecommit_client.comments.values())[-1]
+    summary = SummaryComment.parse(comment["content"])
+    assert summary.rows[0].status == "REUSED"
+    assert summary.rows[0].build_id == b1["id"]
+
+
+class BrokenResultStore(InMemoryStore):
+    """
+    The build results can't be read, for example the table is throttled.
+    """
+
+    def get(self, key: str):
+        if key.startswith("result:"):
+            raise RuntimeError("store is unavailable")
+        return super().get(key)
+
+
+def test_lookup_error_is_a_miss():
+    clear_cache()
+    clear_commit_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {
+                "jobs": [
+                    {
+                        "project_name": "my-project",
+                        "is_batch_job": False,
+                        "reuse_result": True,
+                    }
+                ]
+            }
+        ),
+    )
+    bsm.codecommit_client.add_commit("repo", "c1", tree_id="t1")
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        reuse_build_results=True,
+    )
+    with patch_lambda_handler(bsm, config):
+        lbd._store = BrokenResultStore()
+        lbd.lambda_handler(
+            make_sns_event(
+                make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+            ),
+            None,
+        )
+    assert bsm.call_counter["codebuild.start_build"] == 1
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.result_cache", preview=False)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from aws_ci_bot.benchmark import get_event_type
+from aws_ci_bot.sns_event import extract_sns_message_dict
+from aws_ci_bot.rule_benchmark import (
+    RuleVersion,
+    generate_rule_corpus,
+    run_rule_benchmark,
+    diff_decisions,
+    compare_rules,
+    load_codecommit_rule,
+)
+
+CANDIDATE_RULE = '''
+from .codecommit_rule import CodeCommitHandlerActionEnum
+
+
+def check_what_to_do(cc_event):
+    if cc_event.is_pr_created_event:
+        return CodeCommitHandlerActionEnum.start_build
+    return CodeCommitHandlerActionEnum.nothing
+'''
+
+
+def test_generate_rule_corpus():
+    corpus = generate_rule_corpus(n_events=400, seed=1)
+    assert len(corpus.events) == 400
+    event_types = {
+        get_event_type(extract_sns_message_dict(event)) for event in corpus.events
+    }
+    assert "codecommit.delete_branch" in event_types
+    assert "codecommit.commit_to_branch" in event_types
+    assert "codebuild.state_change.FAILED" in event_types
+
+
+def test_compare_rules_no_diff():
+    baseline, candidate, diff = compare_rules(
+        baseline=RuleVersion.from_spec("code"),
+        candidate=RuleVersion.from_spec("default"),
+        n_events=600,
+        repeat=1,
+    )
+    assert diff.n_changed == 0
+    assert baseline.decisions == candidate.decisions
+    assert baseline.evaluations_per_sec > 0
+    dist = baseline.action_distribution
+    assert dist["codecommit.pr_merged"]["start_build"] > 0
+    assert set(dist["codebuild.phase_change"]) == {"nothing"}
+    # the declarative rules don't read the commit message if not needed
+    assert (
+        candidate.api_calls["codecommit.get_commit"]
+        < baseline.api_calls["codecommit.get_commit"]
+    )
+    json.dumps(baseline.to_dict())
+
+
+def test_diff_decisions(tmp_path):
+    path = tmp_path / "my_codecommit_rule.py"
+    path.write_text(CANDIDATE_RULE)
+    rules_path = tmp_path / "trigger-rules.json"
+    rules_path.write_text(json.dumps({"rules": [], "default_action": "nothing"}))
+
+    corpus = generate_rule_corpus(n_events=400, seed=2)
+    baseline = run_rule_benchmark(RuleVersion.from_spec("code"), corpus, repeat=1)
+    candidate = run_rule_benchmark(
+        RuleVersion.from_spec(str(path)), corpus, repeat=1
+    )
+    diff = diff_decisions(corpus, baseline, candidate)
+    assert diff.n_changed > 0
+    for change in diff.changes:
+        assert change["baseline"] != change["candidate"]
+        assert change["event_type"] in (
+            "codecommit.pr_created",
+            "codecommit.pr_updated",
+            "codecommit.pr_merged",
+        )
+    assert sum(diff.summary.values()) == diff.n_changed
+    assert diff.to_dict(max_changes=1)["n_changed"] == diff.n_changed
+
+    never = run_rule_benchmark(
+        RuleVersion.from_spec(str(rules_path)), corpus, repeat=1
+    )
+    assert {
+        action
+        for event_type, action in zip(never.event_types, never.decisions)
+        if event_type.startswith("codecommit")
+    } == {"nothing"}
+
+    with pytest.raises(ValueError):
+        load_codecommit_rule("latest")
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.rule_benchmark", preview=False)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+from datetime import datetime
+
+from aws_codecommit import CodeCommitEvent
+
+from aws_ci_bot.sns_event import (
+    extract_sns_message_dict,
+    split_sns_event,
+    encode_partition_key,
+    get_ci_event_s3_key,
+    encode_ci_event,
+    decode_ci_event,
+    upload_ci_event,
+    upload_ci_event_in_background,
+    archive_stats,
+)
+
+
+def make_sns_record(message: dict, message_id: str) -> dict:
+    return {
+        "EventSource": "aws:sns",
+        "EventVersion": "1.0",
+        "EventSubscriptionArn": "arn:aws:sns:us-east-1:111122223333:aws-ci-bot",
+        "Sns": {
+            "Type": "Notification",
+            "MessageId": message_id,
+            "TopicArn": "arn:aws:sns:us-east-1:111122223333:aws-ci-bot",
+            "Subject": None,
+            "Message": json.dumps(message),
+            "Timestamp": "2023-01-01T00:00:00.000Z",
+        },
+    }
+
+
+def test_split_sns_event():
+    event = {
+        "Records": [
+            make_sns_record({"source": "aws.codecommit"}, "msg-1"),
+            make_sns_record({"source": "aws.codebuild"}, "msg-2"),
+        ]
+    }
+    sub_events = split_sns_event(event)
+    assert len(sub_events) == 2
+    assert [len(sub_event["Records"]) for sub_event in sub_events] == [1, 1]
+    assert extract_sns_message_dict(sub_events[0]) == {"source": "aws.codecommit"}
+    assert extract_sns_message_dict(sub_events[1]) == {"source": "aws.codebuild"}
+
+    assert split_sns_event({}) == []
+
+
+def test_encode_partition_key():
+    assert (
+        encode_partition_key(datetime(2023, 1, 2)) == "year=2023/month=01/day=02"
+    )
+
+
+class FakeS3Client:
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+        self.objects = dict()
+        self.event = threading.Event()
+
+    def put_object(self, Bucket: str, Key: str, Body: str, **kwargs):
+        # block until the test allows the upload to finish
+        self.event.wait(5)
+        if self.fail:
+            raise ConnectionError("S3 is down")
+        self.objects[(Bucket, Key)] = Body
+
+
+def test_get_ci_event_s3_key():
+    cc_event = CodeCommitEvent(repositoryName="my-repo")
+    s3_key = get_ci_event_s3_key(
+        event_obj=cc_event,
+        prefix="ci/",
+        utc_now=datetime(2023, 1, 2, 3, 4, 5, 6),
+    )
+    assert s3_key == (
+        "ci/codecommit/my-repo/year=2023/month=01/day=02/"
+        "2023-01-02T03-04-05.000006_my-repo.json"
+    )
+
+
+def test_upload_ci_event():
+    s3_client = FakeS3Client()
+    s3_client.event.set()
+    s3_uri = upload_ci_event(
+        s3_client=s3_client,
+        event_dict={"key": "value"},
+        event_obj=CodeCommitEvent(repositoryName="my-repo"),
+        bucket="my-bucket",
+        prefix="ci",
+        verbose=False,
+    )
+    assert s3_uri.startswith("s3://my-bucket/ci/codecommit/my-repo/")
+    assert len(s3_client.objects) == 1
+
+
+def test_upload_ci_event_compressed():
+    s3_client = FakeS3Client()
+    s3_client.event.set()
+    s3_uri = upload_ci_event(
+        s3_client=s3_client,
+        event_dict={"key": "value"},
+        event_obj=CodeCommitEvent(repositoryName="my-repo"),
+        bucket="my-bucket",
+        prefix="ci",
+        verbose=False,
+        compress=True,
+    )
+    assert s3_uri.endswith("_my-repo.json.gz")
+    body = list(s3_client.objects.values())[0]
+    assert isinstance(body, bytes)
+    assert decode_ci_event(body) == {"key": "value"}
+
+
+def test_encode_decode_ci_event():
+    event_dict = {"Records": [{"Sns": {"Message": "hello"}}]}
+    kwargs = encode_ci_event(event_dict, compress=True)
+    assert kwargs["ContentEncoding"] == "gzip"
+    assert kwargs["ContentType"] == "application/json"
+    assert decode_ci_event(kwargs["Body"]) == event_dict
+
+    kwargs = encode_ci_event(event_dict, compress=False)
+    assert "ContentEncoding" not in kwargs
+    assert decode_ci_event(kwargs["Body"].encode("utf-8")) == event_dict
+
+
+def test_upload_ci_event_in_background():
+    # the s3 uri is known before the upload finishes
+    s3_client = FakeS3Client()
+    succeeded = archive_stats.succeeded
+    upload = upload_ci_event_in_background(
+        s3_client=s3_client,
+        event_dict={"key": "value"},
+        event_obj=CodeCommitEvent(repositoryName="my-repo"),
+        bucket="my-bucket",
+        prefix="ci",
+        verbose=False,
+    )
+    assert upload.s3_uri.startswith("s3://my-bucket/ci/codecommit/my-repo/")
+    assert len(s3_client.objects) == 0
+    s3_client.event.set()
+    assert upload.join(timeout=5) is True
+    assert len(s3_client.objects) == 1
+    assert archive_stats.succeeded == succeeded + 1
+
+    # failure is counted, but never raised
+    s3_client = FakeS3Client(fail=True)
+    s3_client.event.set()
+    failed = archive_stats.failed
+    upload = upload_ci_event_in_background(
+        s3_client=s3_client,
+        event_dict={"key": "value"},
+        event_obj=CodeCommitEvent(repositoryName="my-repo"),
+        bucket="my-bucket",
+        prefix="ci",
+        verbose=False,
+    )
+    assert upload.join(timeout=5) is False
+    assert isinstance(upload.error, ConnectionError)
+    assert archive_stats.failed == failed + 1
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.sns_event", preview=False)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from aws_ci_bot.sns_event import extract_sns_message_dict
+from aws_ci_bot.sqs_event import (
+    is_sqs_event,
+    sqs_record_to_sns_event,
+    make_batch_item_failures,
+)
+
+
+def make_sqs_record(message: dict, message_id: str) -> dict:
+    sns_envelope = {
+        "Type": "Notification",
+        "MessageId": f"sns-{message_id}",
+        "TopicArn": "arn:aws:sns:us-east-1:111122223333:aws-ci-bot",
+        "Message": json.dumps(message),
+        "Timestamp": "2023-01-01T00:00:00.000Z",
+    }
+    return {
+        "messageId": message_id,
+        "receiptHandle": "EXAMPLE",
+        "body": json.dumps(sns_envelope),
+        "attributes": {},
+        "messageAttributes": {},
+        "eventSource": "aws:sqs",
+        "eventSourceARN": "arn:aws:sqs:us-east-1:111122223333:aws-ci-bot",
+        "awsRegion": "us-east-1",
+    }
+
+
+def test_is_sqs_event():
+    assert is_sqs_event({"Records": [make_sqs_record({}, "msg-1")]}) is True
+    assert is_sqs_event({"Records": [{"EventSource": "aws:sns"}]}) is False
+    assert is_sqs_event({}) is False
+
+
+def test_sqs_record_to_sns_event():
+    record = make_sqs_record({"source": "aws.codecommit"}, "msg-1")
+    sns_event = sqs_record_to_sns_event(record)
+    assert sns_event["Records"][0]["Sns"]["MessageId"] == "sns-msg-1"
+    assert extract_sns_message_dict(sns_event) == {"source": "aws.codecommit"}
+
+
+def test_make_batch_item_failures():
+    assert make_batch_item_failures([]) == {"batchItemFailures": []}
+    assert make_batch_item_failures(["msg-1", "msg-2"]) == {
+        "batchItemFailures": [
+            {"itemIdentifier": "msg-1"},
+            {"itemIdentifier": "msg-2"},
+        ]
+    }
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.sqs_event", preview=False)
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from aws_ci_bot.store import (
+    get_error_code,
+    InMemoryStore,
+    SQLiteStore,
+    S3Store,
+)
+from aws_ci_bot.local_aws import LocalS3Client, NoSuchKey
+
+
+def make_stores(tmp_path) -> list:
+    return [
+        InMemoryStore(),
+        SQLiteStore(path=str(tmp_path / "store.db")),
+        S3Store(s3_client=LocalS3Client(), bucket="my-bucket", prefix="store/"),
+    ]
+
+
+def test_get_error_code():
+    assert get_error_code(NoSuchKey("s3://b/k")) == "NoSuchKey"
+    assert get_error_code(ValueError()) is None
+
+
+def test_store(tmp_path):
+    for store in make_stores(tmp_path):
+        assert store.get("a/b") is None
+        assert store.put_if_absent("a/b", {"v": 1}, ttl=60) is True
+        assert store.put_if_absent("a/b", {"v": 2}, ttl=60) is False
+        assert store.get("a/b") == {"v": 1}
+
+        store.delete("a/b")
+        assert store.get("a/b") is None
+        assert store.put_if_absent("a/b", {"v": 3}, ttl=60) is True
+
+        # an expired key is treated as absent
+        assert store.put_if_absent("c", {"v": 1}, ttl=0) is True
+        assert store.get("c") is None
+        assert store.put_if_absent("c", {"v": 2}, ttl=60) is True
+        assert store.get("c") == {"v": 2}
+
+        store.put("c", {"v": 3}, ttl=60)
+        assert store.get("c") == {"v": 3}
+
+        # compare and set
+        assert store.put_if_match("d", {"v": 1}, ttl=60, expected=None) is True
+        assert store.put_if_match("d", {"v": 2}, ttl=60, expected=None) is False
+        assert store.put_if_match("d", {"v": 2}, ttl=60, expected={"v": 0}) is False
+        assert store.put_if_match("d", {"v": 2}, ttl=60, expected={"v": 1}) is True
+        assert store.get("d") == {"v": 2}
+        # an expired key is treated as absent
+        store.put("e", {"v": 1}, ttl=0)
+        assert store.put_if_match("e", {"v": 2}, ttl=60, expected={"v": 1}) is False
+        assert store.put_if_match("e", {"v": 2}, ttl=60, expected=None) is True
+        assert store.get("e") == {"v": 2}
+
+
+def test_s3_store_conditional_write():
+    s3_client = LocalS3Client()
+    store = S3Store(s3_client=s3_client, bucket="my-bucket", prefix="store/")
+    assert store.put_if_absent("a/b", {"v": 1}, ttl=60) is True
+    assert ("my-bucket", "store/a%2Fb.json") in s3_client.objects
+
+    # the expired key is changed by another writer before we take it over
+    assert store.put_if_absent("c", {"v": 1}, ttl=0) is True
+    put_object = s3_client.put_object
+
+    def racing_put_object(**kwargs):
+        if "IfMatch" in kwargs:
+            put_object(Bucket="my-bucket", Key="store/c.json", Body="{}")
+        return put_object(**kwargs)
+
+    s3_client.put_object = racing_put_object
+    assert store.put_if_absent("c", {"v": 2}, ttl=60) is False
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.store", preview=False)
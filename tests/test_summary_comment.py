@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+import pytest
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message, make_codebuild_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.summary_comment import JobRow, SummaryComment
+from aws_ci_bot import lbd
+
+
+def test_render_and_parse():
+    summary = SummaryComment(
+        header="## header",
+        rows=[
+            JobRow(project_name="p1"),
+            JobRow(
+                project_name="p2",
+                is_batch_job=True,
+                status="IN_PROGRESS",
+                build_id="p2:run-2",
+                console_url="https://example.com",
+            ),
+        ],
+    )
+    content = summary.render()
+    assert "| p2 | batch build | [p2:run-2](https://example.com) | 🟡 IN_PROGRESS |" in content
+    assert SummaryComment.parse(content) == summary
+
+    assert summary.set_status("p2:run-2", "SUCCEEDED") is True
+    assert summary.set_status("p2:run-2", "SUCCEEDED") is False
+    assert summary.set_status("p3:run-3", "SUCCEEDED") is False
+
+    with pytest.raises(ValueError):
+        SummaryComment.parse("## header")
+
+
+def test_summary_comment_mode():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {
+                "jobs": [
+                    {"project_name": "p1", "is_batch_job": False},
+                    {"project_name": "p2", "is_batch_job": False},
+                    {"project_name": "p3", "is_batch_job": True},
+                ]
+            }
+        ),
+    )
+    config = Config(s3_bucket="b", s3_prefix="p", comment_mode="summary")
+    with patch_lambda_handler(bsm, config):
+        lbd.lambda_handler(
+            make_sns_event(
+                make_pr_message(
+                    "repo", "pr_created", "1", "feature/a", "main", "c1", "c0"
+                )
+            ),
+            None,
+        )
+        calls = bsm.call_counter
+        assert calls["codecommit.post_comment_for_pull_request"] == 1
+        assert calls["codecommit.update_comment"] == 1
+
+        (comment_id,) = list(bsm.codecommit_client.comments)
+        content = bsm.codecommit_client.comments[comment_id]["content"]
+        summary = SummaryComment.parse(content)
+        assert [row.status for row in summary.rows] == ["IN_PROGRESS"] * 3
+
+        builds = sorted(
+            list(bsm.codebuild_client.builds.values())
+            + list(bsm.codebuild_client.build_batches.values()),
+            key=lambda build: build["projectName"],
+        )
+        for build, status in zip(builds, ["SUCCEEDED", "FAILED", "STOPPED"]):
+            env_var = {
+                dct["name"]: dct["value"]
+                for dct in build["environment"]["environmentVariables"]
+            }
+            assert env_var["CI_DATA_COMMENT_MODE"] == "summary"
+            lbd.lambda_handler(
+                make_sns_event(
+                    make_codebuild_message(
+                        project_name=build["projectName"],
+                        run_id=build["id"].split(":", 1)[1],
+                        repo_name="repo",
+                        source_version="c1",
+                        build_status=status,
+                        env_var=env_var,
+                        is_batch=build["arn"].split(":")[5].startswith("build-batch"),
+                    )
+                ),
+                None,
+            )
+
+    calls = bsm.call_counter
+    assert calls["codecommit.update_comment"] == 4
+    assert calls["codecommit.post_comment_reply"] == 0
+    content = bsm.codecommit_client.comments[comment_id]["content"]
+    summary = SummaryComment.parse(content)
+    assert {row.project_name: row.status for row in summary.rows} == {
+        "p1": "SUCCEEDED",
+        "p2": "FAILED",
+        "p3": "STOPPED",
+    }
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.summary_comment", preview=False)
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message, make_codebuild_message
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.summary_comment import SummaryComment
+from aws_ci_bot.store import InMemoryStore
+from aws_ci_bot.supersede import (
+    InflightBuild,
+    Supersede,
+    get_repo_name_from_source_location,
+)
+from aws_ci_bot import lbd
+
+ARN = "arn:aws:codebuild:us-east-1:111122223333:{type}/my-project:{run_id}"
+
+
+def test_inflight_build():
+    build = InflightBuild(
+        build_arn=ARN.format(type="build-batch", run_id="r1"), source_commit="c1"
+    )
+    assert build.is_batch is True
+    assert build.build_id == "my-project:r1"
+    assert (
+        get_repo_name_from_source_location(
+            "https://git-codecommit.us-east-1.amazonaws.com/v1/repos/my-repo"
+        )
+        == "my-repo"
+    )
+
+
+def test_track_and_release():
+    supersede = Supersede(store=InMemoryStore())
+    b1 = InflightBuild(build_arn=ARN.format(type="build", run_id="r1"), source_commit="c1")
+    b2 = InflightBuild(build_arn=ARN.format(type="build", run_id="r2"), source_commit="c2")
+    b3 = InflightBuild(build_arn=ARN.format(type="build", run_id="r3"), source_commit="c2")
+    assert supersede.track("repo", "1", "my-project", b1) is None
+    assert supersede.track("repo", "1", "my-project", b2) == b1
+    # same commit, e.g. PR merged, don't supersede
+    assert supersede.track("repo", "1", "my-project", b3) is None
+    # other PR
+    assert supersede.track("repo", "2", "my-project", b1) is None
+
+    # b2 is replaced by b3, release doesn't remove b3
+    supersede.release("repo", "1", "my-project", b2.build_arn)
+    assert supersede.track("repo", "1", "my-project", b1) == b3
+    supersede.release("repo", "1", "my-project", b1.build_arn)
+    assert supersede.track("repo", "1", "my-project", b2) is None
+
+
+def get_env_var(build: dict) -> dict:
+    return {
+        dct["name"]: dct["value"]
+        for dct in build["environment"]["environmentVariables"]
+    }
+
+
+def run_two_pushes(comment_mode: str):
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        supersede_builds=True,
+        comment_mode=comment_mode,
+    )
+    with patch_lambda_handler(bsm, config):
+        for event_type, commit_id in [("pr_created", "c1"), ("pr_updated", "c2")]:
+            lbd.lambda_handler(
+                make_sns_event(
+                    make_pr_message(
+                        "repo", event_type, "1", "feature/a", "main", commit_id, "c0"
+                    )
+                ),
+                None,
+            )
+        b1, b2 = sorted(
+            bsm.codebuild_client.builds.values(),
+            key=lambda build: build["sourceVersion"],
+        )
+        assert b1["buildStatus"] == "STOPPED"
+        assert b2["buildStatus"] == "IN_PROGRESS"
+        assert bsm.call_counter["codebuild.stop_build"] == 1
+
+        # the STOPPED event of the superseded build
+        lbd.lambda_handler(
+            make_sns_event(
+                make_codebuild_message(
+                    project_name="my-project",
+                    run_id=b1["id"].split(":", 1)[1],
+                    repo_name="repo",
+                    source_version="c1",
+                    build_status="STOPPED",
+                    env_var=get_env_var(b1),
+                )
+            ),
+            None,
+        )
+    return bsm, b1
+
+
+def test_supersede_per_job_comment():
+    bsm, b1 = run_two_pushes("per_job")
+    comment_id = get_env_var(b1)["CI_DATA_COMMENT_ID"]
+    replies = [
+        comment["content"]
+        for comment in bsm.codecommit_client.comments.values()
+        if comment.get("inReplyTo") == comment_id
+    ]
+    assert replies == [
+        "⏭️ Build Run SUPERSEDED by commit c2",
+        "⚫ Build Run STOPPED",
+    ]
+
+
+def test_jobs_of_same_project():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {
+                "jobs": [
+                    {
+                        "project_name": "my-project",
+                        "is_batch_job": False,
+                        "buildspec": buildspec,
+                    }
+                    for buildspec in ["buildspec-test.yml", "buildspec-lint.yml"]
+                ]
+            }
+        ),
+    )
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        supersede_builds=True,
+    )
+    with patch_lambda_handler(bsm, config):
+        for event_type, commit_id in [("pr_created", "c1"), ("pr_updated", "c2")]:
+            lbd.lambda_handler(
+                make_sns_event(
+                    make_pr_message(
+                        "repo", event_type, "1", "feature/a", "main", commit_id, "c0"
+                    )
+                ),
+                None,
+            )
+    # each build job only stops its own stale build job run
+    status = sorted(
+        (build["sourceVersion"], build["buildStatus"])
+        for build in bsm.codebuild_client.builds.values()
+    )
+    assert status == [
+        ("c1", "STOPPED"),
+        ("c1", "STOPPED"),
+        ("c2", "IN_PROGRESS"),
+        ("c2", "IN_PROGRESS"),
+    ]
+
+
+def test_merge_does_not_supersede():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    config = Config(
+        s3_bucket="b",
+        s3_prefix="p",
+        idempotency_store="memory",
+        supersede_builds=True,
+    )
+    with patch_lambda_handler(bsm, config):
+        for event_type, commit_id in [("pr_created", "c1"), ("pr_merged", "m1")]:
+            lbd.lambda_handler(
+                make_sns_event(
+                    make_pr_message(
+                        "repo", event_type, "1", "feature/a", "main", commit_id, "c0"
+                    )
+                ),
+                None,
+            )
+    assert [
+        build["buildStatus"] for build in bsm.codebuild_client.builds.values()
+    ] == ["IN_PROGRESS", "IN_PROGRESS"]
+    assert bsm.call_counter["codebuild.stop_build"] == 0
+
+
+def test_supersede_summary_comment():
+    bsm, b1 = run_two_pushes("summary")
+    comment_id = get_env_var(b1)["CI_DATA_COMMENT_ID"]
+    summary = SummaryComment.parse(bsm.codecommit_client.comments[comment_id]["content"])
+    assert summary.rows[0].status == "SUPERSEDED"
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.supersede", preview=False)
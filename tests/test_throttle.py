@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import json
+import random
+
+import pytest
+
+from aws_ci_bot.config import Config
+from aws_ci_bot.corpus import make_sns_event, make_pr_message
+from aws_ci_bot.local_aws import (
+    LocalBotoSesManager,
+    ThrottlingException,
+    ResourceNotFoundException,
+)
+from aws_ci_bot.replay import patch_lambda_handler
+from aws_ci_bot.code_build_config import clear_cache
+from aws_ci_bot.throttle import (
+    TokenBucket,
+    RateLimiter,
+    parse_rate_limits,
+    is_throttling_error,
+    rate_limiter,
+)
+from aws_ci_bot import lbd
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("") == {}
+    assert parse_rate_limits("codecommit.post_comment=5:10, *=20") == {
+        "codecommit.post_comment": (5.0, 10.0),
+        "*": (20.0, None),
+    }
+    with pytest.raises(ValueError):
+        parse_rate_limits("codecommit.post_comment")
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(max_rate=2, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.5]
+    clock.now = 1.5
+    assert bucket.reserve() == 0.0
+
+    bucket.on_throttle()
+    assert bucket.rate == 1
+    bucket.on_success()
+    bucket.on_success()
+    assert bucket.rate == 2
+
+    # unlimited until throttled, then recover to unlimited
+    bucket = TokenBucket(clock=clock, throttled_rate=10, recovered_rate=11)
+    assert bucket.reserve() == 0.0
+    bucket.on_throttle()
+    assert bucket.rate == 10
+    assert bucket.reserve() == pytest.approx(0.1)
+    bucket.on_success()
+    bucket.on_success()
+    assert bucket.rate is None
+
+
+def test_retry_on_throttle():
+    clock = FakeClock()
+    limiter = RateLimiter(max_attempts=3, clock=clock, sleep=clock.sleep)
+    bsm = LocalBotoSesManager()
+    client = bsm.codebuild_client
+
+    client.inject_throttle("start_build", 2)
+    res = limiter.call("codebuild.start_build", client.start_build, projectName="p")
+    assert res["build"]["projectName"] == "p"
+    assert bsm.throttled_counter["codebuild.start_build"] == 2
+    assert len(clock.sleeps) >= 2
+    # the API is rate limited after the throttling error
+    assert limiter.get_bucket("codebuild.start_build").rate is not None
+
+    client.inject_throttle("start_build", 3)
+    with pytest.raises(ThrottlingException) as e:
+        limiter.call("codebuild.start_build", client.start_build, projectName="p")
+    assert is_throttling_error(e.value)
+
+    # other errors are not retried
+    with pytest.raises(ResourceNotFoundException):
+        limiter.call("codebuild.stop_build", client.stop_build, id="not-exists")
+    assert bsm.call_counter["codebuild.stop_build"] == 1
+
+
+def test_adaptive_rate():
+    random.seed(0)
+    clock = FakeClock()
+    limiter = RateLimiter(max_attempts=10, clock=clock, sleep=clock.sleep)
+    bsm = LocalBotoSesManager()
+    client = bsm.codecommit_client
+    client.clock = clock
+    client.add_comment("c1")
+    client.set_tps_limit("post_comment_reply", 5)
+    for _ in range(30):
+        limiter.call(
+            "codecommit.post_comment_reply",
+            client.post_comment_reply,
+            inReplyTo="c1",
+            content="hello",
+        )
+    throttled = bsm.throttled_counter["codecommit.post_comment_reply"]
+    assert 0 < throttled < 30
+    # the server accepts 5 calls per second
+    assert clock.now >= 5
+
+
+def test_lambda_handler_with_throttle():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_file(
+        file_path="codebuild-config.json",
+        content=json.dumps(
+            {"jobs": [{"project_name": "my-project", "is_batch_job": False}]}
+        ),
+    )
+    bsm.codecommit_client.inject_throttle("post_comment_for_pull_request", 1)
+    bsm.codebuild_client.inject_throttle("start_build", 2)
+    bsm.codecommit_client.inject_throttle("update_comment", 1)
+    event = make_sns_event(
+        make_pr_message("repo", "pr_created", "1", "feature/a", "main", "c1", "c0")
+    )
+    try:
+        with patch_lambda_handler(bsm, Config(s3_bucket="b", s3_prefix="p")):
+            lbd.lambda_handler(event, None)
+    finally:
+        rate_limiter.configure()
+    assert len(bsm.codebuild_client.builds) == 1
+    assert sum(bsm.throttled_counter.values()) == 4
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.throttle", preview=False)
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+import json
+import itertools
+
+import pytest
+from aws_codecommit import CodeCommitEvent
+
+from aws_ci_bot.local_aws import LocalBotoSesManager
+from aws_ci_bot.corpus import (
+    generate_corpus,
+    make_pr_message,
+    make_branch_message,
+    make_commit_to_branch_message,
+    make_comment_message,
+    make_approve_message,
+)
+from aws_ci_bot.codecommit_rule import CodeCommitHandlerActionEnum, check_what_to_do
+from aws_ci_bot.trigger_rule import (
+    TriggerRule,
+    TriggerRules,
+    default_rules,
+    load_trigger_rules,
+    clear_cache,
+)
+
+BRANCH_PREFIXES = [
+    "feat", "feature", "fix", "hotfix", "build", "doc", "rls", "release",
+    "clean", "cleanup", "dev", "develop", "test", "int", "stage", "staging",
+    "qa", "preprod", "prod", "blue", "green", "main", "experiment", "Feature",
+]
+COMMIT_MESSAGES = ["feat: add", "chore: clean up", "chore, fix: both", "no type"]
+
+
+def make_cc_event(bsm, message_dict: dict) -> CodeCommitEvent:
+    cc_event = CodeCommitEvent.from_event(message_dict)
+    cc_event.bsm = bsm
+    return cc_event
+
+
+def iter_message_dicts(repo_name: str):
+    for ind, (prefix, message) in enumerate(
+        itertools.product(BRANCH_PREFIXES, COMMIT_MESSAGES)
+    ):
+        branch = f"{prefix}/{ind}"
+        source_commit, target_commit = f"s{ind}", f"t{ind}"
+        yield source_commit, message, [
+            make_pr_message(repo_name, "pr_created", "1", branch, "main", source_commit, target_commit),
+            make_pr_message(repo_name, "pr_updated", "1", branch, "main", source_commit, target_commit),
+            make_pr_message(repo_name, "pr_merged", "1", branch, "main", source_commit, target_commit),
+            make_pr_message(repo_name, "pr_closed", "1", branch, "main", source_commit, target_commit),
+            make_branch_message(repo_name, branch, source_commit),
+            make_commit_to_branch_message(repo_name, branch, source_commit, target_commit),
+            make_comment_message(repo_name, "1", target_commit, source_commit),
+            make_approve_message(repo_name, "1", branch, "main", source_commit, target_commit),
+        ]
+
+
+def test_default_rules_equivalence():
+    bsm = LocalBotoSesManager()
+    for commit_id, message, message_dicts in iter_message_dicts("repo"):
+        bsm.codecommit_client.add_commit("repo", commit_id, message=message)
+        for message_dict in message_dicts:
+            expected = check_what_to_do(make_cc_event(bsm, message_dict))
+            assert default_rules.evaluate(make_cc_event(bsm, message_dict)) == expected
+
+    corpus = generate_corpus(n_events=500, seed=3)
+    corpus.setup(bsm)
+    for event in corpus.events:
+        message_dict = json.loads(event["Records"][0]["Sns"]["Message"])
+        if message_dict["source"] != "aws.codecommit":
+            continue
+        expected = check_what_to_do(make_cc_event(bsm, message_dict))
+        assert default_rules.evaluate(make_cc_event(bsm, message_dict)) == expected
+
+
+def test_skip_commit_message():
+    bsm = LocalBotoSesManager()
+    for message_dict in [
+        make_commit_to_branch_message("repo", "feat/a", "c1", "c0"),
+        make_branch_message("repo", "feat/a", "c1"),
+        make_comment_message("repo", "1", "c0", "c1"),
+    ]:
+        action = default_rules.evaluate(make_cc_event(bsm, message_dict))
+        assert action == CodeCommitHandlerActionEnum.nothing
+    # these events can never trigger build, the commit message is not needed
+    assert bsm.call_counter["codecommit.get_commit"] == 0
+
+
+def test_custom_rules():
+    rules = TriggerRules.from_dict(
+        {
+            "rules": [
+                {"commit_message_pattern": r"\[skip ci\]", "action": "nothing"},
+                {
+                    "event_types": ["commit_to_branch"],
+                    "source_branch_pattern": "^release/v\\d+$",
+                    "action": "start_build",
+                },
+                {
+                    "event_types": ["pr_created"],
+                    "target_branches": ["main"],
+                    "action": "start_build",
+                },
+            ]
+        }
+    )
+    bsm = LocalBotoSesManager()
+    bsm.codecommit_client.add_commit("repo", "c2", message="fix: typo [skip ci]")
+
+    def evaluate(message_dict):
+        return rules.evaluate(make_cc_event(bsm, message_dict)).value
+
+    assert evaluate(make_commit_to_branch_message("repo", "release/v1", "c1", "c0")) == "start_build"
+    assert evaluate(make_commit_to_branch_message("repo", "release/v1", "c2", "c0")) == "nothing"
+    assert evaluate(make_commit_to_branch_message("repo", "release/x", "c1", "c0")) == "nothing"
+    assert evaluate(make_pr_message("repo", "pr_created", "1", "x/a", "main", "c1", "c0")) == "start_build"
+    assert evaluate(make_pr_message("repo", "pr_created", "1", "x/a", "dev", "c1", "c0")) == "nothing"
+
+    with pytest.raises(ValueError):
+        TriggerRule.from_dict({"action": "deploy"})
+    with pytest.raises(ValueError):
+        TriggerRule.from_dict({"action": "nothing", "event_types": ["push"]})
+    with pytest.raises(ValueError):
+        TriggerRule.from_dict({"action": "nothing", "branch": ["main"]})
+
+
+def test_load_trigger_rules():
+    clear_cache()
+    bsm = LocalBotoSesManager()
+    assert load_trigger_rules(bsm, "repo", "c1") is default_rules
+    assert load_trigger_rules(bsm, "repo", "c1") is default_rules
+    assert bsm.call_counter["codecommit.get_file"] == 1
+
+    bsm.codecommit_client.add_file(
+        file_path="trigger-rules.json",
+        content=json.dumps({"rules": [], "default_action": "start_build"}),
+        repo_name="repo",
+        commit_id="c2",
+    )
+    rules = load_trigger_rules(bsm, "repo", "c2")
+    assert rules.default_action == "start_build"
+    assert load_trigger_rules(bsm, "repo", "c2") is rules
+    assert bsm.call_counter["codecommit.get_file"] == 2
+
+
+if __name__ == "__main__":
+    from aws_ci_bot.tests import run_cov_test
+
+    run_cov_test(__file__, "aws_ci_bot.trigger_rule", preview=False)